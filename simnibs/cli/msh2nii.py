@@ -47,6 +47,9 @@ def parse_arguments(argv):
                         "interpolating fields")
     parser.add_argument("--create_label", action="store_true",
                         help="write tissue labels instead of interpolating fields")
+    parser.add_argument("--cpus", type=int, default=1,
+                        help="Number of threads used to interpolate the fields. "
+                        "Default: 1")
     parser.add_argument('--version', action='version', version=__version__)
     return parser.parse_args(argv)
 
@@ -58,7 +61,8 @@ def main():
     transformations.interpolate_to_volume(
         args.fn_mesh, args.fn_reference, args.fn_out, 
         create_masks=args.create_masks, 
-        create_label=args.create_label)
+        create_label=args.create_label,
+        cpus=args.cpus)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,111 @@
+''' Benchmark of the multi-threaded AABB tree queries
+
+    Times points_inside, min_sqdist, closest_point, intersection and
+    any_point_inside with increasing numbers of threads on a skin-sized
+    surface. By default, the surface is an ellipsoid with the size and number
+    of triangles of a typical skin surface. Alternatively, the skin surface
+    (tag 1005) of a head mesh can be given.
+
+    Run with:
+
+    simnibs_python AABBTree_queries.py [--mesh m2m_ernie/ernie.msh] [--n_points 1000000]
+'''
+import argparse
+import os
+import time
+
+import numpy as np
+
+from simnibs.mesh_tools import mesh_io
+from simnibs.mesh_tools import cgal
+
+
+def timeit(f, *args, repeat=3, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def ellipsoid(n_faces, radii=(80., 95., 110.)):
+    ''' Latitude-longitude triangulation of an ellipsoid with about n_faces '''
+    n = int(np.sqrt(n_faces / 4))
+    theta = np.linspace(0, np.pi, n + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, 2 * n, endpoint=False)
+    theta, phi = np.meshgrid(theta, phi, indexing='ij')
+    vertices = np.stack([
+        np.sin(theta) * np.cos(phi),
+        np.sin(theta) * np.sin(phi),
+        np.cos(theta)], axis=-1).reshape(-1, 3)
+    vertices = np.vstack([vertices, [[0, 0, 1], [0, 0, -1]]]) * radii
+    n_rings, n_phi = n - 1, 2 * n
+    ring = np.arange(n_phi)
+    faces = []
+    for i in range(n_rings - 1):
+        a = i * n_phi + ring
+        b = i * n_phi + (ring + 1) % n_phi
+        faces.append(np.stack([a, a + n_phi, b], axis=1))
+        faces.append(np.stack([b, a + n_phi, b + n_phi], axis=1))
+    top, bottom = n_rings * n_phi, n_rings * n_phi + 1
+    last = (n_rings - 1) * n_phi
+    faces.append(np.stack([np.full(n_phi, top), ring, (ring + 1) % n_phi], axis=1))
+    faces.append(np.stack(
+        [np.full(n_phi, bottom), last + (ring + 1) % n_phi, last + ring], axis=1))
+    return vertices, np.vstack(faces)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mesh', default=None,
+                        help='head mesh, the skin surface (1005) is used')
+    parser.add_argument('--n_faces', type=int, default=200000)
+    parser.add_argument('--n_points', type=int, default=1000000)
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.mesh is None:
+        vertices, faces = ellipsoid(args.n_faces)
+    else:
+        skin = mesh_io.read_msh(args.mesh).crop_mesh(tags=1005, elm_type=2)
+        vertices, faces = skin.nodes[:], skin.elm[:, :3] - 1
+    tree = cgal.pyAABBTree()
+    tree.set_data(vertices, faces)
+
+    rng = np.random.default_rng(0)
+    bounds = np.stack([vertices.min(axis=0), vertices.max(axis=0)]) * 1.2
+    points = rng.uniform(bounds[0], bounds[1], (args.n_points, 3))
+    # segments from the center to the points, for the intersection queries
+    n_segments = args.n_points // 10
+    center = np.tile(vertices.mean(axis=0), (n_segments, 1))
+    # points outside, so that any_point_inside needs to check all of them
+    outside = points[tree.min_sqdist(points) > 1]
+    outside = outside[np.setdiff1d(
+        np.arange(len(outside)), tree.points_inside(outside))]
+    print(f'{len(faces)} triangles, {args.n_points} points, '
+          f'{n_segments} segments')
+
+    for n_threads in sorted(set(args.threads)):
+        print(f'{n_threads} thread(s)')
+        t = timeit(tree.points_inside, points, n_threads=n_threads,
+                   repeat=args.repeat)
+        print(f'  points_inside:    {t:.3f}s')
+        t = timeit(tree.min_sqdist, points, n_threads=n_threads,
+                   repeat=args.repeat)
+        print(f'  min_sqdist:       {t:.3f}s')
+        t = timeit(tree.closest_point, points, n_threads=n_threads,
+                   repeat=args.repeat)
+        print(f'  closest_point:    {t:.3f}s')
+        t = timeit(tree.intersection, center, points[:n_segments],
+                   n_threads=n_threads, repeat=args.repeat)
+        print(f'  intersection:     {t:.3f}s')
+        t = timeit(tree.any_point_inside, outside, n_threads=n_threads,
+                   repeat=args.repeat)
+        print(f'  any_point_inside: {t:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
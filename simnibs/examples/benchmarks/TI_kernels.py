@@ -0,0 +1,68 @@
+''' Benchmark of the allocation-free TI kernels
+
+    Times get_maxTI and get_dirTI against get_maxTI_kernel and get_dirTI_kernel
+    with preallocated buffers, in float64 and float32, and the block-wise
+    weighted mean in mean_maxTI, for stacks of random fields.
+
+    Run with:
+
+    simnibs_python TI_kernels.py [--n_points 100000] [--n_fields 16]
+'''
+import argparse
+import time
+
+import numpy as np
+
+from simnibs.utils import TI_utils as TI
+
+
+def timeit(f, *args, repeat=5, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n_points', type=int, default=100000)
+    parser.add_argument('--n_fields', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = (args.n_fields, args.n_points, 3)
+    E1 = rng.normal(size=shape)
+    E2 = rng.normal(size=shape)
+    n = np.array([0., 0., 1.])
+    w = rng.uniform(size=args.n_points)
+    print(f'{args.n_fields} fields, {args.n_points} positions')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = timeit(TI.get_maxTI, E1, E2, repeat=args.repeat)
+    print(f'get_maxTI:                 {t:.3f}s')
+    # get_dirTI takes one field at a time
+    t = timeit(lambda: [TI.get_dirTI(e1, e2, n) for e1, e2 in zip(E1, E2)],
+               repeat=args.repeat)
+    print(f'get_dirTI:                 {t:.3f}s')
+
+    for dtype in [np.float64, np.float32]:
+        e1 = E1.astype(dtype)
+        e2 = E2.astype(dtype)
+        buffers = TI.TIBuffers(shape, dtype)
+        out = np.empty(shape[:-1], dtype=dtype)
+        name = np.dtype(dtype).name
+        t = timeit(TI.get_maxTI_kernel, e1, e2, out=out, buffers=buffers,
+                   repeat=args.repeat)
+        print(f'get_maxTI_kernel ({name}): {t:.3f}s')
+        t = timeit(TI.get_dirTI_kernel, e1, e2, n, out=out, buffers=buffers,
+                   repeat=args.repeat)
+        print(f'get_dirTI_kernel ({name}): {t:.3f}s')
+        t = timeit(TI.mean_maxTI, e1, e2, w, repeat=args.repeat)
+        print(f'mean_maxTI ({name}):       {t:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
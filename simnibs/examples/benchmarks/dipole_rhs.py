@@ -0,0 +1,92 @@
+''' Benchmark of the dipole right-hand side assembly
+
+    Places dipoles at random gray matter tetrahedra of a head mesh and times
+    the assembly of the partial integration and St. Venant right-hand sides,
+    comparing the St. Venant loads with the previous per-dipole loop.
+
+    Run with:
+
+    simnibs_python dipole_rhs.py m2m_ernie/ernie.msh [--n_dipoles 20000]
+'''
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+
+from simnibs import mesh_io
+from simnibs.simulation import fem
+from simnibs.utils.mesh_element_properties import ElementTags
+
+
+def st_venant_loop(mesh, dip_pos, dip_mom):
+    ''' Previous implementation: neighbourhoods and loads one dipole at a time '''
+    aref = 20
+    lambda_ = 1e-5
+    _, src_idx = mesh.nodes.find_closest_node(dip_pos, return_index=True)
+    node_indices = [
+        np.unique(mesh.elm.node_number_list[
+            np.intersect1d(
+                mesh.elm.find_all_elements_with_node(i), mesh.elm.tetrahedra,
+                assume_unique=True) - 1] - 1)
+        for i in src_idx
+    ]
+    rows = np.concatenate(node_indices)
+    cols = np.repeat(np.arange(len(dip_pos)), list(map(len, node_indices)))
+    data = np.zeros(len(rows))
+    for i, (p, d, ni) in enumerate(zip(dip_pos, dip_mom, node_indices)):
+        v = (mesh.nodes.node_coord[ni] - p) / aref
+        X = np.ones((7, len(ni)))
+        X[1:4] = v.T
+        X[4:] = v.T**2
+        t = np.zeros(7)
+        t[1:4] = d / aref
+        W = np.vstack([np.diag(v[:, 0]), np.diag(v[:, 1]), np.diag(v[:, 2])])
+        data[cols == i] = np.linalg.solve(X.T @ X + lambda_ * W.T @ W, X.T @ t)
+    return sparse.csc_matrix(
+        (data, (rows, cols)), shape=(mesh.nodes.nr, len(dip_pos)))
+
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    out = f(*args)
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('fn_mesh', help='Head mesh (.msh)')
+    parser.add_argument('--n_dipoles', type=int, default=20000)
+    parser.add_argument('--n_loop', type=int, default=2000,
+                        help='Number of dipoles for the per-dipole loop')
+    args = parser.parse_args()
+
+    mesh = mesh_io.read_msh(args.fn_mesh)
+    rng = np.random.default_rng(0)
+    gm = mesh.elm.elm_number[
+        (mesh.elm.tag1 == ElementTags.GM) * (mesh.elm.elm_type == 4)]
+    dip_pos = mesh.elements_baricenters()[rng.choice(gm, args.n_dipoles)]
+    dip_mom = rng.normal(size=(args.n_dipoles, 3))
+    print(f'{args.n_dipoles} dipoles, {mesh.nodes.nr} nodes')
+
+    b, t = timeit(
+        fem.assemble_dipole_rhs, mesh, dip_pos, dip_mom, 'partial integration')
+    print(f'Partial integration:      {t:.2f}s (nnz: {b.nnz})')
+
+    def st_venant(dip_pos, dip_mom):
+        node_indices = fem.st_venant_node_indices(mesh, dip_pos)
+        return fem.compute_st_venant_loads(
+            dip_pos, dip_mom * 1e3, node_indices, mesh.nodes.node_coord)
+
+    b, t = timeit(st_venant, dip_pos, dip_mom)
+    print(f'St. Venant (batched):     {t:.2f}s (nnz: {b.nnz})')
+    n = min(args.n_loop, args.n_dipoles)
+    b_loop, t_loop = timeit(st_venant_loop, mesh, dip_pos[:n], dip_mom[:n] * 1e3)
+    print(f'St. Venant (loop):        {t_loop:.2f}s for {n} dipoles, '
+          f'{t_loop * args.n_dipoles / n:.2f}s extrapolated')
+    print('Max. difference:         '
+          f'{np.abs(b[:, :n] - b_loop).max():.2e}')
+
+
+if __name__ == '__main__':
+    main()
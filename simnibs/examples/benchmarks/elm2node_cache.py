@@ -0,0 +1,56 @@
+''' Benchmark of the cached element-to-node (SPR) operator
+
+    Converts the E and J fields of a batch of simulation results in the same head
+    model to node data, recomputing the operator for each field (as without the
+    cache) and reusing the cached operator.
+
+    Run with:
+
+    simnibs_python elm2node_cache.py tms_simu/*.msh [--cache m2m_ernie/operators.hdf5]
+
+    If --cache is given, the operator is also stored in the HDF5 file, so that
+    later runs on the same head model do not need to calculate it again.
+'''
+import argparse
+import time
+
+from simnibs import mesh_io
+
+
+def convert(meshes, fields, cache=True, fn_cache=None):
+    start = time.perf_counter()
+    with mesh_io.operator_cache():
+        for m in meshes:
+            if fn_cache is not None:
+                m.elm2node_matrix(m.elm.tetrahedra, fn_cache=fn_cache)
+            for name in fields:
+                if not cache:
+                    mesh_io.clear_operator_cache()
+                m.field[name].elm_data2node_data()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('fn_results', nargs='+', help='Simulation results (.msh)')
+    parser.add_argument('--fields', nargs='+', default=['E', 'J'])
+    parser.add_argument('--cache', default=None,
+                        help='HDF5 file where the operator is persisted')
+    args = parser.parse_args()
+
+    meshes = [mesh_io.read_msh(fn) for fn in args.fn_results]
+    n_conversions = len(meshes) * len(args.fields)
+    print(f'{len(meshes)} meshes, fields: {" ".join(args.fields)}')
+
+    t = convert(meshes, args.fields, cache=False)
+    print(f'Without cache:   {t:.2f}s ({t / n_conversions:.3f}s per field)')
+    t = convert(meshes, args.fields)
+    print(f'With cache:      {t:.2f}s ({t / n_conversions:.3f}s per field)')
+    if args.cache is not None:
+        convert(meshes[:1], args.fields, fn_cache=args.cache)
+        t = convert(meshes, args.fields, fn_cache=args.cache)
+        print(f'Cache from disk: {t:.2f}s ({t / n_conversions:.3f}s per field)')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,10 @@
 #include <CGAL/AABB_face_graph_triangle_primitive.h>
 #include <CGAL/Side_of_triangle_mesh.h>
 
+#include <algorithm>
+#include <atomic>
 #include <cstdlib>
+#include <thread>
 
 // Domain
 typedef CGAL::Exact_predicates_inexact_constructions_kernel K;
@@ -24,6 +27,7 @@ typedef CGAL::AABB_traits<K, Primitive> Traits;
 typedef CGAL::AABB_tree<Traits> Tree;
 typedef boost::optional<Tree::Intersection_and_primitive_id<Segment>::Type> Segment_intersection;
 typedef Tree::Primitive_id Primitive_id;
+typedef Tree::Point_and_primitive_id Point_and_primitive_id;
 
 // Side of triangle
 typedef CGAL::Side_of_triangle_mesh<Surface_mesh, K> Point_inside;
@@ -32,6 +36,27 @@ typedef CGAL::Side_of_triangle_mesh<Surface_mesh, K> Point_inside;
 // To avoid verbose function and named parameters call
 using namespace CGAL::parameters;
 
+// Splits [0, n) in contiguous chunks and calls f(start, end, chunk) for each
+// chunk in its own thread. The tree queries are const, so the threads only
+// need to write to their own chunk of the output
+template <typename F>
+void _parallel_chunks(int n, int n_threads, F f)
+{
+  n_threads = std::max(1, std::min(n_threads, n));
+  if (n_threads == 1) {
+    f(0, n, 0);
+    return;
+  }
+  std::vector<std::thread> threads;
+  int chunk_size = (n + n_threads - 1) / n_threads;
+  for (int t = 0; t < n_threads; t++) {
+    int start = t * chunk_size;
+    int end = std::min(n, start + chunk_size);
+    threads.push_back(std::thread(f, start, end, t));
+  }
+  for (auto& thread : threads) thread.join();
+}
+
 std::pair<std::vector<int>, std::vector<float>> _segment_triangle_intersection(
         float* vertices, int n_vertices, int* tris, int n_faces,
         float* segment_start, float* segment_end, int n_segments)
@@ -87,11 +112,12 @@ class TreeC{
   TreeC() {tree = Tree();};
   ~TreeC();
   TreeC(float* , int , int* , int);
-  std::pair<std::vector<int>, std::vector<float>> _intersections(float*, float*, int);
+  std::pair<std::vector<int>, std::vector<float>> _intersections(float*, float*, int, int n_threads=1);
   bool _any_intersections(float*, float*, int);
-  bool _any_point_inside(float*, int);
-  std::vector<int> _points_inside(float*, int);
-  std::vector<float> _min_sqdist(float*, int);
+  bool _any_point_inside(float*, int, int n_threads=1);
+  std::vector<int> _points_inside(float*, int, int n_threads=1);
+  std::vector<float> _min_sqdist(float*, int, int n_threads=1);
+  void _closest_points(float*, int, float*, int*, float*, int n_threads=1);
 };
 
 TreeC::TreeC(float* vertices, int n_vertices, int* tris, int n_faces) {
@@ -111,6 +137,10 @@ TreeC::TreeC(float* vertices, int n_vertices, int* tris, int n_faces) {
   this->tree.insert(faces(this->m).first, faces(this->m).second, this->m);
   this->tree.build();
   this->tree.accelerate_distance_queries();
+  // The search tree for distance queries is built lazily, do it here so that
+  // it is not built concurrently by the query threads
+  if (n_vertices > 0 && n_faces > 0)
+    this->tree.closest_point(Point(vertices[0], vertices[1], vertices[2]));
 };
 
 TreeC::~TreeC () {
@@ -119,11 +149,14 @@ TreeC::~TreeC () {
 }
 
 std::pair<std::vector<int>, std::vector<float>> TreeC::_intersections(
-        float* segment_start, float* segment_end, int n_segments) {
-  // Output vectors
-  std::vector<int> indices_pairs;
-  std::vector<float> intersect_positions;
-  for (int i=0; i < n_segments; i++){
+        float* segment_start, float* segment_end, int n_segments, int n_threads) {
+  // Output vectors, one per chunk so that the segment order is kept
+  std::vector<std::vector<int>> chunk_pairs(std::max(1, n_threads));
+  std::vector<std::vector<float>> chunk_positions(std::max(1, n_threads));
+  _parallel_chunks(n_segments, n_threads, [&](int start, int end, int chunk) {
+    std::vector<int>& indices_pairs = chunk_pairs[chunk];
+    std::vector<float>& intersect_positions = chunk_positions[chunk];
+    for (int i=start; i < end; i++){
       Segment segment(
         Point(segment_start[3*i], segment_start[3*i + 1], segment_start[3*i + 2]),
         Point(segment_end[3*i], segment_end[3*i + 1], segment_end[3*i + 2])
@@ -145,6 +178,14 @@ std::pair<std::vector<int>, std::vector<float>> TreeC::_intersections(
               for (int j=0; j<3; j++) intersect_positions.push_back((float) s->source()[j]);
           }
       }
+    }
+  });
+  std::vector<int> indices_pairs;
+  std::vector<float> intersect_positions;
+  for (std::size_t c=0; c < chunk_pairs.size(); c++){
+    indices_pairs.insert(indices_pairs.end(), chunk_pairs[c].begin(), chunk_pairs[c].end());
+    intersect_positions.insert(
+      intersect_positions.end(), chunk_positions[c].begin(), chunk_positions[c].end());
   }
   return std::make_pair(indices_pairs, intersect_positions);
 }
@@ -172,37 +213,59 @@ bool TreeC::_any_intersections(
   return false;
 }
 
-bool TreeC::_any_point_inside(float* points, int n_points) {
- Point_inside points_inside(this->tree);
- for (int i=0; i < n_points; i++){
-  // Determine the side and return true if inside!
-  if (points_inside(
-    Point(points[3*i], points[3*i + 1], points[3*i + 2])) ==  CGAL::ON_BOUNDED_SIDE) {
-      return true;
-      break;
-    };
- }
-  return false;
+bool TreeC::_any_point_inside(float* points, int n_points, int n_threads) {
+ std::atomic<bool> found(false);
+ _parallel_chunks(n_points, n_threads, [&](int start, int end, int chunk) {
+  // Side_of_triangle_mesh keeps a random generator, use one per thread
+  Point_inside points_inside(this->tree);
+  for (int i=start; i < end && !found.load(std::memory_order_relaxed); i++){
+   // Determine the side and stop if inside!
+   if (points_inside(
+     Point(points[3*i], points[3*i + 1], points[3*i + 2])) ==  CGAL::ON_BOUNDED_SIDE) {
+       found = true;
+     };
+  }
+ });
+ return found;
 }
 
-std::vector<int> TreeC::_points_inside(float* points, int n_points) {
- Point_inside points_inside(this->tree);
+std::vector<int> TreeC::_points_inside(float* points, int n_points, int n_threads) {
+ std::vector<char> inside(std::max(0, n_points), 0);
+ _parallel_chunks(n_points, n_threads, [&](int start, int end, int chunk) {
+  Point_inside points_inside(this->tree);
+  for (int i=start; i < end; i++){
+   // Determine the side and mark if inside!
+   inside[i] = points_inside(
+     Point(points[3*i], points[3*i + 1], points[3*i + 2])) ==  CGAL::ON_BOUNDED_SIDE;
+  }
+ });
  std::vector<int> indices;
  for (int i=0; i < n_points; i++){
-  // Determine the side and return true if inside!
-  if (points_inside(
-    Point(points[3*i], points[3*i + 1], points[3*i + 2])) ==  CGAL::ON_BOUNDED_SIDE) {
-      indices.push_back(i);
-    };
+  if (inside[i]) indices.push_back(i);
  }
-  return indices;
+ return indices;
 }
 
-std::vector<float> TreeC::_min_sqdist(float* points, int n_points) {
- std::vector<float> dist;
- for (int i=0; i < n_points; i++){
-  // Determine the side and return true if inside!
-  dist.push_back(this->tree.squared_distance(Point(points[3*i], points[3*i + 1], points[3*i + 2])));
- }
-  return dist;
-}
\ No newline at end of file
+std::vector<float> TreeC::_min_sqdist(float* points, int n_points, int n_threads) {
+ std::vector<float> dist(std::max(0, n_points));
+ _parallel_chunks(n_points, n_threads, [&](int start, int end, int chunk) {
+  for (int i=start; i < end; i++){
+   dist[i] = this->tree.squared_distance(Point(points[3*i], points[3*i + 1], points[3*i + 2]));
+  }
+ });
+ return dist;
+}
+
+void TreeC::_closest_points(
+        float* points, int n_points, float* sqdist, int* face_index,
+        float* closest, int n_threads) {
+ _parallel_chunks(n_points, n_threads, [&](int start, int end, int chunk) {
+  for (int i=start; i < end; i++){
+   Point p(points[3*i], points[3*i + 1], points[3*i + 2]);
+   Point_and_primitive_id pp = this->tree.closest_point_and_primitive(p);
+   sqdist[i] = (float) CGAL::squared_distance(p, pp.first);
+   face_index[i] = (int) (std::size_t) pp.second;
+   for (int j=0; j<3; j++) closest[3*i + j] = (float) pp.first[j];
+  }
+ });
+}
@@ -5,6 +5,7 @@
 #include <CGAL/Labeled_mesh_domain_3.h>
 #include <CGAL/make_mesh_3.h>
 #include <CGAL/Image_3.h>
+#include <CGAL/ImageIO.h>
 
 #ifdef CGAL_CONCURRENT_MESH_3
 #include "tbb/task_arena.h"
@@ -13,6 +14,9 @@
 #endif
 
 #include <cstdlib>
+#include <cstring>
+#include <map>
+#include <vector>
 // Domain
 typedef CGAL::Exact_predicates_inexact_constructions_kernel K;
 typedef K::FT FT;
@@ -127,30 +131,18 @@ struct Sizing_field
     };
 };
 
-int _mesh_image_sizing_field(
-  char *fn_image,
-  char *fn_out,
+C3t3_img _make_mesh_sizing_field(
+  const CGAL::Image_3 &image,
   float facet_angle,
   float *facet_size,
   float *facet_distance,
   float cell_radius_edge_ratio,
   float *cell_size,
-  int num_threads,
-  bool do_perturb = false,
-  bool do_exude = false,
-  bool do_lloyd = false
+  bool do_perturb,
+  bool do_exude,
+  bool do_lloyd
 )
 {
-  /// Load image
-  CGAL::Image_3 image;
-  if(!image.read(fn_image)){
-    std::cerr << "Error: Cannot read file " <<  fn_image << std::endl;
-    return EXIT_FAILURE;
-  }
-
-  // Set max number of threads
-  tbb::global_control global_limit(tbb::global_control::max_allowed_parallelism, num_threads);
-
   // Mesh domain
   Mesh_domain_img domain = Mesh_domain_img::create_labeled_image_mesh_domain(image, 1e-10);
 
@@ -208,8 +200,124 @@ int _mesh_image_sizing_field(
   if (do_perturb) CGAL::perturb_mesh_3(c3t3, domain);
   if (do_exude) CGAL::exude_mesh_3(c3t3);
 
+  return c3t3;
+}
+
+int _mesh_image_sizing_field(
+  char *fn_image,
+  char *fn_out,
+  float facet_angle,
+  float *facet_size,
+  float *facet_distance,
+  float cell_radius_edge_ratio,
+  float *cell_size,
+  int num_threads,
+  bool do_perturb = false,
+  bool do_exude = false,
+  bool do_lloyd = false
+)
+{
+  /// Load image
+  CGAL::Image_3 image;
+  if(!image.read(fn_image)){
+    std::cerr << "Error: Cannot read file " <<  fn_image << std::endl;
+    return EXIT_FAILURE;
+  }
+
+  // Set max number of threads
+  tbb::global_control global_limit(tbb::global_control::max_allowed_parallelism, num_threads);
+
+  C3t3_img c3t3 = _make_mesh_sizing_field(
+    image, facet_angle, facet_size, facet_distance,
+    cell_radius_edge_ratio, cell_size,
+    do_perturb, do_exude, do_lloyd
+  );
+
   std::ofstream medit_file(fn_out);
   c3t3.output_to_medit(medit_file);
 
   return EXIT_SUCCESS;
 }
+
+int _mesh_image_sizing_field_array(
+  void *image_data,
+  std::size_t xdim,
+  std::size_t ydim,
+  std::size_t zdim,
+  std::size_t word_size,
+  float vx,
+  float vy,
+  float vz,
+  float facet_angle,
+  float *facet_size,
+  float *facet_distance,
+  float cell_radius_edge_ratio,
+  float *cell_size,
+  int num_threads,
+  bool do_perturb,
+  bool do_exude,
+  bool do_lloyd,
+  std::vector<float> &vertices,
+  std::vector<int> &tetrahedra,
+  std::vector<int> &tags
+)
+{
+  /// Wrap the label image (fortran order, unsigned integers) without going
+  /// through an INR file
+  _image *img = _createImage(
+    xdim, ydim, zdim, 1, vx, vy, vz, word_size, WK_FIXED, SGN_UNSIGNED
+  );
+  if (img == NULL){
+    std::cerr << "Error: Cannot allocate image" << std::endl;
+    return EXIT_FAILURE;
+  }
+  std::memcpy(img->data, image_data, xdim * ydim * zdim * word_size);
+  CGAL::Image_3 image(img);
+
+  // Set max number of threads
+  tbb::global_control global_limit(tbb::global_control::max_allowed_parallelism, num_threads);
+
+  C3t3_img c3t3 = _make_mesh_sizing_field(
+    image, facet_angle, facet_size, facet_distance,
+    cell_radius_edge_ratio, cell_size,
+    do_perturb, do_exude, do_lloyd
+  );
+
+  // Export only the vertices used by tetrahedra in the complex. Node indices
+  // start at 1, as in the medit output
+  std::map<Tr_img::Vertex_handle, int> vertex_index;
+  vertices.clear();
+  tetrahedra.clear();
+  tags.clear();
+  tetrahedra.reserve(4 * c3t3.number_of_cells_in_complex());
+  tags.reserve(c3t3.number_of_cells_in_complex());
+  for (C3t3_img::Cells_in_complex_iterator cit = c3t3.cells_in_complex_begin();
+       cit != c3t3.cells_in_complex_end(); ++cit)
+  {
+    for (int i = 0; i < 4; ++i)
+    {
+      Tr_img::Vertex_handle vh = cit->vertex(i);
+      std::map<Tr_img::Vertex_handle, int>::iterator it = vertex_index.find(vh);
+      int idx;
+      if (it == vertex_index.end())
+      {
+        idx = vertex_index.size() + 1;
+        vertex_index[vh] = idx;
+        const Tr_img::Bare_point p = c3t3.triangulation().geom_traits().construct_point_3_object()(
+          c3t3.triangulation().point(vh)
+        );
+        vertices.push_back(CGAL::to_double(p.x()));
+        vertices.push_back(CGAL::to_double(p.y()));
+        vertices.push_back(CGAL::to_double(p.z()));
+      }
+      else
+      {
+        idx = it->second;
+      }
+      tetrahedra.push_back(idx);
+    }
+    tags.push_back(c3t3.subdomain_index(cit));
+  }
+
+  return EXIT_SUCCESS;
+}
@@ -16,15 +16,18 @@ cdef extern from "_cgal_intersect.cpp" nogil:
         TreeC(float* vertices, int n_vertices, int* tris, int n_faces) except+
         TreeC() except+
         pair[vector[int], vector[float]] _intersections(
-            float* segment_start, float* segment_end, int n_segments)
+            float* segment_start, float* segment_end, int n_segments, int n_threads)
         bool _any_intersections(
             float* segment_start, float* segment_end, int n_segments)
         bool _any_point_inside(
-            float* pts, int n_points)
+            float* pts, int n_points, int n_threads)
         vector[int] _points_inside(
-            float* pts, int n_points)
+            float* pts, int n_points, int n_threads)
         vector[float] _min_sqdist(
-            float* pts, int n_points)
+            float* pts, int n_points, int n_threads)
+        void _closest_points(
+            float* pts, int n_points, float* sqdist, int* face_index,
+            float* closest, int n_threads)
 
 cdef class pyAABBTree:
     cdef TreeC *thisptr
@@ -43,11 +46,13 @@ cdef class pyAABBTree:
         del self.thisptr 
         self.thisptr = new TreeC(&vert[0], len(vertices), &fac[0], len(faces))
 
-    def intersection(self,segment_start, segment_end):
+    def intersection(self,segment_start, segment_end, int n_threads=1):
         cdef np.ndarray[float] ss = np.ascontiguousarray(segment_start, dtype=np.float32).reshape(-1)
         cdef np.ndarray[float] se = np.ascontiguousarray(segment_end, dtype=np.float32).reshape(-1)
         cdef pair[vector[int], vector[float]] out
-        out = self.thisptr._intersections(&ss[0], &se[0], len(segment_start))
+        cdef int n = len(segment_start)
+        with nogil:
+            out = self.thisptr._intersections(&ss[0], &se[0], n, n_threads)
         pairs = np.array(out.first, dtype=int).reshape(-1, 2)
         positions = np.array(out.second, dtype=float).reshape(-1, 3)
         return pairs, positions
@@ -58,23 +63,61 @@ cdef class pyAABBTree:
         out = self.thisptr._any_intersections(&ss[0], &se[0], len(segment_start))
         return out
 
-    def any_point_inside(self, points):
+    def any_point_inside(self, points, int n_threads=1):
         cdef np.ndarray[float] pts = np.ascontiguousarray(points, dtype=np.float32).reshape(-1)
-        out = self.thisptr._any_point_inside(&pts[0], len(points))
+        cdef bool out
+        cdef int n = len(points)
+        with nogil:
+            out = self.thisptr._any_point_inside(&pts[0], n, n_threads)
         return out
     
-    def points_inside(self, points):
+    def points_inside(self, points, int n_threads=1):
         cdef np.ndarray[float] pts = np.ascontiguousarray(points, dtype=np.float32).reshape(-1)
         cdef vector[int] out
-        out = self.thisptr._points_inside(&pts[0], len(points))
+        cdef int n = len(points)
+        with nogil:
+            out = self.thisptr._points_inside(&pts[0], n, n_threads)
         return out
     
-    def min_sqdist(self, points):
+    def min_sqdist(self, points, int n_threads=1):
         cdef np.ndarray[float] pts = np.ascontiguousarray(points, dtype=np.float32).reshape(-1)
         cdef vector[float] out
-        out = self.thisptr._min_sqdist(&pts[0], len(points))
+        cdef int n = len(points)
+        with nogil:
+            out = self.thisptr._min_sqdist(&pts[0], n, n_threads)
         return out
 
+    def closest_point(self, points, int n_threads=1):
+        ''' Closest point on the surface for each point
+
+        Parameters
+        ------------
+        points: (N, 3) array
+            query points
+        n_threads: int (optional)
+            number of threads used for the queries. Default: 1
+
+        Returns
+        ---------
+        sqdist: (N, ) float32 array
+            squared distance to the surface
+        face_index: (N, ) int32 array
+            index of the closest triangle, in the order given in set_data
+        closest: (N, 3) float32 array
+            projection of the points on the surface
+        '''
+        cdef np.ndarray[float] pts = np.ascontiguousarray(points, dtype=np.float32).reshape(-1)
+        cdef int n = len(points)
+        cdef np.ndarray[float] sqdist = np.empty(n, dtype=np.float32)
+        cdef np.ndarray[int] face_index = np.empty(n, dtype=np.int32)
+        cdef np.ndarray[float] closest = np.empty(3 * n, dtype=np.float32)
+        if n == 0:
+            return sqdist, face_index, closest.reshape(-1, 3)
+        with nogil:
+            self.thisptr._closest_points(
+                &pts[0], n, &sqdist[0], &face_index[0], &closest[0], n_threads)
+        return sqdist, face_index, closest.reshape(-1, 3)
+
 
 def segment_triangle_intersection(vertices, faces, segment_start, segment_end):
     ''' Calculates the intersection between a triangular mesh and line segments
@@ -36,6 +36,28 @@ cdef extern from "_mesh_volumes.cpp" nogil:
         bool do_exude,
         bool do_lloyd
     )
+    int _mesh_image_sizing_field_array(
+        void *image_data,
+        size_t xdim,
+        size_t ydim,
+        size_t zdim,
+        size_t word_size,
+        float vx,
+        float vy,
+        float vz,
+        float facet_angle,
+        float *facet_size,
+        float *facet_distance,
+        float cell_radius_edge_ratio,
+        float *cell_size,
+        int num_threads,
+        bool do_perturb,
+        bool do_exude,
+        bool do_lloyd,
+        vector[float] &vertices,
+        vector[int] &tetrahedra,
+        vector[int] &tags
+    )
 
 
 def mesh_image(
@@ -93,3 +115,86 @@ def mesh_image_sizing_field(
     )
 
 
+
+
+def mesh_image_sizing_field_array(
+        image,
+        voxel_dims,
+        facet_angle: float,
+        facet_size,
+        facet_distance,
+        cell_radius_edge_ratio: float,
+        cell_size,
+        num_threads: int,
+        do_perturb: bool = False,
+        do_exude: bool = False,
+        do_lloyd: bool = False,
+    ):
+    """ Meshes a label image passed as an array and returns the tetrahedra
+
+    The image is passed to CGAL in memory and the tetrahedra are returned as
+    arrays, avoiding the INR and medit files. The GIL is released while
+    meshing.
+
+    Returns
+    --------
+    ret: int
+        Return code, 0 on success
+    vertices: (N, 3) ndarray of float
+        Vertex coordinates in voxel_dims-scaled image space
+    tetrahedra: (M, 4) ndarray of int
+        Tetrahedra, node indices start at 1
+    tags: (M,) ndarray of int
+        Subdomain index (label) of each tetrahedron
+    """
+    image = np.asfortranarray(image)
+    if image.dtype not in [np.uint8, np.uint16]:
+        raise ValueError('Image must be of type uint8 or uint16')
+    cdef np.ndarray[float, ndim=3] sf_facet_size = np.array(
+        facet_size, dtype=np.float32, order='F', copy=False
+    )
+    cdef np.ndarray[float, ndim=3] sf_cell_size = np.array(
+        cell_size, dtype=np.float32, order='F', copy=False
+    )
+    cdef np.ndarray[float, ndim=3] sf_facet_distance = np.array(
+        facet_distance, dtype=np.float32, order='F', copy=False
+    )
+    cdef np.ndarray image_buffer = image
+    cdef void *image_ptr = np.PyArray_DATA(image_buffer)
+    cdef size_t xdim = image.shape[0]
+    cdef size_t ydim = image.shape[1]
+    cdef size_t zdim = image.shape[2]
+    cdef size_t word_size = image.itemsize
+    cdef float vx = voxel_dims[0]
+    cdef float vy = voxel_dims[1]
+    cdef float vz = voxel_dims[2]
+    cdef float c_facet_angle = facet_angle
+    cdef float c_cell_radius_edge_ratio = cell_radius_edge_ratio
+    cdef int c_num_threads = num_threads
+    cdef bool c_do_perturb = do_perturb
+    cdef bool c_do_exude = do_exude
+    cdef bool c_do_lloyd = do_lloyd
+    cdef vector[float] vertices
+    cdef vector[int] tetrahedra
+    cdef vector[int] tags
+    cdef int ret
+
+    with nogil:
+        ret = _mesh_image_sizing_field_array(
+            image_ptr, xdim, ydim, zdim, word_size,
+            vx, vy, vz,
+            c_facet_angle,
+            &sf_facet_size[0, 0, 0],
+            &sf_facet_distance[0, 0, 0],
+            c_cell_radius_edge_ratio,
+            &sf_cell_size[0, 0, 0],
+            c_num_threads, c_do_perturb, c_do_exude, c_do_lloyd,
+            vertices, tetrahedra, tags
+        )
+
+    return (
+        ret,
+        np.array(vertices, dtype=float).reshape(-1, 3),
+        np.array(tetrahedra, dtype=int).reshape(-1, 4),
+        np.array(tags, dtype=int),
+    )
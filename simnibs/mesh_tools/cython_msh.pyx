@@ -19,13 +19,17 @@ cdef inline int int_min(int a, int b): return a if a <= b else b
 def interp_grid(np.ndarray[np.int_t, ndim=1] n_voxels,
                 np.ndarray[double, ndim=2] field,
                 np.ndarray[double, ndim=2] nd,
-                np.ndarray[np.int_t, ndim=2] tetrahedra):
+                np.ndarray[np.int_t, ndim=2] tetrahedra,
+                node_data=None):
     # image
     cdef np.ndarray[double, ndim=4] image = np.zeros((n_voxels[0], n_voxels[1],
                                                       n_voxels[2], field.shape[1]), np.double)
 
     cdef np.int_t nr_components = field.shape[1]
-    cdef np.int_t node_data = field.shape[0] == nd.shape[0]
+    # field is defined in the nodes or in the tetrahedra
+    if node_data is None:
+        node_data = field.shape[0] == nd.shape[0]
+    cdef bint is_node_data = node_data
     ## Create bounding box with each tetrahedra
     cdef np.ndarray[double, ndim=3] th_coords = nd[tetrahedra]
 
@@ -39,46 +43,51 @@ def interp_grid(np.ndarray[np.int_t, ndim=1] n_voxels,
     cdef np.ndarray[np.int_t, ndim=2] th_boxes_max = np.rint(
         np.max(th_coords, axis=1)).astype(int)
 
-    cdef np.ndarray[np.int_t, ndim=1] in_roi = np.where(
-        np.all((th_boxes_min <= n_voxels) * (th_boxes_max >= 0), axis=1))[0].astype(int)
+    cdef int[:] in_roi = np.where(
+        np.all((th_boxes_min <= n_voxels) * (th_boxes_max >= 0), axis=1))[0].astype(np.int32)
 
     th_boxes_max = np.minimum(th_boxes_max, np.array(n_voxels) - 1)
     th_boxes_min = np.maximum(th_boxes_min, 0)
     # pre-calculate the inverse of M (this is faster than solving every M[j])
     #invM[in_roi] = np.linalg.inv(M[in_roi])
 
-    cdef int i, j, k, x, y, z, info
-    cdef np.ndarray[double, ndim=1] b = np.zeros((4, ), dtype=float)
+    cdef int i, j, k, x, y, z, info, jj
+    cdef double[4] b
     cdef double xc, yc, zc
     cdef double eps = 1e-5
+    cdef np.int_t n_in_roi = len(in_roi)
 
-    for j in in_roi:
-        for x in range(th_boxes_min[j, 0], th_boxes_max[j, 0] + 1):
-            xc = x - th_coords[j, 3, 0]
-            for y in range(th_boxes_min[j, 1], th_boxes_max[j, 1] + 1):
-                yc = y - th_coords[j, 3, 1]
-                for z in range(th_boxes_min[j, 2], th_boxes_max[j, 2] + 1):
-                    zc = z - th_coords[j, 3, 2]
-                    b[0] = invM[j, 0, 0] * xc + \
-                           invM[j, 0, 1] * yc + \
-                           invM[j, 0, 2] * zc
-                    if b[0] > -eps and b[0] < 1. + eps:
-                        b[1] = invM[j, 1, 0] * xc + \
-                               invM[j, 1, 1] * yc + \
-                               invM[j, 1, 2] * zc
-                        if b[1] > -eps and b[0] + b[1] < 1. + eps:
-                            b[2] = invM[j, 2, 0] * xc + \
-                                   invM[j, 2, 1] * yc + \
-                                   invM[j, 2, 2] * zc
-                            b[3] = 1. - b[0] - b[1] - b[2]
-                            if b[2] > -eps and b[3] > -eps:
-                                for k in range(nr_components):
-                                    if node_data:
-                                        image[x, y, z, k] = 0.
-                                        for i in range(4):
-                                            image[x, y, z, k] += b[i] * field[tetrahedra[j, i], k]
-                                    else:
-                                        image[x, y, z, k] = field[j, k]
+    # The GIL is released so that several slabs of the image can be filled in
+    # parallel threads
+    with nogil:
+        for jj in range(n_in_roi):
+            j = in_roi[jj]
+            for x in range(th_boxes_min[j, 0], th_boxes_max[j, 0] + 1):
+                xc = x - th_coords[j, 3, 0]
+                for y in range(th_boxes_min[j, 1], th_boxes_max[j, 1] + 1):
+                    yc = y - th_coords[j, 3, 1]
+                    for z in range(th_boxes_min[j, 2], th_boxes_max[j, 2] + 1):
+                        zc = z - th_coords[j, 3, 2]
+                        b[0] = invM[j, 0, 0] * xc + \
+                               invM[j, 0, 1] * yc + \
+                               invM[j, 0, 2] * zc
+                        if b[0] > -eps and b[0] < 1. + eps:
+                            b[1] = invM[j, 1, 0] * xc + \
+                                   invM[j, 1, 1] * yc + \
+                                   invM[j, 1, 2] * zc
+                            if b[1] > -eps and b[0] + b[1] < 1. + eps:
+                                b[2] = invM[j, 2, 0] * xc + \
+                                       invM[j, 2, 1] * yc + \
+                                       invM[j, 2, 2] * zc
+                                b[3] = 1. - b[0] - b[1] - b[2]
+                                if b[2] > -eps and b[3] > -eps:
+                                    for k in range(nr_components):
+                                        if is_node_data:
+                                            image[x, y, z, k] = 0.
+                                            for i in range(4):
+                                                image[x, y, z, k] += b[i] * field[tetrahedra[j, i], k]
+                                        else:
+                                            image[x, y, z, k] = field[j, k]
 
     del invM
     del th_boxes_min
@@ -30,7 +30,10 @@ import gc
 import hashlib
 import subprocess
 import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from itertools import combinations
+from collections import OrderedDict
 from typing import Union
 from functools import partial
 from pathlib import Path
@@ -1925,7 +1928,60 @@ class Msh:
         matsimnibs[3, 3] = 1
         return matsimnibs
 
-    def elm2node_matrix(self, elm_indices=None):
+    def elm2node_matrix(self, elm_indices=None, fn_cache=None):
+        ''' Calculates a sparse matrix to tranform from ElementData to NodeData
+        Uses Superconvergent patch recovery for volumetric data. Will not work well for
+        discontinuous fields (like E, if several tissues are used)
+
+        Inside an operator_cache block, the matrices are cached in memory and indexed
+        by a hash of the mesh nodes and elements, so they are computed only once for
+        all fields and meshes with the same geometry (e.g. the results of several
+        simulations in the same head model). The cached matrix is returned, it should
+        not be modified in-place.
+
+        Parameters
+        -----------
+        elm_indices: np.ndarray (optional)
+            Indices of the elements to be considered for interpolation. Default: use all
+            elements
+        fn_cache: str (optional)
+            HDF5 file where the matrices are stored to be reused across sessions.
+            Default: only cache in memory
+
+        Returns
+        ---------
+        M: scipy.sparse.csr
+            Sparse matrix, where M.dot(elm_data) = node_data, elm_data is a vector with
+            element data, and node_data is a vector with node data. Interpolation is done
+            different for tetrahedra, tetrahedra outside faces, and triangles without an
+            associated tetrahedron
+
+        '''
+        if elm_indices is None:
+            key = self._geometry_hash()
+        else:
+            key = self._geometry_hash(np.unique(np.asarray(elm_indices, dtype=np.int64)))
+        key = 'elm2node_' + key
+
+        M = _operator_cache.get(key)
+        if M is None and fn_cache is not None:
+            M = _read_sparse_hdf5(fn_cache, key)
+        if M is None:
+            M = self._calc_elm2node_matrix(elm_indices).tocsr()
+            if fn_cache is not None:
+                _write_sparse_hdf5(fn_cache, key, M)
+        _operator_cache.put(key, M)
+        return M
+
+    def _geometry_hash(self, *arrays):
+        ''' sha1 hash of the nodes and elements of the mesh, and of additional arrays '''
+        h = hashlib.sha1(np.ascontiguousarray(self.nodes.node_coord))
+        h.update(np.ascontiguousarray(self.elm.node_number_list))
+        for a in arrays:
+            h.update(np.ascontiguousarray(a))
+        return h.hexdigest()
+
+    def _calc_elm2node_matrix(self, elm_indices=None):
         ''' Calculates a sparse matrix to tranform from ElementData to NodeData
         Uses Superconvergent patch recovery for volumetric data. Will not work well for
         discontinuous fields (like E, if several tissues are used)
@@ -2011,7 +2067,17 @@ class Msh:
             A[:, 3, 1] = A[:, 1, 3]
             A[:, 3, 2] = A[:, 2, 3]
 
-            Ainv = np.linalg.inv(A)
+            try:
+                Ainv = np.linalg.inv(A)
+                singular = None
+            except np.linalg.LinAlgError:
+                # The mesh probably contains "duplicate" nodes
+                # TODO fix the mesh instead - then this shouldn't be necessary
+                S = np.linalg.svd(A, compute_uv=False)
+                singular = S[:, 1:].sum(1) < 1e-6
+                singular[0] = False
+                Ainv = np.zeros_like(A)
+                Ainv[~singular] = np.linalg.inv(A[~singular])
 
             node_pos = np.hstack(
                 [np.ones((self.nodes.nr, 1)), self.nodes.node_coord])
@@ -2039,6 +2105,28 @@ class Msh:
 
             M = M[1:]
 
+            if singular is not None and np.any(singular[1:]):
+                # use nearest neighbor interpolation at the singular nodes
+                singular = np.where(singular[1:])[0]
+                inner = np.setdiff1d(
+                    np.unique(th_nodes), np.append(points_outside, singular))
+                tree = scipy.spatial.cKDTree(self.nodes.node_coord[inner])
+                di, ix = tree.query(self.nodes.node_coord[singular])
+                warnings.warn(
+                    ("NumPy raised a `LinAlgError` interpolating to certain nodes "
+                     f"(mean coordinate {self.nodes.node_coord[singular].mean(0)}, "
+                     f"standard deviation {self.nodes.node_coord[singular].std(0)}). "
+                     f"Using nearest neighbor interpolation at {len(singular)} "
+                     f"nodes (maximum distance is {di.max():.5f})."
+                    )
+                )
+                rows = np.arange(self.nodes.nr)
+                rows[singular] = inner[ix]
+                R = scipy.sparse.csr_matrix(
+                    (np.ones(self.nodes.nr), (np.arange(self.nodes.nr), rows)),
+                    shape=(self.nodes.nr, self.nodes.nr))
+                M = R.dot(M)
+
             node_vols = np.bincount(
                 th_nodes.reshape(-1),
                 np.repeat(volumes, 4),
@@ -2188,6 +2276,85 @@ class Msh:
 
         return M
 
+    def interpolate_scattered_matrix(self, pos, th_indices=None, element_wise=False):
+        ''' Sparse matrix form of interpolate_scattered with out_fill='nearest'
+
+        For node data (element_wise=False), M.dot(x) is equivalent to
+        NodeData(x).interpolate_scattered(pos, out_fill='nearest', th_indices=th_indices).
+        For element data, it is equivalent to
+        ElementData(x).interpolate_scattered(pos, out_fill='nearest', method='linear',
+        continuous=False, th_indices=th_indices), that is, the superconvergent patch
+        recovery is done separately in each tissue.
+
+        Unlike interp_matrix, the columns always correspond to the nodes (or
+        elements) of this mesh, also if th_indices is set.
+
+        Parameters
+        ----------
+        pos: (N x 3) np.ndarray
+            Positions where interpolation is to be performed
+        th_indices: np.ndarray (optional)
+            Indices of the tetrahedra to be considered in the volume. Default: use all
+            tetrahedra
+        element_wise: bool (optional)
+            Wether to do interpolations one element-wise data. Default=False
+
+        Returns
+        -------
+        M: scipy.sparse.csr
+            Sparse matrix of shape (N, nodes.nr) or (N, elm.nr)
+        '''
+        if len(self.elm.tetrahedra) == 0:
+            raise ValueError("Can only create interpolation matrices for tetrahedral meshes")
+
+        th_with_points, bar = self.find_tetrahedron_with_points(
+            pos, compute_baricentric=True)
+        if th_indices is not None:
+            th_with_points[~np.isin(th_with_points, th_indices)] = -1
+        inside = th_with_points != -1
+        where_inside = np.where(inside)[0]
+
+        def _bar_matrix(points):
+            # baricentric interpolation of node values
+            return scipy.sparse.csr_matrix(
+                (bar[points].reshape(-1),
+                 (np.repeat(points, 4),
+                  self.elm[th_with_points[points]].reshape(-1) - 1)),
+                shape=(len(pos), self.nodes.nr))
+
+        if element_wise:
+            M = scipy.sparse.csr_matrix((len(pos), self.elm.nr))
+            tags = self.elm.tag1[th_with_points[inside] - 1]
+            for t in np.unique(tags):
+                M += _bar_matrix(where_inside[tags == t]).dot(
+                    self.elm2node_matrix(
+                        self.elm.elm_number[(self.elm.tag1 == t) * (self.elm.elm_type == 4)]))
+        else:
+            M = _bar_matrix(where_inside)
+
+        # the points outside get the value of the nearest node / element
+        if np.any(~inside):
+            if th_indices is None:
+                elm_in_volume = self.elm.elm_number
+            else:
+                elm_in_volume = self.elm.elm_number[np.isin(self.elm.elm_number, th_indices)]
+            if element_wise:
+                _, nearest = self.find_closest_element(
+                    pos[~inside], return_index=True, elements_of_interest=elm_in_volume)
+                shape = (len(pos), self.elm.nr)
+            else:
+                nodes_in_volume = np.unique(self.elm[elm_in_volume])
+                nodes_in_volume = nodes_in_volume[nodes_in_volume > 0]
+                tree = scipy.spatial.cKDTree(self.nodes[nodes_in_volume])
+                _, nearest = tree.query(pos[~inside])
+                nearest = nodes_in_volume[nearest]
+                shape = (len(pos), self.nodes.nr)
+            M += scipy.sparse.csr_matrix(
+                (np.ones(np.sum(~inside)), (np.where(~inside)[0], nearest - 1)),
+                shape=shape)
+
+        return M.tocsr()
+
 
     def intersect_segment(self, near, far):
         ''' Finds the triangle (if any) that intersects a line segment
@@ -2226,7 +2393,7 @@ class Msh:
 
 
 
-    def intersect_ray(self, points, directions, AABBTree=None):
+    def intersect_ray(self, points, directions, AABBTree=None, cpus=1):
         ''' Finds the triangle (if any) that intersects with the rays starting
             at points and pointing into directions
 
@@ -2240,6 +2407,9 @@ class Msh:
             direction vectors
         AABBTree: PyAABBTree cython object
             optional precalculated AABBTree
+        cpus: int (optional)
+            Number of threads for the intersection tests. If larger than 1 and
+            AABBTree is not given, an AABBTree is calculated. Default: 1
 
         Returns
         --------
@@ -2260,6 +2430,8 @@ class Msh:
         idx, far = self._intersect_segment_getfarpoint(points, directions)
 
         if len(idx) > 0:
+            if AABBTree is None and cpus > 1:
+                AABBTree = self.get_AABBTree()
             if AABBTree is None:
                 indices, intercpt_pos = cgal.segment_triangle_intersection(
                     self.nodes[:],
@@ -2267,7 +2439,8 @@ class Msh:
                     points[idx, :], far
                 )
             else:
-                indices, intercpt_pos = AABBTree.intersection(points[idx, :], far)
+                indices, intercpt_pos = AABBTree.intersection(
+                    points[idx, :], far, n_threads=cpus)
 
             if len(indices) > 0:
                 indices[:, 1] = self.elm.triangles[indices[:, 1]]
@@ -2349,7 +2522,7 @@ class Msh:
 
         return np.where(has_far)[0], far
 
-    def get_min_distance_on_grid(self, resolution=1.0, AABBTree=None):
+    def get_min_distance_on_grid(self, resolution=1.0, AABBTree=None, cpus=1):
         """Generates a distance field on a grid to the mesh surface
 
         Parameters
@@ -2358,104 +2531,24 @@ class Msh:
             The resolution of the grid, by default 1.0
         AABBTree : pyAABBTree, optional
             A pre-calculated AABBTree, will be generated if None, by default None
+        cpus : int, optional
+            Number of threads for the inside tests, by default 1
 
         Returns
         -------
-        Callable
-            The signed gridded distance field function (inside is negative)
+        SignedDistanceGrid
+            The signed gridded distance field, callable with points (inside is negative)
         pyAABBTree
             The AABBTree used
         """
 
         if AABBTree is None:
             AABBTree = self.get_AABBTree()
-        xmin = self.nodes.node_coord.min(0)
-        xmax = self.nodes.node_coord.max(0)
-        xyz = np.meshgrid(
-            *[
-                np.arange(np.floor(x[0]), x[1], resolution)
-                for x in zip(xmin - 5, xmax + 5)
-            ],
-            indexing="ij",
-        )
-        xyzc = np.array(xyz).reshape(3, -1).T
-
-        M = np.identity(4) * resolution
-        M[3, 3] = 1
-        M[:3, 3] = np.floor(xmin - 5)
-        iM = np.linalg.inv(M)
-
-        grid = np.zeros(xyz[0].shape, dtype="bool")
-
-        np.put(grid, AABBTree.points_inside(xyzc), 1)
-        grid = scipy.ndimage.binary_closing(grid, iterations=3)
-        inside = scipy.ndimage.distance_transform_edt(grid)
-        outside = scipy.ndimage.distance_transform_edt(1 - grid)
-        grid = -inside + outside
-
-        def min_distance_on_grid(x):
-            x_coords, y_coords, z_coords = iM[:3, :3] @ x.T + iM[:3, 3, None]
-            width, height, depth = grid.shape
-
-            # Filter coordinates that are inside the image boundaries
-            inside_image_mask = (
-                    (x_coords >= 0)
-                    & (x_coords < width)
-                    & (y_coords >= 0)
-                    & (y_coords < height)
-                    & (z_coords >= 0)
-                    & (z_coords < depth)
-            )
-
-            mapped_values_inside = scipy.ndimage.map_coordinates(
-                grid,
-                (
-                    x_coords[inside_image_mask],
-                    y_coords[inside_image_mask],
-                    z_coords[inside_image_mask],
-                ),
-                order=1,
-            )
+        distance_grid = SignedDistanceGrid.from_surface(
+            self, resolution, AABBTree, cpus=cpus)
+        return distance_grid, AABBTree
 
-            outside_image_indices = ~inside_image_mask
-            outside_x = x_coords[outside_image_indices]
-            outside_y = y_coords[outside_image_indices]
-            outside_z = z_coords[outside_image_indices]
-
-            x1 = np.clip(np.floor(outside_x), 0, width - 1).astype(np.int_)
-            x2 = np.clip(np.floor(outside_x), 1, width - 2).astype(np.int_)
-            x2[np.floor(outside_x) == 0] = 0
-            x2[np.floor(width - 1) == 0] = width - 1
-            y1 = np.clip(np.floor(outside_y), 0, height - 1).astype(np.int_)
-            y2 = np.clip(np.floor(outside_y), 1, height - 2).astype(np.int_)
-            y2[np.floor(outside_y) == 0] = 0
-            y2[np.floor(height - 1) == 0] = height - 1
-            z1 = np.clip(np.floor(outside_z), 0, depth - 1).astype(np.int_)
-            z2 = np.clip(np.floor(outside_z), 1, depth - 2).astype(np.int_)
-            z2[np.floor(outside_z) == 0] = 0
-            z2[np.floor(depth - 1) == 0] = depth - 1
-
-            dx = np.abs(outside_x - x1)
-            dy = np.abs(outside_y - y1)
-            dz = np.abs(outside_z - z1)
-
-            extrapolation_values = (
-                    grid[x1, y1, z1]
-                    + dx * (grid[x1, y1, z1] - grid[x2, y1, z1])
-                    + dy * (grid[x1, y1, z1] - grid[x1, y2, z1])
-                    + dz * (grid[x1, y1, z1] - grid[x1, y1, z2])
-            )
-
-            # Create an array for all coordinates with extrapolation
-            mapped_values = np.empty_like(x_coords)
-            mapped_values[inside_image_mask] = mapped_values_inside
-            mapped_values[outside_image_indices] = extrapolation_values
-
-            return mapped_values
-
-        return min_distance_on_grid, AABBTree
-
-    def pts_inside_surface(self, pts, AABBTree=None):
+    def pts_inside_surface(self, pts, AABBTree=None, cpus=1):
         """
         Test which points are inside the surface.
 
@@ -2466,6 +2559,8 @@ class Msh:
         pts: (Nx3) np.ndarray
         AABBTree: PyAABBTree cython object
             optional precalculated AABBTree
+        cpus: int (optional)
+            Number of threads for the intersection tests. Default: 1
 
         Returns
         -------
@@ -2476,7 +2571,7 @@ class Msh:
         """
         directions = np.zeros_like(pts)
         directions[:,2] = 1
-        indices, _ = self.intersect_ray(pts, directions, AABBTree)
+        indices, _ = self.intersect_ray(pts, directions, AABBTree, cpus=cpus)
         if len(indices) == 0:
             return []
         else:
@@ -2799,11 +2894,15 @@ class Msh:
 
         percentiles_table = [['Field'] + [f'{p:.1f}%' for p in percentiles]]
         focality_table = [['Field'] + [f'{f:.1f}%' for f in focality_cutoffs]]
+        # node and element weights, shared by all fields
+        weights = {}
         for fn, u in zip(fields, units):
             f = mesh.field[fn]
-            prc = f.get_percentiles(percentiles)
+            if type(f) not in weights:
+                weights[type(f)] = f._weights()
+            prc, focality, _ = f._summary_values(
+                percentiles, focality_cutoffs, 99.9, weights[type(f)])
             percentiles_table.append([fn] + [f'{p:.2e}{u}' for p in prc])
-            focality = f.get_focality(focality_cutoffs, 99.9)
             focality_table.append([fn] + [f'{fv:.2e}{units_mesh}' for fv in focality])
 
         def format_table(table):
@@ -3448,17 +3547,7 @@ class Data(object):
         '''
         data = self.interpolate_to_grid(n_voxels, affine, method=method,
                                         continuous=continuous)
-        if data.dtype == np.bool_ or data.dtype == bool:
-            data = data.astype(np.uint8)
-        if data.dtype == np.float64:
-            data = data.astype(np.float32)
-        img = nibabel.Nifti1Pair(data, affine)
-        img.header.set_xyzt_units(units)
-        if qform is not None:
-            img.set_qform(qform)
-        else:
-            img.set_qform(affine)
-        img.update_header()
+        img = _grid_to_nifti(data, affine, units=units, qform=qform)
         del data
         if fn is not None:
             nibabel.save(img, fn)
@@ -3469,7 +3558,7 @@ class Data(object):
                          out_original=None, tags=None, order=1,
                          method='linear', continuous=False,
                          inverse_warp=None, reference_original=None,
-                         binary=False):
+                         binary=False, cpus=1):
         ''' Interpolates field to a grid and apply non-linear interpolation
 
         We first interpolate to a grid and then apply the transformation in order to
@@ -3509,6 +3598,8 @@ class Data(object):
         reference_original: str
             Name of nifti file with reference in the original space. Used to determine
             the dimensions and affine transformation for the initial griding
+        cpus: int
+            Number of threads used for non-linear transformations. Default: 1
 
         Returns
         --------
@@ -3554,7 +3645,7 @@ class Data(object):
         img = nifti_transform(
             (image, affine),
             warp, reference, out=out, order=order,
-            inverse_warp=inverse_warp, binary=binary)
+            inverse_warp=inverse_warp, binary=binary, cpus=cpus)
 
         del image
         gc.collect()
@@ -3624,18 +3715,8 @@ class Data(object):
             v = np.linalg.norm(self[roi], axis=1)
         else:
             v = np.squeeze(self[roi])
-        s = np.argsort(v)
-        v = v[s]
-        weights = self._weights(roi)[s]
-        weights = np.cumsum(weights)
-        weights /= weights[-1]
-        perc = np.array(percentile, dtype=float) / 100
-        perc = perc.reshape(-1)
-        closest = np.zeros(perc.shape, dtype=int)
-        for i, p in enumerate(perc):
-            closest[i] = np.argmin(np.abs(weights - p))
-
-        return v[closest]
+        prc, _, _ = _weighted_summary(v, self._weights(roi), percentiles=percentile)
+        return prc
 
     def get_focality(self, cuttofs=[50, 70], peak_percentile=99.9):
         ''' Caluclates field focality as the area/volume of the mesh experiencing a field
@@ -3660,21 +3741,31 @@ class Data(object):
             warnings.warn('Calculating focality of fields in meshes with'
                           ' triangles and tetrahedra can give misleading results')
 
-        norm = self._norm()
-        s = np.argsort(norm)
-        norm = norm[s]
-        weights = self._weights()[s]
-        weights_norm = np.cumsum(weights)
-        weights_norm = weights_norm * 100 / weights_norm[-1]
-        peak_value = norm[np.argmin(np.abs(weights_norm - peak_percentile))]
-
-        co = np.array(cuttofs, dtype=float).reshape(-1) / 100
-        focality = np.zeros(co.shape, dtype=int)
-        for i, c in enumerate(co):
-            focality[i] = np.sum(weights[norm > c * peak_value])
-
+        _, focality, _ = _weighted_summary(
+            self._norm(), self._weights(),
+            focality_cutoffs=cuttofs, peak_percentile=peak_percentile)
         return focality
 
+    def _summary_values(self, percentiles=(), focality_cutoffs=(),
+                        peak_percentile=99.9, weights=None):
+        ''' Percentiles (as in get_percentiles), focality (as in get_focality) and
+        mean of the field norm. Sorts the field only once, unless the percentiles
+        of a scalar field with negative values are requested
+
+        Parameters
+        ------------
+        weights: ndarray (optional)
+            Area / volume of each node or element. Default: calculate from the mesh
+        '''
+        if weights is None:
+            weights = self._weights()
+        prc, focality, mean = _weighted_summary(
+            self._norm(), weights, percentiles, focality_cutoffs, peak_percentile)
+        if self.nr_comp == 1 and len(prc) > 0 and np.any(self.value < 0):
+            prc, _, _ = _weighted_summary(
+                self.value.reshape(-1), weights, percentiles)
+        return prc, focality, mean
+
     def summary(self, percentiles=(99.9, 99, 95), focality_cutoffs=(75, 50), units=None):
         ''' Creates a text summary of the field
 
@@ -3706,11 +3797,8 @@ class Data(object):
         if np.all(np.isin([2, 4], self.mesh.elm.elm_type)):
             warnings.warn('Field summary in meshes with'
                           ' triangles and tetrahedra can give misleading results')
-        norm = self._norm()
-        weights = self._weights()
-        mean_norm = np.sum(norm * weights)/np.sum(weights)
-        prc = self.get_percentiles(percentiles)
-        focality = self.get_focality(focality_cutoffs, percentiles[-1])
+        prc, focality, mean_norm = self._summary_values(
+            percentiles, focality_cutoffs, percentiles[-1])
         string = f'Field: {self.field_name}\n'
         string += 'Peak Values:\n'
         n_spaces = len(f'{percentiles[0]:.2e}{units} ') - 5
@@ -3987,6 +4075,12 @@ class ElementData(Data):
         simnibs.NodeData
             Structure with NodeData
 
+        Notes
+        --------
+        The patch recovery is done with the (cached) sparse matrix from
+        Msh.elm2node_matrix, so it is only calculated once for all fields defined in
+        meshes with the same geometry
+
         References
         -------------------
             Zienkiewicz, Olgierd Cecil, and Jian
@@ -4000,98 +4094,13 @@ class ElementData(Data):
         if self.nr != msh.elm.nr:
             raise ValueError("The number of data points in the data "
                              "structure should be equal to the number of elements in the mesh")
-        nd = np.zeros((msh.nodes.nr, self.nr_comp))
 
         if len(msh.elm.tetrahedra) == 0:
             raise ValueError("Can only transform volume data")
 
-        value = np.atleast_2d(self[msh.elm.tetrahedra])
-        if value.shape[0] < value.shape[1]:
-            value = value.T
-
-        # get all nodes used in tetrahedra, creates the NodeData structure
-        uq = np.unique(msh.elm[msh.elm.tetrahedra])
-        nd = NodeData(np.zeros((len(uq), self.nr_comp)), self.field_name, mesh=msh)
-
-        # Get the point in the outside surface
-        points_outside = np.unique(msh.elm.get_outside_faces())
-        outside_points_mask = np.in1d(msh.elm[msh.elm.tetrahedra],
-                                      points_outside).reshape(-1, 4)
-        masked_th_nodes = np.copy(msh.elm[msh.elm.tetrahedra])
-        masked_th_nodes[outside_points_mask] = -1
-
-        # Calculates the quantities needed for the superconvergent patch recovery
-        uq_in, th_nodes = np.unique(masked_th_nodes, return_inverse=True)
-        baricenters = msh.elements_baricenters()[msh.elm.tetrahedra]
-        volumes = msh.elements_volumes_and_areas()[msh.elm.tetrahedra]
-        baricenters = np.hstack([np.ones((baricenters.shape[0], 1)), baricenters])
-
-        A = np.empty((len(uq_in), 4, 4))
-        b = np.empty((len(uq_in), 4, self.nr_comp), self.value.dtype)
-        for i in range(4):
-            for j in range(i, 4):
-                A[:, i, j] = np.bincount(th_nodes.reshape(-1),
-                                         np.repeat(baricenters[:, i], 4) *
-                                         np.repeat(baricenters[:, j], 4))
-        A[:, 1, 0] = A[:, 0, 1]
-        A[:, 2, 0] = A[:, 0, 2]
-        A[:, 3, 0] = A[:, 0, 3]
-        A[:, 2, 1] = A[:, 1, 2]
-        A[:, 3, 1] = A[:, 1, 3]
-        A[:, 3, 2] = A[:, 2, 3]
-
-        for j in range(self.nr_comp):
-            for i in range(4):
-                b[:, i, j] = np.bincount(th_nodes.reshape(-1),
-                                         np.repeat(baricenters[:, i], 4) *
-                                         np.repeat(value[:, j], 4))
-
-        try:
-            a = np.linalg.solve(A[uq_in != -1], b[uq_in != -1])
-        except np.linalg.LinAlgError:
-            # The mesh probably contains "duplicate" nodes
-            # TODO fix the mesh instead - then this shouldn't be necessary
-            used_nodes = uq_in[uq_in != -1]-1
-            the_nodes = msh.nodes.node_coord[used_nodes]
-
-            S = np.linalg.svd(A[uq_in != -1], compute_uv=False)
-            to_interp = S[:, 1:].sum(1) < 1e-6
-            to_compute = ~to_interp
-            tree = scipy.spatial.cKDTree(the_nodes[to_compute])
-            di, ix = tree.query(the_nodes[to_interp])
-
-            warnings.warn(
-                ("NumPy raised a `LinAlgError` interpolating to certain nodes "
-                 f"(mean coordinate {the_nodes[to_interp].mean(0)}, "
-                 f"standard deviation {the_nodes[to_interp].std(0)}). "
-                 f"Using nearest neighbor interpolation at {to_interp.sum()} "
-                 f"nodes (maximum distance is {di.max():.5f})."
-                )
-            )
-
-            a = np.zeros(b[uq_in != -1].shape)
-            a[to_compute] = np.linalg.solve(A[uq_in != -1][to_compute], b[uq_in != -1][to_compute])
-            a[to_interp] = a[to_compute][ix]
-
-        p = np.hstack([np.ones((np.sum(uq_in != -1), 1)), msh.nodes[uq_in[uq_in != -1]]])
-        f = np.einsum('ij, ijk -> ik', p, a)
-        nd[uq_in[uq_in != -1]] = f
-
-        # Assigns the average value to the points in the outside surface
-        masked_th_nodes = np.copy(msh.elm[msh.elm.tetrahedra])
-        masked_th_nodes[~outside_points_mask] = -1
-        uq_out, th_nodes_out = np.unique(masked_th_nodes,
-                                         return_inverse=True)
-        sum_vals = np.empty((len(uq_out), self.nr_comp), self.value.dtype)
-        for j in range(self.nr_comp):
-            sum_vals[:, j] = np.bincount(th_nodes_out.reshape(-1),
-                                         np.repeat(value[:, j], 4) *
-                                         np.repeat(volumes, 4))
-
-        sum_vols = np.bincount(th_nodes_out.reshape(-1), np.repeat(volumes, 4))
-
-        nd[uq_out[uq_out != -1]] = (sum_vals/sum_vols[:, None])[uq_out != -1]
-
+        value = self.value.reshape(self.nr, -1)
+        M = msh.elm2node_matrix(msh.elm.tetrahedra)
+        nd = NodeData(M.dot(value), self.field_name, mesh=msh)
         nd.value = np.squeeze(nd.value)
         return nd
 
@@ -4189,39 +4198,31 @@ class ElementData(Data):
                     # get the 'tag1' from 'msh' for every element in 'th' in 'points' order
                     sorted_tag = msh.elm.tag1[sorted_th - 1]
 
-                    # assign 'msh.elmdata'
-                    msh.elmdata = [ElementData(self.value, mesh=msh)]
+                    value = self.value.reshape(self.nr, -1)
 
                     for t in np.unique(sorted_tag):
                         # find the elements in 'sorted_tag' which equals to 't'
                         is_t = sorted_tag == t
 
-                        # 'msh_tag' contains only the tetrahedra with 'elm_number == th_with_t'
-                        msh_tag = msh.crop_mesh(tags=t)
-
-                        # convert the 'elmdata' to 'nodedata'
-                        nd = msh_tag.elmdata[0].elm_data2node_data()
-
-                        # 'msh_with_t' is sorted because 'elm_number' is always sorted
-                        msh_with_t = msh.elm.elm_number[msh.elm.tag1 == t]
-
                         # use 'is_t' to select the indices of the tetrahedra inside and with 'tag1 == t'
                         where_inside_with_t = where_inside[is_t[arg_inv]]
 
                         # the 'elm_number' of elements in 'msh'. These elements contain points and 'tag1 == t'
                         th_with_t = th_with_points[where_inside_with_t]
 
-                        # get the indices of elements in 'msh_tag'. The 'elm_number' of the same elements are 'th_with_t' in 'msh'. 'idx' starts from 0, not 1.
-                        idx = np.searchsorted(msh_with_t, th_with_t)
+                        if not where_inside_with_t.size:
+                            continue
 
-                        if where_inside_with_t.size and len(nd.value.shape) == 1:
-                            f[where_inside_with_t] = np.einsum('ik, ik -> i',
-                                                               nd[msh_tag.elm[idx+1]],
-                                                               bar[where_inside_with_t])
-                        elif where_inside_with_t.size:
-                            f[where_inside_with_t] = np.einsum('ikj, ik -> ij',
-                                                               nd[msh_tag.elm[idx+1]],
-                                                               bar[where_inside_with_t])
+                        # convert the values in the tetrahedra with 'tag1 == t' to the nodes
+                        # the matrix is cached, and reused by other fields in the same mesh
+                        M = msh.elm2node_matrix(
+                            msh.elm.elm_number[(msh.elm.tag1 == t) * (msh.elm.elm_type == 4)])
+                        nd = M.dot(value)
+
+                        f_t = np.einsum('ikj, ik -> ij',
+                                        nd[msh.elm[th_with_t] - 1],
+                                        bar[where_inside_with_t])
+                        f[where_inside_with_t] = f_t.reshape(f[where_inside_with_t].shape)
 
         else:
             raise ValueError('Invalid interpolation method!')
@@ -4280,69 +4281,12 @@ class ElementData(Data):
             interpolated values. If nr_comp == 1, the last dimension is squeezed out
         '''
 
-        msh = self.mesh
         self._test_msh()
-        if self.nr != msh.elm.nr:
+        if self.nr != self.mesh.elm.nr:
             raise ValueError('Invalid Mesh! Mesh should have the same number of elements'
                              'as the number of data points')
-        if len(n_voxels) != 3:
-            raise ValueError('n_voxels should have length = 3')
-        if affine.shape != (4, 4):
-            raise ValueError('Affine should be a 4x4 matrix')
-        if len(msh.elm.tetrahedra) == 0:
-            raise InvalidMeshError('Mesh has no volume elements')
-
-        msh_th = msh.crop_mesh(elm_type=4)
-        msh_th.elmdata = []
-        msh_th.nodedata = []
-        v = np.atleast_2d(self.value)
-        if v.shape[0] < v.shape[1]:
-            v = v.T
-        v = v[msh.elm.elm_type == 4]
-
-        if method == 'assign':
-            nd = np.hstack([msh_th.nodes.node_coord, np.ones((msh_th.nodes.nr, 1))])
-            inv_affine = np.linalg.inv(affine)
-            nd = inv_affine.dot(nd.T).T[:, :3]
-
-            # initialize image
-            image = np.zeros([n_voxels[0], n_voxels[1], n_voxels[2], self.nr_comp], dtype=float)
-            field = v.astype(float)
-            image = cython_msh.interp_grid(
-                np.array(n_voxels, dtype=int), field, nd.astype(float),
-                (msh_th.elm.node_number_list - 1).astype(int))
-            image = image.astype(self.value.dtype)
-            if self.nr_comp == 1:
-                image = np.squeeze(image, axis=3)
-
-        elif method == 'linear':
-            if continuous:
-                nd = self.elm_data2node_data()
-                image = nd.interpolate_to_grid(n_voxels, affine)
-
-            else:
-                if self.nr_comp != 1:
-                    image = np.zeros(list(n_voxels) + [self.nr_comp], dtype=float)
-                else:
-                    image = np.zeros(list(n_voxels), dtype=float)
-                # Interpolate each tag separetelly
-                tags = np.unique(msh_th.elm.tag1)
-                msh_th.elmdata = [ElementData(v, mesh=msh_th)]
-                for t in tags:
-                    msh_tag = msh_th.crop_mesh(tags=t)
-                    nd = msh_tag.elmdata[0].elm_data2node_data()
-                    image += nd.interpolate_to_grid(n_voxels, affine)
-                    del msh_tag
-                    del nd
-                    gc.collect()
-        else:
-            raise ValueError('Invalid interpolation method!')
-
-        del msh_th
-        del v
-
-        gc.collect()
-        return image
+        return interpolate_fields_to_grid(
+            [self], n_voxels, affine, method=method, continuous=continuous)[0]
 
     def assign_triangle_values(self):
         ''' In-place Assigns field value at triangle as the same as the one of the tetrahedra with
@@ -4786,40 +4730,7 @@ class NodeData(Data):
                 interpolated values. If nr_comp == 1, the last dimension is squeezed out
         '''
 
-        msh = self.mesh
-        self._test_msh()
-        if len(n_voxels) != 3:
-            raise ValueError('n_voxels should have length = 3')
-        if affine.shape != (4, 4):
-            raise ValueError('Affine should be a 4x4 matrix')
-        if len(msh.elm.tetrahedra) == 0:
-            raise InvalidMeshError('Mesh has no volume elements')
-
-        v = np.atleast_2d(self.value)
-        if v.shape[0] < v.shape[1]:
-            v = v.T
-        msh_th = msh.crop_mesh(elm_type=4)
-        inv_affine = np.linalg.inv(affine)
-        nd = np.hstack([msh_th.nodes.node_coord, np.ones((msh_th.nodes.nr, 1))])
-        nd = inv_affine.dot(nd.T).T[:, :3]
-
-        # initialize image
-        image = np.zeros([n_voxels[0], n_voxels[1], n_voxels[2], self.nr_comp], dtype=float)
-        field = v.astype(float)
-        if v.shape[0] != msh_th.nodes.nr:
-            raise ValueError('Number of data points in the structure does not match '
-                             'the number of nodes present in the volume-only mesh')
-        image = cython_msh.interp_grid(
-            np.array(n_voxels, dtype=int), field, nd,
-            msh_th.elm.node_number_list - 1)
-        image = image.astype(self.value.dtype)
-        if self.nr_comp == 1:
-            image = np.squeeze(image, axis=3)
-        del nd
-        del msh_th
-        del field
-        gc.collect()
-        return image
+        return interpolate_fields_to_grid([self], n_voxels, affine)[0]
 
     def interpolate_to_grid_max(self, n_voxels, affine, compartments=None, parallel=True):
         ''' Interpolates the NodeData into a grid.
@@ -5146,6 +5057,296 @@ class NodeData(Data):
             f.write(b'$EndNodeData\n')
 
 
+def _grid_to_nifti(data, affine, units='mm', qform=None):
+    ''' Wraps an interpolated grid into a NifTI image
+
+    Parameters
+    -----------
+    data: ndarray
+        Gridded data
+    affine: 4x4 ndarray
+        Transformation of voxel space into xyz. This sets the sform
+    units: str (optional)
+        Units to be set in the NifTI header. Default: mm
+    qform: 4x4 ndarray (optional)
+        Header qform. Default: set the same as the affine
+
+    Returns
+    ---------
+    img: nibabel.Nifti1Pair
+        Image object with the data
+    '''
+    if data.dtype == np.bool_ or data.dtype == bool:
+        data = data.astype(np.uint8)
+    if data.dtype == np.float64:
+        data = data.astype(np.float32)
+    img = nibabel.Nifti1Pair(data, affine)
+    img.header.set_xyzt_units(units)
+    if qform is not None:
+        img.set_qform(qform)
+    else:
+        img.set_qform(affine)
+    img.update_header()
+    return img
+
+
+def _interp_grid_slabs(n_voxels, field, nd, tetrahedra, node_data,
+                       cpus=1, slab_size=None):
+    ''' Runs cython_msh.interp_grid in slabs along the z axis
+
+    Each slab only visits the tetrahedra intersecting it, so the slabs are
+    independent and can be filled in parallel threads.
+
+    Parameters
+    -----------
+    n_voxels: list or tuple
+        number of voxels in x, y, and z directions
+    field: (N, nr_comp) ndarray
+        Field values in the nodes or in the tetrahedra
+    nd: (N_nodes, 3) ndarray
+        Node coordinates in voxel space
+    tetrahedra: (N_th, 4) ndarray
+        Zero-based node indices of the tetrahedra
+    node_data: bool
+        Whether the field is defined in the nodes
+    cpus: int (optional)
+        Number of threads. Default: 1
+    slab_size: int (optional)
+        Number of slices per slab. Default: whole volume for cpus=1, four
+        slabs per thread otherwise
+
+    Returns
+    --------
+    image: ndarray
+        An (n_voxels[0], n_voxels[1], n_voxels[2], nr_comp) matrix
+    '''
+    n_voxels = np.array(n_voxels, dtype=int)
+    field = np.ascontiguousarray(field, dtype=float)
+    nd = np.ascontiguousarray(nd, dtype=float)
+    tetrahedra = np.asarray(tetrahedra, dtype=int)
+    if slab_size is None:
+        if cpus > 1:
+            slab_size = int(np.ceil(n_voxels[2] / (4 * cpus)))
+        else:
+            slab_size = n_voxels[2]
+    slab_size = max(int(slab_size), 1)
+    if slab_size >= n_voxels[2]:
+        return cython_msh.interp_grid(n_voxels, field, nd, tetrahedra, node_data)
+
+    image = np.zeros(tuple(n_voxels) + (field.shape[1],), dtype=float)
+    th_z = nd[tetrahedra, 2]
+    z_min = np.rint(th_z.min(axis=1)).astype(int)
+    z_max = np.rint(th_z.max(axis=1)).astype(int)
+    del th_z
+
+    def _fill_slab(z0):
+        z1 = min(z0 + slab_size, n_voxels[2])
+        idx = np.where((z_min < z1) * (z_max >= z0))[0]
+        if len(idx) == 0:
+            return
+        nodes_slab, th_slab = np.unique(tetrahedra[idx], return_inverse=True)
+        th_slab = th_slab.reshape(-1, 4)
+        nd_slab = nd[nodes_slab]
+        nd_slab[:, 2] -= z0
+        if node_data:
+            field_slab = field[nodes_slab]
+        else:
+            field_slab = field[idx]
+        image[:, :, z0:z1] = cython_msh.interp_grid(
+            np.array([n_voxels[0], n_voxels[1], z1 - z0], dtype=int),
+            field_slab, nd_slab, th_slab, node_data)
+
+    slabs = range(0, n_voxels[2], slab_size)
+    if cpus > 1:
+        with ThreadPoolExecutor(max_workers=cpus) as executor:
+            list(executor.map(_fill_slab, slabs))
+    else:
+        for z0 in slabs:
+            _fill_slab(z0)
+    return image
+
+
+def interpolate_fields_to_grid(fields, n_voxels, affine, method='linear',
+                               continuous=False, cpus=1, slab_size=None,
+                               batch_size=4):
+    ''' Interpolates several fields defined in the same mesh into a grid
+
+    Gives the same results as calling interpolate_to_grid for each field, but
+    the mesh is cropped only once and the fields are gridded in batches, with
+    one superconvergent patch recovery and one pass over the tetrahedra per
+    batch.
+
+    Parameters
+    -----------
+    fields: list of ElementData and/or NodeData
+        Fields to be interpolated. All fields must be defined in the same mesh
+    n_voxels: list or tuple
+        number of voxels in x, y, and z directions
+    affine: ndarray
+        A 4x4 matrix specifying the transformation from voxels to xyz
+    method: {'assign' or 'linear'} (Optional)
+        If 'assign', gives to each voxel the value of the element that contains
+        it. If linear, first assign fields to nodes, and then perform
+        baricentric interpolatiom. Only for ElementData fields. Default: linear
+    continuous: bool
+        Wether fields is continuous across tissue boundaries. Changes the
+        behaviour of the function only if method == 'linear'. Default: False
+    cpus: int (optional)
+        Number of threads used for gridding. The volume is split into slabs
+        along the z axis which are filled in parallel. Default: 1
+    slab_size: int (optional)
+        Number of slices per slab. Default: whole volume for cpus=1, four
+        slabs per thread otherwise
+    batch_size: int (optional)
+        Maximum number of field components gridded together. Bounds the size
+        of the intermediate float64 volumes. Fields with more components are
+        gridded alone. Default: 4
+
+    Returns
+    --------
+    images: list of ndarray
+        One image for each field, with shape
+        (n_voxels[0], n_voxels[1], n_voxels[2], nr_comp). If nr_comp == 1, the
+        last dimension is squeezed out
+    '''
+    if len(fields) == 0:
+        return []
+    msh = fields[0].mesh
+    for f in fields:
+        f._test_msh()
+        if f.mesh is not msh:
+            raise ValueError('All fields must be defined in the same mesh')
+    if len(n_voxels) != 3:
+        raise ValueError('n_voxels should have length = 3')
+    if affine.shape != (4, 4):
+        raise ValueError('Affine should be a 4x4 matrix')
+    if len(msh.elm.tetrahedra) == 0:
+        raise InvalidMeshError('Mesh has no volume elements')
+    if method not in ['assign', 'linear']:
+        raise ValueError('Invalid interpolation method!')
+
+    # crop the volume mesh only once, and without copying the data in it
+    msh_nodata = copy.copy(msh)
+    msh_nodata.elmdata = []
+    msh_nodata.nodedata = []
+    msh_th = msh_nodata.crop_mesh(elm_type=4)
+    is_th = msh.elm.elm_type == 4
+    th_nodes = np.unique(msh.elm.node_number_list[is_th])
+
+    # sort the fields in groups which can be gridded together
+    # each entry is (field index, values)
+    elm_group = []
+    node_group = []
+    continuous_group = []
+    tag_group = []
+    for i, f in enumerate(fields):
+        v = np.atleast_2d(f.value)
+        if v.shape[0] < v.shape[1]:
+            v = v.T
+        if isinstance(f, NodeData):
+            if v.shape[0] == msh.nodes.nr and v.shape[0] != msh_th.nodes.nr:
+                v = v[th_nodes - 1]
+            if v.shape[0] != msh_th.nodes.nr:
+                raise ValueError('Number of data points in the structure does not match '
+                                 'the number of nodes present in the volume-only mesh')
+            node_group.append((i, v))
+        else:
+            if f.nr != msh.elm.nr:
+                raise ValueError('Invalid Mesh! Mesh should have the same number of elements'
+                                 'as the number of data points')
+            if method == 'assign':
+                elm_group.append((i, v[is_th]))
+            elif continuous:
+                continuous_group.append((i, v))
+            else:
+                tag_group.append((i, v))
+
+    def _voxel_coords(m):
+        nd = np.hstack([m.nodes.node_coord, np.ones((m.nodes.nr, 1))])
+        return np.linalg.inv(affine).dot(nd.T).T[:, :3]
+
+    def _batches(group):
+        batch, nr_comp = [], 0
+        for i, v in group:
+            if len(batch) > 0 and nr_comp + v.shape[1] > batch_size:
+                yield batch
+                batch, nr_comp = [], 0
+            batch.append((i, v))
+            nr_comp += v.shape[1]
+        if len(batch) > 0:
+            yield batch
+
+    def _stack(batch):
+        return np.hstack([np.asarray(v, dtype=float) for _, v in batch])
+
+    def _grid(batch, m, node_data):
+        return _interp_grid_slabs(
+            n_voxels, _stack(batch), _voxel_coords(m),
+            m.elm.node_number_list - 1, node_data,
+            cpus=cpus, slab_size=slab_size)
+
+    images = [None] * len(fields)
+
+    def _split(batch, image):
+        start = 0
+        for i, v in batch:
+            nr_comp = v.shape[1]
+            # copy, so that the batch image can be freed
+            # same output types as the interpolate_to_grid methods
+            if isinstance(fields[i], NodeData) or method == 'assign':
+                dtype = fields[i].value.dtype
+            else:
+                dtype = float
+            img = np.array(image[..., start:start + nr_comp], dtype=dtype)
+            start += nr_comp
+            if fields[i].nr_comp == 1:
+                img = np.squeeze(img, axis=3)
+            images[i] = img
+
+    for batch in _batches(elm_group):
+        _split(batch, _grid(batch, msh_th, False))
+
+    for batch in _batches(continuous_group):
+        # One patch recovery for all fields in the batch
+        ed = ElementData(_stack(batch), mesh=msh_nodata)
+        nd = ed.elm_data2node_data().value.reshape(msh.nodes.nr, -1)
+        nd = nd[th_nodes - 1]
+        del ed
+        start = 0
+        for i, v in batch:
+            node_group.append((i, nd[:, start:start + v.shape[1]]))
+            start += v.shape[1]
+        del nd
+
+    for batch in _batches(node_group):
+        _split(batch, _grid(batch, msh_th, True))
+    del node_group
+
+    if len(tag_group) > 0:
+        # Interpolate each tag separetelly
+        nd_voxel = _voxel_coords(msh)
+        tags = np.unique(msh.elm.tag1[is_th])
+        for batch in _batches(tag_group):
+            stacked = _stack(batch)
+            image = np.zeros(list(n_voxels) + [stacked.shape[1]], dtype=float)
+            for t in tags:
+                th_tag = msh.elm.elm_number[is_th * (msh.elm.tag1 == t)]
+                nd = msh.elm2node_matrix(th_tag).dot(stacked)
+                image += _interp_grid_slabs(
+                    n_voxels, nd, nd_voxel,
+                    msh.elm.node_number_list[th_tag - 1] - 1, True,
+                    cpus=cpus, slab_size=slab_size)
+                del nd
+            del stacked
+            _split(batch, image)
+            del image
+            gc.collect()
+
+    del msh_th
+    gc.collect()
+    return images
+
+
 def read_msh(fn, m=None, skip_data=False):
     ''' Reads a gmsh '.msh' file
 
@@ -6737,6 +6938,409 @@ def _hash_rows(array, mult=1000003, dtype=np.uint64):
     return hash_array
 
 
+class SignedDistanceGrid:
+    ''' Signed distance to a closed surface, sampled on a regular grid
+
+    Inside the surface the distance is negative. Calling the object with an array
+    of points [... x 3] evaluates the distance by trilinear interpolation. Points
+    outside the grid are extrapolated linearly from the closest grid position.
+
+    Parameters
+    ------------
+    values: ndarray
+        Signed distance at the grid points [Nx x Ny x Nz]
+    affine: ndarray
+        4x4 affine from the grid indices to the mesh space. Only scaling and
+        translation are supported
+    mesh_hash: str (optional)
+        Hash of the surface and resolution, used to identify cached grids
+
+    Attributes
+    ------------
+    values: ndarray
+        Signed distance at the grid points [Nx x Ny x Nz]
+    affine: ndarray
+        4x4 affine from the grid indices to the mesh space
+    '''
+    def __init__(self, values, affine, mesh_hash=None):
+        self.values = np.asarray(values, dtype=float)
+        self.affine = np.asarray(affine, dtype=float)
+        self.mesh_hash = mesh_hash
+        if np.any(np.array(self.values.shape) < 2):
+            raise ValueError('The grid needs at least 2 points in each direction')
+        self._spacing = np.diag(self.affine)[:3]
+        self._origin = self.affine[:3, 3]
+
+    @classmethod
+    def from_surface(cls, mesh, resolution=1.0, AABBTree=None, band=3.0, cpus=1):
+        ''' Calculates the signed distance grid of a closed surface
+
+        Only the grid points in a band around the surface are tested for being
+        inside the surface with the AABBTree. The remaining regions are classified
+        with a single point each.
+
+        Parameters
+        ------------
+        mesh: Msh
+            Mesh with a closed triangle surface
+        resolution: float (optional)
+            Grid resolution. Default: 1.0
+        AABBTree: pyAABBTree (optional)
+            A pre-calculated AABBTree of the surface. Default: calculate it
+        band: float (optional)
+            Half width of the band around the surface. Default: 3.0
+        cpus: int (optional)
+            Number of threads for the inside tests. Default: 1
+
+        Returns
+        ---------
+        distance_grid: SignedDistanceGrid
+            The signed distance grid, with a margin of 5 around the surface
+        '''
+        if AABBTree is None:
+            AABBTree = mesh.get_AABBTree()
+        xmin = mesh.nodes.node_coord.min(0)
+        xmax = mesh.nodes.node_coord.max(0)
+        origin = np.floor(xmin - 5)
+        shape = tuple(
+            len(np.arange(np.floor(x[0]), x[1], resolution))
+            for x in zip(xmin - 5, xmax + 5)
+        )
+        affine = np.identity(4) * resolution
+        affine[3, 3] = 1
+        affine[:3, 3] = origin
+
+        def to_coords(indices):
+            return np.array(np.unravel_index(indices, shape)).T * resolution + origin
+
+        # band of grid points around the surface
+        points = _sample_triangles(
+            mesh.nodes[:], mesh.elm[mesh.elm.elm_type == 2, :3] - 1, resolution)
+        points = np.round((points - origin) / resolution).astype(int)
+        points = np.clip(points, 0, np.array(shape) - 1)
+        band_mask = np.zeros(shape, dtype=bool)
+        band_mask[tuple(points.T)] = True
+        band_mask = scipy.ndimage.binary_dilation(
+            band_mask, iterations=max(int(np.ceil(band / resolution)), 1))
+
+        inside = np.zeros(shape, dtype=bool)
+        band_indices = np.flatnonzero(band_mask)
+        np.put(inside, band_indices[AABBTree.points_inside(
+            to_coords(band_indices), n_threads=cpus)], 1)
+
+        # the connected regions outside the band are either inside or outside
+        labels, n_labels = scipy.ndimage.label(~band_mask)
+        if n_labels > 0:
+            labels_flat = labels.reshape(-1)
+            _, first = np.unique(labels_flat, return_index=True)
+            first = first[labels_flat[first] > 0]
+            inside_labels = labels_flat[
+                first[AABBTree.points_inside(to_coords(first), n_threads=cpus)]]
+            inside |= np.isin(labels, inside_labels)
+
+        inside = scipy.ndimage.binary_closing(inside, iterations=3)
+        values = (
+            scipy.ndimage.distance_transform_edt(~inside, sampling=resolution) -
+            scipy.ndimage.distance_transform_edt(inside, sampling=resolution)
+        )
+        return cls(values, affine, mesh._geometry_hash(np.array([resolution, band])))
+
+    def __call__(self, points):
+        points = np.asarray(points, dtype=float)
+        coords = (points.reshape(-1, 3) - self._origin) / self._spacing
+        closest = np.clip(coords, 0, np.array(self.values.shape) - 1)
+        offset = coords - closest
+        distances = scipy.ndimage.map_coordinates(self.values, closest.T, order=1)
+        # points outside the grid are extrapolated linearly from the closest grid
+        # position, with one-sided differences towards the inside of the grid
+        outside = np.any(offset != 0, axis=1)
+        if np.any(outside):
+            offset = offset[outside]
+            inwards = closest[outside][:, None, :] - \
+                np.sign(offset)[:, None, :] * np.eye(3)
+            values = scipy.ndimage.map_coordinates(
+                self.values, inwards.reshape(-1, 3).T, order=1).reshape(-1, 3)
+            distances[outside] += np.sum(
+                np.abs(offset) * (distances[outside, None] - values), axis=1)
+        return distances.reshape(points.shape[:-1])
+
+    def write_hdf5(self, fn):
+        ''' Writes the grid to a HDF5 file, replacing its contents '''
+        with h5py.File(fn, 'w') as f:
+            f.create_dataset('values', data=self.values, compression='gzip')
+            f.create_dataset('affine', data=self.affine)
+            if self.mesh_hash is not None:
+                f.attrs['mesh_hash'] = self.mesh_hash
+
+    @classmethod
+    def read_hdf5(cls, fn, mesh_hash=None):
+        ''' Reads a grid from a HDF5 file
+
+        Returns None if mesh_hash is given and it does not match the stored grid
+        '''
+        with h5py.File(fn, 'r') as f:
+            stored_hash = f.attrs.get('mesh_hash')
+            if mesh_hash is not None and stored_hash != mesh_hash:
+                return None
+            return cls(f['values'][:], f['affine'][:], stored_hash)
+
+
+def get_signed_distance_grid(surface, fn_cache=None, resolution=1.0, band=3.0,
+                             cpus=1):
+    ''' Returns the signed distance grid of a closed surface
+
+    If fn_cache is given, the grid is read from it when it was already computed for
+    the same surface and settings. Otherwise, it is computed and stored there, so
+    that it can be reused e.g. for all coil placements on a subject's skin
+    (see SubjectFiles.skin_distance_grid).
+
+    Parameters
+    ------------
+    surface: Msh
+        Mesh with a closed triangle surface
+    fn_cache: str (optional)
+        HDF5 file where the grid is cached. Default: do not cache
+    resolution: float (optional)
+        Grid resolution. Default: 1.0
+    band: float (optional)
+        Half width of the band around the surface. Default: 3.0
+    cpus: int (optional)
+        Number of threads used to compute the grid. Default: 1
+
+    Returns
+    ---------
+    distance_grid: SignedDistanceGrid
+    '''
+    if fn_cache is not None and os.path.isfile(fn_cache):
+        mesh_hash = surface._geometry_hash(np.array([resolution, band]))
+        try:
+            distance_grid = SignedDistanceGrid.read_hdf5(fn_cache, mesh_hash)
+        except (OSError, KeyError):
+            warnings.warn(f'Could not read signed distance grid from {fn_cache}')
+            distance_grid = None
+        if distance_grid is not None:
+            return distance_grid
+
+    distance_grid = SignedDistanceGrid.from_surface(
+        surface, resolution, band=band, cpus=cpus)
+    if fn_cache is not None:
+        try:
+            distance_grid.write_hdf5(fn_cache)
+        except OSError:
+            warnings.warn(f'Could not write signed distance grid to {fn_cache}')
+    return distance_grid
+
+
+def _sample_triangles(nodes, triangles, spacing):
+    ''' Points on the triangles, at most "spacing" apart from their neighbours '''
+    p = nodes[triangles]
+    edges = np.linalg.norm(p - np.roll(p, 1, axis=1), axis=2).max(axis=1)
+    n_div = np.maximum(np.ceil(edges / spacing).astype(int), 1)
+    samples = [nodes]
+    for n in np.unique(n_div):
+        i, j = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing='ij')
+        inside = i + j <= n
+        bary = np.stack([i[inside], j[inside], n - i[inside] - j[inside]], axis=1) / n
+        samples.append(np.einsum('kv,tvd->tkd', bary, p[n_div == n]).reshape(-1, 3))
+    return np.vstack(samples)
+
+
+def _closest_index(sorted_values, targets):
+    ''' Index of the element closest to each target in a non-decreasing array.
+    Equivalent to np.argmin(np.abs(sorted_values - t)) for each target t '''
+    targets = np.asarray(targets, dtype=float)
+    upper = np.searchsorted(sorted_values, targets)
+    lower = np.clip(upper - 1, 0, len(sorted_values) - 1)
+    upper = np.clip(upper, 0, len(sorted_values) - 1)
+    # argmin returns the first occurrence
+    lower = np.searchsorted(sorted_values, sorted_values[lower])
+    take_upper = (np.abs(sorted_values[upper] - targets) <
+                  np.abs(sorted_values[lower] - targets))
+    return np.where(take_upper, upper, lower)
+
+
+def _weighted_summary(values, weights, percentiles=(), focality_cutoffs=(),
+                      peak_percentile=99.9):
+    ''' Weighted percentiles, focality and mean of a set of values
+
+    The values are sorted once, and all percentiles and cutoffs are found by
+    binary search in the sorted values and cumulative weights
+
+    Parameters
+    ------------
+    values: ndarray
+        Values (e.g. field magnitudes) [N]
+    weights: ndarray
+        Area / volume associated with each value [N]
+    percentiles: ndarray (optional)
+        Percentiles, between 0 and 100. Returns the values with normalized
+        cumulative weight closest to each percentile
+    focality_cutoffs: ndarray (optional)
+        Percentages of the peak value, between 0 and 100
+    peak_percentile: float (optional)
+        Percentile of the peak value used for the focality. Default: 99.9
+
+    Returns
+    ---------
+    prc: ndarray
+        Values at the percentiles
+    focality: ndarray
+        Total weight of the values above each cutoff of the peak value
+    mean: float
+        Weighted mean of the values
+    '''
+    s = np.argsort(values)
+    values = values[s]
+    weights = weights[s]
+    cumulative = np.cumsum(weights)
+
+    perc = np.array(percentiles, dtype=float).reshape(-1) / 100
+    prc = values[_closest_index(cumulative / cumulative[-1], perc)]
+
+    co = np.array(focality_cutoffs, dtype=float).reshape(-1) / 100
+    focality = np.zeros(co.shape, dtype=int)
+    if len(co) > 0:
+        peak_value = values[_closest_index(
+            cumulative * 100 / cumulative[-1], peak_percentile)]
+        first = np.searchsorted(values, co * peak_value, side='right')
+        for i, f in enumerate(first):
+            focality[i] = np.sum(weights[f:])
+
+    mean = np.sum(values * weights) / cumulative[-1]
+    return prc, focality, mean
+
+
+class _OperatorCache:
+    ''' Thread-safe LRU cache for sparse operators calculated from a mesh
+
+    The keys are hashes of the mesh geometry (see Msh._geometry_hash), so that
+    operators are shared between all meshes with the same nodes and elements.
+    The cache only stores operators while it is enabled, see operator_cache.
+
+    Parameters
+    ------------
+    max_bytes: int
+        Maximum memory used by the cached operators. Default: 1 GiB
+    '''
+    def __init__(self, max_bytes=2**30):
+        self.max_bytes = max_bytes
+        self._operators = OrderedDict()
+        self._nbytes = 0
+        self._enabled = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(operator):
+        return sum(getattr(operator, a).nbytes for a in ['data', 'indices', 'indptr'])
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._operators:
+                return None
+            self._operators.move_to_end(key)
+            return self._operators[key]
+
+    def put(self, key, operator):
+        with self._lock:
+            if not self._enabled or key in self._operators:
+                return
+            size = self._size(operator)
+            if size > self.max_bytes:
+                return
+            self._operators[key] = operator
+            self._nbytes += size
+            while self._nbytes > self.max_bytes:
+                _, removed = self._operators.popitem(last=False)
+                self._nbytes -= self._size(removed)
+
+    def enable(self, max_bytes=None):
+        with self._lock:
+            if self._enabled == 0 and max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._enabled += 1
+
+    def disable(self):
+        with self._lock:
+            self._enabled -= 1
+            if self._enabled == 0:
+                self._operators.clear()
+                self._nbytes = 0
+
+    def clear(self):
+        with self._lock:
+            self._operators.clear()
+            self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+
+_operator_cache = _OperatorCache()
+
+
+@contextmanager
+def operator_cache(max_bytes=2**30):
+    ''' Caches mesh operators (e.g. Msh.elm2node_matrix) in memory within a block
+
+    Operators calculated inside the block are reused by all meshes with the same
+    geometry. The cache is freed when the (outermost) block exits.
+
+    Parameters
+    ------------
+    max_bytes: int (optional)
+        Maximum memory used by the cached operators. The least recently used
+        operators are removed when it is exceeded. Only set by the outermost
+        block. Default: 1 GiB
+
+    Example
+    ---------
+    >>> with operator_cache():
+    ...     for m in meshes:
+    ...         m.field['E'].elm_data2node_data()
+    '''
+    _operator_cache.enable(max_bytes)
+    try:
+        yield _operator_cache
+    finally:
+        _operator_cache.disable()
+
+
+def clear_operator_cache():
+    ''' Removes the cached mesh operators (e.g. Msh.elm2node_matrix) from memory '''
+    _operator_cache.clear()
+
+
+def _write_sparse_hdf5(fn, key, M):
+    ''' Writes a sparse CSR matrix to the group "key" of a HDF5 file '''
+    M = M.tocsr()
+    with h5py.File(fn, 'a') as f:
+        if key in f:
+            del f[key]
+        g = f.create_group(key)
+        g.create_dataset('data', data=M.data)
+        g.create_dataset('indices', data=M.indices)
+        g.create_dataset('indptr', data=M.indptr)
+        g.attrs['shape'] = M.shape
+
+
+def _read_sparse_hdf5(fn, key):
+    ''' Reads a sparse CSR matrix from a HDF5 file, returns None if not found
+    or incomplete '''
+    if not os.path.isfile(fn):
+        return None
+    with h5py.File(fn, 'r') as f:
+        if key not in f:
+            return None
+        g = f[key]
+        try:
+            return scipy.sparse.csr_matrix(
+                (g['data'][:], g['indices'][:], g['indptr'][:]),
+                shape=tuple(g.attrs['shape']))
+        except KeyError:
+            return None
+
+
 
 def _fix_indexing_one(index):
     '''Fix indexing to allow getting and setting items with one-idexed arrays'''
@@ -5,6 +5,7 @@ import numpy as np
 import nibabel as nib
 import scipy.sparse
 import scipy.ndimage
+import scipy.stats
 import time
 
 from simnibs.utils import transformations
@@ -56,7 +57,16 @@ def _write_inr(image, voxel_dims, fn_out):
 def _mesh_image(image, voxel_dims, facet_angle,
                 facet_size, facet_distance,
                 cell_radius_edge_ratio, cell_size,
-                num_threads, do_perturb, do_exude, do_lloyd):
+                num_threads, do_perturb, do_exude, do_lloyd,
+                tetrahedra_only=False):
+
+    if tetrahedra_only:
+        return _mesh_image_in_memory(
+            image, voxel_dims, facet_angle,
+            facet_size, facet_distance,
+            cell_radius_edge_ratio, cell_size,
+            num_threads, do_perturb, do_exude, do_lloyd
+        )
 
     with tempfile.TemporaryDirectory() as tmpdir:
         fn_image = os.path.join(tmpdir, 'image.inr')
@@ -88,6 +98,43 @@ def _mesh_image(image, voxel_dims, facet_angle,
     return mesh
 
 
+def _mesh_image_in_memory(image, voxel_dims, facet_angle,
+                          facet_size, facet_distance,
+                          cell_radius_edge_ratio, cell_size,
+                          num_threads, do_perturb, do_exude, do_lloyd):
+    """ Meshes the image passing image and tetrahedra to CGAL in memory
+
+    Only the tetrahedra are returned, and only the nodes used by them
+    """
+    if image.ndim != 3:
+        raise MeshingError('Nifti volume must have 3 dimensions')
+    if len(voxel_dims) != 3:
+        raise MeshingError('Voxel_dims must have 3 dimensions')
+    sizes = []
+    for sf in [facet_size, facet_distance, cell_size]:
+        if type(sf) is not np.ndarray:
+            sf = sf * np.ones_like(image, dtype=np.float32, order='F')
+        sizes.append(sf)
+    facet_size, facet_distance, cell_size = sizes
+
+    ret, vertices, tetrahedra, tags = cgal.mesh_image_sizing_field_array(
+        image, voxel_dims,
+        facet_angle, facet_size, facet_distance,
+        cell_radius_edge_ratio, cell_size,
+        num_threads, do_perturb, do_exude, do_lloyd,
+    )
+    if ret != 0:
+        raise MeshingError('There was an error while meshing the image')
+
+    mesh = mesh_io.Msh(
+        mesh_io.Nodes(vertices),
+        mesh_io.Elements(tetrahedra=tetrahedra)
+    )
+    mesh.elm.tag1 = tags.astype(np.int32)
+    mesh.elm.tag2 = mesh.elm.tag1.copy()
+    return mesh
+
+
 def _decompose_affine(affine):
     ''' Decompose affine transformation into the form A = RZS
     Where R is a rotation matriz, Z a scaling matrix and S a shearing matrix
@@ -135,7 +182,8 @@ def _resample2iso(image, affine, sampling_rate=1, order=1):
 def image2mesh(image, affine, facet_angle=30,
                facet_size=None, facet_distance=None,
                cell_radius_edge_ratio=3, cell_size=None,
-               num_threads=2, do_perturb=False, do_exude=False, do_lloyd=False
+               num_threads=2, do_perturb=False, do_exude=False, do_lloyd=False,
+               tetrahedra_only=False
     ):
     ''' Creates a mesh from a 3D image
 
@@ -188,6 +236,10 @@ def image2mesh(image, affine, facet_angle=30,
         Apply exudation in CGAL after meshing (default = False).
     do_lloyd: bool
         Apply Lloyd optimization in CGAL after meshing (default = False).
+    tetrahedra_only: bool
+        Only return the tetrahedra. The image and the resulting mesh are passed
+        to and from CGAL in memory instead of through temporary files
+        (default = False).
 
     Returns
     ----------
@@ -239,7 +291,8 @@ def image2mesh(image, affine, facet_angle=30,
         image, voxel_dims,
         facet_angle, facet_size, facet_distance,
         cell_radius_edge_ratio, cell_size,
-        num_threads, do_perturb, do_exude, do_lloyd
+        num_threads, do_perturb, do_exude, do_lloyd,
+        tetrahedra_only=tetrahedra_only
     )
     # Rotate nodes
     mesh.nodes.node_coord = rot.dot(mesh.nodes.node_coord.T).T
@@ -472,7 +525,21 @@ def _get_surfaces(faces, tet_faces, adj_tets, tag, nr_nodes):
     return idx_surface_tri, face_node_diff, nneighb, conn_nodes
     
     
-def _get_elm_and_new_tag(tag, adj_tets, nr_diff, return_diffmat = False):
+def _get_adj_diff(tag, adj_tets, idx_elm = None):
+    ''' boolean matrix indicating neighbor tets with different labels
+        (for all tets, or only for the tets in idx_elm) '''
+    if idx_elm is None:
+        adj_labels = tag[adj_tets]
+        adj_labels[adj_tets == -1] = -1
+        return adj_labels - tag.reshape((len(tag),1)) != 0
+    adj_tets = adj_tets[idx_elm]
+    adj_labels = tag[adj_tets]
+    adj_labels[adj_tets == -1] = -1
+    return adj_labels - tag[idx_elm].reshape((-1,1)) != 0
+
+
+def _get_elm_and_new_tag(tag, adj_tets, nr_diff, return_diffmat = False,
+                         idx_subset = None):
     ''' get index of all tets with nr_diff (2, 3 or 4) neigboring tets 
         with different labels and returns also the labels of these neighbor tets
                 
@@ -486,6 +553,9 @@ def _get_elm_and_new_tag(tag, adj_tets, nr_diff, return_diffmat = False):
             required number of neighbors with different labels (2, 3 or 4)
         return_diffmat (optional; Default: False):
             whether to return a boolean matrix indicating neighbors with different labels
+        idx_subset (optional; Default: None):
+            ndarray of tets to consider (standard: all tets); idx_elm is
+            returned as indices into the full tag array
         
         Returns
         -------
@@ -495,6 +565,7 @@ def _get_elm_and_new_tag(tag, adj_tets, nr_diff, return_diffmat = False):
             new tag based on the neighbor labels
         adj_diff (optional):
             n_tetx4 boolean ndarray indicating neighbor tets with different labels
+            (only the rows of idx_subset if given)
               
         Notes
         -------
@@ -505,9 +576,15 @@ def _get_elm_and_new_tag(tag, adj_tets, nr_diff, return_diffmat = False):
         * nr_diff == 2: only tets are returned where the two neighbors 
                         have the same label
     '''
-    adj_labels = tag[adj_tets]
-    adj_labels[adj_tets == -1] = -1
-    adj_diff = adj_labels - tag.reshape((len(tag),1)) != 0
+    if idx_subset is not None:
+        adj_tets = adj_tets[idx_subset]
+        adj_labels = tag[adj_tets]
+        adj_labels[adj_tets == -1] = -1
+        adj_diff = adj_labels - tag[idx_subset].reshape((-1,1)) != 0
+    else:
+        adj_labels = tag[adj_tets]
+        adj_labels[adj_tets == -1] = -1
+        adj_diff = adj_labels - tag.reshape((len(tag),1)) != 0
     
     idx_elm = np.where(np.sum(adj_diff, axis=1) == nr_diff)[0]
     adj_labels = adj_labels[idx_elm]
@@ -528,6 +605,9 @@ def _get_elm_and_new_tag(tag, adj_tets, nr_diff, return_diffmat = False):
         new_tag = adj_labels[idx_relabel,0]
     else:
         raise ValueError('nr_diff has to be 2,3 or 4')
+
+    if idx_subset is not None:
+        idx_elm = idx_subset[idx_elm]
                 
     if return_diffmat:
         return idx_elm, new_tag, adj_diff
@@ -612,11 +692,11 @@ def _get_test_nodes(faces, tet_faces, adj_tets, idx_surface_tri, face_node_diff,
         idx_test_nodes *= nd.value > 0.1
     
     # add nodes that belong to tets of three different regions
-    C = scipy.sparse.lil_matrix((len(nneighb), np.max(tag)+2), dtype=bool)
-    for i in range(4):
-        C[node_number_list[:,i]-1, tag] = True
-    C[:,-1] = False # do not count tags of air tets
-    n_node_tags = np.asarray( C.sum(axis=1) ).reshape(-1)
+    # (unique node-tag pairs, not counting tags of air tets)
+    nr_tags = np.max(tag) + 2
+    node_tags = (node_number_list - 1).astype(np.int64) * nr_tags + tag.reshape(-1,1)
+    node_tags = np.unique(node_tags[tag != -1])
+    n_node_tags = np.bincount(node_tags // nr_tags, minlength=len(nneighb))
     idx_test_nodes += n_node_tags == 3       
     
     # a spike node needs at least 6 neighbor nodes
@@ -1029,6 +1109,95 @@ def _split_spikes(m, splitlist):
     return idx_splittets
 
 
+def _get_relabeling_connectivity(node_number_list, faces, tet_faces, adj_tets, nr_nodes):
+    ''' connectivity used to update tags locally during despiking
+
+        Parameters
+        ----------
+        node_number_list:
+            n_tetx4 ndarray of node indices (1-based)
+        faces:
+            n_facesx3 ndarray of triangle nodes
+        tet_faces:
+            n_tetsx4 ndarray of tet faces (indices into the faces array)
+        adj_tets:
+            n_tetx4 ndarray of tet neighbors (-1 in case of "air")
+        nr_nodes:
+            total number of nodes
+
+        Returns
+        -------
+        node_tets:
+            csr sparse matrix (nr_nodes x n_tets) of the tets of each node
+        node_faces:
+            csr sparse matrix (nr_nodes x n_faces) of the faces of each node
+        face_tets:
+            n_facesx2 ndarray of the two tets sharing each face (-1 in case of "air")
+    '''
+    n_tets = len(node_number_list)
+    n_faces = len(faces)
+    node_tets = scipy.sparse.csr_matrix(
+        (np.ones(4*n_tets, dtype=bool),
+         (node_number_list.reshape(-1) - 1, np.repeat(np.arange(n_tets), 4))),
+        shape=(nr_nodes, n_tets)
+    )
+    node_faces = scipy.sparse.csr_matrix(
+        (np.ones(3*n_faces, dtype=bool),
+         (faces.reshape(-1), np.repeat(np.arange(n_faces), 3))),
+        shape=(nr_nodes, n_faces)
+    )
+    _, idx_first = np.unique(tet_faces.reshape(-1), return_index=True)
+    face_tets = np.stack(
+        (idx_first // 4, adj_tets.reshape(-1)[idx_first]), axis=1
+    )
+    return node_tets, node_faces, face_tets
+
+
+def _get_face_node_diff(nodes, faces, node_faces, face_tets, tag):
+    ''' face_node_diff as returned by _get_surfaces, evaluated only for
+        the given (unique) nodes
+
+        Parameters
+        ----------
+        nodes:
+            sorted ndarray of unique node indices (0-based)
+        faces:
+            n_facesx3 ndarray of triangle nodes
+        node_faces:
+            csr sparse matrix (nr_nodes x n_faces) of the faces of each node
+        face_tets:
+            n_facesx2 ndarray of the two tets sharing each face (-1 in case of "air")
+        tag:
+            n_tetx1 ndarray of tet labels
+
+        Returns
+        -------
+        face_node_diff:
+            ndarray with the difference between the number of surface faces
+            connected to each node and its number of neigbhor surface nodes
+    '''
+    # a face is a surface face when the tets on both sides have different
+    # labels (air: -1)
+    tag_air = np.append(tag, -1)
+    nr_nodes = node_faces.shape[0]
+    node_faces = node_faces[nodes]
+    node_rep = np.repeat(np.arange(len(nodes)), np.diff(node_faces.indptr))
+    idx_faces = node_faces.indices
+    is_surf = tag_air[face_tets[idx_faces, 0]] != tag_air[face_tets[idx_faces, 1]]
+    node_rep = node_rep[is_surf]
+    idx_faces = idx_faces[is_surf]
+    nfaces = np.bincount(node_rep, minlength=len(nodes))
+    # unique neighbor nodes on the surface
+    node_rep = np.repeat(node_rep, 3)
+    neighb = faces[idx_faces].reshape(-1)
+    is_neighb = neighb != nodes[node_rep]
+    pairs = np.unique(
+        node_rep[is_neighb].astype(np.int64) * nr_nodes + neighb[is_neighb]
+    )
+    nneighb = np.bincount(pairs // nr_nodes, minlength=len(nodes))
+    return nfaces - nneighb
+
+
 def update_tag_from_label_img(m, adj_tets, vol, affine, label_GM=None, label_CSF=None):
     ''' relables tags when:
             * tetrahedron more likely belongs to another label, based on the label image
@@ -1103,6 +1272,41 @@ def update_tag_from_label_img(m, adj_tets, vol, affine, label_GM=None, label_CSF
     return m
 
 
+def _get_changed_neighborhood(relabeled, last_run, adj_tets,
+                              node_number_list = None, node_tets = None):
+    ''' returns the tets that need to be tested again by a relabeling step
+
+        Parameters
+        ----------
+        relabeled:
+            dictionary with the tets relabeled in each step
+        last_run:
+            step in which the relabeling step was last run (None: never)
+        adj_tets:
+            n_tetx4 ndarray of tet neighbors (-1 in case of "air")
+        node_number_list (optional):
+            n_tetx4 ndarray of node indices (1-based)
+        node_tets (optional):
+            csr sparse matrix (nr_nodes x n_tets) of the tets of each node. If
+            given, all tets sharing a node with the relabeled tets are returned,
+            otherwise only the relabeled tets and their face neighbors
+
+        Returns
+        -------
+        idx_test:
+            sorted ndarray of tets to test (None: all tets)
+    '''
+    if last_run is None:
+        return None
+    changed = [idx for step, idx in relabeled.items() if step >= last_run]
+    changed = np.unique(np.concatenate(changed))
+    if node_tets is None:
+        idx_test = np.union1d(changed, adj_tets[changed].reshape(-1))
+        return idx_test[idx_test > -1]
+    nodes = np.unique(node_number_list[changed] - 1)
+    return np.unique(node_tets[nodes].indices)
+
+
 def update_tag_from_tet_neighbors(m, faces, tet_faces, adj_tets, nr_iter = 12):
     ''' relables tetrahedra when they are surrounded by
             * 4 neighbors all having a different label
@@ -1115,7 +1319,9 @@ def update_tag_from_tet_neighbors(m, faces, tet_faces, adj_tets, nr_iter = 12):
         
         this is done iteratively (standard: 12 times), whereby (most) tetrahedra 
         that get repeatedly relabled are blocked from further relabeling; 
-        full convergence is not guaranteed
+        full convergence is not guaranteed. After the first iteration, only
+        the neighborhoods of the tetrahedra relabeled in the previous steps
+        are tested again
             
         Parameters
         ----------
@@ -1143,47 +1349,76 @@ def update_tag_from_tet_neighbors(m, faces, tet_faces, adj_tets, nr_iter = 12):
     tag = np.copy(m.elm.tag1) 
     tag_buffer = np.copy(m.elm.tag1)
     relabeling_allowed = np.ones_like(m.elm.tag1, dtype = bool)
-    just_relabelled = np.zeros_like(m.elm.tag1, dtype = bool)
+    node_tets, node_faces, face_tets = _get_relabeling_connectivity(
+        m.elm.node_number_list, faces, tet_faces, adj_tets, m.nodes.nr)
+    # the result of a relabeling step for a tet only changes when a tet in its
+    # neighborhood was relabeled since the step was last run. Thus, keep track
+    # of the tets relabeled in each step and only test their neighborhoods
+    relabeled = {}
+    last_run = {4: None, 3: None, 2: None}
+    step = 0
     for i in range(nr_iter):
-        just_relabelled[:] = False
+        step_first = step
+        just_relabelled = []
         
         # relabel tets with 4 and 3 different neighbors
         for k in (4,3):
-            idx_elm, new_tag = _get_elm_and_new_tag(tag, adj_tets, k)
+            idx_test = _get_changed_neighborhood(relabeled, last_run[k], adj_tets)
+            last_run[k] = step
+            idx_elm, new_tag = _get_elm_and_new_tag(tag, adj_tets, k, idx_subset=idx_test)
             tag[idx_elm] = new_tag
-            just_relabelled[idx_elm] = True
+            just_relabelled.append(idx_elm)
+            relabeled[step] = idx_elm
+            step += 1
             
         # relabel tets with 2 different neighbors
-        idx_elm, new_tag, adj_diff = _get_elm_and_new_tag(tag, adj_tets, 2, return_diffmat = True)
+        # (face_node_diff depends on all tets sharing a node with the tet)
+        idx_test = _get_changed_neighborhood(relabeled, last_run[2], adj_tets,
+                                             m.elm.node_number_list, node_tets)
+        last_run[2] = step
+        idx_elm, new_tag = _get_elm_and_new_tag(tag, adj_tets, 2, idx_subset=idx_test)
         # exclude tets at outer surface and ensure that tets can still be relabeled
         idx = new_tag > -1
-        idx *= np.in1d( idx_elm, np.where(relabeling_allowed)[0] )
+        idx *= relabeling_allowed[idx_elm]
         idx_elm = idx_elm[idx]
         new_tag = new_tag[idx]
         # get the 2 nodes that are shared by the two tet faces facing the 
         # different neighbor tets 
+        adj_diff = _get_adj_diff(tag, adj_tets, idx_elm)
         faces_elm = tet_faces[idx_elm]
-        faces_elm = faces_elm[adj_diff[idx_elm]].reshape((-1,2))
+        faces_elm = faces_elm[adj_diff].reshape((-1,2))
         facenodes_elm = np.sort(faces[faces_elm].reshape((-1,6)))
         facenodes_elm = facenodes_elm[:,:5][np.diff(facenodes_elm) == 0].reshape((-1,2))
         # test whether these nodes are part of a surface defect
         # (note: get_elm_and_new_tag ensure only tets with diff neighbors that 
         #  have the same label --> face_node_diff reveals defect, not T-junction)
-        idx_surface_tri, face_node_diff = _get_surfaces(faces, tet_faces, adj_tets, tag, m.nodes.nr)[:2]
+        test_nodes, facenodes_elm = np.unique(facenodes_elm, return_inverse=True)
+        face_node_diff = _get_face_node_diff(test_nodes, faces, node_faces, face_tets, tag)
+        facenodes_elm = facenodes_elm.reshape((-1,2))
         idx = np.max(face_node_diff[facenodes_elm],axis=1)>0 # face_node_diff > 0 indicates a surface defect
         idx_elm = idx_elm[idx]
         new_tag = new_tag[idx]
         tag[idx_elm] = new_tag
-    
+        relabeled[step] = idx_elm
+        step += 1
+        
+        # tets relabeled in this iteration
+        idx_it = np.unique(np.concatenate(
+            [relabeled[j] for j in range(step_first, step)]))
         if i > 2:
             # stop flip-flopping between the orginal and a second label
-            idx = (tag == m.elm.tag1) * (tag != tag_buffer)
-            relabeling_allowed[idx] = False
+            idx = (tag[idx_it] == m.elm.tag1[idx_it]) * (tag[idx_it] != tag_buffer[idx_it])
+            relabeling_allowed[idx_it[idx]] = False
             # prevent that relabeling tets with two faces converts them to back to tets with 3 or 4 faces
-            idx = (tag == tag_buffer) * just_relabelled
-            relabeling_allowed[idx] = False
-        logger.info('     It. ' + str(i) + ': relabled ' + str(np.sum(tag_buffer != tag)) + ' tets')
-        tag_buffer[:] = tag
+            just_relabelled = np.concatenate(just_relabelled)
+            idx = tag[just_relabelled] == tag_buffer[just_relabelled]
+            relabeling_allowed[just_relabelled[idx]] = False
+        logger.info('     It. ' + str(i) + ': relabled ' + str(np.sum(tag_buffer[idx_it] != tag[idx_it])) + ' tets')
+        tag_buffer[idx_it] = tag[idx_it]
+        # steps that all relabeling steps have seen are not needed anymore
+        for j in list(relabeled):
+            if j < min(last_run.values()):
+                del relabeled[j]
     
     logger.info('   Relabeled ' + str(np.sum(m.elm.tag1 != tag)) + ' tets')    
     m.elm.tag1 = tag
@@ -1418,6 +1653,7 @@ def _run_mmg(m, repeats=2, mmg_noinsert=True, sizing_field=None, affine=None):
         Mesh structure.
     """
     logger.info('Improving Mesh Quality')
+    start = time.time()
     with tempfile.NamedTemporaryFile(suffix=".msh", delete=False) as tmpfile:
         tmp_in = tmpfile.name
     with tempfile.NamedTemporaryFile(suffix=".msh", delete=False) as tmpfile:
@@ -1454,6 +1690,7 @@ def _run_mmg(m, repeats=2, mmg_noinsert=True, sizing_field=None, affine=None):
         m = m.crop_mesh(elm_type=[2, 4])
 
         logger.info(f'Tetraedras after remeshing run {i + 1}: {len(m.elm.tetrahedra)}')
+        start = _log_substep_time(f'run mmg (run {i + 1})', start)
 
     # remove tmp-files
     if os.path.exists(tmp_in):
@@ -1463,6 +1700,13 @@ def _run_mmg(m, repeats=2, mmg_noinsert=True, sizing_field=None, affine=None):
     return m
     
 
+def _log_substep_time(name, start):
+    """ Logs the time since start for a meshing step and returns the current time """
+    now = time.time()
+    logger.info(f'Time to {name}: ' + format_time(now - start))
+    return now
+
+
 def create_mesh(label_img, affine,
                 elem_sizes={"standard": {"range": [1, 5], "slope": 1.0}},
                 smooth_size_field=2,
@@ -1658,6 +1902,7 @@ def create_mesh(label_img, affine,
         do_perturb=optimize,
         do_exude=optimize,
         do_lloyd=optimize,
+        tetrahedra_only=True,
     )
 
     del size_field
@@ -1670,13 +1915,16 @@ def create_mesh(label_img, affine,
 
     # separate out tetrahedron (will reconstruct surfaces later)
     start = time.time()
+    step_start = start
     m = m.crop_mesh(elm_type=4)
 
     # assign the right labels to the mesh as CGAL modifies them
     m = _fix_labels(m, label_img)
+    step_start = _log_substep_time('fix labels', step_start)
 
     # relabel groups of microscopic tets to a common tag, so that mmg fixes them
     m = _relabel_microtets(m)
+    step_start = _log_substep_time('relabel micro-tets', step_start)
 
     if debug:
         mesh_io.write_msh(m, os.path.join(debug_path, 'before_despike.msh'))
@@ -1684,6 +1932,7 @@ def create_mesh(label_img, affine,
     # remove spikes from mesh
     if remove_spikes:
         m = _remove_spikes(m, label_img, affine, label_GM=2, label_CSF=3)
+        step_start = _log_substep_time('remove spikes', step_start)
         
     # Remove cream mask (optional)
     if apply_cream:
@@ -1699,11 +1948,13 @@ def create_mesh(label_img, affine,
     logger.info('Reconstructing Surfaces')
     m.fix_th_node_ordering()
     m.reconstruct_unique_surface(hierarchy=hierarchy, add_outer_as=skin_tag)
+    step_start = _log_substep_time('reconstruct surfaces', step_start)
 
     if debug:
         mesh_io.write_msh(m, os.path.join(debug_path, 'before_smooth.msh'))
 
     m = _run_mmg(m, 1, mmg_noinsert)
+    step_start = time.time()
 
     # smooth surfaces
     if smooth_steps > 0:
@@ -1713,6 +1964,7 @@ def create_mesh(label_img, affine,
     if skin_care > 0:
         logger.info('Extra Skin Care')
         m.smooth_surfaces(skin_care, step_size=0.3, tags=skin_tag, max_gamma=10)
+    step_start = _log_substep_time('smooth surfaces', step_start)
 
     if debug:
         mesh_io.write_msh(m, os.path.join(debug_path, 'before_mmg.msh'), mmg_fix=True)
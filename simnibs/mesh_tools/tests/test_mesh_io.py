@@ -958,6 +958,44 @@ class TestMsh:
         region = R_node > 86
         assert np.allclose(M.dot(x_elms)[region], x_node[region], atol=3)
 
+    def test_elm2node_matrix_cache(self, sphere3_msh):
+        m = sphere3_msh.crop_mesh(elm_type=4)
+        # not cached outside an operator_cache block
+        assert m.elm2node_matrix() is not m.elm2node_matrix()
+        with mesh_io.operator_cache() as cache:
+            M = m.elm2node_matrix()
+            assert m.elm2node_matrix() is M
+            assert copy.deepcopy(m).elm2node_matrix() is M
+            assert m.elm2node_matrix(m.elm.tetrahedra) is not M
+            m2 = copy.deepcopy(m)
+            m2.nodes.node_coord[0] += 1
+            assert m2.elm2node_matrix() is not M
+            assert cache.nbytes > 0
+        assert cache.nbytes == 0
+        assert m.elm2node_matrix() is not M
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fn = os.path.join(tmpdir, 'operators.hdf5')
+            m.elm2node_matrix(fn_cache=fn)
+            M_disk = m.elm2node_matrix(fn_cache=fn)
+            assert np.allclose(M_disk.toarray(), M.toarray())
+
+    def test_operator_cache_max_bytes(self, sphere3_msh):
+        m = sphere3_msh.crop_mesh(elm_type=4)
+        M = m.elm2node_matrix()
+        size = M.data.nbytes + M.indices.nbytes + M.indptr.nbytes
+        with mesh_io.operator_cache(max_bytes=int(1.5 * size)) as cache:
+            M = m.elm2node_matrix()
+            assert m.elm2node_matrix() is M
+            m2 = copy.deepcopy(m)
+            m2.nodes.node_coord[0] += 1
+            m2.elm2node_matrix()
+            # the least recently used operator was removed
+            assert cache.nbytes <= 1.5 * size
+            assert m.elm2node_matrix() is not M
+        with mesh_io.operator_cache(max_bytes=size - 1) as cache:
+            m.elm2node_matrix()
+            assert cache.nbytes == 0
 
     def test_interp_matrix(self, sphere3_msh):
         m = sphere3_msh.crop_mesh(elm_type=4)
@@ -1010,6 +1048,27 @@ class TestMsh:
             x = m.nodes.node_coord[:, 0]
         assert np.allclose(M.dot(x), interp_points[:, 0], atol=1, rtol=1e-1)
 
+    @pytest.mark.parametrize("element_wise", [False, True])
+    def test_interpolate_scattered_matrix(self, element_wise, sphere3_msh):
+        m = sphere3_msh.crop_mesh(elm_type=4)
+        m_out = sphere3_msh.crop_mesh(1005)
+        interp_points = np.vstack([
+            m_out.elements_baricenters().value / 95. * 50.,
+            m_out.elements_baricenters().value / 95. * 87.5])
+        th_indices = m.elm.elm_number[np.isin(m.elm.tag1, [3, 4])]
+        M = m.interpolate_scattered_matrix(
+            interp_points, th_indices=th_indices, element_wise=element_wise)
+        if element_wise:
+            data = m.elements_baricenters()
+            kwargs = {'method': 'linear', 'continuous': False}
+        else:
+            data = mesh_io.NodeData(m.nodes.node_coord, mesh=m)
+            kwargs = {}
+        assert M.shape[1] == data.nr
+        interp = data.interpolate_scattered(
+            interp_points, out_fill='nearest', th_indices=th_indices, **kwargs)
+        assert np.allclose(M.dot(data.value), interp)
+
     def test_find_shared_nodes(self, sphere3_msh):
         shared_nodes = sphere3_msh.find_shared_nodes([3, 4])
         surf_nodes = np.unique(sphere3_msh.elm[sphere3_msh.elm.tag1==1003, :3])
@@ -1270,6 +1329,31 @@ class TestData:
             mesh=m)
         field.summary(units='A.u')
 
+    def test_weighted_summary(self):
+        rng = np.random.default_rng(0)
+        values = rng.integers(0, 10, 200).astype(float)
+        weights = rng.random(200)
+        weights[:20] = 0
+        prc, foc, mean = mesh_io._weighted_summary(
+            values, weights, [99.9, 95, 50, 0], [75, 50], 99)
+        s = np.argsort(values)
+        cumulative = np.cumsum(weights[s]) / np.sum(weights)
+        closest = [np.argmin(np.abs(cumulative - p)) for p in [.999, .95, .5, 0]]
+        assert np.all(prc == values[s][closest])
+        peak = values[s][np.argmin(np.abs(cumulative * 100 - 99))]
+        assert np.allclose(foc, [int(np.sum(weights[values > c * peak])) for c in [.75, .5]])
+        assert np.isclose(mean, np.average(values, weights=weights))
+
+    def test_summary_values_signed(self, sphere3_msh):
+        m = sphere3_msh.crop_mesh(elm_type=4)
+        field = mesh_io.ElementData(
+            np.random.rand(m.elm.nr) - .8,
+            mesh=m)
+        prc, foc, mean = field._summary_values([99, 50], [50], 99.9)
+        assert np.allclose(prc, field.get_percentiles([99, 50]))
+        assert np.allclose(foc, field.get_focality([50], 99.9))
+        assert np.isclose(mean, field.mean_field_norm())
+
 
 
 class TestElmData:
@@ -2021,6 +2105,46 @@ class TestNodeRasterization:
         assert(np.all(l!=lp))
         assert(np.allclose(p,pp))
 
+    @pytest.mark.parametrize('method', ['assign', 'linear'])
+    @pytest.mark.parametrize('continuous', [False, True])
+    @pytest.mark.parametrize('batch_size', [1, 4])
+    def test_interpolate_fields_to_grid(self, sphere3_msh, method, continuous,
+                                        batch_size):
+        # reference images computed with interpolate_to_grid before it used
+        # interpolate_fields_to_grid
+        reference = np.load(os.path.join(
+            SIMNIBSDIR, '_internal_resources', 'testing_files',
+            'sphere3_grid_reference.npz'))
+        if method == 'assign':
+            names = ['assign_0', 'assign_1', 'node_2']
+        elif continuous:
+            names = ['continuous_0', 'continuous_1', 'node_2']
+        else:
+            names = ['linear_0', 'linear_1', 'node_2']
+        b = sphere3_msh.elements_baricenters().value
+        fields = [
+            mesh_io.ElementData(b, mesh=sphere3_msh),
+            mesh_io.ElementData(b[:, 0], mesh=sphere3_msh),
+            mesh_io.NodeData(sphere3_msh.nodes.node_coord[:, 1], mesh=sphere3_msh),
+        ]
+        n = (20, 20, 8)
+        affine = np.array([[5, 0, 0, -50],
+                           [0, 5, 0, -50],
+                           [0, 0, 5, -20],
+                           [0, 0, 0, 1]], dtype=float)
+        images = mesh_io.interpolate_fields_to_grid(
+            fields, n, affine, method=method, continuous=continuous,
+            batch_size=batch_size)
+        for name, im in zip(names, images):
+            assert im.dtype == reference[name].dtype
+            assert np.allclose(im, reference[name], rtol=1e-10, atol=1e-10)
+
+        images_slabs = mesh_io.interpolate_fields_to_grid(
+            fields, n, affine, method=method, continuous=continuous,
+            cpus=2, slab_size=3, batch_size=batch_size)
+        for name, im in zip(names, images_slabs):
+            assert np.allclose(im, reference[name], rtol=1e-10, atol=1e-10)
+
 class TestAABBTree:
     def test_AABBTree(self, sphere3_msh):
         tree = sphere3_msh.get_AABBTree()
@@ -2031,3 +2155,80 @@ class TestAABBTree:
         assert(tree.any_point_inside(np.array((50,30,25))==False))
         # tree.__del__()
         del tree
+
+    def test_AABBTree_threads(self, sphere3_msh):
+        tree = sphere3_msh.get_AABBTree()
+        rng = np.random.default_rng(0)
+        points = rng.uniform(-100, 100, (1000, 3))
+        start = points * 0.5
+        assert tree.points_inside(points, n_threads=4) == tree.points_inside(points)
+        assert np.allclose(
+            tree.min_sqdist(points, n_threads=4), tree.min_sqdist(points))
+        assert tree.any_point_inside(points, n_threads=4)
+        assert not tree.any_point_inside(
+            points[np.linalg.norm(points, axis=1) > 100], n_threads=4)
+        pairs, positions = tree.intersection(start, points)
+        pairs_t, positions_t = tree.intersection(start, points, n_threads=4)
+        assert np.all(pairs == pairs_t)
+        assert np.allclose(positions, positions_t)
+
+    def test_closest_point(self, sphere3_msh):
+        tree = sphere3_msh.get_AABBTree()
+        surf = sphere3_msh.crop_mesh(elm_type=2)
+        rng = np.random.default_rng(0)
+        points = rng.uniform(-100, 100, (500, 3))
+        sqdist, face_index, closest = tree.closest_point(points, n_threads=3)
+        assert np.allclose(sqdist, tree.min_sqdist(points), rtol=1e-4)
+        assert np.allclose(
+            np.sum((points - closest) ** 2, axis=1), sqdist, rtol=1e-3)
+        # the projection lies in the plane of the closest triangle
+        tri = surf.nodes[surf.elm[face_index + 1, :3]]
+        normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+        normals /= np.linalg.norm(normals, axis=1)[:, None]
+        assert np.allclose(
+            np.sum((closest - tri[:, 0]) * normals, axis=1), 0, atol=1e-3)
+
+
+class _SphereTree:
+    ''' Stands in for the AABBTree of a sphere centered in the origin '''
+    def __init__(self, radius):
+        self.radius = radius
+
+    def points_inside(self, points, n_threads=1):
+        return np.where(np.linalg.norm(points, axis=1) < self.radius)[0]
+
+
+class TestSignedDistanceGrid:
+    @pytest.fixture
+    def sphere_surf(self, sphere3_msh):
+        surf = sphere3_msh.crop_mesh(1005)
+        radius = np.mean(np.linalg.norm(surf.nodes.node_coord, axis=1))
+        return surf, radius
+
+    def test_from_surface(self, sphere_surf):
+        surf, radius = sphere_surf
+        grid = mesh_io.SignedDistanceGrid.from_surface(
+            surf, resolution=2., AABBTree=_SphereTree(radius))
+        rng = np.random.default_rng(0)
+        points = rng.uniform(-90, 90, (1000, 3))
+        d = grid(points)
+        assert d.shape == (1000,)
+        assert np.allclose(d, np.linalg.norm(points, axis=1) - radius, atol=3)
+        assert grid(points.reshape(10, 100, 3)).shape == (10, 100)
+        # outside of the grid
+        far = np.array([[200., 0., 0.], [0., -300., 0.]])
+        assert np.allclose(grid(far), np.linalg.norm(far, axis=1) - radius, atol=3)
+
+    def test_get_signed_distance_grid_cache(self, sphere_surf, tmp_path):
+        surf, radius = sphere_surf
+        surf = copy.deepcopy(surf)
+        surf.get_AABBTree = lambda: _SphereTree(radius)
+        fn = str(tmp_path / 'grid.hdf5')
+        grid = mesh_io.get_signed_distance_grid(surf, fn, resolution=3.)
+        assert os.path.isfile(fn)
+        surf.get_AABBTree = None
+        cached = mesh_io.get_signed_distance_grid(surf, fn, resolution=3.)
+        assert cached.mesh_hash == grid.mesh_hash
+        assert np.allclose(cached.values, grid.values)
+        assert np.allclose(cached.affine, grid.affine)
+        assert mesh_io.SignedDistanceGrid.read_hdf5(fn, 'other') is None
@@ -194,6 +194,21 @@ class TestImage2mesh():
         assert np.isclose(vol_2, 1e3, rtol=1e-1)
         assert np.isclose(vol_1, (30 * 20 * 10) - 1e3, rtol=1e-1)
 
+    def test_tetrahedra_only(self, labeled_image):
+        affine = np.eye(4)
+        affine[:3, 3] = -25
+        mesh = meshing.image2mesh(
+            labeled_image, affine, facet_distance=0.5, facet_size=5, cell_size=5,
+            tetrahedra_only=True
+        )
+        assert np.all(mesh.elm.elm_type == 4)
+        assert np.all(np.isin(np.arange(1, mesh.nodes.nr + 1), mesh.elm[:]))
+        assert np.allclose(np.min(mesh.nodes[:], axis=0), [9.5-25, 14.5-25, 19.5-25], rtol=1e-2)
+        assert np.allclose(np.max(mesh.nodes[:], axis=0), [39.5-25, 34.5-25, 29.5-25], rtol=1e-2)
+        vol_1, vol_2 = volumes(mesh)
+        assert np.isclose(vol_2, 1e3, rtol=1e-1)
+        assert np.isclose(vol_1, (30 * 20 * 10) - 1e3, rtol=1e-1)
+
     def test_diagonal_with_optimization(self, labeled_image):
         affine = np.eye(4)
         mesh = meshing.image2mesh(
@@ -398,6 +413,19 @@ class TestRelabelSpikes:
         assert np.all(mesh.elm.tag1 == sphere3_th.elm.tag1)
         assert np.all(mesh.elm.tag2 == sphere3_th.elm.tag2)
 
+    def test_face_node_diff(self, spikyblob):
+        m = spikyblob
+        faces, tet_faces, adj_tets = m.elm._get_tet_faces_and_adjacent_tets()
+        face_node_diff = meshing._get_surfaces(
+            faces, tet_faces, adj_tets, m.elm.tag1, m.nodes.nr)[1]
+        _, node_faces, face_tets = meshing._get_relabeling_connectivity(
+            m.elm.node_number_list, faces, tet_faces, adj_tets, m.nodes.nr)
+        nodes = np.arange(0, m.nodes.nr, 3)
+        assert np.all(
+            meshing._get_face_node_diff(nodes, faces, node_faces, face_tets, m.elm.tag1) ==
+            face_node_diff[nodes]
+        )
+
     def test_despikeblob(self, spikyblob):
         elmdata = spikyblob.elmdata[0]
         assert (elmdata.field_name == 'despiked')
@@ -26,6 +26,7 @@ import time
 
 from . import _cat_c_utils
 from .marching_cube import marching_cube
+from .surface_operators import SurfaceOperators, vertex_face_incidence, csr2padded
 from ..mesh_tools import mesh_io
 from ..utils import file_finder
 from ..utils.simnibs_logger import logger
@@ -95,7 +96,7 @@ def expandCS(vertices_org, faces, mm2move_total, ensure_distance=0.2, nsteps=5,
 
     vertices = vertices_org.copy() # prevent modification of input "vertices"
     move = np.ones(len(vertices), dtype=bool)
-    v2f = verts2faces(vertices, faces)
+    surf_ops = SurfaceOperators(faces, len(vertices))
 
     edges1 = vertices[faces[:, 0]] - vertices[faces[:, 1]]
     edges2 = vertices[faces[:, 0]] - vertices[faces[:, 2]]
@@ -156,7 +157,7 @@ def expandCS(vertices_org, faces, mm2move_total, ensure_distance=0.2, nsteps=5,
         vc_tst = vertices.copy()
         vc_tst[move] += node_normals[move]*mm2move[move, None]
         # We need to shift the nodes to that the ray tracing becomes stable
-        vc_tst = smooth_vertices(vc_tst, faces, v2f_map=v2f, mask_move=move, taubin=True)
+        vc_tst = smooth_vertices(vc_tst, faces, surf_ops=surf_ops, mask_move=move, taubin=True)
 
         intersect_pairs, _ = segment_triangle_intersect(
             vc_tst, faces,
@@ -174,11 +175,8 @@ def expandCS(vertices_org, faces, mm2move_total, ensure_distance=0.2, nsteps=5,
         # returns a few spurious false positives
         # --------------------------------------
         if despike_nonmove:
-            Nnomove = np.zeros(len(move), dtype='uint16')
-            Nfaces = np.zeros(len(move), dtype='uint16')
-            for j in range(len(move)):
-                Nnomove[j] = np.sum(~move[faces[v2f[j]]])
-                Nfaces[j] = len(v2f[j])
+            Nnomove = surf_ops.count_in_faces(~move)
+            Nfaces = surf_ops.faces_per_vertex()
             # a single vertex reoccurs #faces --> Nnomove>Nfaces will be true
             # when more than one vertex is marked "non-move"
             move = ~(~move & (Nnomove > Nfaces))
@@ -188,7 +186,7 @@ def expandCS(vertices_org, faces, mm2move_total, ensure_distance=0.2, nsteps=5,
         # ----------------------------
         mm2move[~move] = 0
         if smooth_mm2move:
-            mm2move = smooth_vertices(mm2move, faces, Niterations=1)
+            mm2move = smooth_vertices(mm2move, faces, surf_ops=surf_ops, Niterations=1)
             mm2move[~move] = 0
             pass
 
@@ -206,7 +204,7 @@ def expandCS(vertices_org, faces, mm2move_total, ensure_distance=0.2, nsteps=5,
             vertices = smooth_vertices(
                 vertices, faces,
                 verts2consider=np.unique(faces[flipped_faces]),
-                v2f_map=v2f, Niterations=5, Ndilate=2)
+                surf_ops=surf_ops, Niterations=5, Ndilate=2)
             mesh = vertices[faces]
             facenormals_post = get_triangle_normals(mesh)
             flipped_faces = np.sum(facenormals_post*facenormals_pre,axis=1) < 0
@@ -216,10 +214,10 @@ def expandCS(vertices_org, faces, mm2move_total, ensure_distance=0.2, nsteps=5,
             if skip_lastsmooth & (i == nsteps-1):
                 logger.debug(f'{actualsurf}: Last iteration: skipping vertex smoothing')
                 vertices = smooth_vertices(
-                    vertices, faces, v2f_map=v2f, Niterations=10, mask_move=move, taubin=True)
+                    vertices, faces, surf_ops=surf_ops, Niterations=10, mask_move=move, taubin=True)
             else:
                 vertices = smooth_vertices(
-                    vertices, faces, v2f_map=v2f, mask_move=move)
+                    vertices, faces, surf_ops=surf_ops, mask_move=move)
 
         logger.info(f'{actualsurf}: Moved {np.sum(move)} of {len(vertices)} vertices.')
 
@@ -250,7 +248,7 @@ def expandCS(vertices_org, faces, mm2move_total, ensure_distance=0.2, nsteps=5,
 
 
 def smooth_vertices(vertices, faces, verts2consider=None,
-                    v2f_map=None, Niterations=1,
+                    surf_ops=None, Niterations=1,
                     Ndilate=0, mask_move=None,
                     taubin=False):
     """Simple mesh smoothing by averaging vertex coordinates or other data
@@ -264,9 +262,9 @@ def smooth_vertices(vertices, faces, verts2consider=None,
         Faces describing the mesh.
     verts2consider: ndarray
         Array of indices of the vertex that will be smoothed (default: all vertices)
-    v2f_map: {list, ndarray}
-        Mapping from vertices to faces. Optional (to save a bit of time for repeated use),
-        will be created if not given as input.
+    surf_ops: SurfaceOperators
+        Sparse adjacency and smoothing operators of the mesh. Optional (to save
+        time for repeated use), will be created if not given as input.
     Niterations: int
         Number of smoothing iterations (default: 1)
     Ndilate: int
@@ -282,14 +280,11 @@ def smooth_vertices(vertices, faces, verts2consider=None,
 
     if verts2consider is None:
         verts2consider = np.arange(len(vertices))
-    if v2f_map is None:
-        v2f_map = verts2faces(vertices,faces)
+    if surf_ops is None:
+        surf_ops = SurfaceOperators(faces, len(vertices))
 
     for i in range(Ndilate):
-        f2c = [v2f_map[n] for n in verts2consider]
-        f2c, f2cok = list2numpy(f2c,dtype=int)
-        f2c = f2c[f2cok]  # faces of verts2consider
-        verts2consider = np.unique(faces[f2c])
+        verts2consider = surf_ops.dilate(verts2consider)
 
     if mask_move is not None:
         verts2consider = verts2consider[mask_move[verts2consider]]
@@ -303,12 +298,7 @@ def smooth_vertices(vertices, faces, verts2consider=None,
         m.smooth_surfaces_simple(Niterations, nodes_mask=vert_mask)
         smoo = m.nodes[:]
     else:
-        for n in verts2consider:
-            smoo[n] = np.average(vertices[faces[v2f_map[n]]], axis=(0,1))
-        for i in range(Niterations-1):
-            smoo2 = smoo.copy()
-            for n in verts2consider:
-                smoo[n] = np.average(smoo2[faces[v2f_map[n]]], axis=(0,1))
+        smoo = surf_ops.smooth(smoo, verts2consider, Niterations)
     return smoo
 
 
@@ -403,15 +393,12 @@ def verts2faces(vertices, faces, pad_val=0, array_out_type="list"):
     """
     # Mapping from node to triangles, i.e. which nodes belongs to which
     # triangles
-    v2f = [[] for i in range(len(vertices))]
-    for t in range(len(faces)):
-        for n in faces[t]:
-            v2f[n].append(t)
+    v2f = vertex_face_incidence(faces, len(vertices))
 
     if array_out_type == "list":
-        return v2f
+        return [r.tolist() for r in np.split(v2f.indices, v2f.indptr[1:-1])]
     elif array_out_type == "numpy_array":
-        v2f, ok = list2numpy(v2f, pad_val, int)
+        v2f, ok = csr2padded(v2f, pad_val, int)
         return v2f, ok
     else:
         raise ValueError("Array output type must be list or numpy array.")
@@ -437,11 +424,11 @@ def list2numpy(L, pad_val=0, dtype=float):
         L expressed as a numpy array.
     """
 
-    max_neighbors = len(sorted(L, key=len, reverse=True)[0])
-    narr = np.array([r+[np.nan]*(max_neighbors-len(r)) for r in L])
-    ok = ~np.isnan(narr)
-    narr[~ok] = pad_val
-    narr = narr.astype(dtype)
+    row_len = np.fromiter(map(len, L), dtype=int, count=len(L))
+    ok = np.arange(row_len.max()) < row_len[:, None]
+    narr = np.full(ok.shape, pad_val, dtype=dtype)
+    narr[ok] = np.fromiter(itertools.chain.from_iterable(L), dtype=dtype,
+                           count=row_len.sum())
 
     return narr, ok
 
@@ -231,6 +231,8 @@ def run(
             gmm_parameters,
             visualizer,
             parameter_filename = os.path.join(sub_files.segmentation_folder, "parameters.p") if debug else None,
+            # the GMM uses as many threads as the GEMS code
+            num_threads=num_threads if isinstance(num_threads, int) and num_threads > 0 else os.cpu_count(),
         )
 
         # Okay now the parameters have been estimated, and we can segment the
@@ -159,6 +159,7 @@ def _estimate_parameters(
     user_optimization_options=None,
     user_model_specifications=None,
     parameter_filename=None,
+    num_threads=1,
 ):
 
     ds_targets = segment_settings["downsampling_targets"]
@@ -188,7 +189,8 @@ def _estimate_parameters(
                     "maximumNumberOfIterations": 100,
                     "estimateBiasField": True,
                 },
-            ]
+            ],
+            "numberOfThreads": num_threads,
         }
 
     if user_model_specifications is None:
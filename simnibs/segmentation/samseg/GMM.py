@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from scipy.stats import invwishart
 
@@ -10,7 +12,8 @@ class GMM:
                  initialMixtureWeights=None,
                  initialHyperMeans=None, initialHyperMeansNumberOfMeasurements=None, initialHyperVariances=None,
                  initialHyperVariancesNumberOfMeasurements=None, initialHyperMixtureWeights=None,
-                 initialHyperMixtureWeightsNumberOfMeasurements=None ):
+                 initialHyperMixtureWeightsNumberOfMeasurements=None,
+                 numberOfVoxelsPerChunk=16384, useSinglePrecision=False, numberOfThreads=1 ):
         #
         self.numberOfGaussiansPerClass = numberOfGaussiansPerClass
         self.numberOfClasses = len(self.numberOfGaussiansPerClass)
@@ -18,6 +21,13 @@ class GMM:
         self.numberOfContrasts = numberOfContrasts
         self.useDiagonalCovarianceMatrices = useDiagonalCovarianceMatrices
 
+        # The likelihoods of all Gaussians are evaluated together in chunks of voxels, optionally in single precision
+        # and with several threads working on different chunks
+        self.numberOfVoxelsPerChunk = numberOfVoxelsPerChunk
+        self.useSinglePrecision = useSinglePrecision
+        self.numberOfThreads = numberOfThreads
+        self.classNumberOfGaussians = np.repeat(np.arange(self.numberOfClasses), self.numberOfGaussiansPerClass)
+
         self.means = initialMeans
         self.variances = initialVariances
         self.mixtureWeights = initialMixtureWeights
@@ -120,27 +130,79 @@ class GMM:
         gaussianLikelihoods = np.exp(squaredMahalanobisDistances * -0.5) * scaling
         return gaussianLikelihoods.T
 
+    def getBatchedGaussianLikelihoods(self):
+        # Stack the inverse Cholesky factors of all Gaussians, so that their likelihoods can be evaluated together with
+        # processChunks. Returns a function computing the (numberOfGaussians x numberOfVoxelsInChunk) likelihoods of
+        # a (numberOfVoxelsInChunk x numberOfContrasts) chunk of data
+        dtype = np.float32 if self.useSinglePrecision else np.float64
+        L = np.linalg.cholesky(self.variances)
+        inverseL = np.linalg.inv(L).astype(dtype)
+        means = self.means[:, :, None].astype(dtype)
+        sqrtDeterminantOfVariances = np.prod(np.diagonal(L, axis1=1, axis2=2), axis=1)
+        scaling = (1.0 / (2 * np.pi) ** (self.numberOfContrasts / 2) / sqrtDeterminantOfVariances).astype(dtype)
+
+        def gaussianLikelihoods(dataChunk, buffers):
+            # The voxels are along the last axis, so that the sum over the (few) contrasts adds contiguous rows
+            numberOfVoxels = dataChunk.shape[0]
+            differences = buffers['differences'][..., :numberOfVoxels]
+            whitened = buffers['whitened'][..., :numberOfVoxels]
+            likelihoods = buffers['likelihoods'][:, :numberOfVoxels]
+            np.subtract(dataChunk.T, means, out=differences)
+            np.matmul(inverseL, differences, out=whitened)
+            np.square(whitened, out=whitened)
+            np.sum(whitened, axis=1, out=likelihoods)
+            likelihoods *= -0.5
+            np.exp(likelihoods, out=likelihoods)
+            likelihoods *= scaling[:, None]
+            return likelihoods
+
+        return gaussianLikelihoods
+
+    def allocateBuffers(self):
+        # Buffers for a chunk of voxels, one set is allocated per thread and re-used for all its chunks
+        dtype = np.float32 if self.useSinglePrecision else np.float64
+        shape = (self.numberOfGaussians, self.numberOfContrasts, self.numberOfVoxelsPerChunk)
+        return {'differences': np.empty(shape, dtype=dtype),
+                'whitened': np.empty(shape, dtype=dtype),
+                'likelihoods': np.empty((self.numberOfGaussians, self.numberOfVoxelsPerChunk), dtype=dtype)}
+
+    def processChunks(self, numberOfVoxels, processChunk, useBuffers=True):
+        # Calls processChunk(start, stop, buffers) for consecutive chunks of voxels and returns the list of results,
+        # in the order of the chunks. With several threads, each thread works on every numberOfThreads-th chunk. If
+        # processChunk does not evaluate the likelihoods, useBuffers=False skips the allocation and passes None instead
+        starts = range(0, numberOfVoxels, self.numberOfVoxelsPerChunk)
+        chunks = [(start, min(start + self.numberOfVoxelsPerChunk, numberOfVoxels)) for start in starts]
+        numberOfThreads = max(1, min(self.numberOfThreads, len(chunks)))
+
+        def processChunksOfThread(threadNumber):
+            buffers = self.allocateBuffers() if useBuffers else None
+            return [processChunk(start, stop, buffers) for start, stop in chunks[threadNumber::numberOfThreads]]
+
+        if numberOfThreads == 1:
+            return processChunksOfThread(0)
+        with ThreadPoolExecutor(max_workers=numberOfThreads) as executor:
+            resultsPerThread = list(executor.map(processChunksOfThread, range(numberOfThreads)))
+        results = [None] * len(chunks)
+        for threadNumber, threadResults in enumerate(resultsPerThread):
+            results[threadNumber::numberOfThreads] = threadResults
+        return results
+
     def getGaussianPosteriors(self, data, classPriors):
 
         #
         numberOfVoxels = data.shape[0]
+        gaussianLikelihoods = self.getBatchedGaussianLikelihoods()
 
         gaussianPosteriors = np.zeros((numberOfVoxels, self.numberOfGaussians), order='F')
-        for classNumber in range(self.numberOfClasses):
-            classPrior = classPriors[:, classNumber]
-            numberOfComponents = self.numberOfGaussiansPerClass[classNumber]
-            for componentNumber in range(numberOfComponents):
-                gaussianNumber = sum(self.numberOfGaussiansPerClass[:classNumber]) + componentNumber
-                mean = np.expand_dims(self.means[gaussianNumber, :], 1)
-                variance = self.variances[gaussianNumber, :, :]
 
-                gaussianLikelihoods = self.getGaussianLikelihoods(data, mean, variance)
-                gaussianPosteriors[:, gaussianNumber] = gaussianLikelihoods * (
-                            self.mixtureWeights[gaussianNumber] * classPrior)
-        normalizer = np.sum(gaussianPosteriors, axis=1) + eps
-        gaussianPosteriors = gaussianPosteriors / np.expand_dims(normalizer, 1)
+        def posteriorsOfChunk(start, stop, buffers):
+            chunkPosteriors = gaussianLikelihoods(data[start:stop], buffers) * (
+                    self.mixtureWeights[:, None] * classPriors[start:stop].T[self.classNumberOfGaussians])
+            normalizer = np.sum(chunkPosteriors, axis=0) + eps
+            gaussianPosteriors[start:stop] = (chunkPosteriors / normalizer).T
+            return np.sum(np.log(normalizer))
 
-        minLogLikelihood = -np.sum(np.log(normalizer))
+        minLogLikelihood = -np.sum(self.processChunks(numberOfVoxels, posteriorsOfChunk))
 
         return gaussianPosteriors, minLogLikelihood
 
@@ -149,28 +211,18 @@ class GMM:
         numberOfVoxels = data.shape[0]
         numberOfStructures = fractionsTable.shape[1]
 
+        # Each Gaussian contributes to the structures with its mixture weight times the fraction of its class
+        fractions = np.where(fractionsTable < 1e-10, 0, fractionsTable)
+        gaussianFractions = self.mixtureWeights[:, None] * fractions[self.classNumberOfGaussians]
+        gaussianLikelihoods = self.getBatchedGaussianLikelihoods()
+
         #
         likelihoods = np.zeros((numberOfVoxels, numberOfStructures), dtype=np.float64)
-        for classNumber in range(self.numberOfClasses):
-
-            # Compute likelihood for this class
-            classLikelihoods = np.zeros(numberOfVoxels)
-            numberOfComponents = self.numberOfGaussiansPerClass[classNumber]
-            for componentNumber in range(numberOfComponents):
-                gaussianNumber = sum(self.numberOfGaussiansPerClass[:classNumber]) + componentNumber
-                mean = np.expand_dims(self.means[gaussianNumber, :], 1)
-                variance = self.variances[gaussianNumber, :, :]
-                mixtureWeight = self.mixtureWeights[gaussianNumber]
 
-                gaussianLikelihoods = self.getGaussianLikelihoods(data, mean, variance)
-                classLikelihoods += gaussianLikelihoods * mixtureWeight
+        def likelihoodsOfChunk(start, stop, buffers):
+            likelihoods[start:stop] = gaussianLikelihoods(data[start:stop], buffers).T @ gaussianFractions
 
-            # Add contribution to the actual structures
-            for structureNumber in range(numberOfStructures):
-                fraction = fractionsTable[classNumber, structureNumber]
-                if fraction < 1e-10:
-                    continue
-                likelihoods[:, structureNumber] += classLikelihoods * fraction
+        self.processChunks(numberOfVoxels, likelihoodsOfChunk)
 
         #
         return likelihoods
@@ -187,26 +239,27 @@ class GMM:
 
     def fitGMMParameters(self, data, gaussianPosteriors):
 
-        # Means and variances
-        for gaussianNumber in range(self.numberOfGaussians):
-            posterior = gaussianPosteriors[:, gaussianNumber].reshape(-1, 1)
-            hyperMean = np.expand_dims(self.hyperMeans[gaussianNumber, :], 1)
-            hyperMeanNumberOfMeasurements = self.hyperMeansNumberOfMeasurements[gaussianNumber]
-            hyperVariance = self.hyperVariances[gaussianNumber, :, :]
-            hyperVarianceNumberOfMeasurements = self.hyperVariancesNumberOfMeasurements[gaussianNumber]
-
-            mean = (data.T @ posterior + hyperMean * hyperMeanNumberOfMeasurements) \
-                   / (np.sum(posterior) + hyperMeanNumberOfMeasurements)
-            tmp = data - mean.T
-            variance = (tmp.T @ (tmp * posterior) + \
-                        hyperMeanNumberOfMeasurements * ((mean - hyperMean) @ (mean - hyperMean).T) + \
-                        hyperVariance * hyperVarianceNumberOfMeasurements) \
-                       / (np.sum(posterior) + hyperVarianceNumberOfMeasurements)
-            if self.useDiagonalCovarianceMatrices:
-                # Force diagonal covariance matrices
-                variance = np.diag(np.diag(variance))
-            self.variances[gaussianNumber, :, :] = variance
-            self.means[gaussianNumber, :] = mean.T
+        # Means and variances, for all Gaussians at once
+        softSums = np.sum(gaussianPosteriors, axis=0)
+        means = (gaussianPosteriors.T @ data + self.hyperMeans * self.hyperMeansNumberOfMeasurements[:, None]) \
+                / (softSums + self.hyperMeansNumberOfMeasurements)[:, None]
+
+        # Weighted scatter matrices around the new means, accumulated over chunks of voxels
+        def scatterOfChunk(start, stop, buffers):
+            tmp = data[start:stop].T - means[:, :, None]
+            return (tmp * gaussianPosteriors[start:stop].T[:, None, :]) @ tmp.transpose(0, 2, 1)
+
+        scatter = np.sum(self.processChunks(data.shape[0], scatterOfChunk, useBuffers=False), axis=0)
+        tmp = (means - self.hyperMeans)[:, :, None]
+        variances = (scatter +
+                     self.hyperMeansNumberOfMeasurements[:, None, None] * (tmp @ tmp.transpose(0, 2, 1)) +
+                     self.hyperVariances * self.hyperVariancesNumberOfMeasurements[:, None, None]) \
+                    / (softSums + self.hyperVariancesNumberOfMeasurements)[:, None, None]
+        if self.useDiagonalCovarianceMatrices:
+            # Force diagonal covariance matrices
+            variances = variances * np.eye(self.numberOfContrasts)
+        self.variances[:] = variances
+        self.means[:] = means
 
         # Mixture weights
         self.mixtureWeights = np.sum(gaussianPosteriors + eps, axis=0)
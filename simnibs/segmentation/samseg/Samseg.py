@@ -314,7 +314,10 @@ class Samseg:
 
         # Parameter initialization.
         self.gmm = GMM(numberOfGaussiansPerClass, numberOfContrasts=self.imageBuffers.shape[-1],
-                       useDiagonalCovarianceMatrices=self.modelSpecifications.useDiagonalCovarianceMatrices)
+                       useDiagonalCovarianceMatrices=self.modelSpecifications.useDiagonalCovarianceMatrices,
+                       numberOfVoxelsPerChunk=self.optimizationOptions['numberOfVoxelsPerChunk'],
+                       useSinglePrecision=self.optimizationOptions['useSinglePrecision'],
+                       numberOfThreads=self.optimizationOptions['numberOfThreads'])
 
     def estimateModelParameters(self, initialBiasFieldCoefficients=None, initialDeformation=None,
                                 initialDeformationAtlasFileName=None,
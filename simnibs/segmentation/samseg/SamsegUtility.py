@@ -51,6 +51,10 @@ def getOptimizationOptions(atlasDir, userOptimizationOptions={}):
         'lineSearchMaximalDeformationIntervalStopCriterion': 0.001,
         'maximalDeformationAppliedStopCriterion': 0.0,
         'BFGSMaximumMemoryLength': 12,
+        # The GMM likelihoods are evaluated in chunks of voxels, with several threads working on different chunks
+        'numberOfVoxelsPerChunk': 16384,
+        'useSinglePrecision': False,
+        'numberOfThreads': 1,
         'multiResolutionSpecification':
             [
                 {'atlasFileName': os.path.join(atlasDir, 'atlas_level1.txt.gz'),
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse operators on triangulated surfaces used during surface reconstruction
+
+The vertex-to-face mapping is stored as a CSR incidence matrix instead of a
+python list of lists, and neighborhood averaging is expressed as a sparse
+matrix that can be applied repeatedly without python loops over vertices.
+"""
+
+import numpy as np
+import scipy.sparse
+
+
+def vertex_face_incidence(faces, n_vertices=None):
+    """Sparse vertex-to-face incidence matrix.
+
+    PARAMETERS
+    ----------
+    faces : ndarray
+        N x 3 array of (zero-based) vertex indices.
+    n_vertices : int, optional
+        Number of vertices in the mesh (default = faces.max() + 1).
+
+    RETURNS
+    ----------
+    v2f : csr_matrix
+        n_vertices x N matrix with v2f[i, j] = 1 if vertex i is part of face
+        j. The column indices of row i are the faces of vertex i in ascending
+        order, i.e. v2f.indices[v2f.indptr[i]:v2f.indptr[i+1]].
+    """
+    faces = np.asarray(faces)
+    if n_vertices is None:
+        n_vertices = faces.max() + 1
+    n_faces, n_corners = faces.shape
+    col_ind = np.repeat(np.arange(n_faces), n_corners)
+    v2f = scipy.sparse.csr_matrix(
+        (np.ones(faces.size, dtype=np.int32), (faces.ravel(), col_ind)),
+        shape=(n_vertices, n_faces)
+    )
+    v2f.sort_indices()
+    return v2f
+
+
+def csr2padded(a, pad_val=0, dtype=int):
+    """Convert the sparsity pattern of a CSR matrix to a padded array.
+
+    PARAMETERS
+    ----------
+    a : csr_matrix
+        Sparse matrix, e.g. from vertex_face_incidence.
+    pad_val : float, int
+        The value with which to pad the array (default = 0).
+    dtype : datatype, optional
+        Datatype of the output array (default = int).
+
+    RETURNS
+    ----------
+    narr : ndarray
+        n_rows x max_row_length array with the column indices of each row.
+    ok : ndarray (bool)
+        Which entries of narr are actual column indices and which are padding.
+    """
+    row_len = np.diff(a.indptr)
+    n_cols = row_len.max() if len(row_len) > 0 else 0
+    ok = np.arange(n_cols) < row_len[:, None]
+    narr = np.full(ok.shape, pad_val, dtype=dtype)
+    narr[ok] = a.indices
+    return narr, ok
+
+
+def averaging_matrix(faces, n_vertices=None, v2f=None):
+    """Sparse operator averaging vertex data across neighboring faces.
+
+    Row i of the operator averages the data over all corners of the faces
+    vertex i is part of (counting vertices once per face), which corresponds
+    to np.average(data[faces[v2f[i]]], axis=(0, 1)).
+
+    PARAMETERS
+    ----------
+    faces : ndarray
+        N x 3 array of (zero-based) vertex indices.
+    n_vertices : int, optional
+        Number of vertices in the mesh (default = faces.max() + 1).
+    v2f : csr_matrix, optional
+        Vertex-to-face incidence matrix, will be created if not given.
+
+    RETURNS
+    ----------
+    S : csr_matrix
+        n_vertices x n_vertices smoothing operator. Vertices which are not
+        part of any face keep their value.
+    """
+    if v2f is None:
+        v2f = vertex_face_incidence(faces, n_vertices)
+    S = (v2f @ v2f.T).astype(float)
+    row_sum = np.asarray(S.sum(axis=1)).ravel()
+    isolated = row_sum == 0
+    row_sum[isolated] = 1
+    S = scipy.sparse.diags(1. / row_sum) @ S
+    S = S + scipy.sparse.diags(isolated.astype(float))
+    return S.tocsr()
+
+
+class SurfaceOperators:
+    """Sparse adjacency and smoothing operators of a triangulated surface.
+
+    The operators are built lazily and reused across calls, so that they can
+    be shared by all iterations of e.g. the central surface expansion.
+
+    PARAMETERS
+    ----------
+    faces : ndarray
+        N x 3 array of (zero-based) vertex indices.
+    n_vertices : int, optional
+        Number of vertices in the mesh (default = faces.max() + 1).
+
+    ATTRIBUTES
+    ----------
+    faces : ndarray
+        N x 3 array of vertex indices.
+    n_vertices : int
+        Number of vertices.
+    v2f : csr_matrix
+        Vertex-to-face incidence matrix.
+    smoothing : csr_matrix
+        Neighborhood averaging operator (see averaging_matrix).
+    """
+
+    def __init__(self, faces, n_vertices=None):
+        self.faces = np.asarray(faces)
+        if n_vertices is None:
+            n_vertices = self.faces.max() + 1
+        self.n_vertices = n_vertices
+        self._v2f = None
+        self._smoothing = None
+
+    @property
+    def v2f(self):
+        if self._v2f is None:
+            self._v2f = vertex_face_incidence(self.faces, self.n_vertices)
+        return self._v2f
+
+    @property
+    def smoothing(self):
+        if self._smoothing is None:
+            self._smoothing = averaging_matrix(
+                self.faces, self.n_vertices, v2f=self.v2f)
+        return self._smoothing
+
+    def faces_per_vertex(self):
+        """Number of faces each vertex is part of."""
+        return np.diff(self.v2f.indptr)
+
+    def count_in_faces(self, mask):
+        """For each vertex, count how often vertices in mask occur in the faces
+        of that vertex (counting once per face).
+
+        PARAMETERS
+        ----------
+        mask : ndarray (bool)
+            Vertex mask.
+
+        RETURNS
+        ----------
+        count : ndarray (int)
+            Count for each vertex.
+        """
+        per_face = np.sum(mask[self.faces], axis=1)
+        return self.v2f @ per_face
+
+    def dilate(self, verts):
+        """Add all vertices which share a face with any of the vertices.
+
+        PARAMETERS
+        ----------
+        verts : ndarray (int)
+            Indices of the vertices.
+
+        RETURNS
+        ----------
+        dilated : ndarray (int)
+            Sorted unique indices of the dilated vertex set.
+        """
+        f = np.unique(self.v2f[verts].indices)
+        return np.unique(self.faces[f])
+
+    def smooth(self, data, verts2consider=None, n_iterations=1):
+        """Iteratively replace data at the selected vertices by the
+        neighborhood average.
+
+        PARAMETERS
+        ----------
+        data : ndarray
+            Vertex data (n_vertices,) or (n_vertices, k), e.g. coordinates.
+        verts2consider : ndarray (int), optional
+            Indices of the vertices that will be smoothed (default: all).
+        n_iterations : int
+            Number of smoothing iterations (default = 1).
+
+        RETURNS
+        ----------
+        smoo : ndarray
+            Smoothed copy of data.
+        """
+        smoo = np.array(data, copy=True)
+        if verts2consider is None:
+            verts2consider = np.arange(self.n_vertices)
+        S = self.smoothing[verts2consider]
+        for i in range(n_iterations):
+            smoo[verts2consider] = S @ smoo
+        return smoo
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from ..samseg.GMM import GMM
+
+
+@pytest.fixture
+def gmm_data():
+    rng = np.random.default_rng(0)
+    numberOfGaussiansPerClass = [2, 1, 3]
+    data = rng.normal(size=(1001, 2)) * 2 + 5
+    classPriors = rng.random((1001, 3))
+    classPriors /= np.sum(classPriors, axis=1, keepdims=True)
+    return numberOfGaussiansPerClass, data, classPriors
+
+
+def reference_likelihoods(gmm, data):
+    ''' Likelihoods of each Gaussian, evaluated one at a time '''
+    return np.stack([
+        gmm.getGaussianLikelihoods(data, gmm.means[[g]].T, gmm.variances[g])
+        for g in range(gmm.numberOfGaussians)], axis=1)
+
+
+@pytest.mark.parametrize('diagonal', [True, False])
+@pytest.mark.parametrize('kwargs', [{}, {'numberOfVoxelsPerChunk': 100, 'numberOfThreads': 3}])
+def test_gaussian_posteriors(diagonal, kwargs, gmm_data):
+    numberOfGaussiansPerClass, data, classPriors = gmm_data
+    gmm = GMM(numberOfGaussiansPerClass, 2, diagonal, **kwargs)
+    gmm.initializeGMMParameters(data, classPriors)
+
+    posteriors, minLogLikelihood = gmm.getGaussianPosteriors(data, classPriors)
+
+    weighted = reference_likelihoods(gmm, data) * gmm.mixtureWeights * \
+        classPriors[:, gmm.classNumberOfGaussians]
+    normalizer = np.sum(weighted, axis=1) + np.finfo(float).eps
+    assert np.allclose(posteriors, weighted / normalizer[:, None], rtol=1e-12, atol=1e-14)
+    assert np.isclose(minLogLikelihood, -np.sum(np.log(normalizer)), rtol=1e-12)
+
+
+def test_gaussian_posteriors_single_precision(gmm_data):
+    numberOfGaussiansPerClass, data, classPriors = gmm_data
+    gmm = GMM(numberOfGaussiansPerClass, 2, useSinglePrecision=True)
+    gmm.initializeGMMParameters(data, classPriors)
+    posteriors, _ = gmm.getGaussianPosteriors(data, classPriors)
+    gmm.useSinglePrecision = False
+    posteriors_double, _ = gmm.getGaussianPosteriors(data, classPriors)
+    assert posteriors.dtype == np.float64
+    assert np.allclose(posteriors, posteriors_double, atol=1e-5)
+
+
+def test_likelihoods(gmm_data):
+    numberOfGaussiansPerClass, data, classPriors = gmm_data
+    gmm = GMM(numberOfGaussiansPerClass, 2, numberOfVoxelsPerChunk=128)
+    gmm.initializeGMMParameters(data, classPriors)
+    fractionsTable = np.array([[1., .5, 0., 0.],
+                               [0., .5, 1., 0.],
+                               [0., 0., 0., 1.]])
+
+    likelihoods = gmm.getLikelihoods(data, fractionsTable)
+
+    classLikelihoods = np.stack([
+        np.sum((reference_likelihoods(gmm, data) * gmm.mixtureWeights)[:, gmm.classNumberOfGaussians == c], axis=1)
+        for c in range(3)], axis=1)
+    assert np.allclose(likelihoods, classLikelihoods @ fractionsTable, rtol=1e-12)
+
+
+@pytest.mark.parametrize('diagonal', [True, False])
+def test_fit_gmm_parameters(diagonal, gmm_data):
+    numberOfGaussiansPerClass, data, classPriors = gmm_data
+    gmm = GMM(numberOfGaussiansPerClass, 2, diagonal, numberOfVoxelsPerChunk=100)
+    gmm.initializeGMMParameters(data, classPriors)
+    posteriors, _ = gmm.getGaussianPosteriors(data, classPriors)
+    gmm.fitGMMParameters(data, posteriors)
+
+    for g in range(gmm.numberOfGaussians):
+        posterior = posteriors[:, [g]]
+        mean = data.T @ posterior / np.sum(posterior)
+        tmp = data - mean.T
+        variance = (tmp.T @ (tmp * posterior) + np.eye(2)) / (np.sum(posterior) + 1 + np.finfo(float).eps)
+        if diagonal:
+            variance = np.diag(np.diag(variance))
+        assert np.allclose(gmm.means[g], mean.squeeze(), rtol=1e-12)
+        assert np.allclose(gmm.variances[g], variance, rtol=1e-10)
+
+
+@pytest.mark.parametrize('useBuffers', [True, False])
+def test_process_chunks(useBuffers, gmm_data):
+    numberOfGaussiansPerClass, data, classPriors = gmm_data
+    gmm = GMM(numberOfGaussiansPerClass, 2, numberOfVoxelsPerChunk=100, numberOfThreads=3)
+
+    def chunk(start, stop, buffers):
+        assert (buffers is not None) == useBuffers
+        return start, stop
+
+    chunks = gmm.processChunks(1001, chunk, useBuffers=useBuffers)
+    assert chunks == [(start, min(start + 100, 1001)) for start in range(0, 1001, 100)]
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+from ... import SIMNIBSDIR
+from ...mesh_tools import mesh_io
+from .. import surface_operators
+
+
+@pytest.fixture
+def sphere_surf():
+    fn = os.path.join(
+            SIMNIBSDIR, '_internal_resources', 'testing_files', 'sphere3.msh')
+    mesh = mesh_io.read_msh(fn)
+    return mesh.crop_mesh(1005)
+
+
+def _v2f_list(faces, n_vertices):
+    v2f = [[] for i in range(n_vertices)]
+    for t in range(len(faces)):
+        for n in faces[t]:
+            v2f[n].append(t)
+    return v2f
+
+
+class TestSurfaceOperators:
+    def test_vertex_face_incidence(self, sphere_surf):
+        vertices = sphere_surf.nodes[:]
+        faces = sphere_surf.elm[:, :3] - 1
+        v2f_ref = _v2f_list(faces, len(vertices))
+        v2f = surface_operators.vertex_face_incidence(faces, len(vertices))
+        for i in range(len(vertices)):
+            assert v2f.indices[v2f.indptr[i]:v2f.indptr[i+1]].tolist() == v2f_ref[i]
+
+        v2f_arr, ok = surface_operators.csr2padded(v2f)
+        for i in range(len(vertices)):
+            assert v2f_arr[i, ok[i]].tolist() == v2f_ref[i]
+
+    def test_smooth(self, sphere_surf):
+        vertices = sphere_surf.nodes[:]
+        faces = sphere_surf.elm[:, :3] - 1
+        v2f_ref = _v2f_list(faces, len(vertices))
+        verts2consider = np.arange(0, len(vertices), 3)
+
+        smoo = vertices.copy()
+        for i in range(3):
+            smoo2 = smoo.copy()
+            for n in verts2consider:
+                smoo[n] = np.average(smoo2[faces[v2f_ref[n]]], axis=(0, 1))
+
+        ops = surface_operators.SurfaceOperators(faces, len(vertices))
+        np.testing.assert_allclose(
+            ops.smooth(vertices, verts2consider, 3), smoo)
+
+    def test_dilate(self, sphere_surf):
+        faces = sphere_surf.elm[:, :3] - 1
+        ops = surface_operators.SurfaceOperators(faces)
+        dilated = ops.dilate([0])
+        assert np.array_equal(
+            dilated, np.unique(faces[np.any(faces == 0, axis=1)]))
+
+    def test_count_in_faces(self, sphere_surf):
+        faces = sphere_surf.elm[:, :3] - 1
+        ops = surface_operators.SurfaceOperators(faces)
+        mask = np.zeros(ops.n_vertices, dtype=bool)
+        mask[0] = True
+        count = ops.count_in_faces(mask)
+        assert count[0] == ops.faces_per_vertex()[0]
+        assert np.all(count[ops.dilate([0])] >= 1)
+        assert np.sum(count > 0) == len(ops.dilate([0]))
@@ -24,20 +24,24 @@
 
 import warnings
 import copy
+import multiprocessing
 import numpy as np
 import scipy.spatial
 
 from simnibs.utils.mesh_element_properties import ElementTags
 from ..mesh_tools.mesh_io import _hash_rows
-from ..utils.transformations import project_points_on_surface
+from ..utils.transformations import _get_triangle_neighbors, \
+    _project_points_to_surface
 
 
 def _remove_unconnected_triangles(mesh, roi_triangles, center,
                                   roi_nodes, triangles):
     cc = mesh.elm.connected_components(roi_triangles)
     if len(cc) > 1:
-        _, center_index = mesh.find_closest_element(center, return_index=True,
-                                                    elements_of_interest=roi_triangles)
+        # closest baricenter, only looking at the triangles in the ROI
+        bar = np.average(mesh.nodes[mesh.elm[roi_triangles, :3]], axis=1)
+        center_index = roi_triangles[
+            np.argmin(np.linalg.norm(bar - center, axis=1))]
         for comps in cc:
             if center_index in comps:
                 roi_triangles = comps
@@ -54,20 +58,20 @@ def _get_nodes_in_surface(mesh, surface_tags):
     return nodes_in_surface
 
 def _get_transform(center, y_axis, mesh, mesh_surface=[ElementTags.SCALP, ElementTags.SCALP_TH_SURFACE], y_type='relative',
-                   nodes_roi=None):
+                   nodes_roi=None, scalp_index=None):
     ''' Finds the transformation to make  '''
     center = np.array(center, dtype=float)
+    if scalp_index is None:
+        scalp_index = ScalpIndex(mesh, mesh_surface)
 
-    c = project_points_on_surface(mesh, center, surface_tags = mesh_surface).flatten()
+    c = scalp_index.project(mesh, center).flatten()
 
     if nodes_roi is None:
-        nodes_in_surface = _get_nodes_in_surface(mesh, mesh_surface)
-        kd_tree = scipy.spatial.cKDTree(mesh.nodes[nodes_in_surface])
-        _, center_idx = kd_tree.query(center)
-        normal = mesh.nodes_normals().value[nodes_in_surface - 1][center_idx]
+        center_idx = scalp_index.closest_nodes(mesh, center)[0, 0]
+        normal = scalp_index.normals(mesh, scalp_index.nodes[[center_idx]])[0]
     else:
         normal = np.nanmean(
-            mesh.nodes_normals().value[nodes_roi - 1],
+            scalp_index.normals(mesh, nodes_roi),
             axis=0
         )
 
@@ -90,11 +94,10 @@ def _get_transform(center, y_axis, mesh, mesh_surface=[ElementTags.SCALP, Elemen
         alpha = 0
         nr_iter = 0
         y_ref = c
-        nodes_in_surface = _get_nodes_in_surface(mesh, mesh_surface)
-        kd_tree = scipy.spatial.cKDTree(mesh.nodes[nodes_in_surface])
         while np.linalg.norm(c - y_ref) < 1e-5:
-            _, y_ref_idx = kd_tree.query(y_axis + alpha * (y_axis - center))
-            y_ref = mesh.nodes.node_coord[nodes_in_surface - 1][y_ref_idx]
+            y_ref_idx = scalp_index.closest_nodes(
+                mesh, y_axis + alpha * (y_axis - center))[0, 0]
+            y_ref = mesh.nodes.node_coord[scalp_index.nodes[y_ref_idx] - 1]
             alpha += 1.
             nr_iter += 1
             if nr_iter == 10:
@@ -119,42 +122,237 @@ def _get_transform(center, y_axis, mesh, mesh_surface=[ElementTags.SCALP, Elemen
     affine[3, 3] = 1
     return affine, c
 
-def _get_roi(center, radius, mesh, mesh_surface=[5, 1005], min_cos=.1):
+def _get_roi(center, radius, mesh, mesh_surface=[5, 1005], min_cos=.1,
+             scalp_index=None):
     ''' Defines the region of interest of a given radius. Around a given center. Only
     node with normals pointing in the given direction are
     considered. Returns a list of triangles with at least 1 element in the ROI and their adjacent tetrahedra'''
-    center = np.array(center, dtype=float)
-    nodes_in_surface = _get_nodes_in_surface(mesh, mesh_surface)
-    if len(nodes_in_surface) == 0:
-        raise ValueError('Could not find surface {0} in mesh'.format(mesh_surface))
-
-    distances = np.linalg.norm(center - mesh.nodes[nodes_in_surface], axis=1)
-    normals = mesh.nodes_normals()[nodes_in_surface]
-    center_normal = normals[np.argmin(distances)]
-    
-    # determine average edge length in roi by sampling
-    avg_l = np.average(np.linalg.norm(mesh.nodes[mesh.elm[mesh.elm.triangles, 0][nodes_in_surface]] - \
-                                      mesh.nodes[mesh.elm[mesh.elm.triangles, 1][nodes_in_surface]], axis=1))
-    
-    nodes_in_roi_ext = nodes_in_surface[(distances <= radius + 2*avg_l) *
-                            (center_normal.dot(normals.T) > min_cos)]
-    nodes_in_roi = nodes_in_surface[(distances <= radius) *
-                            (center_normal.dot(normals.T) > min_cos)]
+    if scalp_index is None:
+        scalp_index = ScalpIndex(mesh, mesh_surface)
+    return scalp_index.roi(mesh, center, radius, min_cos=min_cos)
 
-    tr_in_roi = np.any(
-        np.in1d(mesh.elm[mesh.elm.triangles, :3], nodes_in_roi).reshape(-1, 3), axis=1)
 
-    th_in_roi = np.any(
-        np.in1d(mesh.elm[mesh.elm.tetrahedra], nodes_in_roi_ext).reshape(-1, 4), axis=1)
+class ScalpIndex:
+    ''' Index of the surface where electrodes are placed
 
-    roi_tr_nodes, roi_triangles_reordering = \
-        np.unique(mesh.elm[mesh.elm.triangles[tr_in_roi], :3], return_inverse=True)
+    Keeps a KD-tree of the surface nodes and the triangles and tetrahedra
+    adjacent to them, so that the regions of interest, normals and projections
+    of many electrodes do not go through the whole mesh each time.
 
-    roi_th_nodes, roi_tetrahedra_reordering = \
-        np.unique(mesh.elm[mesh.elm.tetrahedra[th_in_roi]], return_inverse=True)
+    The surface nodes can move (see nodes_moved), but the elements of the mesh
+    must not change after the index is built.
 
-    return mesh.elm.triangles[tr_in_roi], roi_tr_nodes, roi_triangles_reordering.reshape(-1,3), \
-        mesh.elm.tetrahedra[th_in_roi], roi_th_nodes, roi_tetrahedra_reordering.reshape(-1,4)
+    Parameters
+    ------------
+    mesh: simnibs.msh.mesh_io.Msh
+        Mesh where the electrodes are to be placed
+    surface_tags: int or list of ints (optional)
+        Tags of the surface, None for all triangles. Default: [5, 1005]
+
+    Attributes
+    -------------
+    nodes: np.ndarray
+        Nodes in the surface (1-based)
+    '''
+    def __init__(self, mesh, surface_tags=[ElementTags.SCALP, ElementTags.SCALP_TH_SURFACE]):
+        self.surface_tags = surface_tags
+        # surface triangles, all triangles if surface_tags is None
+        if surface_tags is not None:
+            tr_of_interest = (mesh.elm.elm_type == 2) * \
+                (np.in1d(mesh.elm.tag1, surface_tags))
+        else:
+            tr_of_interest = mesh.elm.elm_type == 2
+        self.nodes = np.unique(mesh.elm.node_number_list[tr_of_interest, :3])
+        self._nr_elements = mesh.elm.nr
+        self._local = -np.ones(mesh.nodes.nr + 1, dtype=int)
+        self._local[self.nodes] = np.arange(len(self.nodes))
+        # positions in the KD-tree and maximum displacement since then
+        self._coords = mesh.nodes.node_coord[self.nodes - 1].copy()
+        self._kdtree = scipy.spatial.cKDTree(self._coords)
+        self._max_shift = 0.
+        # surface in the format used in project_points_on_surface
+        self._tris = self._local[mesh.elm.node_number_list[tr_of_interest, :3]]
+        self._pttris = None
+        # nodes used to estimate the average edge length in _get_roi
+        if len(self.nodes) > 0:
+            self._edge_sample = (
+                mesh.elm[mesh.elm.triangles, 0][self.nodes],
+                mesh.elm[mesh.elm.triangles, 1][self.nodes]
+            )
+        # Built when first needed
+        self._node_triangles = None
+        self._node_tetrahedra = None
+        self._fixed_th_ordering = False
+
+    def _check(self, mesh):
+        if mesh.elm.nr != self._nr_elements:
+            raise ValueError(
+                'The mesh elements changed after the ScalpIndex was built')
+
+    def nodes_moved(self, mesh, nodes):
+        ''' Registers that the positions of the given nodes changed
+
+        Parameters
+        -----------
+        mesh: simnibs.msh.mesh_io.Msh
+            Mesh with the new positions
+        nodes: np.ndarray
+            Nodes which moved (1-based)
+        '''
+        local = self._local[np.asarray(nodes, dtype=int)]
+        local = local[local >= 0]
+        if len(local) > 0:
+            shift = np.linalg.norm(
+                mesh.nodes.node_coord[self.nodes[local] - 1] - self._coords[local],
+                axis=1)
+            self._max_shift = max(self._max_shift, shift.max())
+
+    def closest_nodes(self, mesh, points, k=1):
+        ''' Indices (in self.nodes) of the k closest surface nodes to each point '''
+        self._check(mesh)
+        points = np.atleast_2d(points)
+        k = min(k, len(self.nodes))
+        d, _ = self._kdtree.query(points, k)
+        d = d.reshape(len(points), -1)[:, -1]
+        closest = np.zeros((len(points), k), dtype=int)
+        for i, (p, r) in enumerate(zip(points, d)):
+            # the tree is out of date for nodes which moved, look a bit further
+            r = r * (1 + 1e-6) + 1e-6 + 2 * self._max_shift
+            candidates = np.sort(np.array(
+                self._kdtree.query_ball_point(p, r), dtype=int))
+            dist = np.linalg.norm(
+                mesh.nodes.node_coord[self.nodes[candidates] - 1] - p, axis=1)
+            closest[i] = candidates[np.argsort(dist, kind='stable')[:k]]
+        return closest
+
+    def _nodes_within(self, center, radius):
+        # superset of the nodes closer than radius to the center
+        radius = radius * (1 + 1e-6) + 1e-6 + self._max_shift
+        return np.sort(np.array(
+            self._kdtree.query_ball_point(center, radius), dtype=int))
+
+    def _adjacency(self, mesh, elements, n, local):
+        # CSR structure with the elements around each node
+        nodes = mesh.elm.node_number_list[elements - 1, :n]
+        if local:
+            nodes = self._local[nodes]
+            n_rows = len(self.nodes)
+        else:
+            n_rows = mesh.nodes.nr + 1
+        rows, cols = np.nonzero(nodes >= 0)
+        nodes = nodes[rows, cols]
+        order = np.argsort(nodes, kind='stable')
+        indptr = np.zeros(n_rows + 1, dtype=int)
+        indptr[1:] = np.cumsum(np.bincount(nodes, minlength=n_rows))
+        return indptr, elements[rows[order]]
+
+    @staticmethod
+    def _gather(adjacency, rows):
+        # elements around each row, and the position of the row in rows
+        indptr, elements = adjacency
+        start = indptr[rows]
+        count = indptr[rows + 1] - start
+        offset = np.cumsum(count) - count
+        idx = np.arange(count.sum()) - np.repeat(offset - start, count)
+        return elements[idx], np.repeat(np.arange(len(rows)), count)
+
+    def normals(self, mesh, nodes):
+        ''' Normals at the given nodes, same as mesh.nodes_normals()[nodes]
+
+        Parameters
+        -----------
+        mesh: simnibs.msh.mesh_io.Msh
+            Mesh
+        nodes: np.ndarray
+            Nodes (1-based)
+
+        Returns
+        ---------
+        normals: np.ndarray
+            Normals at each node, considering all triangles in the mesh
+        '''
+        self._check(mesh)
+        if self._node_triangles is None:
+            self._node_triangles = self._adjacency(
+                mesh, mesh.elm.triangles, 3, local=False)
+        nodes = np.asarray(nodes, dtype=int)
+        tr, row = self._gather(self._node_triangles, nodes)
+        node_tr = mesh.nodes.node_coord[mesh.elm.node_number_list[tr - 1, :3] - 1]
+        tr_normals = np.cross(node_tr[:, 1] - node_tr[:, 0],
+                              node_tr[:, 2] - node_tr[:, 0])
+        nd = np.zeros((len(nodes), 3))
+        for i in range(3):
+            nd[:, i] = np.bincount(row, tr_normals[:, i], len(nodes))
+        in_tr = np.bincount(row, minlength=len(nodes)) > 0
+        nd[in_tr] = nd[in_tr] / np.linalg.norm(nd[in_tr], axis=1)[:, None]
+        return nd
+
+    def project(self, mesh, points):
+        ''' Same as project_points_on_surface(mesh, points, surface_tags) '''
+        points = np.array(points)
+        if points.ndim == 1:
+            points = points.reshape((1, len(points)))
+        if self._pttris is None:
+            self._pttris = _get_triangle_neighbors(self._tris, len(self.nodes))
+        ix = self.closest_nodes(mesh, points, k=3)
+        pttris = list(map(lambda x: np.unique(np.concatenate(x)), self._pttris[ix]))
+        surf = {
+            'tris': self._tris,
+            'points': mesh.nodes.node_coord[self.nodes - 1]
+        }
+        _, _, projs, _ = _project_points_to_surface(points, surf, pttris)
+        return projs
+
+    def average_edge_length(self, mesh):
+        ''' Average edge length, estimated as in _get_roi '''
+        return np.average(np.linalg.norm(
+            mesh.nodes[self._edge_sample[0]] - mesh.nodes[self._edge_sample[1]],
+            axis=1))
+
+    def roi(self, mesh, center, radius, min_cos=.1):
+        ''' Same as _get_roi(center, radius, mesh, surface_tags, min_cos) '''
+        self._check(mesh)
+        center = np.array(center, dtype=float)
+        if len(self.nodes) == 0:
+            raise ValueError('Could not find surface {0} in mesh'.format(self.surface_tags))
+
+        avg_l = self.average_edge_length(mesh)
+        candidates = self._nodes_within(center, radius + 2*avg_l)
+        distances = np.linalg.norm(
+            center - mesh.nodes[self.nodes[candidates]], axis=1)
+        normals = self.normals(mesh, self.nodes[candidates])
+        center_normal = self.normals(
+            mesh, self.nodes[self.closest_nodes(mesh, center)[0]])[0]
+
+        nodes_in_roi_ext = candidates[(distances <= radius + 2*avg_l) *
+                                      (center_normal.dot(normals.T) > min_cos)]
+        nodes_in_roi = self.nodes[candidates[(distances <= radius) *
+                                             (center_normal.dot(normals.T) > min_cos)]]
+
+        if self._node_tetrahedra is None:
+            self._node_tetrahedra = self._adjacency(
+                mesh, mesh.elm.tetrahedra, 4, local=True)
+        if self._node_triangles is None:
+            self._node_triangles = self._adjacency(
+                mesh, mesh.elm.triangles, 3, local=False)
+        triangles = np.unique(self._gather(self._node_triangles, nodes_in_roi)[0])
+        tetrahedra = np.unique(self._gather(self._node_tetrahedra, nodes_in_roi_ext)[0])
+
+        roi_tr_nodes, roi_triangles_reordering = \
+            np.unique(mesh.elm[triangles, :3], return_inverse=True)
+
+        roi_th_nodes, roi_tetrahedra_reordering = \
+            np.unique(mesh.elm[tetrahedra], return_inverse=True)
+
+        return triangles, roi_tr_nodes, roi_triangles_reordering.reshape(-1,3), \
+            tetrahedra, roi_th_nodes, roi_tetrahedra_reordering.reshape(-1,4)
+
+    def fix_th_node_ordering(self, mesh):
+        ''' Calls mesh.fix_th_node_ordering() the first time it is called '''
+        self._check(mesh)
+        if not self._fixed_th_ordering:
+            mesh.fix_th_node_ordering()
+            self._fixed_th_ordering = True
 
 def _point_inside_polygon(vertices, points, tol=1e-3):
     '''uses the line-tracing algorithm Known issues: if the point is right in the edge,
@@ -788,9 +986,21 @@ def _build_electrode(poly, height, nodes, triangles, holes=[], plug=None,
 
 def _build_electrode_on_mesh(center, ydir, poly, h, mesh, el_vol_tag, el_surf_tag,
                              on_top_of=[ElementTags.SCALP, ElementTags.SCALP_TH_SURFACE], holes=[], plug=None, plug_tag=None,
-                             middle_layer=None):
+                             middle_layer=None, scalp_index=None):
     ''' Given the spatial localization of the electrode and the polygon description, add
     it to the mesh '''
+    patch = _get_electrode_on_mesh_patch(
+        center, ydir, poly, h, mesh, el_vol_tag, el_surf_tag,
+        on_top_of=on_top_of, holes=holes, plug=plug, plug_tag=plug_tag,
+        middle_layer=middle_layer, scalp_index=scalp_index)
+    return _add_electrode_patches(mesh, [patch])
+
+
+def _get_electrode_on_mesh_patch(center, ydir, poly, h, mesh, el_vol_tag, el_surf_tag,
+                                 on_top_of=[ElementTags.SCALP, ElementTags.SCALP_TH_SURFACE], holes=[], plug=None, plug_tag=None,
+                                 middle_layer=None, scalp_index=None):
+    ''' Builds the electrode, only changing the positions of the mesh nodes.
+    The elements are described in the patch returned, see _add_electrode_patches '''
     # Get Roi
     h = np.atleast_1d(h).astype(float)
     el_vol_tag = np.atleast_1d(el_vol_tag).astype(int)
@@ -806,10 +1016,13 @@ def _build_electrode_on_mesh(center, ydir, poly, h, mesh, el_vol_tag, el_surf_ta
     if plug is not None:
         assert plug_tag is not None
 
+    if scalp_index is None:
+        scalp_index = ScalpIndex(mesh, on_top_of)
+
     R = np.linalg.norm(poly, axis=1).max() * 1.2
 
     roi_triangles, roi_tr_nodes, triangles, _, _, _ = _get_roi(
-             center, R, mesh, mesh_surface=on_top_of)
+             center, R, mesh, mesh_surface=on_top_of, scalp_index=scalp_index)
         
     # Sometimes the ROI can include nodes inside the head. Figure out the 
     # connected components and take the group, which includes the center node
@@ -820,7 +1033,8 @@ def _build_electrode_on_mesh(center, ydir, poly, h, mesh, el_vol_tag, el_surf_ta
     affine, _ = _get_transform(
         center, ydir, mesh,
         mesh_surface=on_top_of,
-        nodes_roi=roi_tr_nodes
+        nodes_roi=roi_tr_nodes,
+        scalp_index=scalp_index
     )
     tr_nodes = _apply_affine(affine, tr_nodes)
     tr_nodes_z = tr_nodes[:, 2]
@@ -831,7 +1045,7 @@ def _build_electrode_on_mesh(center, ydir, poly, h, mesh, el_vol_tag, el_surf_ta
         poly, h, tr_nodes, triangles, holes=holes, plug=plug, middle_layer=middle_layer
     )
     if out is None:
-        return mesh
+        return {'moved': [], 'electrode': None}
     else:
         moved_tr_nodes, tetrahedra, triangles, corresponding, in_surf, th_tag, tr_tag = out
     
@@ -845,15 +1059,9 @@ def _build_electrode_on_mesh(center, ydir, poly, h, mesh, el_vol_tag, el_surf_ta
     moved_tr_nodes = moved_tr_nodes[~in_surf]
     moved_tr_nodes = _apply_affine(inv_affine, moved_tr_nodes)
 
-    # Add nodes to mesh
+    # Move the nodes in the mesh
     mesh.nodes.node_coord[roi_tr_nodes-1, :] = tr_nodes
-    mesh.nodes.node_coord = np.vstack(
-        [mesh.nodes.node_coord, moved_tr_nodes])
-
-    # Create dictonary in order to make the elements
-    node_dict = np.zeros(len(corresponding), dtype=int)
-    node_dict[in_surf] = roi_tr_nodes[corresponding[in_surf]]
-    node_dict[~in_surf] = 1 + mesh.nodes.nr - len(moved_tr_nodes) + np.arange(len(moved_tr_nodes))
+    scalp_index.nodes_moved(mesh, roi_tr_nodes)
 
     # Tetrahedra tags
     tetra_tags = np.ones_like(th_tag, dtype=int)
@@ -863,22 +1071,7 @@ def _build_electrode_on_mesh(center, ydir, poly, h, mesh, el_vol_tag, el_surf_ta
         tetra_tags[th_tag == 0] = el_vol_tag[0]
         tetra_tags[th_tag == 1] = el_vol_tag[1]
 
-    # Make the tetrahedra
-    mesh.elm.tag1 = np.hstack(
-        [mesh.elm.tag1, tetra_tags])
-    mesh.elm.tag2 = np.hstack(
-        [mesh.elm.tag2, tetra_tags])
-    mesh.elm.elm_type = np.hstack(
-        [mesh.elm.elm_type, int(4) * np.ones(len(tetrahedra), dtype=int)])
-
-    mesh.elm.node_number_list = np.vstack(
-        [mesh.elm.node_number_list, node_dict[tetrahedra]])
-
-    # Make the triangles
-    s = np.min(np.where(mesh.elm.elm_type==4)[0])
-    tr = node_dict[triangles]
-    tr = np.concatenate((tr, -1 * np.ones((len(tr), 1), dtype=int)), axis=1)
-
+    # Triangle tags
     surf_tags = np.ones_like(tr_tag, dtype=int)
     if len(h) == 1:
         surf_tags[:] = el_surf_tag[0]
@@ -891,6 +1084,72 @@ def _build_electrode_on_mesh(center, ydir, poly, h, mesh, el_vol_tag, el_surf_ta
             raise ValueError('Could not find any triangles in the plug region')
         surf_tags[tr_tag == -1] = plug_tag
 
+    electrode = {
+        'nodes': moved_tr_nodes,
+        'in_surf': in_surf,
+        'surface_nodes': roi_tr_nodes[corresponding[in_surf]],
+        'tetrahedra': tetrahedra,
+        'tetra_tags': tetra_tags,
+        'triangles': triangles,
+        'surf_tags': surf_tags,
+    }
+    return {'moved': [(roi_tr_nodes, tr_nodes)], 'electrode': electrode}
+
+
+def _add_electrode_patches(mesh, patches):
+    ''' Adds the electrodes in the patches to the mesh, in order.
+
+    The result is the same as adding the electrodes one after the other: the
+    new nodes are appended to the mesh, the new tetrahedra are appended to the
+    elements and the new triangles are inserted before the first tetrahedron '''
+    node_coord = [mesh.nodes.node_coord]
+    nr_nodes = mesh.nodes.nr
+    tetrahedra = []
+    tetra_tags = []
+    triangles = []
+    surf_tags = []
+    for patch in patches:
+        for nodes, coords in patch['moved']:
+            mesh.nodes.node_coord[nodes - 1, :] = coords
+        el = patch['electrode']
+        if el is None:
+            continue
+        # Create dictonary in order to make the elements
+        node_dict = np.zeros(len(el['in_surf']), dtype=int)
+        node_dict[el['in_surf']] = el['surface_nodes']
+        node_dict[~el['in_surf']] = 1 + nr_nodes + np.arange(len(el['nodes']))
+        nr_nodes += len(el['nodes'])
+        node_coord.append(el['nodes'])
+        tetrahedra.append(node_dict[el['tetrahedra']])
+        tetra_tags.append(el['tetra_tags'])
+        tr = node_dict[el['triangles']]
+        triangles.append(
+            np.concatenate((tr, -1 * np.ones((len(tr), 1), dtype=int)), axis=1))
+        surf_tags.append(el['surf_tags'])
+
+    if len(tetrahedra) == 0:
+        return mesh
+
+    # Add nodes to mesh
+    mesh.nodes.node_coord = np.vstack(node_coord)
+
+    # Make the tetrahedra
+    tetra_tags = np.hstack(tetra_tags)
+    mesh.elm.tag1 = np.hstack(
+        [mesh.elm.tag1, tetra_tags])
+    mesh.elm.tag2 = np.hstack(
+        [mesh.elm.tag2, tetra_tags])
+    mesh.elm.elm_type = np.hstack(
+        [mesh.elm.elm_type, int(4) * np.ones(len(tetra_tags), dtype=int)])
+
+    mesh.elm.node_number_list = np.vstack(
+        [mesh.elm.node_number_list] + tetrahedra)
+
+    # Make the triangles
+    s = np.min(np.where(mesh.elm.elm_type==4)[0])
+    tr = np.vstack(triangles)
+    surf_tags = np.hstack(surf_tags)
+
     mesh.elm.tag1 = np.insert(
         mesh.elm.tag1, s,  surf_tags)
 
@@ -906,7 +1165,10 @@ def _build_electrode_on_mesh(center, ydir, poly, h, mesh, el_vol_tag, el_surf_ta
     return mesh
 
 
-def _create_polygon_from_elec(elec, mesh, skin_tag=[ElementTags.SCALP, ElementTags.SCALP_TH_SURFACE]):
+def _create_polygon_from_elec(elec, mesh, skin_tag=[ElementTags.SCALP, ElementTags.SCALP_TH_SURFACE],
+                              scalp_index=None):
+    if scalp_index is None:
+        scalp_index = ScalpIndex(mesh, skin_tag)
     if elec.definition == 'plane':
         if elec.shape in ['rect', 'rectangle', 'ellipse']:
             if elec.dimensions is None or len(elec.dimensions) == 0:
@@ -942,7 +1204,7 @@ def _create_polygon_from_elec(elec, mesh, skin_tag=[ElementTags.SCALP, ElementTa
             if elec.pos_ydir is not None and len(elec.pos_ydir) == 2:
                 raise NotImplementedError('Relative y axis not implemented yet')
         elif len(center) == 3:
-            center = project_points_on_surface(mesh, center, surface_tags = skin_tag).flatten()
+            center = scalp_index.project(mesh, center).flatten()
         else:
             raise ValueError('Wrong dimension of electrode centre: it should be 1x3 (or 1x2 for plugs)')
 
@@ -954,7 +1216,7 @@ def _create_polygon_from_elec(elec, mesh, skin_tag=[ElementTags.SCALP, ElementTa
         if pos_y:
             y_axis = np.array(elec.pos_ydir, dtype=float)
             if len(y_axis) == 3:
-                y_axis = project_points_on_surface(mesh, y_axis, surface_tags = skin_tag).flatten()
+                y_axis = scalp_index.project(mesh, y_axis).flatten()
         else:
             y_axis = None
 
@@ -966,10 +1228,10 @@ def _create_polygon_from_elec(elec, mesh, skin_tag=[ElementTags.SCALP, ElementTa
         center = np.average(v, axis=0)
         R = np.linalg.norm(center - v, axis=1).max() * 1.2
         _, roi_nodes, _, _, _, _ = _get_roi(
-            center, R, mesh, mesh_surface=skin_tag
+            center, R, mesh, mesh_surface=skin_tag, scalp_index=scalp_index
         )
         transform, c = _get_transform(center, None, mesh, mesh_surface=skin_tag,
-                                      nodes_roi=roi_nodes)
+                                      nodes_roi=roi_nodes, scalp_index=scalp_index)
         center = c
         y_axis = None
         poly = _apply_affine(transform, v)
@@ -981,7 +1243,8 @@ def _create_polygon_from_elec(elec, mesh, skin_tag=[ElementTags.SCALP, ElementTa
     return poly, center, y_axis
 
 def put_electrode_on_mesh(elec, mesh, elec_tag, skin_tag=[ElementTags.SCALP, ElementTags.SCALP_TH_SURFACE], extra_add=(ElementTags.SALINE_START - ElementTags.ELECTRODE_RUBBER_START),
-                          surf_add=ElementTags.TH_SURFACE_START, plug_add=ElementTags.ELECTRODE_PLUG_SURFACE_START):
+                          surf_add=ElementTags.TH_SURFACE_START, plug_add=ElementTags.ELECTRODE_PLUG_SURFACE_START,
+                          scalp_index=None):
     ''' Places an electrode in the given mesh
 
     Parameters
@@ -1000,6 +1263,9 @@ def put_electrode_on_mesh(elec, mesh, elec_tag, skin_tag=[ElementTags.SCALP, Ele
         Number to be added to designate electrode surfaces. Default:1000
     plug_add:
         Number to be added to designate plug surfaces. Default:2000
+    scalp_index: ScalpIndex (optional)
+        Index of the skin surface of the mesh. The index can not be used
+        anymore after the electrode is added. Default: build a new index
 
     Returns:
     ---------
@@ -1008,19 +1274,32 @@ def put_electrode_on_mesh(elec, mesh, elec_tag, skin_tag=[ElementTags.SCALP, Ele
     el_surf: int
         Electrode surface tag
     '''
+    if scalp_index is None:
+        scalp_index = ScalpIndex(mesh, skin_tag)
+    patch = _get_electrode_patch(
+        elec, mesh, elec_tag, skin_tag, extra_add, surf_add, plug_add,
+        scalp_index)
+    mesh = _add_electrode_patches(mesh, [patch])
+    return mesh, elec_tag + plug_add
+
 
+def _get_electrode_polygons(elec, mesh, skin_tag, scalp_index):
+    ''' Polygons describing the electrode, its holes, plug and sponge '''
     # Generate the polygon
     elec = copy.deepcopy(elec)
     elec.substitute_positions_from_cap()
-    elec_poly, elec_center, ydir = _create_polygon_from_elec(elec, mesh, skin_tag=skin_tag)
-    thick = np.atleast_1d(elec.thickness)
+    elec_poly, elec_center, ydir = _create_polygon_from_elec(
+        elec, mesh, skin_tag=skin_tag, scalp_index=scalp_index)
     holes_poly = []
     for h in elec.holes:
         holes_poly.append(
-            _create_polygon_from_elec(h, mesh, skin_tag=skin_tag)[0])
+            _create_polygon_from_elec(
+                h, mesh, skin_tag=skin_tag, scalp_index=scalp_index)[0])
 
     if elec.plug in [[], None]:
+        plug = None
         plug_poly = None
+        plug_center = None
     else:
         try:
             plug = elec.plug[0]
@@ -1029,7 +1308,8 @@ def put_electrode_on_mesh(elec, mesh, elec_tag, skin_tag=[ElementTags.SCALP, Ele
         except (IndexError, TypeError):
             plug = elec.plug
         plug_poly, plug_center, plug_ydir = \
-            _create_polygon_from_elec(plug, mesh, skin_tag=skin_tag)
+            _create_polygon_from_elec(
+                plug, mesh, skin_tag=skin_tag, scalp_index=scalp_index)
 
     if elec.dimensions_sponge is not None and len(elec.dimensions_sponge) > 0:
         if elec.definition != 'plane':
@@ -1044,19 +1324,37 @@ def put_electrode_on_mesh(elec, mesh, elec_tag, skin_tag=[ElementTags.SCALP, Ele
         has_sponge = True
         sponge_el = copy.deepcopy(elec)
         sponge_el.dimensions = elec.dimensions_sponge
-        sponge_poly = _create_polygon_from_elec(sponge_el, mesh, skin_tag=skin_tag)[0]
+        sponge_poly = _create_polygon_from_elec(
+            sponge_el, mesh, skin_tag=skin_tag, scalp_index=scalp_index)[0]
 
     else:
         has_sponge = False
+        sponge_el = None
+        sponge_poly = None
 
     if has_sponge:
         R = np.linalg.norm(sponge_poly, axis=1).max() * 1.2
     else:
         R = np.linalg.norm(elec_poly, axis=1).max() * 1.2
 
+    return elec, elec_poly, elec_center, ydir, holes_poly, plug, plug_poly, \
+        plug_center, sponge_el, sponge_poly, R
+
+
+def _get_electrode_patch(elec, mesh, elec_tag, skin_tag, extra_add, surf_add,
+                         plug_add, scalp_index, polygons=None):
+    ''' Places the electrode, but only changes the positions of the mesh nodes.
+    See _add_electrode_patches. "polygons" is the output of
+    _get_electrode_polygons, if it was already computed '''
+    if polygons is None:
+        polygons = _get_electrode_polygons(elec, mesh, skin_tag, scalp_index)
+    elec, elec_poly, elec_center, ydir, holes_poly, plug, plug_poly, \
+        plug_center, sponge_el, sponge_poly, R = polygons
+    thick = np.atleast_1d(elec.thickness)
+    has_sponge = sponge_poly is not None
 
     roi_triangles, roi_tr_nodes, triangles, roi_tetrahedra, roi_th_nodes, tetrahedra =  _get_roi(
-        elec_center, R, mesh, mesh_surface=skin_tag)
+        elec_center, R, mesh, mesh_surface=skin_tag, scalp_index=scalp_index)
     
     # Sometimes the ROI can include nodes inside the head. Figure out the 
     # connected components and take the group, which includes the center node
@@ -1065,12 +1363,13 @@ def put_electrode_on_mesh(elec, mesh, elec_tag, skin_tag=[ElementTags.SCALP, Ele
 
     tr_nodes = mesh.nodes[roi_tr_nodes]
     th_nodes = mesh.nodes[roi_th_nodes]
-    mesh.fix_th_node_ordering()
+    scalp_index.fix_th_node_ordering(mesh)
 
     affine, elec_center = _get_transform(
         elec_center, ydir, mesh,
         mesh_surface=skin_tag,
-        nodes_roi=roi_tr_nodes)
+        nodes_roi=roi_tr_nodes,
+        scalp_index=scalp_index)
     tr_nodes = _apply_affine(affine, tr_nodes)
     
     inv_affine = np.linalg.inv(affine)
@@ -1119,37 +1418,177 @@ def put_electrode_on_mesh(elec, mesh, elec_tag, skin_tag=[ElementTags.SCALP, Ele
     # Change the mesh
     tr_nodes = _apply_affine(inv_affine, tr_nodes)
     mesh.nodes.node_coord[roi_tr_nodes-1, :] = tr_nodes
+    scalp_index.nodes_moved(mesh, roi_tr_nodes)
 
     # Build electrodes
     if plug_poly is None:
         plug_poly = elec_poly
 
     if len(thick) == 1:
-        mesh = _build_electrode_on_mesh(
+        patch = _get_electrode_on_mesh_patch(
             elec_center, ydir, elec_poly, thick, mesh,
             elec_tag + extra_add, elec_tag + extra_add + surf_add,
-            on_top_of=skin_tag, holes=holes_poly, plug=plug_poly, plug_tag=elec_tag + plug_add)
+            on_top_of=skin_tag, holes=holes_poly, plug=plug_poly, plug_tag=elec_tag + plug_add,
+            scalp_index=scalp_index)
 
     elif len(thick) == 2:
-        mesh = _build_electrode_on_mesh(
+        patch = _get_electrode_on_mesh_patch(
             elec_center, ydir, elec_poly, thick, mesh,
             [elec_tag + extra_add, elec_tag],
             [elec_tag + extra_add + surf_add, elec_tag + surf_add],
-            on_top_of=skin_tag, holes=holes_poly, plug=plug_poly, plug_tag=elec_tag + plug_add)
+            on_top_of=skin_tag, holes=holes_poly, plug=plug_poly, plug_tag=elec_tag + plug_add,
+            scalp_index=scalp_index)
 
     elif len(thick) == 3:
         if not has_sponge:
             sponge_poly = copy.deepcopy(elec_poly)
 
-        mesh = _build_electrode_on_mesh(
+        patch = _get_electrode_on_mesh_patch(
             elec_center, ydir, sponge_poly, thick, mesh,
             [elec_tag + extra_add, elec_tag],
             [elec_tag + extra_add + surf_add, elec_tag + surf_add],
             on_top_of=skin_tag, holes=holes_poly, plug=plug_poly,
             plug_tag=elec_tag + plug_add,
-            middle_layer=elec_poly)
+            middle_layer=elec_poly, scalp_index=scalp_index)
     else:
         raise ValueError('Electrodes must have 1, 2, or 3 layers')
 
+    patch['moved'].insert(0, (roi_tr_nodes, tr_nodes))
+    return patch
 
-    return mesh, elec_tag + plug_add
+
+def put_electrodes_on_mesh(electrodes, mesh, elec_tags, skin_tag=[ElementTags.SCALP, ElementTags.SCALP_TH_SURFACE], extra_add=(ElementTags.SALINE_START - ElementTags.ELECTRODE_RUBBER_START),
+                           surf_add=ElementTags.TH_SURFACE_START, plug_add=ElementTags.ELECTRODE_PLUG_SURFACE_START,
+                           cpus=1):
+    ''' Places several electrodes in the given mesh
+
+    Gives the same result as calling put_electrode_on_mesh for each electrode,
+    but the electrodes are placed in batches of electrodes which are far enough
+    from each other not to touch the same nodes and elements. The electrodes
+    in a batch share a ScalpIndex, can be built in parallel and are added to
+    the mesh together.
+
+    Parameters
+    ---------------
+    electrodes: list of simnibs.simulation.sim_struct.ELEC
+        Structures with electrode information
+    mesh: simnibs.msh.mesh_io.mesh
+        Mesh where the electrodes are to be placed
+    elec_tags: list of ints
+        Tag for the volume of each electrode.
+    skin_tag: int or list of ints (optional)
+        Tags where the electrode is to be placed. Default: [5, 1005]
+    extra_add: int
+        Number to be added to electrode_tag to designate gel/sponge. Default:400
+    surf_add:
+        Number to be added to designate electrode surfaces. Default:1000
+    plug_add:
+        Number to be added to designate plug surfaces. Default:2000
+    cpus: int (optional)
+        Number of processes used to build the electrodes in a batch. Default: 1
+
+    Returns:
+    ---------
+    mesh_w_electrode: simnibs.msh.mesh_io
+        Mesh structure with the electrodes added
+    el_surf: list of ints
+        Electrode surface tags
+    '''
+    if len(electrodes) != len(elec_tags):
+        raise ValueError('Please define one tag per electrode')
+    settings = (skin_tag, extra_add, surf_add, plug_add)
+    start = 0
+    while start < len(electrodes):
+        scalp_index = ScalpIndex(mesh, skin_tag)
+        # Electrodes are independent if their regions of interest are far
+        # enough from each other, considering the nodes around them
+        margin = 4 * scalp_index.average_edge_length(mesh)
+        batch = []
+        footprints = []
+        for elec, tag in zip(electrodes[start:], elec_tags[start:]):
+            polygons = _get_electrode_polygons(elec, mesh, skin_tag, scalp_index)
+            center, radius = polygons[2], polygons[-1] + margin
+            if any(np.linalg.norm(center - c) <= radius + r for c, r in footprints):
+                break
+            footprints.append((center, radius))
+            batch.append((elec, tag, polygons))
+        start += len(batch)
+
+        if cpus == 1 or len(batch) == 1:
+            patches = [
+                _get_electrode_patch(
+                    elec, mesh, tag, *settings, scalp_index, polygons)
+                for elec, tag, polygons in batch
+            ]
+        else:
+            with multiprocessing.Pool(
+                processes=cpus, initializer=_set_placement_data,
+                initargs=((mesh, scalp_index, settings),)
+            ) as pool:
+                patches = pool.map(_electrode_patch_worker, batch)
+            scalp_index.fix_th_node_ordering(mesh)
+        mesh = _add_electrode_patches(mesh, patches)
+    return mesh, [tag + plug_add for tag in elec_tags]
+
+
+def _set_placement_data(data):
+    global _placement_data
+    _placement_data = data
+
+
+def _electrode_patch_worker(electrode):
+    mesh, scalp_index, settings = _placement_data
+    elec, tag, polygons = electrode
+    return _get_electrode_patch(
+        elec, mesh, tag, *settings, scalp_index, polygons)
+
+
+def get_electrode_node_patches(mesh, centres, radius=0., outer_nodes=None):
+    ''' Maps electrode positions to patches of nodes in the outer scalp
+
+    The electrodes are projected to the outer part of the scalp surface. Each
+    patch contains the nodes of the triangle where the electrode is projected
+    and the outer scalp nodes closer than radius to the projection. The mesh
+    is not modified, so that the patches can be used as "nodes" input to
+    fem.TDCSFEMNeumann
+
+    Parameters
+    ---------------
+    mesh: simnibs.msh.mesh_io.mesh
+        Head mesh
+    centres: (N, 3) array
+        Electrode positions
+    radius: float or list of floats (optional)
+        Radius of the patch of each electrode, in mm. Default: 0, only the
+        nodes of the triangle where the electrode is projected
+    outer_nodes: np.ndarray (optional)
+        Nodes in the outer scalp surface (1-based), as returned by
+        mesh.partition_skin_surface(). Default: computed from the mesh
+
+    Returns
+    ---------
+    patches: list of np.ndarray
+        Nodes (1-based) in each patch
+    projections: (N, 3) array
+        Positions of the electrodes projected to the outer scalp
+    '''
+    centres = np.atleast_2d(centres)
+    radius = np.broadcast_to(radius, len(centres))
+    if outer_nodes is None:
+        _, outer_nodes, _, _ = mesh.partition_skin_surface()
+    outer_nodes = np.asarray(outer_nodes, dtype=int) - 1
+    skin_faces = mesh.elm[mesh.elm.tag1 == ElementTags.SCALP_TH_SURFACE, :3] - 1
+    surf = dict(points=mesh.nodes.node_coord, tris=skin_faces)
+    kdtree = scipy.spatial.cKDTree(surf['points'][outer_nodes])
+    _, ix = kdtree.query(centres, 3)
+    pttris = _get_triangle_neighbors(skin_faces, mesh.nodes.nr)[outer_nodes[ix]]
+    pttris = list(map(lambda x: np.unique(np.concatenate(x)), pttris))
+    tris, _, projections, _ = _project_points_to_surface(centres, surf, pttris)
+    patches = []
+    for t, p, r in zip(tris, projections, radius):
+        nodes = skin_faces[t]
+        if r > 0:
+            nodes = np.union1d(
+                nodes, outer_nodes[kdtree.query_ball_point(p, r)])
+        patches.append(nodes + 1)
+    return patches, projections
@@ -22,6 +22,7 @@ from ..utils import cond_utils as cond_lib
 from . import coil_numpy as coil_lib
 from . import pardiso
 from . import petsc_solver
+from . import scipy_solver
 from ..utils.simnibs_logger import logger
 
 DEFAULT_SOLVER_OPTIONS = \
@@ -491,7 +492,21 @@ class FEMSystem(object):
     store_G: bool (optional)
         Wether to store the gradient matrix. Default: False
     solver_options: str
-        Options to be used by the solver. Default: DEFAULT_SOLVER_OPTIONS
+        Options to be used by the solver. 'pardiso' uses MKL PARDISO, options
+        starting with 'scipy' use the conjugate gradient solver in
+        scipy_solver (e.g. 'scipy -pc_type amg -ksp_rtol 1e-10'), other
+        options are passed on to PETSc. Default: DEFAULT_SOLVER_OPTIONS
+    stiffness_pattern: StiffnessPattern (optional)
+        Precomputed sparsity pattern used to assemble the stiffness matrix.
+        Default: assemble the matrix from scratch
+    incremental_stiffness: IncrementalStiffness (optional)
+        Stiffness matrix of the head, updated for the electrodes in the mesh.
+        Default: assemble the matrix from scratch
+    previous_solver: FEMSystem or scipy_solver.Solver (optional)
+        System, or its solver, with a close by matrix of the same size, such as
+        another conductivity sample in the same mesh. With the 'scipy' solver
+        options, its preconditioner is re-used and its last solution is the
+        first initial guess. Default: prepare a new preconditioner
 
     Attributes
     ----------
@@ -507,6 +522,8 @@ class FEMSystem(object):
         Sparse system matric
     dof_map: dofMap
         Mapping between rows/columns of A and DOFs
+    solver:
+        Solver of the system, None until the solver is prepared
 
     Notes
     -----
@@ -514,7 +531,8 @@ class FEMSystem(object):
 
     '''
     def __init__(self, mesh, cond, dirichlet=None, units='mm', store_G=False,
-                 solver_options=None):
+                 solver_options=None, stiffness_pattern=None,
+                 incremental_stiffness=None, previous_solver=None):
         if units in ['mm', 'm']:
             self.units = units
         else:
@@ -533,6 +551,9 @@ class FEMSystem(object):
         self._solver = None
         self._G = None # Gradient operator
         self._D = None # Gradient matrix
+        self._stiffness_pattern = stiffness_pattern
+        self._incremental_stiffness = incremental_stiffness
+        self._previous_solver = previous_solver
         if solver_options in [None, '']:
             self._solver_options = DEFAULT_SOLVER_OPTIONS
         else:
@@ -559,21 +580,40 @@ class FEMSystem(object):
     def dof_map(self):
         return self._dof_map
 
+    @property
+    def solver(self):
+        return self._solver
+
     def assemble_fem_matrix(self, store_G=False):
         ''' Assembly of the l.h.s matrix A. !Only works with symmetric matrices!
         Based in the OptVS algorithm in Cuvelier et. al. 2016 '''
         logger.info('Assembling FEM Matrix')
         start = time.time()
         msh = self.mesh
-        cond = self.cond[msh.elm.elm_type == 4]
-        th_nodes = msh.elm.node_number_list[msh.elm.elm_type == 4]
-        G = _gradient_operator(msh)
-        if store_G:
-            self._G = G  # stores the operator in case we need it later (TMS)
-        vols = _vol(msh)
-        dof_map = self.dof_map
-        self._A = _assemble_matrix(vols, G, th_nodes, cond, dof_map,
-                                   units=self.units)
+        pattern = self._stiffness_pattern
+        if pattern is not None:
+            if (pattern.units != self.units or pattern.dof_map.nr != self.dof_map.nr
+                    or not pattern.dof_map == self.dof_map):
+                raise ValueError('The stiffness pattern does not match the system')
+            if store_G:
+                self._G = pattern.G
+            self._A = pattern.assemble(self.cond)
+        elif self._incremental_stiffness is not None:
+            if self._incremental_stiffness.units != self.units:
+                raise ValueError('The incremental stiffness does not match the system')
+            if store_G:
+                self._G = _gradient_operator(msh)
+            self._A = self._incremental_stiffness.assemble(msh, self.cond)
+        else:
+            cond = self.cond[msh.elm.elm_type == 4]
+            th_nodes = msh.elm.node_number_list[msh.elm.elm_type == 4]
+            G = _gradient_operator(msh)
+            if store_G:
+                self._G = G  # stores the operator in case we need it later (TMS)
+            vols = _vol(msh)
+            dof_map = self.dof_map
+            self._A = _assemble_matrix(vols, G, th_nodes, cond, dof_map,
+                                       units=self.units)
         if np.any(np.diff(self.A.indptr) == 0):
             raise ValueError('Found a column of zeros in the stiffness matrix'
                              ' disconected nodes?')
@@ -598,10 +638,19 @@ class FEMSystem(object):
 
         if self._solver_options == 'pardiso':
             self._solver = pardiso.Solver(A)
+        elif self._solver_options.split(' ')[0] == 'scipy':
+            kwargs = scipy_solver.parse_options(self._solver_options)
+            previous = self._previous_solver
+            if isinstance(previous, FEMSystem):
+                previous = previous.solver
+            if isinstance(previous, scipy_solver.Solver) and previous.A.shape == A.shape:
+                kwargs['preconditioner'] = previous
+            self._solver = scipy_solver.Solver(A, **kwargs)
         else:
             _initialize_petsc()
             self._A_reduced = A  # We need to save this as PETSc does not copy the vectors
             self._solver = petsc_solver.Solver(self._solver_options, A)
+        self._previous_solver = None
 
     def solve(self, b=None):
         ''' Solves the FEM system
@@ -679,7 +728,9 @@ class TMSFEM(FEMSystem):
             cond,
             solver_options=None,
             units='mm',
-            store_G=True
+            store_G=True,
+            stiffness_pattern=None,
+            previous_solver=None,
         ):
         '''Set up a TMS problem.
 
@@ -691,9 +742,14 @@ class TMSFEM(FEMSystem):
             Conductivity of each element.
         solver_options: str
             Options to be used by the solver. Default: DEFAULT_SOLVER_OPTIONS
+        stiffness_pattern: StiffnessPattern (optional)
+            Precomputed sparsity pattern of the stiffness matrix.
+        previous_solver: FEMSystem or scipy_solver.Solver (optional)
+            Solver whose preconditioner and last solution are re-used.
         '''
         dirichlet_bc = set_ground_at_nodes(mesh)
-        super().__init__(mesh, cond, dirichlet_bc, units, store_G, solver_options)
+        super().__init__(mesh, cond, dirichlet_bc, units, store_G, solver_options,
+                         stiffness_pattern, previous_solver=previous_solver)
 
     def assemble_rhs(self, dadt):
         '''Assemble the right-hand side for a TMS simulation.
@@ -757,6 +813,9 @@ class TDCSFEMDirichlet(FEMSystem):
             solver_options=None,
             units='mm',
             store_G=False,
+            stiffness_pattern=None,
+            incremental_stiffness=None,
+            previous_solver=None,
         ):
         '''Set up a TDCS problem using Dirichlet boundary conditions in all
         electrodes.
@@ -773,13 +832,20 @@ class TDCSFEMDirichlet(FEMSystem):
             list of the potentials each surface is to be set.
         solver_options: str
             Options to be used by the solver. Default: DEFAULT_SOLVER_OPTIONS
+        stiffness_pattern: StiffnessPattern (optional)
+            Precomputed sparsity pattern of the stiffness matrix.
+        incremental_stiffness: IncrementalStiffness (optional)
+            Stiffness matrix of the head, updated for the electrodes.
+        previous_solver: FEMSystem or scipy_solver.Solver (optional)
+            Solver whose preconditioner and last solution are re-used.
         '''
         self.electrodes = electrodes
         self.potentials = potentials
         # self.input_type = input_type
 
         dirichlet_bc = self._init_dirichlet_bcs(mesh)
-        super().__init__(mesh, cond, dirichlet_bc, units, store_G, solver_options)
+        super().__init__(mesh, cond, dirichlet_bc, units, store_G, solver_options,
+                         stiffness_pattern, incremental_stiffness, previous_solver)
 
     def _init_dirichlet_bcs(self, mesh):
         """Set Dirichlet boundary conditions on all electrodes."""
@@ -817,8 +883,13 @@ class TDCSFEMNeumann(FEMSystem):
             Mesh structure
         cond: ndarray or simnibs.mesh_io.msh.ElementData
             Conductivity of each element
-        ground_electrode: int
-            Tag of the ground electrode surface
+        ground_electrode: int or None
+            Tag of the ground electrode surface. If None, a single node inside
+            the volume is grounded and all electrodes, including the
+            reference, are set as Neumann boundary conditions. The system then
+            does not depend on the electrodes and can be reused for several
+            electrode montages, as long as the currents of each right-hand
+            side add up to zero
         solver_options: str (optional)
             Options to be used by the solver. Default: DEFAULT_SOLVER_OPTIONS
         input_type: 'tag' or "nodes" (optional)
@@ -840,6 +911,17 @@ class TDCSFEMNeumann(FEMSystem):
     def _init_dirichlet_bc(self, mesh):
         """Set Dirichlet boundary condition on the ground electrode only."""
 
+        if self.ground_electrode is None:
+            # Lowest node which is not in a surface, so that it is not part of
+            # any electrode
+            in_volume = np.zeros(mesh.nodes.nr + 1, dtype=bool)
+            in_volume[mesh.elm.node_number_list[mesh.elm.elm_type == 4]] = True
+            in_volume[mesh.elm.node_number_list[mesh.elm.elm_type == 2, :3]] = False
+            n = np.where(in_volume)[0]
+            if len(n) == 0:
+                raise ValueError('Could not find a node to use as ground')
+            return set_ground_at_nodes(
+                mesh, n[mesh.nodes.node_coord[n - 1, 2].argmin()])
         # The first surface is set to a DirichletBC
         if self.input_type == 'tag':
             # Find the nodes in the tag
@@ -876,7 +958,10 @@ class TDCSFEMNeumann(FEMSystem):
             Right-hand-side of FEM system
         '''
         if self.input_type == "nodes":
-            electrodes = np.atleast_2d(electrodes)
+            if np.ndim(electrodes) == 0 or np.ndim(electrodes[0]) == 0:
+                # a single electrode, possibly with several nodes
+                electrodes = [electrodes]
+            electrodes = [np.atleast_1d(e) for e in electrodes]
         assert len(electrodes) == len(currents)
         b = np.zeros(self.dof_map.nr, dtype=np.float64)
         for e, c in zip(electrodes, currents):
@@ -932,41 +1017,14 @@ class DipoleFEM(FEMSystem):
     # def assemble_rhs(self, primary_j, source_model):
     def assemble_rhs(self, dip_pos, dip_mom, source_model):
         '''Assemble the right-hand side of the system equation using the
-        specified source model. Supported source models
-
-        * Partial Integration
-            Sources are placed on nodes of the tetrahedron in which a dipole
-            resides.
-            Loads are calculated by computing the similarity of the dipole
-            moment with the gradient in a particular element and weighing each
-            node accordingly (*integrating* the contributions from each dot
-            product). (Node positions are related to the basis vectors of the
-            element, e.g., e1=v1-v0, which are related to the gradients.)
-
-            This is insensitive to the position of a dipole within a given
-            volume element!
-
-        * St. Venant
-            Sources are placed on the node closest to the dipole as well as
-            first degree neighbors. A linear system of equations is solved
-            such that the sum of the monopolar moments is 0, the dipole moment
-            is equal to the specified moment, and the squared dipole moment is
-            zero as well. Thus, there are 7 equations with n unknowns where n
-            is the number of nodes on which loads are placed.
+        specified source model. See `assemble_dipole_rhs` for details.
 
         Parameters
         ----------
         dip_pos: ndarray (n, 3)
             Dipole positions.
         dip_mom: ndarray (n, 3)
-            Dipole moments in ampere-meter (Am). In case one wants to supply a
-            dipole moment matching a particular (primary) current density, J,
-            instead, use the following relationship between the dipole moment,
-            p, and J, to calculate the proper value of p.
-                p = int J dV
-                p = J*V_i
-                J = p/V_i
-            Here V_i is the volume of the ith element.
+            Dipole moments in ampere-meter (Am).
         source_model: str
             Select `partial integration` or `st. venant`.
 
@@ -974,73 +1032,153 @@ class DipoleFEM(FEMSystem):
         -------
         b: ndarray
             Right-hand side.
-
-        References
-        ----------
-        Weinstein, David, Leonid Zhukov, and Chris Johnson. "Lead-field bases
-            for electroencephalography source imaging." Annals of biomedical
-            engineering 28.9 (2000): 1059-1065.
         '''
-        dip_pos = np.atleast_2d(dip_pos).astype(float)
-        dip_mom = np.atleast_2d(dip_mom).astype(float)
-        assert dip_pos.shape == dip_mom.shape, "`dip_pos` and `dip_mom` must have the same dimensions"
-        n_dip = dip_pos.shape[0]
-
-        if self.units == "mm":
-            dip_mom *= 1e3 # Am to Amm
-
-        if source_model == "partial integration":
-            # This is very similar to the TMS case. Guilherme's original
-            # comment was
-            #   The RHS is basically the same as the TMS one, but with the
-            #   conductiviy is already incorporated in dipole_vectors
-
-            # find element containing each source
-            tetra_idx = self.mesh.find_tetrahedron_with_points(dip_pos, False)
-
-            # convert 1 to 0 indexing!
-            tetra_idx -= 1
-            tetra_idx = np.atleast_1d(tetra_idx)
-            nodes_idx = self.mesh.elm.node_number_list[tetra_idx]-1
-
-            n_nodes_idx = list(map(len, nodes_idx))
-            rows = np.concatenate(nodes_idx)
-            cols = np.concatenate([i*np.ones(n_nodes_idx[i], dtype=int) for i in range(n_dip)], dtype=int)
-
-            grad_op = _gradient_operator(self.mesh) if self._G is None else self._G
-            # grad_op is only computed for tetrahedra so reindex `tetra_idx`
-            reindexer = np.zeros(self.mesh.elm.nr, int)
-            reindexer[self.mesh.elm.tetrahedra-1] = np.arange(len(self.mesh.elm.tetrahedra))
-            tetra_idx = reindexer[tetra_idx]
-
-            # compute the integrals
-            data = np.ravel(grad_op[tetra_idx] @ dip_mom[..., None])
-            b = sparse.csc_matrix((data, (rows, cols)), shape=(self.mesh.nodes.nr, n_dip))
-        elif source_model == "st. venant":
-            raise NotImplementedError("St. Venant implementation has not been validated yet...")
-            # find closest mesh node to each source position
-            _, src_idx = self.mesh.nodes.find_closest_node(dip_pos, return_index=True)
-            # find all elements of closest nodes and keep only tetrahedra and
-            # reindex to 0
-            element_idx = [
-                np.intersect1d(
-                    self.mesh.elm.find_all_elements_with_node(i), self.mesh.elm.tetrahedra,
-                    assume_unique=True,
-                )-1 for i in src_idx
-            ]
-            # find all unique nodes of those elements
-            node_indices = [np.unique(self.mesh.elm.node_number_list[e]-1) for e in element_idx]
-
-            b = compute_st_venant_loads(dip_pos, dip_mom, node_indices, self.mesh.nodes.node_coord)
-        else:
-            raise ValueError
-
+        b = assemble_dipole_rhs(
+            self.mesh, dip_pos, dip_mom, source_model, self.units, self._G
+        )
         return np.array(b.todense()).squeeze()
 
 
+def assemble_dipole_rhs(mesh, dip_pos, dip_mom, source_model, units='mm', grad_op=None):
+    '''Assemble the right-hand side of the system equation using the
+    specified source model. Supported source models
+
+    * Partial Integration
+        Sources are placed on nodes of the tetrahedron in which a dipole
+        resides.
+        Loads are calculated by computing the similarity of the dipole
+        moment with the gradient in a particular element and weighing each
+        node accordingly (*integrating* the contributions from each dot
+        product). (Node positions are related to the basis vectors of the
+        element, e.g., e1=v1-v0, which are related to the gradients.)
+
+        This is insensitive to the position of a dipole within a given
+        volume element!
+
+    * St. Venant
+        Sources are placed on the node closest to the dipole as well as
+        first degree neighbors. A linear system of equations is solved
+        such that the sum of the monopolar moments is 0, the dipole moment
+        is equal to the specified moment, and the squared dipole moment is
+        zero as well. Thus, there are 7 equations with n unknowns where n
+        is the number of nodes on which loads are placed.
+
+    Parameters
+    ----------
+    mesh: simnibs.mesh_io.msh.Msh
+        Mesh structure
+    dip_pos: ndarray (n, 3)
+        Dipole positions.
+    dip_mom: ndarray (n, 3)
+        Dipole moments in ampere-meter (Am). In case one wants to supply a
+        dipole moment matching a particular (primary) current density, J,
+        instead, use the following relationship between the dipole moment,
+        p, and J, to calculate the proper value of p.
+            p = int J dV
+            p = J*V_i
+            J = p/V_i
+        Here V_i is the volume of the ith element.
+    source_model: str
+        Select `partial integration` or `st. venant`.
+    units: {'mm' or 'm'} (optional)
+        Units of the mesh nodes. Default: mm
+    grad_op: ndarray (optional)
+        Gradient operator of the mesh (see `_gradient_operator`). Default:
+        compute it
+
+    Returns
+    -------
+    b: scipy.sparse.csc_matrix
+        Right-hand side of shape (n_nodes, n), one column per dipole.
+
+    References
+    ----------
+    Weinstein, David, Leonid Zhukov, and Chris Johnson. "Lead-field bases
+        for electroencephalography source imaging." Annals of biomedical
+        engineering 28.9 (2000): 1059-1065.
+    '''
+    dip_pos = np.atleast_2d(dip_pos).astype(float)
+    dip_mom = np.atleast_2d(dip_mom).astype(float)
+    assert dip_pos.shape == dip_mom.shape, "`dip_pos` and `dip_mom` must have the same dimensions"
+    n_dip = dip_pos.shape[0]
+
+    if units == "mm":
+        dip_mom *= 1e3 # Am to Amm
+
+    if source_model == "partial integration":
+        # This is very similar to the TMS case. Guilherme's original
+        # comment was
+        #   The RHS is basically the same as the TMS one, but with the
+        #   conductiviy is already incorporated in dipole_vectors
+
+        # find element containing each source
+        tetra_idx = mesh.find_tetrahedron_with_points(dip_pos, False)
+
+        # convert 1 to 0 indexing!
+        tetra_idx -= 1
+        tetra_idx = np.atleast_1d(tetra_idx)
+        rows = np.ravel(mesh.elm.node_number_list[tetra_idx] - 1)
+        cols = np.repeat(np.arange(n_dip), 4)
+
+        if grad_op is None:
+            grad_op = _gradient_operator(mesh)
+        # grad_op is only computed for tetrahedra so reindex `tetra_idx`
+        reindexer = np.zeros(mesh.elm.nr, int)
+        reindexer[mesh.elm.tetrahedra-1] = np.arange(len(mesh.elm.tetrahedra))
+        tetra_idx = reindexer[tetra_idx]
+
+        # compute the integrals
+        data = np.ravel(grad_op[tetra_idx] @ dip_mom[..., None])
+        b = sparse.csc_matrix((data, (rows, cols)), shape=(mesh.nodes.nr, n_dip))
+    elif source_model == "st. venant":
+        raise NotImplementedError("St. Venant implementation has not been validated yet...")
+        node_indices = st_venant_node_indices(mesh, dip_pos)
+        b = compute_st_venant_loads(dip_pos, dip_mom, node_indices, mesh.nodes.node_coord)
+    else:
+        raise ValueError
+
+    return sparse.csc_matrix(b)
+
+
+def st_venant_node_indices(mesh, dip_pos):
+    """Find the nodes where the St. Venant loads of each dipole are placed,
+    that is, the node closest to the dipole and all nodes sharing a
+    tetrahedron with it.
+
+    Parameters
+    ----------
+    mesh: simnibs.mesh_io.msh.Msh
+        Mesh structure
+    dip_pos : ndarray (n, 3)
+        Dipole positions.
+
+    Returns
+    -------
+    dip_node_indices : list (n, ) of ndarray
+        Indices (0-indexed) of the nodes surrounding each dipole.
+    """
+    # find closest mesh node to each source position
+    _, src_idx = mesh.nodes.find_closest_node(
+        np.atleast_2d(dip_pos), return_index=True
+    )
+    # node-tetrahedron incidence matrix. The nodes of the tetrahedra with
+    # the closest node are the non-zero columns of the products of its rows
+    th = mesh.elm.node_number_list[mesh.elm.elm_type == 4] - 1
+    incidence = sparse.csr_matrix(
+        (np.ones(th.size), (th.ravel(), np.repeat(np.arange(len(th)), 4))),
+        shape=(mesh.nodes.nr, len(th))
+    )
+    neighbors = (incidence[np.atleast_1d(src_idx) - 1] @ incidence.T).tocsr()
+    neighbors.sort_indices()
+    return np.split(neighbors.indices, neighbors.indptr[1:-1])
+
+
 def compute_st_venant_loads(dip_pos, dip_mom, dip_node_indices, vertices):
     """Compute the loads for the St. Venant source model.
 
+    The small regularized least-squares systems are solved in batches of
+    dipoles with the same number of nodes.
+
     Parameters
     ----------
     dip_pos : ndarray (n, 3)
@@ -1062,15 +1200,20 @@ def compute_st_venant_loads(dip_pos, dip_mom, dip_node_indices, vertices):
     lambda_ = 1e-5
     r = 1
 
-    ntotal = sum(map(len, dip_node_indices))
+    dip_pos = np.atleast_2d(dip_pos)
+    dip_mom = np.atleast_2d(dip_mom)
+    n_nodes = np.array(list(map(len, dip_node_indices)), dtype=int)
     rows = np.concatenate(dip_node_indices)
-    cols = np.concatenate([i*np.ones(len(dip_node_indices[i]), dtype=int) for i in range(len(dip_node_indices))], dtype=int)
-    data = np.zeros(ntotal)
-    for i, (vert, d, ni) in enumerate(zip(dip_pos, dip_mom, dip_node_indices)):
-        nn = len(ni)
-
-        # vector from vertex to neighboring vertices
-        v = vertices[ni] - np.atleast_2d(vert)
+    cols = np.repeat(np.arange(len(dip_node_indices)), n_nodes)
+    start = np.cumsum(n_nodes) - n_nodes
+    data = np.zeros(len(rows))
+    for nn in np.unique(n_nodes):
+        dips = np.where(n_nodes == nn)[0]
+        # position of the loads of each dipole in `data` (n_batch, nn)
+        loads = start[dips, None] + np.arange(nn)
+
+        # vector from vertex to neighboring vertices (n_batch, nn, 3)
+        v = vertices[rows[loads]] - dip_pos[dips, None]
         v /= aref
 
         # system matrix
@@ -1084,9 +1227,9 @@ def compute_st_venant_loads(dip_pos, dip_mom, dip_node_indices, vertices):
         # not sure why they use 9 rows as we only have 7 eqs.
 
         # in simnibs the order is 1 x y z x**2 y**2 z**2
-        X = np.ones((7, nn))
-        X[1:4] = v.T
-        X[4:] = v.T**2
+        X = np.ones((len(dips), 7, nn))
+        X[:, 1:4] = v.transpose(0, 2, 1)
+        X[:, 4:] = X[:, 1:4]**2
 
         # moments (RHS)
 
@@ -1094,21 +1237,371 @@ def compute_st_venant_loads(dip_pos, dip_mom, dip_node_indices, vertices):
         #   t = np.zeros(9)
         #   t[1::3] = d / aref
 
-        t = np.zeros(7)
-        t[1:4] = d/aref
+        t = np.zeros((len(dips), 7, 1))
+        t[:, 1:4, 0] = dip_mom[dips] / aref
 
-        # 3*nn x nn
-        W = np.zeros((3 * nn, nn))
-        W[:nn] = np.diag(v[:,0])**r
-        W[nn:2*nn] = np.diag(v[:,1])**r
-        W[2*nn:] = np.diag(v[:,2])**r
+        # W is (3*nn x nn), with diagonal blocks diag(v[:, i])**r, so W.T @ W
+        # is diagonal
+        XtX = X.transpose(0, 2, 1) @ X
+        diag = np.arange(nn)
+        XtX[:, diag, diag] += lambda_ * np.sum(v**(2 * r), axis=2)
 
         # Calculate the loads, q
-        q = np.linalg.solve(X.T @ X + lambda_ * W.T @ W, X.T @ t)
-        data[cols==i] = q
+        q = np.linalg.solve(XtX, X.transpose(0, 2, 1) @ t)
+        data[loads] = q[..., 0]
     return sparse.csc_matrix((data, (rows, cols)), shape=(vertices.shape[0], dip_pos.shape[0]))
 
 
+class DipoleTransferMatrix:
+    '''EEG leadfields using the transfer matrix (reciprocity) approach.
+
+    Instead of solving one FEM system per dipole (see `DipoleFEM`), one
+    system is solved per electrode, with a unit current injected in the
+    electrode and the reference electrode grounded. By reciprocity, the
+    potential difference between an electrode and the reference caused by a
+    dipole is the dot product of that solution with the right-hand side of
+    the dipole. Only the solutions at the nodes of the source space
+    tetrahedra are kept (the transfer matrix), so leadfields for any number of
+    dipoles and source models are computed as sparse matrix products without
+    solving any further FEM systems.
+
+    Parameters
+    ----------
+    mesh: simnibs.mesh_io.msh.Msh
+        Mesh structure
+    cond: ndarray or simnibs.mesh_io.msh.ElementData
+        Conductivity of each element
+    electrodes: list
+        If `input_type` is "tag", a list of the tags of the electrode
+        surfaces. If `input_type` is "nodes", a list (or list of lists) of
+        nodes. The first electrode is used as a reference.
+    source_elements: ndarray (optional)
+        Tetrahedra (1-indexed) where the dipoles can be placed. Default: all
+        tetrahedra
+    current: float | iterable (optional)
+        Current injected in each electrode (excluding the reference), or in
+        each of its nodes. See `tdcs_leadfield`. The transfer matrix is
+        normalized to a total current of 1 A. Default: 1
+    input_type: 'tag' or "nodes" (optional)
+        Whether `electrodes` refers to surface tags or nodes. Default: "nodes"
+    weigh_by_area: bool (optional)
+        Weigh current by node area. Default: False
+    solver_options: str (optional)
+        Options to be used by the solver. Default: DEFAULT_SOLVER_OPTIONS
+    units: {'mm' or 'm'} (optional)
+        Units of the mesh nodes. Default: mm
+
+    Attributes
+    ----------
+    transfer: ndarray (n_electrodes - 1, n_source_nodes)
+        Transfer matrix, potential at each electrode (relative to the
+        reference) caused by a unit load in each source node
+    source_nodes: ndarray
+        Nodes (1-indexed) of the source space tetrahedra
+    '''
+    def __init__(
+            self,
+            mesh,
+            cond,
+            electrodes,
+            source_elements=None,
+            current=1.,
+            input_type="nodes",
+            weigh_by_area=False,
+            solver_options=None,
+            units='mm',
+        ):
+        self.mesh = mesh
+        self.units = units
+        if source_elements is None:
+            source_elements = mesh.elm.tetrahedra
+        source_elements = np.asarray(source_elements)
+        if not np.all(mesh.elm.elm_type[source_elements - 1] == 4):
+            raise ValueError('The source space should only contain tetrahedra')
+        self.source_elements = source_elements
+        self.source_nodes = np.unique(mesh.elm[source_elements])
+        self._G = _gradient_operator(mesh)
+
+        n_channels = len(electrodes) - 1
+        if isinstance(current, (int, float)):
+            current = np.full(n_channels, current, dtype=float)
+        if len(current) != n_channels:
+            raise ValueError(
+                'Please define one current for each electrode (excluding the '
+                'reference)'
+            )
+
+        S = TDCSFEMNeumann(
+            mesh, cond, electrodes[0], input_type, weigh_by_area,
+            solver_options, units
+        )
+        logger.info(f'Computing transfer matrix for {n_channels} electrodes')
+        start = time.time()
+        self.transfer = np.empty((n_channels, len(self.source_nodes)), dtype=float)
+        for i, (el, c) in enumerate(zip(electrodes[1:], current)):
+            b = S.assemble_rhs([el], [c])
+            c_total = np.sum(c)
+            self.transfer[i] = S.solve(b)[self.source_nodes - 1] / c_total
+        logger.info(
+            '{0:.2f}s to compute transfer matrix'.format(time.time() - start))
+
+        # Maps the nodes of the mesh to the columns of the transfer matrix
+        self._node_to_source = -np.ones(mesh.nodes.nr, dtype=int)
+        self._node_to_source[self.source_nodes - 1] = np.arange(len(self.source_nodes))
+
+    def leadfield(self, dip_pos, dip_mom, source_model='partial integration'):
+        '''Computes the potential caused by a set of dipoles at the electrodes
+
+        Parameters
+        ----------
+        dip_pos: ndarray (n, 3)
+            Dipole positions. Should be in the source space
+        dip_mom: ndarray (n, 3)
+            Dipole moments in ampere-meter (Am)
+        source_model: str (optional)
+            Select `partial integration` or `st. venant`. Default: partial
+            integration
+
+        Returns
+        -------
+        lf: ndarray (n_electrodes - 1, n)
+            Potential at each electrode, relative to the reference electrode,
+            caused by each dipole
+        '''
+        b = assemble_dipole_rhs(
+            self.mesh, dip_pos, dip_mom, source_model, self.units, self._G
+        ).tocoo()
+        rows = self._node_to_source[b.row]
+        if np.any(rows[b.data != 0] == -1):
+            raise ValueError('Found dipoles outside the source space')
+        keep = rows != -1
+        b = sparse.csr_matrix(
+            (b.data[keep], (rows[keep], b.col[keep])),
+            shape=(len(self.source_nodes), b.shape[1])
+        )
+        return b.T.dot(self.transfer.T).T
+
+    def element_leadfield(self, source_model='partial integration'):
+        '''Leadfield of dipoles placed at the baricenters of the source space
+        tetrahedra, oriented along x, y and z
+
+        Parameters
+        ----------
+        source_model: str (optional)
+            Select `partial integration` or `st. venant`. Default: partial
+            integration
+
+        Returns
+        -------
+        lf: ndarray (n_electrodes - 1, n_source_elements, 3)
+            Leadfield for a unit (1 Am) dipole in each direction
+        '''
+        bar = self.mesh.elements_baricenters()[self.source_elements]
+        n = len(bar)
+        lf = self.leadfield(
+            np.repeat(bar, 3, axis=0), np.tile(np.eye(3), (n, 1)), source_model
+        )
+        return lf.reshape(-1, n, 3)
+
+
+class StiffnessPattern:
+    '''Sparsity pattern of the stiffness matrix of a mesh, to assemble it
+    quickly for many conductivities (e.g. in gPC or Monte Carlo sampling).
+
+    The gradient operator, the volumes and the position of each local
+    element entry in the matrix are calculated only once. Each assembly then
+    consists of calculating the local entries and summing them into the
+    data array of the matrix.
+
+    Parameters
+    ----------
+    mesh: simnibs.mesh_io.msh.Msh
+        Mesh structure
+    units: {'mm' or 'm'} (optional)
+        Units of the mesh nodes. Default: mm
+
+    Attributes
+    ----------
+    G: ndarray (n_th, 4, 3)
+        Gradient operator of the tetrahedra
+    dof_map: dofMap
+        Mapping between rows/columns of the matrix and DOFs
+    '''
+    def __init__(self, mesh, units='mm'):
+        if units not in ['mm', 'm']:
+            raise ValueError('Invalid unit: {0}'.format(units))
+        self.units = units
+        self._tetrahedra = mesh.elm.elm_type == 4
+        self.dof_map = dofMap(mesh.nodes.node_number)
+        self.G = _gradient_operator(mesh)
+        self._vols = _vol(mesh)
+        th_dofs = self.dof_map[mesh.elm.node_number_list[self._tetrahedra]]
+        n = self.dof_map.nr
+        # column-major keys of all 16 local entries of each element, sorted
+        # they give the CSC ordering
+        keys = (th_dofs[:, None, :].astype(np.int64) * n + th_dofs[:, :, None]).reshape(-1)
+        keys, pos = np.unique(keys, return_inverse=True)
+        index_type = np.int32 if len(keys) < np.iinfo(np.int32).max else np.int64
+        self._pos = pos.astype(index_type)
+        self._indices = (keys % n).astype(index_type)
+        self._indptr = np.zeros(n + 1, dtype=index_type)
+        np.cumsum(np.bincount(keys // n, minlength=n), out=self._indptr[1:])
+
+    def assemble(self, cond):
+        '''Assembles the stiffness matrix
+
+        Parameters
+        ----------
+        cond: ndarray or simnibs.mesh_io.msh.ElementData
+            Conductivity of each element
+
+        Returns
+        -------
+        A: scipy.sparse.csc_matrix
+            Stiffness matrix, the same as assembled in FEMSystem
+        '''
+        if isinstance(cond, mesh_io.ElementData):
+            cond = cond.value.squeeze()
+            if cond.ndim == 2:
+                cond = cond.reshape(-1, 3, 3)
+        cond = cond[self._tetrahedra]
+        G = self.G
+        if cond.ndim == 1:
+            vGc = self._vols[:, None, None] * G * cond[:, None, None]
+        elif cond.ndim == 3:
+            vGc = self._vols[:, None, None] * np.einsum('aij, ajk -> aik', G, cond)
+        else:
+            raise ValueError('Invalid cond array')
+        # symmetric local matrices, from the upper triangle
+        K = np.empty((len(G), 4, 4), dtype=np.float64)
+        for i in range(4):
+            for j in range(i, 4):
+                K[:, i, j] = (vGc[:, i, :] * G[:, j, :]).sum(axis=1)
+                K[:, j, i] = K[:, i, j]
+        data = np.bincount(self._pos, K.reshape(-1), minlength=len(self._indices))
+        if self.units == 'mm':
+            data *= 1e-3  # * 1e6 from the gradiend operator, 1e-9 from the volume
+        A = sparse.csc_matrix(
+            (data, self._indices, self._indptr),
+            shape=(self.dof_map.nr, self.dof_map.nr)
+        )
+        A.eliminate_zeros()
+        return A
+
+
+class IncrementalStiffness:
+    '''Stiffness matrix of a head mesh, updated locally for meshes where
+    electrodes were added to the head (e.g. with put_electrode_on_mesh).
+
+    The mesh with electrodes should have the nodes and tetrahedra of the head
+    mesh, in the same order, followed by the electrode nodes and tetrahedra.
+    Only the rows and columns of the nodes in new tetrahedra or in tetrahedra
+    with moved nodes are assembled, the others are copied from the head
+    matrix, which is assembled only once. Meshes which do not extend the head
+    mesh are assembled from scratch.
+
+    Parameters
+    ----------
+    mesh: simnibs.mesh_io.msh.Msh
+        Head mesh, without electrodes
+    units: {'mm' or 'm'} (optional)
+        Units of the mesh nodes. Default: mm
+    '''
+    def __init__(self, mesh, units='mm'):
+        if units not in ['mm', 'm']:
+            raise ValueError('Invalid unit: {0}'.format(units))
+        self.units = units
+        self._node_coord = mesh.nodes.node_coord.copy()
+        self._th_nodes = np.sort(
+            mesh.elm.node_number_list[mesh.elm.elm_type == 4], axis=1)
+        # conductivities and entries of the head matrix, set in assemble
+        self._cond = None
+        self._A = None
+
+    def _extends_head(self, mesh, th_nodes):
+        n_th = len(self._th_nodes)
+        return (
+            mesh.nodes.nr >= len(self._node_coord) and
+            len(th_nodes) >= n_th and
+            np.array_equal(np.sort(th_nodes[:n_th], axis=1), self._th_nodes)
+        )
+
+    def _assemble_head(self, cond):
+        logger.info('Assembling the FEM matrix of the head')
+        th = self._node_coord[self._th_nodes - 1]
+        dof_map = dofMap(np.arange(1, len(self._node_coord) + 1))
+        A = _assemble_matrix(
+            _th_vol(th), _th_gradient(th), self._th_nodes, cond, dof_map,
+            units=self.units).tocoo()
+        self._cond = cond.copy()
+        self._A = (A.row, A.col, A.data)
+
+    def assemble(self, mesh, cond):
+        '''Assembles the stiffness matrix of the mesh
+
+        Parameters
+        ----------
+        mesh: simnibs.mesh_io.msh.Msh
+            Mesh with the electrodes
+        cond: ndarray or simnibs.mesh_io.msh.ElementData
+            Conductivity of each element in the mesh
+
+        Returns
+        -------
+        A: scipy.sparse.csc_matrix
+            Stiffness matrix, the same as assembled in FEMSystem
+        '''
+        if isinstance(cond, mesh_io.ElementData):
+            cond = cond.value.squeeze()
+            if cond.ndim == 2:
+                cond = cond.reshape(-1, 3, 3)
+        cond = cond[mesh.elm.elm_type == 4]
+        th_nodes = mesh.elm.node_number_list[mesh.elm.elm_type == 4]
+        dof_map = dofMap(mesh.nodes.node_number)
+        if not self._extends_head(mesh, th_nodes):
+            logger.info('The mesh does not extend the head mesh, '
+                        'assembling it from scratch')
+            return _assemble_matrix(
+                _vol(mesh), _gradient_operator(mesh), th_nodes, cond, dof_map,
+                units=self.units)
+
+        n_nodes, n_th = len(self._node_coord), len(self._th_nodes)
+        if (self._cond is None or self._cond.shape != cond[:n_th].shape or
+                not np.array_equal(self._cond, cond[:n_th])):
+            self._assemble_head(cond[:n_th])
+
+        # Nodes with changed rows and columns
+        moved = np.zeros(mesh.nodes.nr + 1, dtype=bool)
+        moved[1:n_nodes + 1] = np.any(
+            mesh.nodes.node_coord[:n_nodes] != self._node_coord, axis=1)
+        changed = np.any(moved[th_nodes], axis=1)
+        changed[n_th:] = True
+        touched = np.zeros(mesh.nodes.nr + 1, dtype=bool)
+        touched[th_nodes[changed]] = True
+        touched[n_nodes + 1:] = True
+        touched = touched[dof_map.inverse]
+        # Assemble all tetrahedra around these nodes
+        local = np.any(touched[dof_map[th_nodes]], axis=1)
+        th = mesh.nodes[th_nodes[local]]
+        A_local = _assemble_matrix(
+            _th_vol(th), _th_gradient(th), th_nodes[local], cond[local],
+            dof_map, units=self.units).tocoo()
+        in_local = touched[A_local.row] | touched[A_local.col]
+        row, col, data = self._A
+        in_head = ~(touched[row] | touched[col])
+        logger.info(
+            'Updating {0} of {1} rows of the FEM matrix'.format(
+                np.sum(touched), dof_map.nr))
+        A = sparse.csc_matrix(
+            (np.concatenate([data[in_head], A_local.data[in_local]]),
+             (np.concatenate([row[in_head], A_local.row[in_local]]),
+              np.concatenate([col[in_head], A_local.col[in_local]]))),
+            shape=(dof_map.nr, dof_map.nr)
+        )
+        A.eliminate_zeros()
+        return A
+
+
 def assemble_diagonal_mass_matrix(msh, units='mm'):
     ''' Assemble a Mass matrix by doing a first-order integration at the nodes
     Results in a diagonal matrix
@@ -1160,6 +1653,11 @@ def _gradient_operator(msh, volume_tag=None):
     else:
         th = msh.nodes[msh.elm.node_number_list[(msh.elm.elm_type == 4) *
                                                 (msh.elm.tag1 == volume_tag)]]
+    return _th_gradient(th)
+
+
+def _th_gradient(th):
+    ''' Gradient operator from the node coordinates of tetrahedra (n_th, 4, 3) '''
     A = np.hstack([-np.ones((3, 1)), np.eye(3)])
     G = np.linalg.solve(th[:, 1:4] - th[:, 0, None], A[None, :, :])
     G = np.transpose(G, (0, 2, 1))
@@ -1268,11 +1766,17 @@ def _vol(msh, volume_tag=None):
     else:
         th = msh.nodes[msh.elm.node_number_list[(msh.elm.elm_type == 4) *
                                                 (msh.elm.tag1 == volume_tag)]]
+    return _th_vol(th)
+
+
+def _th_vol(th):
+    '''Volume of the tetrahedra from their node coordinates (n_th, 4, 3) '''
     return np.abs(np.linalg.det(th[:, 1:] - th[:, 0, None])) / 6.
 
 
 def tdcs(mesh, cond, currents, electrode_surface_tags, n_workers=1, units='mm',
-         solver_options=None):
+         solver_options=None, stiffness_pattern=None, incremental_stiffness=None,
+         system=None, solver_cache=None):
     ''' Simulates a tDCS electric potential.
 
     Parameters
@@ -1286,19 +1790,48 @@ def tdcs(mesh, cond, currents, electrode_surface_tags, n_workers=1, units='mm',
     electrode_surface_tags: list
         A list of the indices of the surfaces where the dirichlet BC is to be
         applied.
+    stiffness_pattern: StiffnessPattern (optional)
+        Precomputed sparsity pattern of the stiffness matrix, to speed up
+        repeated simulations in the same mesh.
+    incremental_stiffness: IncrementalStiffness (optional)
+        Stiffness matrix of the head without electrodes, to speed up
+        simulations of several montages in the same head. Only the part of the
+        matrix around the electrodes is assembled.
+    system: TDCSFEMNeumann (optional)
+        System created with `ground_electrode=None` for this mesh. If set, the
+        currents are applied as Neumann boundary conditions in the electrode
+        surfaces, and all the electrodes are solved with the solver of the
+        system, which is prepared only once and can be reused for other
+        montages in the same mesh. `currents` can then also be an array of
+        shape (n_montages, n_electrodes), with the montages solved together.
+        Each electrode then injects a uniform, area-weighted current density,
+        instead of being held at a single potential, so the potentials differ
+        from the ones with Dirichlet boundary conditions.
+        Default: Dirichlet boundary conditions, one system per electrode pair
+    solver_cache: dict (optional)
+        Solvers of previous simulations in the same mesh, such as other
+        conductivity samples, by electrode pair. With the 'scipy' solver
+        options, their preconditioners and last solutions are re-used, and the
+        dictionary is updated with the new solvers. Only used if n_workers=1.
+        Default: prepare new solvers
 
     Returns
     -------
     potential: simnibs.msh.mesh_io.NodeData
-        Total electric potential
+        Total electric potential. A list with one NodeData per montage if
+        `system` is set and `currents` is 2-dimensional
     '''
-    assert len(currents) == len(electrode_surface_tags),\
-        'there should be one channel for each current'
-
     surf_tags = np.unique(mesh.elm.tag1[mesh.elm.elm_type == 2])
     assert np.all(np.in1d(electrode_surface_tags, surf_tags)),\
         'Could not find all the electrode surface tags in the mesh'
 
+    if system is not None:
+        return _tdcs_neumann_montages(
+            system, mesh, currents, electrode_surface_tags)
+
+    assert len(currents) == len(electrode_surface_tags),\
+        'there should be one channel for each current'
+
     assert np.isclose(np.sum(currents), 0),\
         'Currents should sum to 0'
 
@@ -1309,15 +1842,23 @@ def tdcs(mesh, cond, currents, electrode_surface_tags, n_workers=1, units='mm',
     if n_workers == 1:
         for el_surf, el_c in zip(electrode_surface_tags[1:], currents[1:]):
             total_p += _sim_tdcs_pair(
-                mesh, cond, ref_electrode, el_surf, el_c, units, solver_options)
+                mesh, cond, ref_electrode, el_surf, el_c, units, solver_options,
+                stiffness_pattern, incremental_stiffness, solver_cache)
     else:
-        with multiprocessing.Pool(processes=n_workers) as pool:
+        if incremental_stiffness is not None:
+            # so that the head matrix is assembled here, and not in each worker
+            incremental_stiffness.assemble(mesh, cond)
+        # the head matrix is sent once to each worker, and not with each task
+        with multiprocessing.Pool(processes=n_workers,
+                                  initializer=_set_up_tdcs_incremental_stiffness,
+                                  initargs=(incremental_stiffness,)) as pool:
             sims = []
             for el_surf, el_c in zip(electrode_surface_tags[1:], currents[1:]):
                 sims.append(
                     pool.apply_async(
-                        _sim_tdcs_pair,
-                        (mesh, cond, ref_electrode, el_surf, el_c, units, solver_options)))
+                        _sim_tdcs_pair_worker,
+                        (mesh, cond, ref_electrode, el_surf, el_c, units,
+                         solver_options, stiffness_pattern)))
             for s in sims:
                 total_p += s.get()
             pool.close()
@@ -1326,12 +1867,61 @@ def tdcs(mesh, cond, currents, electrode_surface_tags, n_workers=1, units='mm',
     return mesh_io.NodeData(total_p, 'v', mesh=mesh)
 
 
-def _sim_tdcs_pair(mesh, cond, ref_electrode, el_surf, el_c, units, solver_options):
+def _tdcs_neumann_montages(S, mesh, currents, electrode_surface_tags):
+    if S.ground_electrode is not None or S.input_type != 'tag':
+        raise ValueError(
+            "The system should be created with ground_electrode=None and input_type='tag'")
+    if S.mesh.nodes.nr != mesh.nodes.nr or S.mesh.elm.nr != mesh.elm.nr:
+        raise ValueError('The system was created for a different mesh')
+    currents = np.asarray(currents, dtype=float)
+    montages = np.atleast_2d(currents)
+    assert montages.shape[1] == len(electrode_surface_tags),\
+        'there should be one channel for each current'
+    assert np.allclose(montages.sum(axis=1), 0),\
+        'Currents should sum to 0'
+
+    logger.info(
+        'Simulating {0} montage(s) with Neumann boundary conditions'.format(
+            len(montages)))
+    # one right-hand side per montage, from the right-hand side of each
+    # electrode with an unit current
+    unit_rhs = np.stack(
+        [S.assemble_rhs([t], [1.]) for t in electrode_surface_tags], axis=1)
+    v = S.solve(unit_rhs.dot(montages.T)).reshape(mesh.nodes.nr, -1)
+    if currents.ndim == 1:
+        return mesh_io.NodeData(v[:, 0], 'v', mesh=mesh)
+    return [mesh_io.NodeData(x, 'v', mesh=mesh) for x in v.T]
+
+
+def _set_up_tdcs_incremental_stiffness(incremental_stiffness):
+    global tdcs_global_incremental_stiffness
+    tdcs_global_incremental_stiffness = incremental_stiffness
+
+
+def _sim_tdcs_pair_worker(mesh, cond, ref_electrode, el_surf, el_c, units,
+                          solver_options, stiffness_pattern=None):
+    global tdcs_global_incremental_stiffness
+    return _sim_tdcs_pair(
+        mesh, cond, ref_electrode, el_surf, el_c, units, solver_options,
+        stiffness_pattern, tdcs_global_incremental_stiffness)
+
+
+def _sim_tdcs_pair(mesh, cond, ref_electrode, el_surf, el_c, units, solver_options,
+                   stiffness_pattern=None, incremental_stiffness=None,
+                   solver_cache=None):
     logger.info('Simulating electrode pair {0} - {1}'.format(
         ref_electrode, el_surf))
 
-    s = TDCSFEMDirichlet(mesh, cond,  [ref_electrode, el_surf], [0., 1.], solver_options)
+    previous_solver = None
+    if solver_cache is not None:
+        previous_solver = solver_cache.get((ref_electrode, el_surf))
+    s = TDCSFEMDirichlet(mesh, cond,  [ref_electrode, el_surf], [0., 1.], solver_options,
+                         stiffness_pattern=stiffness_pattern,
+                         incremental_stiffness=incremental_stiffness,
+                         previous_solver=previous_solver)
     v = s.solve()
+    if solver_cache is not None and isinstance(s.solver, scipy_solver.Solver):
+        solver_cache[(ref_electrode, el_surf)] = s.solver
 
     v = mesh_io.NodeData(v, name='v', mesh=mesh)
     flux = np.array([
@@ -1400,7 +1990,8 @@ def _calc_flux_electrodes(v, cond, el_volume, scalp_tag=[ElementTags.SCALP, Elem
     return flux
 
 
-def tms_dadt(mesh, cond, dAdt, solver_options=None):
+def tms_dadt(mesh, cond, dAdt, solver_options=None, stiffness_pattern=None,
+             solver_cache=None):
     ''' Simulates a TMS electric potential from a dA/dt field.
 
     Parameters
@@ -1411,15 +2002,29 @@ def tms_dadt(mesh, cond, dAdt, solver_options=None):
         An ElementData field with conductivity information
     dAdt: simnibs.msh.mesh_io.NodeData or simnibs.msh.mesh_io.ElementData
         dAdt information
+    stiffness_pattern: StiffnessPattern (optional)
+        Precomputed sparsity pattern of the stiffness matrix, to speed up
+        repeated simulations in the same mesh.
+    solver_cache: dict (optional)
+        Solver of a previous simulation in the same mesh, such as another
+        conductivity sample. With the 'scipy' solver options, its
+        preconditioner and last solution are re-used, and the dictionary is
+        updated with the new solver. Default: prepare a new solver
 
     Returns
     -------
     v:  simnibs.msh.mesh_io.NodeData
         NodeData instance with potential at the nodes
     '''
-    s = TMSFEM(mesh, cond, solver_options)
+    previous_solver = None
+    if solver_cache is not None:
+        previous_solver = solver_cache.get('tms')
+    s = TMSFEM(mesh, cond, solver_options, stiffness_pattern=stiffness_pattern,
+               previous_solver=previous_solver)
     b = s.assemble_rhs(dAdt)
     v = s.solve(b)
+    if solver_cache is not None and isinstance(s.solver, scipy_solver.Solver):
+        solver_cache['tms'] = s.solver
     
     del s, b
     gc.collect()
@@ -1601,7 +2206,7 @@ def tdcs_neumann(mesh, cond, currents, electrode_surface_tags):
 def tdcs_leadfield(mesh, cond, electrode_surface, fn_hdf5, dataset,
                    current=1., roi=None, post_pro=None, field='E',
                    solver_options=None, n_workers=1, input_type='tag',
-                   weigh_by_area=True):
+                   weigh_by_area=True, system=None):
     '''Simulates tDCS fields using Neumann boundary conditions and writes the
     output electric fields to an HDF5 file.
 
@@ -1645,6 +2250,13 @@ def tdcs_leadfield(mesh, cond, electrode_surface, fn_hdf5, dataset,
     weigh_by_area: bool
         Weigh current by node area. If `input_type == "tag"` this is ignored
         and area weighting is implied.
+    system: TDCSFEMNeumann (optional)
+        System created with `ground_electrode=None` for this mesh. The
+        reference electrode is then given the opposite current of each
+        electrode, and the system, including the solver, is reused. This way,
+        the same system can be used for many electrode positions. The
+        `input_type` and `weigh_by_area` of the system are used. Default: set
+        up a new system, grounded at the reference electrode
 
     Returns
     -------
@@ -1686,14 +2298,24 @@ def tdcs_leadfield(mesh, cond, electrode_surface, fn_hdf5, dataset,
         raise ValueError(f"Field shoud be either 'E' or 'J' (got {field})")
 
     # Construct system and gradient matrix
-    S = TDCSFEMNeumann(
-        mesh,
-        cond,
-        electrode_surface[0],
-        input_type,
-        weigh_by_area,
-        solver_options,
-    )
+    if system is None:
+        S = TDCSFEMNeumann(
+            mesh,
+            cond,
+            electrode_surface[0],
+            input_type,
+            weigh_by_area,
+            solver_options,
+        )
+    else:
+        if system.ground_electrode is not None:
+            raise ValueError('The system should be created with ground_electrode=None')
+        if system.mesh.nodes.nr != mesh.nodes.nr or system.mesh.elm.nr != mesh.elm.nr:
+            raise ValueError('The system was created for a different mesh')
+        if not system.weigh_by_area and system.input_type == 'nodes':
+            raise ValueError('The system should weigh the currents by area')
+        S = system
+        input_type = S.input_type
 
     logger.info("Computing gradient matrix")
     D = grad_matrix(mesh, split=True)
@@ -1721,12 +2343,21 @@ def tdcs_leadfield(mesh, cond, electrode_surface, fn_hdf5, dataset,
     currents = [current]*n_sims if isinstance(current, float) else current
     assert len(currents) == n_sims, f"Number of currents ({len(currents)}) do not correspond to the number of simulations ({n_sims})"
 
+    # Electrodes and currents of each simulation
+    if system is None:
+        sim_electrodes = [[el] for el in electrode_surface[1:]]
+        sim_currents = [[c] for c in currents]
+    else:
+        # The reference is not grounded, it gets the opposite current
+        sim_electrodes = [[el, electrode_surface[0]] for el in electrode_surface[1:]]
+        sim_currents = [[c, -c] for c in currents]
+
     # Run simulations (sequential)
     if n_workers == 1:
-        for i, (el_tag, current) in enumerate(zip(electrode_surface[1:], currents)):
+        for i, el_tag in enumerate(electrode_surface[1:]):
             logger.info('Running Simulation {0} out of {1}'.format(
                 i+1, n_sims))
-            b = S.assemble_rhs([el_tag], [current])
+            b = S.assemble_rhs(sim_electrodes[i], sim_currents[i])
             v = S.solve(b)
 
             #TODO implement calibration error also for element/node defined electrodes
@@ -1775,17 +2406,17 @@ def tdcs_leadfield(mesh, cond, electrode_surface, fn_hdf5, dataset,
                                   initializer=_set_up_tdcs_global_solver,
                                   initargs=(S, n_sims, D, post_pro, cond_roi, field)) as pool:
             sims = []
-            for i, (el_tag, current) in enumerate(zip(electrode_surface[1:], currents)):
+            for i, el_tag in enumerate(electrode_surface[1:]):
+                ref_electrode = el_tag
                 if input_type == "tag":
-                    ref_electrode = el_tag
                     other_electrodes = np.array([x for x in electrode_surface if x!=ref_electrode])
                 else:
-                    ref_electrode = el_tag
-                    other_electrodes = [x for x in electrode_surface if np.all(x!=ref_electrode)][0]
+                    # only used for the calibration error with tags
+                    other_electrodes = None
                 sims.append(
                     pool.apply_async(
                         _run_tdcs_leadfield,
-                        (i, [el_tag], [current], fn_hdf5, dataset, input_type, mesh, cond, ref_electrode, other_electrodes)))
+                        (i, sim_electrodes[i], sim_currents[i], fn_hdf5, dataset, input_type, mesh, cond, ref_electrode, other_electrodes)))
             [s.get() for s in sims]
             pool.close()
             pool.join()
@@ -21,6 +21,8 @@
 '''
 from __future__ import print_function
 import os
+import functools
+import multiprocessing
 
 import h5py
 import numpy as np
@@ -247,12 +249,16 @@ class gPC_regression(pygpc.RegularizedRegression):
         # than just speed. it uses calc_fields
         if len(to_calc) > 0:
             logger.info('Calculating fields: {0}'.format(''.join(to_calc)))
+            tensor_field = None
+            if lst.anisotropy_type != 'scalar':
+                tensor_field = lst.get_tensor_field()
             for i, phi, gr in zip(range(nr_simu), potentials, self.grid.coords):
                 # set the conductivities right
                 for rv, g in zip(self.random_vars, gr):
                     if isinstance(rv, int):
                         lst.cond[rv - 1].value = g
-                    elmdata = lst.cond2elmdata(logger_level=10)
+                    elmdata = lst.cond2elmdata(
+                        logger_level=10, tensor_field=tensor_field)
                 # sets the potential
                 pot = mesh_io.NodeData(phi, mesh=msh)
                 # calclate the remaining fields
@@ -523,7 +529,8 @@ def run_tms_gpc(poslist, fn_simu, cpus=1, tissues=[ElementTags.GM], eps=1e-2,
     fn_simu: str
         Output name
     cpus: int (optional)
-        Number of CPUs to use
+        Number of CPUs to use. The samples of each iteration are simulated in
+        parallel
     tissues: list (Optional)
         List of tissue tags where to evaluate the electric field. Default: [2]
     eps: float (optional)
@@ -539,13 +546,15 @@ def run_tms_gpc(poslist, fn_simu, cpus=1, tissues=[ElementTags.GM], eps=1e-2,
     --------
     fns: list
         List of mesh file names
+
+    Notes
+    -------
+    Every sample is stored in the output HDF5 file as soon as it is
+    simulated. If the output file of an interrupted run exists, the run is
+    resumed using the samples in it
     '''
     poslist._prepare()
     fn_simu = os.path.abspath(os.path.expanduser(fn_simu))
-    if cpus > 1:
-        logger.warning("Can't run GPC with multiprocessing (for now)")
-        logger.warning("Setting cpus=1")
-        cpus = 1
 
     logger.info('Running a gPC expansion with tolerance: {0:1e}'.format(eps))
     # run simulations
@@ -557,14 +566,12 @@ def run_tms_gpc(poslist, fn_simu, cpus=1, tissues=[ElementTags.GM], eps=1e-2,
     fns = []
     for i, p in enumerate(poslist.pos):
         fn_hdf5 = fn_simu+'_{0:0=4d}_gpc.hdf5'.format(i + 1)
-        if os.path.isfile(fn_hdf5):
-            raise IOError('Output file ' + fn_hdf5 + ' already exists')
         matsimnibs = p.calc_matsimnibs(poslist.mesh)
         sampler = TMSgPCSampler(
             poslist.mesh, poslist, fn_hdf5,
             poslist.fnamecoil, matsimnibs, p.didt,
             roi=tissues)
-        sampler.create_hdf5()
+        samples = _start_sampling(sampler)
         reg, phi = pygpc.adaptive.run_reg_adaptive_grid(
             pdf_type, pdfshape, limits,
             sampler.run_simulation,
@@ -573,7 +580,9 @@ def run_tms_gpc(poslist, fn_simu, cpus=1, tissues=[ElementTags.GM], eps=1e-2,
             eps=eps,
             n_cpus=cpus,
             print_function=logger.info,
-            min_iter=min_iter)
+            min_iter=min_iter,
+            batch_func=functools.partial(sampler.run_simulations, cpus=cpus),
+            samples=samples)
         gpc_reg = gPC_regression(random_vars,
                                  pdf_type, pdfshape, limits, reg.poly_idx,
                                  reg.grid.coords_norm, 'TMS',
@@ -598,7 +607,8 @@ def run_tcs_gpc(poslist, fn_simu, cpus=1, tissues=[2], eps=1e-2,
     fn_simu: str
         Output name
     cpus: int (optional)
-        Number of CPUs to use
+        Number of CPUs to use. The samples of each iteration are simulated in
+        parallel
     tissues: list (Optional)
         List of tissue tags where to evaluate the electric field. Default: [2]
     eps: float (optional)
@@ -614,17 +624,17 @@ def run_tcs_gpc(poslist, fn_simu, cpus=1, tissues=[2], eps=1e-2,
     --------
     fns: list
         List of mesh file names
+
+    Notes
+    -------
+    Every sample is stored in the output HDF5 file as soon as it is
+    simulated. If the output file of an interrupted run exists, the run is
+    resumed using the samples in it
     '''
     poslist._prepare()
     fn_simu = os.path.abspath(os.path.expanduser(fn_simu))
-    if cpus > 1:
-        logger.warning("Can't run GPC with multiprocessing (for now)")
-        logger.warning("Setting cpus=1")
-        cpus = 1
     logger.info('Running a gPC expansion with tolerance: {0:1e}'.format(eps))
     fn_hdf5 = fn_simu+'_gpc.hdf5'
-    if os.path.isfile(fn_hdf5):
-        raise IOError('Output file ' + fn_hdf5 + ' already exists')
     random_vars, pdf_type, pdfshape, limits = prep_gpc(poslist)
 
     path, basename = os.path.split(fn_simu)
@@ -638,7 +648,7 @@ def run_tcs_gpc(poslist, fn_simu, cpus=1, tissues=[2], eps=1e-2,
         m, poslist, fn_simu+'_gpc.hdf5',
         electrode_surfaces, poslist.currents,
         roi=tissues)
-    sampler.create_hdf5()
+    samples = _start_sampling(sampler)
     reg, phi = pygpc.adaptive.run_reg_adaptive_grid(
         pdf_type, pdfshape, limits,
         sampler.run_simulation,
@@ -648,7 +658,9 @@ def run_tcs_gpc(poslist, fn_simu, cpus=1, tissues=[2], eps=1e-2,
         regularization_factors=regularization_factors,
         n_cpus=cpus,
         print_function=logger.info,
-        min_iter=min_iter)
+        min_iter=min_iter,
+        batch_func=functools.partial(sampler.run_simulations, cpus=cpus),
+        samples=samples)
     gpc_reg = gPC_regression(random_vars,
                              pdf_type, pdfshape, limits, reg.poly_idx,
                              reg.grid.coords_norm, 'TCS',
@@ -659,6 +671,23 @@ def run_tcs_gpc(poslist, fn_simu, cpus=1, tissues=[2], eps=1e-2,
 
     return [gpc_reg.mesh_file]
 
+
+def _start_sampling(sampler):
+    ''' Creates the HDF5 file of the sampler. If the file of an interrupted
+    run exists, returns its samples instead '''
+    if not os.path.isfile(sampler.fn_hdf5):
+        sampler.create_hdf5()
+        return None
+    with h5py.File(sampler.fn_hdf5, 'r') as f:
+        finished = 'gpc_object' in f.keys()
+    if finished:
+        raise IOError('Output file ' + sampler.fn_hdf5 + ' already exists')
+    samples = sampler.recorded_samples()
+    logger.info('Resuming gPC with {0} samples from {1}'.format(
+        len(samples[0]), sampler.fn_hdf5))
+    return samples
+
+
 class gPCSampler(object):
     ''' Object used by pygpc to sample
 
@@ -680,6 +709,14 @@ class gPCSampler(object):
         dictionaty with functions for each QOI.
         The first QOI will be passed to the gPC algorithm.
 
+    Notes
+    -------
+    The sparsity pattern of the stiffness matrix (and, for TMS, dA/dt) is
+    calculated once and reused for all samples. With the 'scipy' solver
+    options, each process also reuses the preconditioner and the solution of
+    its previous sample. run_simulations evaluates several samples in
+    parallel, the results are written to the HDF5 file by the calling process
+    only.
 
     Parameters
     ----------
@@ -705,6 +742,19 @@ class gPCSampler(object):
         self._gpc_vars = prep_gpc(poslist)
         self.identifiers = self._gpc_vars[0]
         self.qoi_function = OrderedDict([('E', self._calc_E)])
+        # nodes of the ROI, in the order of mesh_roi
+        roi_nodes = np.unique(m.elm.node_number_list[np.isin(m.elm.tag1, self.roi)])
+        self._roi_nodes = roi_nodes[roi_nodes > 0]
+        self._stiffness_pattern = None
+        self._tensor_field = None
+        # solvers of the previous sample, see fem.tdcs
+        self._solver_cache = {}
+
+    def __getstate__(self):
+        # the solvers are kept in each process, and not sent to the workers
+        state = self.__dict__.copy()
+        state['_solver_cache'] = {}
+        return state
 
     def create_hdf5(self):
         '''Creates an HDF5 file to store the data '''
@@ -760,9 +810,98 @@ class gPCSampler(object):
             dset.resize((dset.shape[0] + 1, ) + data.shape)
             dset[-1, ...] = data
 
+    def recorded_samples(self):
+        ''' Samples recorded in the HDF5 file, e.g. by an interrupted run.
+        Data of samples which were not completely recorded is removed
+
+        Returns
+        --------
+        random_vars: np.ndarray
+            Random variables of each sample [N x N_vars]
+        qoi: np.ndarray
+            First QOI of each sample, flattened [N x N_out]
+        '''
+        qoi_name = 'mesh_roi/data_matrices/' + next(iter(self.qoi_function)) + '_samples'
+        with h5py.File(self.fn_hdf5, 'a') as f:
+            if 'random_var_samples' not in f.keys():
+                return np.empty((0, len(self.identifiers))), np.empty((0, 0))
+            dsets = [f['random_var_samples']]
+            for group in ['mesh/data_matrices', 'mesh_roi/data_matrices']:
+                if group in f:
+                    dsets += list(f[group].values())
+            n = min(d.shape[0] for d in dsets) if qoi_name in f else 0
+            for d in dsets:
+                if d.shape[0] > n:
+                    d.resize(n, axis=0)
+            if n == 0:
+                return np.empty((0, len(self.identifiers))), np.empty((0, 0))
+            random_vars = f['random_var_samples'][()].reshape(n, -1)
+            qoi = f[qoi_name][()].reshape(n, -1)
+        return random_vars, qoi
+
     def run_simulation(self, random_vars):
+        ''' Simulates a sample, records it in the HDF5 file and returns the
+        first QOI, flattened '''
+        self._prepare()
+        records, qoi = self._simulate(random_vars)
+        self._record(records)
+        return qoi
+
+    def run_simulations(self, random_vars, cpus=1):
+        ''' Simulates several samples and records them in the HDF5 file
+
+        Parameters
+        -------------
+        random_vars: np.ndarray
+            Random variables of each sample [N x N_vars]
+        cpus: int (optional)
+            Number of processes simulating samples in parallel. Default: 1
+
+        Returns
+        ---------
+        qoi: np.ndarray
+            First QOI of each sample, flattened [N x N_out]
+        '''
+        self._prepare()
+        cpus = min(cpus, len(random_vars))
+        if cpus <= 1:
+            return np.vstack([self.run_simulation(x) for x in random_vars])
+        qois = []
+        with multiprocessing.Pool(
+                processes=cpus, initializer=_set_up_sampler,
+                initargs=(self,)) as pool:
+            # records are written as soon as each sample is done, in order
+            for records, qoi in pool.imap(_simulate_sample, random_vars):
+                self._record(records)
+                qois.append(qoi)
+        return np.vstack(qois)
+
+    def _prepare(self):
+        ''' Sets up the state reused by all samples '''
+        if self._stiffness_pattern is None:
+            self._stiffness_pattern = fem.StiffnessPattern(self.mesh)
+        if self._tensor_field is None and self.poslist.anisotropy_type != 'scalar':
+            self._tensor_field = self.poslist.get_tensor_field(self.mesh)
+
+    def _simulate(self, random_vars):
+        ''' Simulates a sample, returns the records to be written in the HDF5
+        file as (data, name, group) and the first QOI, flattened '''
         raise NotImplementedError('This method is to be implemented in a subclass!')
 
+    def _record(self, records):
+        for data, name, group in records:
+            self.record_data_matrix(data, name, group)
+
+    def _records(self, random_vars, v, v_c, qois):
+        records = [
+            (random_vars, 'random_var_samples', '/'),
+            (v.value, 'v_samples', 'mesh/data_matrices'),
+            (v_c.value, 'v_samples', 'mesh_roi/data_matrices')
+        ]
+        for qoi_name, qoi_v in zip(self.qoi_function.keys(), qois):
+            records.append((qoi_v, qoi_name + '_samples', 'mesh_roi/data_matrices'))
+        return records
+
     def _calc_E(self, v, random_vars, dAdt=None):
         grad = v.gradient()
         grad.assign_triangle_values()
@@ -855,36 +994,24 @@ class TDCSgPCSampler(gPCSampler):
             s.mesh, s.poslist, s.fn_hdf5, el_tags, el_currents,
             roi=s.roi)
 
-    def run_simulation(self, random_vars):
+    def _simulate(self, random_vars):
         poslist = self._update_poslist(random_vars)
-        cond = poslist.cond2elmdata(self.mesh)
+        cond = poslist.cond2elmdata(
+            self.mesh, logger_level=10, tensor_field=self._tensor_field)
         v = fem.tdcs(
             self.mesh, cond, self.el_currents,
-            self.el_tags, units='mm')
-
-
-        self.mesh.nodedata = [v]
-        cropped = self.mesh.crop_mesh(self.roi)
-        v_c = cropped.nodedata[0]
-        self.mesh.nodedata = []
+            self.el_tags, units='mm',
+            solver_options=self.poslist.solver_options,
+            stiffness_pattern=self._stiffness_pattern,
+            solver_cache=self._solver_cache)
+        v_c = mesh_io.NodeData(v.value[self._roi_nodes - 1], mesh=self.mesh_roi)
 
         qois = []
         for qoi_name, qoi_f in self.qoi_function.items():
             qois.append(qoi_f(v_c, random_vars))
 
-        self.record_data_matrix(random_vars, 'random_var_samples', '/')
-        self.record_data_matrix(v.value, 'v_samples', 'mesh/data_matrices')
-        self.record_data_matrix(v_c.value, 'v_samples', 'mesh_roi/data_matrices')
-        for qoi_name, qoi_v in zip(self.qoi_function.keys(), qois):
-            self.record_data_matrix(
-                qoi_v, qoi_name + '_samples', 'mesh_roi/data_matrices')
-
-        del cropped
-        del cond
-        del v
-        del v_c
-
-        return np.atleast_1d(qois[0]).reshape(-1)
+        records = self._records(random_vars, v, v_c, qois)
+        return records, np.atleast_1d(qois[0]).reshape(-1)
 
 
 class TMSgPCSampler(gPCSampler):
@@ -957,57 +1084,71 @@ class TMSgPCSampler(gPCSampler):
             s.mesh, s.poslist, s.fn_hdf5, fnamecoil,
             matsimnibs, didt, roi=s.roi)
 
-    def run_simulation(self, random_vars):
-        poslist = self._update_poslist(random_vars)
-        cond = poslist.cond2elmdata(self.mesh)
-        if self.constant_dAdt:
-            try:
-                dAdt = self.dAdt
-                dAdt_roi = self.dAdt_roi
-            except AttributeError:
-                tms_coil = TmsCoil.from_file(self.fnamecoil)
-                didt = np.atleast_1d(self.didt)
-                if len(didt) == 1:
-                    for stimulator in tms_coil.get_elements_grouped_by_stimulators().keys():
-                        stimulator.di_dt = didt
-                else:
-                    for stimulator, stimulator_didt in zip(tms_coil.get_elements_grouped_by_stimulators().keys(), didt):
-                        stimulator.di_dt = stimulator_didt 
-                dAdt = tms_coil.get_da_dt(self.mesh, self.matsimnibs)
-                if isinstance(dAdt, mesh_io.NodeData):
-                    dAdt = dAdt.node_data2elm_data()
-                dAdt.field_name = 'dAdt'
-                dAdt.write_hdf5(self.fn_hdf5, 'mesh/elmdata/')
-                self.dAdt = dAdt
-                self.mesh.elmdata = [dAdt]
-                cropped = self.mesh.crop_mesh(self.roi)
-                dAdt_roi = cropped.elmdata[0]
-                dAdt_roi.write_hdf5(self.fn_hdf5, 'mesh_roi/elmdata/')
-                self.mesh.elmdata = []
-                self.dAdt_roi = dAdt_roi
-        else:
+    def _prepare(self):
+        super()._prepare()
+        if not self.constant_dAdt:
             raise NotImplementedError
-
-        v = fem.tms_dadt(self.mesh, cond, dAdt)
-        self.mesh.nodedata = [v]
-        cropped = self.mesh.crop_mesh(self.roi)
-        v_c = cropped.nodedata[0]
-        self.mesh.nodedata = []
+        if hasattr(self, 'dAdt'):
+            return
+        # dA/dt does not depend on the conductivities. It is stored in the
+        # HDF5 file, so that it is also reused when resuming
+        stored = False
+        if os.path.isfile(self.fn_hdf5):
+            with h5py.File(self.fn_hdf5, 'r') as f:
+                stored = 'mesh/elmdata/dAdt' in f and 'mesh_roi/elmdata/dAdt' in f
+        if stored:
+            self.dAdt = mesh_io.ElementData(
+                read_data_hdf5('dAdt', self.fn_hdf5, 'mesh/elmdata/'),
+                'dAdt', mesh=self.mesh)
+            self.dAdt_roi = mesh_io.ElementData(
+                read_data_hdf5('dAdt', self.fn_hdf5, 'mesh_roi/elmdata/'),
+                'dAdt', mesh=self.mesh_roi)
+        else:
+            tms_coil = TmsCoil.from_file(self.fnamecoil)
+            didt = np.atleast_1d(self.didt)
+            if len(didt) == 1:
+                for stimulator in tms_coil.get_elements_grouped_by_stimulators().keys():
+                    stimulator.di_dt = didt
+            else:
+                for stimulator, stimulator_didt in zip(tms_coil.get_elements_grouped_by_stimulators().keys(), didt):
+                    stimulator.di_dt = stimulator_didt 
+            dAdt = tms_coil.get_da_dt(self.mesh, self.matsimnibs)
+            if isinstance(dAdt, mesh_io.NodeData):
+                dAdt = dAdt.node_data2elm_data()
+            dAdt.field_name = 'dAdt'
+            dAdt.write_hdf5(self.fn_hdf5, 'mesh/elmdata/')
+            self.dAdt = dAdt
+            self.mesh.elmdata = [dAdt]
+            cropped = self.mesh.crop_mesh(self.roi)
+            dAdt_roi = cropped.elmdata[0]
+            dAdt_roi.write_hdf5(self.fn_hdf5, 'mesh_roi/elmdata/')
+            self.mesh.elmdata = []
+            self.dAdt_roi = dAdt_roi
+
+    def _simulate(self, random_vars):
+        poslist = self._update_poslist(random_vars)
+        cond = poslist.cond2elmdata(
+            self.mesh, logger_level=10, tensor_field=self._tensor_field)
+        v = fem.tms_dadt(
+            self.mesh, cond, self.dAdt,
+            solver_options=self.poslist.solver_options,
+            stiffness_pattern=self._stiffness_pattern,
+            solver_cache=self._solver_cache)
+        v_c = mesh_io.NodeData(v.value[self._roi_nodes - 1], mesh=self.mesh_roi)
 
         qois = []
         for qoi_name, qoi_f in self.qoi_function.items():
-            qois.append(qoi_f(v_c, random_vars, dAdt_roi))
+            qois.append(qoi_f(v_c, random_vars, self.dAdt_roi))
 
-        self.record_data_matrix(random_vars, 'random_var_samples', '/')
-        self.record_data_matrix(v.value, 'v_samples', 'mesh/data_matrices')
-        self.record_data_matrix(v_c.value, 'v_samples',
-                                'mesh_roi/data_matrices')
-        for qoi_name, qoi_v in zip(self.qoi_function.keys(), qois):
-            self.record_data_matrix(
-                qoi_v, qoi_name + '_samples', 'mesh_roi/data_matrices')
+        records = self._records(random_vars, v, v_c, qois)
+        return records, np.atleast_1d(qois[0]).reshape(-1)
+
+
+def _set_up_sampler(sampler):
+    global gpc_global_sampler
+    gpc_global_sampler = sampler
 
-        del cropped
-        del cond
-        del v
 
-        return np.atleast_1d(qois[0]).reshape(-1)
+def _simulate_sample(random_vars):
+    global gpc_global_sampler
+    return gpc_global_sampler._simulate(random_vars)
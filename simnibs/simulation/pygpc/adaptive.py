@@ -1,9 +1,8 @@
 import multiprocessing
-import functools
 import numpy as np
 import scipy.linalg
 
-from .grid import randomgrid
+from .grid import randomgrid, norm
 from .ni import reg
 
 
@@ -68,10 +67,8 @@ def _tikhonov(A, b, alpha):
                               overwrite_a=True)
 
 
-def _k_fold_cv_regression(A, data, regression_function, error_eq=_relative_error, k=10):
-    if data.ndim == 1:
-        data = data[:, None]
-    n_simulations = data.shape[0]
+def _k_fold_groups(n_simulations, k):
+    ''' Randomly splits the simulations into k groups, returns a [k x N] mask '''
     if n_simulations <= k:
         k = n_simulations
     shuffle = np.arange(n_simulations, dtype=int)
@@ -84,6 +81,14 @@ def _k_fold_cv_regression(A, data, regression_function, error_eq=_relative_error
         if i == k - 1:
             t = n_simulations
         groups[i, shuffle[f:t]] = True
+    return groups
+
+
+def _k_fold_cv_regression(A, data, regression_function, error_eq=_relative_error, k=10):
+    if data.ndim == 1:
+        data = data[:, None]
+    n_simulations = data.shape[0]
+    groups = _k_fold_groups(n_simulations, k)
     eps = 0.0
     for g in groups:
         # determine regression coefficients
@@ -93,25 +98,65 @@ def _k_fold_cv_regression(A, data, regression_function, error_eq=_relative_error
     return eps
 
 
+def _k_fold_cv_tikhonov(A, data, alphas, error_eq=_relative_error, k=10):
+    ''' k-fold cross validation error of _tikhonov for several regularization factors
+
+    The normal equations of each fold are obtained by removing the rows of the
+    fold from A.T A and A.T b, and are diagonalized once for all factors
+
+    Returns
+    --------
+    eps: ndarray
+        Cross validation error for each regularization factor in alphas
+    '''
+    if data.ndim == 1:
+        data = data[:, None]
+    n_simulations = data.shape[0]
+    groups = _k_fold_groups(n_simulations, k)
+    AtA = A.T.dot(A)
+    Atb = A.T.dot(data)
+    eps = np.zeros(len(alphas), dtype=float)
+    for g in groups:
+        A_g = A[g, :]
+        w, Q = scipy.linalg.eigh(AtA - A_g.T.dot(A_g))
+        Qtb = Q.T.dot(Atb - A_g.T.dot(data[g, :]))
+        A_gQ = A_g.dot(Q)
+        for i, alpha in enumerate(alphas):
+            x = Qtb / (w + alpha)[:, None]
+            eps[i] += sum(g) * error_eq(data[g, :], A_gQ.dot(x))
+    eps /= n_simulations
+    return eps
+
+
 class RegularizedRegression(reg):
     ''' RegularizedRegression Regression
     is a subclass of reg
     '''
     def __init__(self, pdftype, pdfshape, limits, order, order_max, interaction_order,
                  grid, regularization_factors=np.logspace(-5, 3, 9)):
+        self._A = np.empty((0, 0))
         super().__init__(pdftype, pdfshape, limits, order, order_max, interaction_order, grid)
         self.regularization_factors = regularization_factors
 
     def construct_gpc_matrix(self):
-        """ construct the gpc matrix A [N_samples x N_poly] """
-        A = np.zeros([self.N_grid, self.N_poly])
+        """ construct the gpc matrix A [N_samples x N_poly]
 
-        for i_poly in range(self.N_poly):
-            A1 = np.ones(self.N_grid)
-            for i_DIM in range(self.DIM):
-                A1 *= self.poly[self.poly_idx[i_poly][i_DIM]][i_DIM](self.grid.coords_norm[:,i_DIM])
-            A[:, i_poly] = A1
-        return A
+        The matrix is cached. As sampling points and polynomials are only
+        appended, later calls only evaluate the new rows and columns
+        """
+        n_rows, n_cols = self._A.shape
+        if n_rows > self.N_grid or n_cols > self.N_poly:
+            n_rows, n_cols = 0, 0
+            self._A = np.empty((0, 0))
+        if n_rows < self.N_grid or n_cols < self.N_poly:
+            new_cols = self.evaluate_basis(
+                self.grid.coords_norm[:n_rows], self.poly_idx[n_cols:])
+            new_rows = self.evaluate_basis(self.grid.coords_norm[n_rows:])
+            self._A = np.vstack([
+                np.hstack([self._A.reshape(n_rows, n_cols), new_cols]),
+                new_rows
+            ])
+        return self._A
 
     def expand(self, data, return_error=True, return_reg_factor=False):
         """ Determine the gPC coefficients by the regression method
@@ -122,11 +167,8 @@ class RegularizedRegression(reg):
         if data.ndim == 1:
             data = data[:, None]
 
-        errors = np.zeros_like(self.regularization_factors, dtype=float)
         A = self.construct_gpc_matrix()
-        for i, reg_factor in enumerate(self.regularization_factors): 
-            regression_fun = functools.partial(_tikhonov, alpha=reg_factor)
-            errors[i] = _k_fold_cv_regression(A, data, regression_fun)
+        errors = _k_fold_cv_tikhonov(A, data, self.regularization_factors)
         min_error = np.argmin(errors)
         reg_error = errors[min_error]
         selected_reg = self.regularization_factors[min_error]
@@ -157,20 +199,31 @@ class RegularizedRegression(reg):
         '''
         newgridpoints = randomgrid(self.pdftype, self.pdfshape, self.limits,
                                    int(np.ceil(n)))
-            
+        self.add_sampling_points(newgridpoints.coords)
+        return newgridpoints.coords
+
+    def add_sampling_points(self, coords):
+        ''' Adds the given sampling points
+
+        Parameters
+        -----------
+        coords: ndarray
+            Sampling points in the original parameter space [N x DIM]
+        '''
+        coords = np.asarray(coords, dtype=float).reshape(-1, self.DIM)
+        coords_norm = norm(coords, self.pdftype, self.pdfshape, self.limits)
         # append points to existing grid
-        self.grid.coords = np.vstack([self.grid.coords, newgridpoints.coords])
-        self.grid.coords_norm = np.vstack([self.grid.coords_norm, newgridpoints.coords_norm])
+        self.grid.coords = np.vstack([self.grid.coords, coords])
+        self.grid.coords_norm = np.vstack([self.grid.coords_norm, coords_norm])
         self.N_grid = self.grid.coords.shape[0]
 
-        return newgridpoints.coords
-
 
 def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
                           data_poly_ratio=2, max_iter=1000,
                           order_max=None, interaction_max=None,
                           eps=1E-3, regularization_factors=np.logspace(-5, 3, 9),
-                          min_iter=0, n_cpus=1, print_function=None):
+                          min_iter=0, n_cpus=1, print_function=None,
+                          batch_func=None, samples=None):
     """  
     Adaptive regression approach based on leave one out cross validation error
     estimation
@@ -211,6 +264,15 @@ def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
         Number of cpus to evaluate "func". Default: 1
     print_function : function
         A function to print convergence information. Default: Does not print
+    batch_func : callable batch_func(coords, *args), optional
+        Evaluates all new sampling points of an iteration at once [N x DIM]
+        and returns the results [N x N_out]. If set, it is used instead of
+        "func" and is responsible for any parallelization.
+        Default: evaluate "func" for each sampling point
+    samples : tuple (coords, results), optional
+        Sampling points [N x DIM] and results [N x N_out] of previous
+        evaluations, e.g. of an interrupted run. They are used in order before
+        drawing new random sampling points. Default: no previous samples
 
     Returns
     -------
@@ -235,7 +297,11 @@ def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
     if interaction_max is None:
         interaction_max = DIM
 
-    if n_cpus > 1:
+    if samples is None:
+        samples = (np.empty((0, DIM)), np.empty((0, 0)))
+    samples_coords, samples_res = samples
+
+    if n_cpus > 1 and batch_func is None:
         pool = multiprocessing.Pool(processes=n_cpus)
 
     while i_iter < max_iter:
@@ -264,37 +330,50 @@ def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
         # This here will ensure we always use n_cpus
         if n % n_cpus > 0:
             n += n_cpus - (n % n_cpus)
-        regobj.add_n_sampling_points(n)
+        # reuse previous samples
+        n_reuse = min(max(n, 0), len(samples_coords))
+        new_res = []
+        if n_reuse > 0:
+            if print_function:
+                print_function("Reusing {} previous simulations".format(n_reuse))
+            regobj.add_sampling_points(samples_coords[:n_reuse])
+            new_res.append(np.atleast_2d(samples_res[:n_reuse]))
+            samples_coords = samples_coords[n_reuse:]
+            samples_res = samples_res[n_reuse:]
+        regobj.add_n_sampling_points(n - n_reuse)
+        new_coords = regobj.grid.coords[i_samples + n_reuse:, :]
 
         # run repeated simulations
+        # Batch version
+        if len(new_coords) == 0:
+            pass
+        elif batch_func is not None:
+            if print_function:
+                print_function("Performing simulations #{} to #{}".format(
+                    i_samples + n_reuse + 1, regobj.grid.coords.shape[0]))
+            new_res.append(batch_func(new_coords, *args))
         # MP version
-        if n_cpus > 1:
+        elif n_cpus > 1:
             processes = []
-            for s in range(i_samples, regobj.grid.coords.shape[0]):
+            for s, x in enumerate(new_coords, i_samples + n_reuse):
                 if print_function:
                     print_function("Performing simulation #{}".format(s+1))
-                x = regobj.grid.coords[s, :]
                 processes.append(pool.apply_async(func, (x, ) + args))
-            if i_samples == 0:
-                RES = np.vstack([p.get() for p in processes])
-            else:
-                RES = np.vstack([RES] + [p.get() for p in processes])
+            new_res += [p.get() for p in processes]
         # Sequential version
         else:
-            for s in range(i_samples, regobj.grid.coords.shape[0]):
+            for s, x in enumerate(new_coords, i_samples + n_reuse):
                 if print_function:
                     print_function("Performing simulation #{}".format(s+1))
-                # read random variables from grid
-                x = regobj.grid.coords[s, :]
                 # evaluate function at grid points
-                res = func(x, *(args))
-                # append result to solution matrix (RHS)
-                if s == 0:
-                    RES = res[None, :]
-                else:
-                    RES = np.vstack([RES, res])
-
-        i_samples = s + 1
+                new_res.append(func(x, *(args)))
+
+        # append results to solution matrix (RHS)
+        if i_samples == 0:
+            RES = np.vstack(new_res)
+        else:
+            RES = np.vstack([RES] + new_res)
+        i_samples = regobj.grid.coords.shape[0]
         # Expand
         coeffs, eps_gpc = regobj.expand(RES)
         if print_function:
@@ -309,7 +388,7 @@ def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
     if i_iter >= max_iter:
         raise ValueError('Maximum number of iterations reached')
 
-    if n_cpus > 1:
+    if n_cpus > 1 and batch_func is None:
         pool.close()
         pool.join()
 
@@ -493,24 +493,17 @@ class gpc:
         
         # construct array of scaling factors to normalize basis functions <psi^2> = int(psi^2*p)dx
         # [Npolybasis x 1]
-        self.poly_norm_basis = np.ones([self.poly_idx.shape[0],1])
-        for i_poly in range(self.poly_idx.shape[0]):
-            for i_DIM in range(self.DIM):
-                self.poly_norm_basis[i_poly] *= self.poly_norm[self.poly_idx[i_poly,i_DIM],i_DIM]
+        self.poly_norm_basis = np.prod(
+            self.poly_norm[self.poly_idx, np.arange(self.DIM)], axis=1)[:, np.newaxis]
     
     def enrich_polynomial_basis(self, poly_idx_added, form_A=True):
         """ Enrich polynomial basis functions and add new columns to gpc matrix 
             poly_idx_added ... array of added polynomials (order), np.array() [N_poly_added x DIM]"""
         
         # determine if polynomials in poly_idx_added are already present in self.poly_idx if so, delete them
-        poly_idx_tmp = []
-        for new_row in poly_idx_added:
-            not_in_poly_idx = True
-            for row in self.poly_idx:
-                if np.allclose(row, new_row):
-                    not_in_poly_idx = False
-            if not_in_poly_idx:
-                poly_idx_tmp.append(new_row)
+        poly_idx_present = set(map(tuple, np.asarray(self.poly_idx, dtype=int)))
+        poly_idx_tmp = [new_row for new_row in poly_idx_added
+                        if tuple(np.asarray(new_row, dtype=int)) not in poly_idx_present]
         
         # if all polynomials are already present end routine
         if len(poly_idx_tmp) == 0:        
@@ -572,22 +565,14 @@ class gpc:
         
         # extend array of scaling factors to normalize basis functions <psi^2> = int(psi^2*p)dx
         # [Npolybasis x 1]
-        N_poly_new = poly_idx_added.shape[0]
-        poly_norm_basis_new = np.ones([N_poly_new,1])
-        for i_poly in range(N_poly_new):
-            for i_DIM in range(self.DIM):
-                poly_norm_basis_new[i_poly] *= self.poly_norm[poly_idx_added[i_poly,i_DIM],i_DIM]
+        poly_norm_basis_new = np.prod(
+            self.poly_norm[poly_idx_added, np.arange(self.DIM)], axis=1)[:, np.newaxis]
         
         self.poly_norm_basis = np.vstack([self.poly_norm_basis, poly_norm_basis_new])
         
         if form_A:
             # append new columns to gpc matrix [N_grid x N_poly_new]
-            A_new_columns = np.zeros([self.N_grid,N_poly_new])
-            for i_poly_new in range(N_poly_new):
-                A1 = np.ones(self.N_grid)
-                for i_DIM in range(self.DIM):
-                    A1 *= self.poly[poly_idx_added[i_poly_new][i_DIM]][i_DIM](self.grid.coords_norm[:,i_DIM])
-                A_new_columns[:,i_poly_new] = A1
+            A_new_columns = self.evaluate_basis(self.grid.coords_norm, poly_idx_added)
             
             self.A = np.hstack([self.A, A_new_columns])
             self.Ainv = np.linalg.pinv(self.A)
@@ -609,12 +594,7 @@ class gpc:
             self.N_grid = self.grid.coords.shape[0]
             
             # determine new row of gpc matrix
-            a = np.zeros([N_grid_new, self.N_poly])
-            for i_poly in range(self.N_poly):
-                a1 = np.ones(N_grid_new)
-                for i_DIM in range(self.DIM):
-                    a1 *= self.poly[self.poly_idx[i_poly][i_DIM]][i_DIM](newgridpoints.coords_norm[:,i_DIM])
-                a[:,i_poly] = a1
+            a = self.evaluate_basis(newgridpoints.coords_norm)
             
             # append new row to gpc matrix    
             self.A = np.vstack([self.A,a])
@@ -627,17 +607,40 @@ class gpc:
         """ construct the gpc matrix A [N_grid x N_poly] """
         #print 'Constructing gPC matrix ...'
                 
-        self.A = np.zeros([self.N_grid,self.N_poly])
-        
-        for i_poly in range(self.N_poly):
-            A1 = np.ones(self.N_grid)
-            for i_DIM in range(self.DIM):
-                A1 *= self.poly[self.poly_idx[i_poly][i_DIM]][i_DIM](self.grid.coords_norm[:,i_DIM])
-            self.A[:,i_poly] = A1
+        self.A = self.evaluate_basis(self.grid.coords_norm)
         
         # invert gpc matrix Ainv [N_basis x N_grid]
         self.Ainv  = np.linalg.pinv(self.A)    
         
+    def evaluate_basis(self, xi, poly_idx=None):
+        """ evaluate basis functions in normalized coordinates xi (interval: [-1, 1])
+
+            A = evaluate_basis(self, xi, poly_idx=None)
+
+            Each 1D polynomial is evaluated once per dimension for all points and
+            the basis functions are formed as products of these values
+
+            input:  xi       ... normalized coordinates of random variables, np.array() [N_xi x DIM]
+                    poly_idx ... (optional) multi-indices of the basis functions,
+                                 np.array() [N_poly x DIM] (default: self.poly_idx)
+
+            output: A ... basis functions evaluated in xi, np.array() [N_xi x N_poly]
+        """
+        if poly_idx is None:
+            poly_idx = self.poly_idx
+        poly_idx = np.asarray(poly_idx, dtype=int).reshape(-1, self.DIM)
+        xi = np.asarray(xi, dtype=float).reshape(-1, self.DIM)
+
+        A = np.ones([xi.shape[0], poly_idx.shape[0]])
+        for i_DIM in range(self.DIM):
+            orders, idx = np.unique(poly_idx[:, i_DIM], return_inverse=True)
+            # values of the 1D polynomials of the orders in use [N_xi x N_orders]
+            poly_vals = np.empty([xi.shape[0], len(orders)])
+            for i, i_order in enumerate(orders):
+                poly_vals[:, i] = self.poly[i_order][i_DIM](xi[:, i_DIM])
+            A *= poly_vals[:, idx.ravel()]
+        return A
+
 
 
 #%%############################################################################
@@ -729,15 +732,7 @@ class gpc:
             output_idx = np.arange(self.N_out, dtype=int)
             output_idx = output_idx[np.newaxis,:]        
         
-        N_out_eval = output_idx.shape[1]
-        N_x = xi.shape[0]
-        
-        y = np.zeros([N_x, N_out_eval])
-        for i_poly in range(self.N_poly):
-            A1 = np.ones(N_x)
-            for i_DIM in range(self.DIM):
-                A1 *= self.poly[self.poly_idx[i_poly][i_DIM]][i_DIM](xi[:,i_DIM])
-            y += np.outer(A1, coeffs[i_poly, output_idx.astype(int)])
+        y = np.dot(self.evaluate_basis(xi), coeffs[:, output_idx.astype(int).ravel()])
 
         return y  
         
@@ -1029,6 +1024,17 @@ class reg(gpc):
          
          self.relerror = np.zeros(data.shape[0])
          
+         # for a gpc matrix of full column rank, the leave one out residuals
+         # follow from the residuals of the full regression and the leverages,
+         # i.e. the diagonal of the hat matrix A*pinv(A) = Q*Q.T
+         Q, R = np.linalg.qr(self.A)
+         leverage = np.sum(Q**2, axis=1)
+         if np.linalg.matrix_rank(R) == self.A.shape[1] and np.all(leverage < 1 - 1e-8):
+             residual = data - np.dot(Q, np.dot(Q.T, data))
+             self.relerror = np.linalg.norm(residual / (1 - leverage[:, np.newaxis]), axis=1) / np.linalg.norm(data, axis=1)
+             self.relerror_LOOCV = np.mean(self.relerror)
+             return self.relerror_LOOCV
+         
          for i in range(data.shape[0]):
              # get mask of eliminated row                
              mask = np.arange(data.shape[0]) != i
@@ -99,6 +99,18 @@ class TestCV:
             k=10)
         assert np.isclose(eps, .5)
 
+    def test_k_fold_cv_tikhonov(self):
+        np.random.seed(1)
+        A = np.random.rand(40, 6)
+        b = A.dot(np.arange(6)) + .1 * np.random.rand(40)
+        alphas = [1e-3, 1e-1, 1e1]
+        np.random.seed(2)
+        eps = adaptive._k_fold_cv_tikhonov(A, b, alphas)
+        for e, alpha in zip(eps, alphas):
+            np.random.seed(2)
+            r = functools.partial(adaptive._tikhonov, alpha=alpha)
+            assert np.isclose(e, adaptive._k_fold_cv_regression(A, b, r))
+
 
 class TestRegularizedRegression:
     def test_expand(self, uniform_dist):
@@ -129,6 +141,21 @@ class TestRegularizedRegression:
         assert new_points.shape == (50, 2)
         assert reg.construct_gpc_matrix().shape == (51, 3)
 
+    def test_construct_gpc_matrix_incremental(self, uniform_dist):
+        pdfshape, gridshape, limits = uniform_dist
+        g = grid.randomgrid(pdfshape, gridshape, limits, 10)
+        reg = adaptive.RegularizedRegression(
+            pdfshape, gridshape, limits, [1, 1], 10, 2, g)
+        reg.enrich_polynomial_basis(np.array([[2, 0], [1, 1]]), form_A=False)
+        reg.add_n_sampling_points(5)
+        A = reg.construct_gpc_matrix()
+        assert A.shape == (15, 5)
+        A_ref = np.ones((15, 5))
+        for i, idx in enumerate(reg.poly_idx):
+            for d in range(2):
+                A_ref[:, i] *= reg.poly[idx[d]][d](reg.grid.coords_norm[:, d])
+        assert np.allclose(A, A_ref)
+
 
 class TestAdaptive:
     def test_adaptive_expand(self,  uniform_dist):
@@ -141,3 +168,29 @@ class TestAdaptive:
                 data_poly_ratio=2)
         assert reg.construct_gpc_matrix().shape == (8,4)
 
+    def test_adaptive_batch_resume(self,  uniform_dist):
+        np.random.seed(1)
+        pdftype, pdfshape, limits = uniform_dist
+        function = lambda x: np.array((3 * x[0], 1 * x[1], 2 * x[0]**2))
+        reg, res = adaptive.run_reg_adaptive_grid(
+                pdftype, pdfshape,
+                limits, function,
+                data_poly_ratio=2)
+        batches = []
+        def batch_function(coords):
+            batches.append(len(coords))
+            return np.array([function(x) for x in coords])
+        reg_resumed, res_resumed = adaptive.run_reg_adaptive_grid(
+                pdftype, pdfshape,
+                limits, function,
+                data_poly_ratio=2,
+                batch_func=batch_function,
+                samples=(reg.grid.coords[:5], res[:5]))
+        assert np.allclose(reg_resumed.grid.coords[:5], reg.grid.coords[:5])
+        assert np.allclose(reg_resumed.grid.coords_norm[:5], reg.grid.coords_norm[:5])
+        assert np.allclose(res_resumed[:5], res[:5])
+        assert np.allclose(
+            res_resumed,
+            [function(x) for x in reg_resumed.grid.coords])
+        assert sum(batches) == len(res_resumed) - 5
+
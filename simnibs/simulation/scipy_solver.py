@@ -0,0 +1,230 @@
+''' Iterative solver for FEM systems using only SciPy and, if installed, PyAMG
+
+Conjugate gradient solver which does not depend on PETSc or MKL. The
+preconditioner is set-up once and re-used in all calls to "solve", and each
+solve is warm-started from the previous solution.
+
+    This program is part of the SimNIBS package.
+    Please check on www.simnibs.org how to cite our work in publications.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import inspect
+import time
+
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as spalg
+
+from ..utils.simnibs_logger import logger
+
+try:
+    import pyamg
+except ImportError:
+    PYAMG = False
+else:
+    PYAMG = True
+
+# The tolerance argument of cg was renamed in SciPy 1.12
+_CG_TOL = 'rtol' if 'rtol' in inspect.signature(spalg.cg).parameters else 'tol'
+
+PRECONDITIONERS = ['amg', 'ilu', 'jacobi', 'none']
+
+
+class SolverError(Exception):
+    pass
+
+
+def parse_options(solver_options):
+    ''' Parses a solver options string
+
+    The options follow the PETSc syntax, for example
+    'scipy -ksp_rtol 1e-10 -pc_type amg -ksp_max_it 1000'
+
+    Parameters
+    ------------
+    solver_options: str
+        Options string, starting with "scipy"
+
+    Returns
+    ---------
+    kwargs: dict
+        Keyword arguments for Solver
+    '''
+    tokens = solver_options.split()
+    if len(tokens) == 0 or tokens[0] != 'scipy':
+        raise ValueError(
+            f'Invalid solver options for the SciPy solver: {solver_options}')
+    names = {
+        '-ksp_rtol': ('rtol', float),
+        '-ksp_max_it': ('maxiter', int),
+        '-pc_type': ('preconditioner', str),
+        '-warm_start': ('warm_start', lambda v: v.lower() in ['1', 'true', 'yes'])
+    }
+    if len(tokens) % 2 != 1:
+        raise ValueError(
+            f'Invalid solver options for the SciPy solver: {solver_options}')
+    kwargs = {}
+    for key, value in zip(tokens[1::2], tokens[2::2]):
+        if key not in names:
+            raise ValueError(f'Unknown option for the SciPy solver: {key}')
+        name, convert = names[key]
+        kwargs[name] = convert(value)
+    return kwargs
+
+
+class Solver:
+    ''' Preconditioned conjugate gradient solver for symmetric positive definite
+    systems
+
+    Parameters
+    ------------
+    A: scipy.sparse matrix
+        Sparse square left-hand side matrix
+    rtol: float (optional)
+        Relative tolerance, with respect to the norm of the right-hand side.
+        Default: 1e-10
+    maxiter: int (optional)
+        Maximum number of iterations per right-hand side. Default: 10000
+    preconditioner: {'amg', 'ilu', 'jacobi', 'none'} or Solver (optional)
+        Preconditioner. 'amg' needs PyAMG. If a Solver is given, its
+        preconditioner is re-used and its last solution is the first initial
+        guess, this is useful for systems with close by matrices.
+        Default: 'amg' if PyAMG is installed, 'jacobi' otherwise
+    warm_start: bool (optional)
+        Whether to start from the previous solution, if it has a smaller
+        residual than the zero initial guess. Default: True
+    log_level: int (optional)
+        Logger level. Default: 20 (Info)
+
+    Attributes
+    ------------
+    M: scipy.sparse.linalg.LinearOperator
+        Preconditioner
+    setup_time: float
+        Time to set-up the preconditioner, in seconds
+    solve_time: float
+        Total time spent in solves, in seconds
+    iterations: list of int
+        Number of iterations for each solved right-hand side
+    '''
+    def __init__(self, A, rtol=1e-10, maxiter=10000, preconditioner=None,
+                 warm_start=True, log_level=20):
+        self.A = sparse.csr_matrix(A)
+        self.rtol = rtol
+        self.maxiter = maxiter
+        self.warm_start = warm_start
+        self.log_level = log_level
+        self.iterations = []
+        self.solve_time = 0.
+        self._x0 = None
+
+        start = time.time()
+        if isinstance(preconditioner, Solver):
+            if preconditioner.A.shape != self.A.shape:
+                raise ValueError('Can only re-use the preconditioner of a '
+                                 'solver with a matrix of the same size')
+            self.preconditioner = preconditioner.preconditioner
+            self.M = preconditioner.M
+            self._x0 = preconditioner._x0
+        else:
+            if preconditioner is None:
+                preconditioner = 'amg' if PYAMG else 'jacobi'
+            self.preconditioner = preconditioner
+            self.M = self._setup_preconditioner(preconditioner)
+        self.setup_time = time.time() - start
+        logger.log(
+            self.log_level,
+            f'Time to prepare the {self.preconditioner} preconditioner: '
+            f'{self.setup_time:.2f}s')
+
+    def _setup_preconditioner(self, preconditioner):
+        if preconditioner == 'amg':
+            if not PYAMG:
+                raise ImportError(
+                    'PyAMG is needed for the amg preconditioner')
+            ml = pyamg.smoothed_aggregation_solver(self.A, symmetry='symmetric')
+            return ml.aspreconditioner(cycle='V')
+        elif preconditioner == 'ilu':
+            ilu = spalg.spilu(sparse.csc_matrix(self.A))
+            return spalg.LinearOperator(self.A.shape, ilu.solve)
+        elif preconditioner == 'jacobi':
+            diagonal = self.A.diagonal()
+            if np.any(diagonal <= 0):
+                raise SolverError(
+                    'The Jacobi preconditioner needs a positive diagonal')
+            return sparse.diags(1. / diagonal).tocsr()
+        elif preconditioner == 'none':
+            return None
+        else:
+            raise ValueError(
+                f'Invalid preconditioner: {preconditioner}. '
+                f'Valid options are: {PRECONDITIONERS}')
+
+    def solve(self, b):
+        ''' Solve a series of equations
+
+        Parameters
+        -----------
+        b: (N x n_sims) np.ndarray
+            Numpy array with "n_sim" right hand sides
+
+        Returns
+        ------------
+        x: (N x n_sims) np.ndarray
+            Solutions
+        '''
+        if b.ndim == 1:
+            b = b[:, None]
+        n_sims = b.shape[1]
+        solution = np.zeros(b.shape, dtype=float)
+        for i in range(n_sims):
+            logger.log(self.log_level,
+                       'Solving system {0} of {1}'.format(i + 1, n_sims))
+            start = time.time()
+            x0 = self._initial_guess(b[:, i])
+            n_iter = [0]
+
+            def count(xk):
+                n_iter[0] += 1
+
+            x, info = spalg.cg(
+                self.A, b[:, i], x0=x0, atol=0., maxiter=self.maxiter,
+                M=self.M, callback=count, **{_CG_TOL: self.rtol}
+            )
+            if info > 0:
+                raise SolverError(
+                    f'The conjugate gradient did not converge in {info} '
+                    'iterations')
+            elif info < 0:
+                raise SolverError('There was an error during the solve.')
+            solution[:, i] = x
+            self._x0 = x
+            self.iterations.append(n_iter[0])
+            end = time.time()
+            self.solve_time += end - start
+            logger.log(
+                self.log_level,
+                f'Time to solve system: {end - start:.2f}s '
+                f'({n_iter[0]} iterations)')
+
+        return solution
+
+    def _initial_guess(self, b):
+        ''' Previous solution, if its residual is smaller than the norm of b '''
+        if not self.warm_start or self._x0 is None:
+            return None
+        if np.linalg.norm(b - self.A.dot(self._x0)) < np.linalg.norm(b):
+            return self._x0
+        return None
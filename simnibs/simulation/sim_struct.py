@@ -26,6 +26,7 @@ import glob
 import gc
 import logging
 import functools
+import multiprocessing
 from typing import Union
 
 import numpy as np
@@ -261,6 +262,20 @@ class SESSION(object):
 
         name = os.path.split(self.fnamehead)[1]
         name = os.path.splitext(name)[0]
+        # When several tDCS simulations use the same head mesh, they share its
+        # stiffness matrix, which is only updated around the electrodes
+        n_tdcs = {}
+        for PL in self.poslists:
+            if PL.type == 'TDCSLIST' and not PL.neumann_electrodes:
+                n_tdcs[id(PL.mesh)] = n_tdcs.get(id(PL.mesh), 0) + 1
+        head_stiffness = []
+        # The middle GM operators depend only on the WM, GM and CSF, so they are
+        # computed (or read) once per head model, from the meshes in memory
+        middle_gm_operators = []
+        subject_files = None
+        if (self.map_to_surf or self.map_to_fsavg) and self.subpath and \
+                os.path.isdir(self.subpath):
+            subject_files = SubjectFiles(subpath=self.subpath)
         for i, PL in enumerate(self.poslists):
             logger.info('Running Poslist Number: {0}'.format(i + 1))
             if PL.name:
@@ -274,8 +289,24 @@ class SESSION(object):
                         dir_name, '{0}_TDCS_{1}'.format(name, i + 1))
                 else:
                     simu_name = os.path.join(dir_name, '{0}'.format(i + 1))
-            fn, fn_geo = PL.run_simulation(
-                simu_name, cpus=cpus, view=self.open_in_gmsh)
+            if PL.type == 'TDCSLIST' and n_tdcs.get(id(PL.mesh), 0) > 1:
+                stiffness = [s for m, s in head_stiffness if m is PL.mesh]
+                if len(stiffness) == 0:
+                    stiffness = [fem.IncrementalStiffness(PL.mesh)]
+                    head_stiffness.append((PL.mesh, stiffness[0]))
+                fn, fn_geo = PL.run_simulation(
+                    simu_name, cpus=cpus, view=self.open_in_gmsh,
+                    incremental_stiffness=stiffness[0])
+            else:
+                fn, fn_geo = PL.run_simulation(
+                    simu_name, cpus=cpus, view=self.open_in_gmsh)
+            if subject_files is not None and PL.mesh is not None:
+                operators = transformations.get_middle_gm_operators(
+                    PL.mesh, subject_files, fsaverage=bool(self.map_to_fsavg),
+                    precomputed=middle_gm_operators)
+                if operators.mesh_hash not in [
+                        o.mesh_hash for o in middle_gm_operators]:
+                    middle_gm_operators.append(operators)
             PL.mesh = None
             final_names += fn
             final_names_geo += fn_geo
@@ -291,54 +322,61 @@ class SESSION(object):
                 raise IOError('Cannot run postprocessing: {0} is not a '
                               'directory'.format(self.subpath))
 
+        out_surf = out_fsavg = out_vol = out_mni = None
         if self.map_to_surf or self.map_to_fsavg:
-            logger.info('Interpolating to the middle of Gray Matter')
-            out_folder = os.path.join(dir_name, 'subject_overlays')
-            folders += [out_folder]
+            out_surf = os.path.join(dir_name, 'subject_overlays')
+            folders += [out_surf]
             if self.map_to_fsavg:
                 out_fsavg = os.path.join(dir_name, 'fsavg_overlays')
                 folders += [out_fsavg]
-            else:
-                out_fsavg = None
-            for f, f_geo in zip(final_names, final_names_geo):
-                if f.endswith('.msh'):
-                    transformations.middle_gm_interpolation(
-                        f, self.subpath, out_folder,
-                        out_fsaverage=out_fsavg, depth=0.5,
-                        open_in_gmsh=self.open_in_gmsh, f_geo=f_geo)
+
+        if self.map_to_vol:
+            out_vol = os.path.join(dir_name, 'subject_volumes')
+            folders += [out_vol]
+
+        if self.map_to_MNI:
+            out_mni = os.path.join(dir_name, 'mni_volumes')
+            folders += [out_mni]
+
+        for f in folders:
+            if not os.path.isdir(f):
+                os.mkdir(f)
 
         keep_tissues = None
         if type(self.tissues_in_niftis) == list:
             keep_tissues = self.tissues_in_niftis
 
-        if self.map_to_vol:
-            logger.info('Mapping to volume')
-            out_folder = os.path.join(dir_name, 'subject_volumes')
-            folders += [out_folder]
-            if not os.path.isdir(out_folder):
-                os.mkdir(out_folder)
-            for f in final_names:
-                if f.endswith('.msh'):
-                    name = os.path.split(f)[1]
-                    name = os.path.splitext(name)[0] + '.nii.gz'
-                    name = os.path.join(out_folder, name)
-                    transformations.interpolate_to_volume(
-                        f, self.subpath, name, keep_tissues=keep_tissues)
-
-        if self.map_to_MNI:
-            logger.info('Mapping to MNI space')
-            out_folder = os.path.join(dir_name, 'mni_volumes')
-            folders += [out_folder]
-            if not os.path.isdir(out_folder):
-                os.mkdir(out_folder)
-
-            for f in final_names:
-                if f.endswith('.msh'):
-                    name = os.path.split(f)[1]
-                    name = os.path.splitext(name)[0] + '.nii.gz'
-                    name = os.path.join(out_folder, name)
-                    transformations.warp_volume(
-                        f, self.subpath, name, keep_tissues=keep_tissues)
+        results = [
+            (f, f_geo) for f, f_geo in zip(final_names, final_names_geo)
+            if f.endswith('.msh')
+        ]
+        if len(folders) > 0 and len(results) > 0:
+            n_workers = min(cpus, len(results))
+            args = (self.subpath, out_surf, out_fsavg, out_vol, out_mni,
+                    keep_tissues, self.open_in_gmsh)
+            if n_workers == 1:
+                # results in the same head model share the mesh operators
+                with mesh_io.operator_cache():
+                    for f, f_geo in results:
+                        _postprocess_result(
+                            f, f_geo, *args, cpus=cpus,
+                            middle_gm_operators=middle_gm_operators)
+            else:
+                logger.info(
+                    'Postprocessing {0} results with {1} processes'.format(
+                        len(results), n_workers))
+                with multiprocessing.Pool(
+                        processes=n_workers,
+                        initializer=_set_up_postprocess_operators,
+                        initargs=(middle_gm_operators,)) as pool:
+                    jobs = [
+                        pool.apply_async(_postprocess_result_worker, (f, f_geo) + args)
+                        for f, f_geo in results
+                    ]
+                    for j in jobs:
+                        j.get()
+                    pool.close()
+                    pool.join()
 
         logger.info('=====================================')
         logger.info('SimNIBS finished running simulations')
@@ -777,7 +815,8 @@ class SimuList(object):
 
         return self.compare_conductivities(other)
 
-    def cond2elmdata(self, mesh=None, excentricity_scale=None, logger_level=20):
+    def cond2elmdata(self, mesh=None, excentricity_scale=None, logger_level=20,
+                     tensor_field=None):
         ''' Transforms a conductivity list to an ElementData field
 
         Parameters
@@ -789,6 +828,10 @@ class SimuList(object):
             Scales the excentricity of conductivity tensors. Used in gPC simulations. Default: do not scale
             excentricities
 
+        tensor_field: simnibs.utils.cond_utils.TensorField (optional)
+            Anisotropy tensors already interpolated to the mesh, see
+            get_tensor_field. Default: interpolate the anisotropy information
+
         Returns
         --------
         conductivity: mesh_io.msh.ElementData()
@@ -812,10 +855,10 @@ class SimuList(object):
                 level,
                 'Using anisotropic direct conductivities based on the file:'
                 ' {0}'.format(self.fn_tensor_nifti))
-            image, affine = self._get_vol_info()
+            if tensor_field is None:
+                tensor_field = SimuList.get_tensor_field(self, mesh)
             return simnibs.utils.cond_utils.cond2elmdata(mesh, cond_list,
-                                     anisotropy_volume=image,
-                                     affine=affine,
+                                     tensor_field=tensor_field,
                                      aniso_tissues=self.anisotropic_tissues,
                                      max_cond=self.aniso_maxcond,
                                      max_ratio=self.aniso_maxratio,
@@ -824,10 +867,10 @@ class SimuList(object):
         elif self.anisotropy_type == 'vn':
             logger.log(level, 'Using anisotropic volume normalized conductivities based on the file:'
                               ' {0}'.format(self.fn_tensor_nifti))
-            image, affine = self._get_vol_info()
+            if tensor_field is None:
+                tensor_field = SimuList.get_tensor_field(self, mesh)
             return simnibs.utils.cond_utils.cond2elmdata(mesh, cond_list,
-                                     anisotropy_volume=image,
-                                     affine=affine,
+                                     tensor_field=tensor_field,
                                      aniso_tissues=self.anisotropic_tissues,
                                      normalize=True,
                                      max_cond=self.aniso_maxcond,
@@ -837,10 +880,10 @@ class SimuList(object):
         elif self.anisotropy_type == 'mc':
             logger.log(level, 'Using isotropic mean conductivities based on the file:'
                               ' {0}'.format(self.fn_tensor_nifti))
-            image, affine = self._get_vol_info()
+            if tensor_field is None:
+                tensor_field = SimuList.get_tensor_field(self, mesh)
             return simnibs.utils.cond_utils.cond2elmdata(mesh, cond_list,
-                                     anisotropy_volume=image,
-                                     affine=affine,
+                                     tensor_field=tensor_field,
                                      aniso_tissues=self.anisotropic_tissues,
                                      max_cond=self.aniso_maxcond,
                                      max_ratio=self.aniso_maxratio,
@@ -851,6 +894,32 @@ class SimuList(object):
                              ' valid types are: "scalar", "mc", "dir", "vn" '
                              ''.format(self.anisotropy_type))
 
+    def get_tensor_field(self, mesh=None):
+        ''' Interpolates the anisotropy information to the mesh
+
+        The tensor field can be passed to cond2elmdata to form the conductivities
+        of several simulations in the same mesh without interpolating and
+        decomposing the tensors again
+
+        Parameters
+        -----------
+        mesh: simnibs.mesh_io.Msh (optional
+            Mesh where the conductivities will be applied. Default: self.mesh
+
+        Returns
+        --------
+        tensor_field: simnibs.utils.cond_utils.TensorField
+            Tensors in each element of the mesh
+        '''
+        if mesh is None:
+            mesh = self.mesh
+
+        if mesh is None:
+            raise ValueError('The mesh for this simulation is not set')
+
+        image, affine = self._get_vol_info()
+        return simnibs.utils.cond_utils.TensorField(mesh, image, affine)
+
     def _get_vol_info(self):
         if self.anisotropy_vol is not None:
             if self.anisotropy_affine is not None:
@@ -1429,6 +1498,12 @@ class TDCSLIST(SimuList):
         type of anisotropy for simulation
     postprocess: property
         fields to be calculated. valid fields are: 'v' , 'E', 'e', 'J', 'j', 'g', 's', 'D', 'q'
+    neumann_electrodes: bool
+        Whether each electrode injects a uniform, area-weighted current density
+        instead of being held at a single potential. All channels are then
+        solved with one FEM system, whose solver is prepared only once. The
+        potentials differ from the ones with the default Dirichlet boundary
+        conditions. Default: False
     """
 
     def __init__(self, matlab_struct=None):
@@ -1438,6 +1513,7 @@ class TDCSLIST(SimuList):
         self.electrode = []
         self.fnamefem = ''
         self.postprocess = 'eEjJ'
+        self.neumann_electrodes = False
 
         # internal to simnibs
         self.tdcs_msh_name = None
@@ -1492,6 +1568,8 @@ class TDCSLIST(SimuList):
             PL, 'currents', list, self.currents)
         self.fnamefem = try_to_read_matlab_field(
             PL, 'fnamefem', str, self.fnamefem)
+        self.neumann_electrodes = try_to_read_matlab_field(
+            PL, 'neumann_electrodes', bool, self.neumann_electrodes)
 
         if len(PL['electrode']) > 0:
             for el in PL['electrode'][0]:
@@ -1502,6 +1580,7 @@ class TDCSLIST(SimuList):
         mat_poslist['type'] = 'TDCSLIST'
         mat_poslist['currents'] = remove_None(self.currents)
         mat_poslist['fnamefem'] = remove_None(self.fnamefem)
+        mat_poslist['neumann_electrodes'] = self.neumann_electrodes
         mat_poslist['electrode'] = save_electrode_mat(self.electrode)
         return mat_poslist
 
@@ -1614,22 +1693,25 @@ class TDCSLIST(SimuList):
                 El.pos_ydir = El.centre + ydir
         return
 
-    def _place_electrodes(self):
+    def _place_electrodes(self, cpus=1):
         """ Add the defined electrodes to a mesh
 
         Parameters:
         ------------
-        fn_out: str
-            name of output file
+        cpus: int (optional)
+            Number of processes used to build electrodes which are far from
+            each other. Default: 1
         """
 
         w_elec = copy.deepcopy(self.mesh)
         w_elec.fix_tr_node_ordering()
-        electrode_surfaces = [None for i in range(len(self.electrode))]
-        for i, el in enumerate(self.electrode):
+        for el in self.electrode:
             logger.info('Placing Electrode:\n{0}'.format(str(el)))
-            w_elec, n = el.add_electrode_to_mesh(w_elec)
-            electrode_surfaces[i] = n
+            el._prepare()
+        w_elec, electrode_surfaces = electrode_placement.put_electrodes_on_mesh(
+            self.electrode, w_elec,
+            [ElementTags.ELECTRODE_RUBBER_START + el.channelnr for el in self.electrode],
+            cpus=cpus)
 
         w_elec.fix_th_node_ordering()
         w_elec.fix_tr_node_ordering()
@@ -1638,7 +1720,8 @@ class TDCSLIST(SimuList):
 
         return w_elec, electrode_surfaces
 
-    def run_simulation(self, fn_simu, cpus=1, view=True):
+    def run_simulation(self, fn_simu, cpus=1, view=True,
+                       incremental_stiffness=None):
         """ Runs the tDCS simulation defined by this structure
 
         Parameters
@@ -1649,6 +1732,10 @@ class TDCSLIST(SimuList):
             Number of parallel processes to run. Default: 1
         view: bool
             Whether to open the simulation result in Gmsh
+        incremental_stiffness: simnibs.simulation.fem.IncrementalStiffness (Optional)
+            Stiffness matrix of the head mesh, which is updated around the
+            electrodes instead of assembling the whole matrix. Not used with
+            neumann_electrodes. Default: assemble the whole matrix
         Returns
         ---------
         final_name: list
@@ -1679,12 +1766,19 @@ class TDCSLIST(SimuList):
 
         fn_no_extension, extension = os.path.splitext(fn_simu)
 
-        mesh_elec, electrode_surfaces = self._place_electrodes()
+        mesh_elec, electrode_surfaces = self._place_electrodes(cpus=cpus)
         cond = self.cond2elmdata(mesh_elec)
+        system = None
+        if self.neumann_electrodes:
+            # a single system and solver for all channels
+            system = fem.TDCSFEMNeumann(
+                mesh_elec, cond, None, solver_options=self.solver_options)
         v = fem.tdcs(mesh_elec, cond, self.currents,
                      np.unique(electrode_surfaces),
                      solver_options=self.solver_options,
-                     n_workers=cpus)
+                     n_workers=cpus,
+                     incremental_stiffness=incremental_stiffness,
+                     system=system)
         m = fem.calc_fields(v, self.postprocess, cond=cond)
         final_name = fn_simu + '_' + self.anisotropy_type + '.msh'
         mesh_io.write_msh(m, final_name)
@@ -2391,9 +2485,9 @@ class TDCSLEADFIELD(LEADFIELD):
                 self.cond[(ElementTags.SALINE_START - 1) + i].name = 'gel_sponge' + str(i + 1)
                 self.cond[(ElementTags.SALINE_START - 1) + i].value = self.cond[(ElementTags.SALINE_START - 1)].value
 
-    def _place_electrodes(self):
+    def _place_electrodes(self, cpus=1):
         """ Add the defined electrodes to a mesh """
-        return TDCSLIST._place_electrodes(self)
+        return TDCSLIST._place_electrodes(self, cpus=cpus)
 
     def _lf_name(self):
         try:
@@ -2433,7 +2527,28 @@ class TDCSLEADFIELD(LEADFIELD):
         name = '{0}ROI.msh'.format(subid)
         return name
 
-    def run(self, cpus=1, allow_multiple_runs=False, save_mat=True):
+    def point_electrode_system(self):
+        ''' Sets up the FEM system for leadfields with electrode patches
+
+        The system is assembled for the head mesh without electrodes and can be
+        passed to run() for several EEG caps and electrode montages, so that the
+        FEM matrix is assembled and the solver is prepared only once
+
+        Returns
+        --------
+        system: simnibs.simulation.fem.TDCSFEMNeumann
+            FEM system for the head mesh, grounded at a single node
+        '''
+        LEADFIELD._prepare(self)
+        cond = SimuList.cond2elmdata(self, self.mesh)
+        return fem.TDCSFEMNeumann(
+            self.mesh, cond, None,
+            input_type='nodes', weigh_by_area=True,
+            solver_options=self.solver_options
+        )
+
+    def run(self, cpus=1, allow_multiple_runs=False, save_mat=True,
+            fem_system=None):
         ''' Runs the calculations for the leadfield
 
         Parameters
@@ -2444,6 +2559,14 @@ class TDCSLEADFIELD(LEADFIELD):
             Wether to allow multiple runs in one folder. Default: False
         save_mat: bool (optional)
             Whether to save the ".mat" file of this structure
+        fem_system: simnibs.simulation.fem.TDCSFEMNeumann (optional)
+            System returned by point_electrode_system(). If set, the electrodes
+            are not meshed. Instead, the current is injected in a patch of
+            scalp nodes around each electrode position, weighted by the node
+            areas. The patch radius is half of the largest electrode dimension,
+            or the triangle below the electrode if the dimensions are not set.
+            Default: place the electrodes on the mesh, or use point electrodes
+            if electrode is None
 
         Returns
         ---------
@@ -2531,10 +2654,28 @@ class TDCSLEADFIELD(LEADFIELD):
         # Get names for leadfield and file of head with cap
         fn_hdf5 = os.path.join(dir_name, self._lf_name())
         fn_el = os.path.join(dir_name, self._el_name())
-        if has_electrodes:
+        if fem_system is not None:
+            # Current is injected in patches of nodes around the electrodes,
+            # the mesh is not modified and the FEM system is reused
+            logger.info("Using electrode patches")
+            w_elec = self.mesh
+            pts = np.array([e.centre for e in self.electrode])
+            radius = [
+                np.max(e.dimensions) / 2
+                if e.dimensions is not None and np.size(e.dimensions) > 0 else 0.
+                for e in self.electrode
+            ]
+            electrode_surfaces, projs = \
+                electrode_placement.get_electrode_node_patches(w_elec, pts, radius)
+            current = 1.0
+            input_type = "nodes"
+            weigh_by_area = True
+            mesh_io.write_geo_spheres(pts, fn_el[:-4] + '.geo')
+            mesh_io.write_geo_spheres(projs, fn_el[:-4] + '_proj.geo')
+        elif has_electrodes:
             # Place electrodes
             logger.info('Placing Electrodes')
-            w_elec, electrode_surfaces = self._place_electrodes()
+            w_elec, electrode_surfaces = self._place_electrodes(cpus=cpus)
             mesh_io.write_msh(w_elec, fn_el)
             scalp_electrodes = w_elec.crop_mesh([ElementTags.SCALP_TH_SURFACE] + electrode_surfaces)
             scalp_electrodes.write_hdf5(fn_hdf5, 'mesh_electrodes/')
@@ -2683,6 +2824,7 @@ class TDCSLEADFIELD(LEADFIELD):
             n_workers=cpus,
             input_type=input_type,
             weigh_by_area=weigh_by_area,
+            system=fem_system,
         )
 
         with h5py.File(fn_hdf5, 'a') as f:
@@ -2690,7 +2832,8 @@ class TDCSLEADFIELD(LEADFIELD):
             f[dset].attrs['reference_electrode'] = self.electrode[0].name
             f[dset].attrs['electrode_pos'] = [el.centre for el in self.electrode]
             f[dset].attrs['electrode_cap'] = self.eeg_cap or "none"
-            f[dset].attrs['electrode_tags'] = electrode_surfaces
+            if fem_system is None:
+                f[dset].attrs['electrode_tags'] = electrode_surfaces
             f[dset].attrs['tissues'] = self.tissues
             f[dset].attrs['field'] = self.field
             f[dset].attrs['current'] = '1A'
@@ -2800,6 +2943,43 @@ def save_electrode_mat(electrode_list):
     return elec_mat
 
 
+def _postprocess_result(fn, fn_geo, subpath, out_surf, out_fsavg, out_vol, out_mni,
+                        keep_tissues, open_in_gmsh, cpus=1, middle_gm_operators=None):
+    ''' Maps a simulation result to the middle GM surfaces, fsaverage, the subject
+    volume and MNI space. The result mesh is read only once for all steps, and
+    the mesh operators are shared between the steps '''
+    m = mesh_io.read_msh(fn)
+    name = os.path.splitext(os.path.split(fn)[1])[0] + '.nii.gz'
+    with mesh_io.operator_cache():
+        if out_surf is not None:
+            logger.info('Interpolating to the middle of Gray Matter: {0}'.format(fn))
+            transformations.middle_gm_interpolation(
+                m, subpath, out_surf,
+                out_fsaverage=out_fsavg, depth=0.5,
+                open_in_gmsh=open_in_gmsh, f_geo=fn_geo,
+                operators=middle_gm_operators)
+        if out_vol is not None:
+            logger.info('Mapping to volume: {0}'.format(fn))
+            transformations.interpolate_to_volume(
+                m, subpath, os.path.join(out_vol, name),
+                keep_tissues=keep_tissues, cpus=cpus)
+        if out_mni is not None:
+            logger.info('Mapping to MNI space: {0}'.format(fn))
+            transformations.warp_volume(
+                m, subpath, os.path.join(out_mni, name),
+                keep_tissues=keep_tissues, cpus=cpus)
+
+
+def _set_up_postprocess_operators(middle_gm_operators):
+    global postprocess_global_operators
+    postprocess_global_operators = middle_gm_operators
+
+
+def _postprocess_result_worker(fn, fn_geo, *args):
+    _postprocess_result(fn, fn_geo, *args,
+                        middle_gm_operators=postprocess_global_operators)
+
+
 def _substitute_el(pos, eeg_cap):
     if isinstance(pos, str):
         if eeg_cap:
@@ -10,6 +10,7 @@ import pytest
 from simnibs import SIMNIBSDIR
 from simnibs.mesh_tools import mesh_io
 from simnibs.simulation import electrode_placement
+from simnibs.utils.transformations import project_points_on_surface
 
 
 @pytest.fixture(scope='module')
@@ -89,6 +90,76 @@ class TestDrawElectrodes:
         assert not np.sum((distances_not_in_roi <= 15 + 2*avg_l) * (center_normal.dot(normals_not_in_roi.T) > .1)), \
             "Found tetrahedra node(s) within radius in the volume, that was not included in ROI."
 
+    def test_scalp_index(self, sphere3_msh):
+        mesh = copy.deepcopy(sphere3_msh)
+        index = electrode_placement.ScalpIndex(mesh, [1005])
+        assert np.all(index.nodes == electrode_placement._get_nodes_in_surface(mesh, [1005]))
+        assert np.allclose(index.normals(mesh, index.nodes),
+                           mesh.nodes_normals()[index.nodes])
+        # move some nodes towards the center
+        center = np.array([0., 0., 95.])
+        roi = index.nodes[np.linalg.norm(mesh.nodes[index.nodes] - center, axis=1) < 20]
+        mesh.nodes.node_coord[roi - 1] *= 0.97
+        index.nodes_moved(mesh, roi)
+        closest = index.closest_nodes(mesh, [[0., 0., 93.], [0., 95., 0.]])
+        d = np.linalg.norm(mesh.nodes[index.nodes] - [[0., 0., 93.]], axis=1)
+        assert closest[0, 0] == np.argmin(d)
+        roi_index = index.roi(mesh, center, 15)
+        roi_new = electrode_placement._get_roi(center, 15, mesh, [1005])
+        for a, b in zip(roi_index, roi_new):
+            assert np.all(a == b)
+        assert np.allclose(
+            index.project(mesh, center),
+            project_points_on_surface(mesh, center, [1005]))
+
+    def test_get_electrode_node_patches(self, sphere3_msh):
+        outer_nodes = electrode_placement._get_nodes_in_surface(sphere3_msh, [1005])
+        patches, projs = electrode_placement.get_electrode_node_patches(
+            sphere3_msh, [[0., 0., 100.], [0., 100., 0.]], [0, 10],
+            outer_nodes=outer_nodes)
+        assert np.allclose(np.linalg.norm(projs, axis=1), 95, atol=.5)
+        assert np.allclose(projs[0], [0., 0., 95.], atol=.5)
+        assert len(patches[0]) == 3
+        assert np.all(np.in1d(patches[0], outer_nodes))
+        d = np.linalg.norm(sphere3_msh.nodes[outer_nodes] - projs[1], axis=1)
+        assert np.all(np.in1d(outer_nodes[d < 10], patches[1]))
+        assert len(patches[1]) <= np.sum(d < 10) + 3
+
+    @pytest.mark.parametrize('cpus', [1, 2])
+    def test_put_electrodes_on_mesh(self, sphere3_msh, cpus):
+        from simnibs.simulation.sim_struct import ELECTRODE
+        electrodes = []
+        for c, shape, dimensions, thickness in [
+                ([0., 0., 95.], 'rect', [10, 10], [2]),
+                ([0., 95., 0.], 'ellipse', [12, 8], [1, 2]),
+                ([0., 80., 50.], 'rect', [10, 10], [2])]:
+            el = ELECTRODE()
+            el.centre = c
+            el.shape = shape
+            el.dimensions = dimensions
+            el.thickness = thickness
+            electrodes.append(el)
+        # Electrodes placed one after the other with put_electrode_on_mesh,
+        # before the electrodes were placed in batches
+        reference = np.load(os.path.join(
+            SIMNIBSDIR, '_internal_resources', 'testing_files',
+            'sphere3_electrodes_reference.npz'))
+        np.random.seed(0)
+        mesh = copy.deepcopy(sphere3_msh)
+        for el, tag in zip(electrodes, [101, 102, 103]):
+            mesh, _ = electrode_placement.put_electrode_on_mesh(el, mesh, tag)
+        assert np.allclose(mesh.nodes.node_coord, reference['node_coord'])
+        assert np.all(mesh.elm.node_number_list == reference['node_number_list'])
+        assert np.all(mesh.elm.tag1 == reference['tag1'])
+
+        np.random.seed(0)
+        w_elec, surf_tags = electrode_placement.put_electrodes_on_mesh(
+            electrodes, copy.deepcopy(sphere3_msh), [101, 102, 103], cpus=cpus)
+        assert surf_tags == [2101, 2102, 2103]
+        assert np.allclose(w_elec.nodes.node_coord, reference['node_coord'])
+        assert np.all(w_elec.elm.node_number_list == reference['node_number_list'])
+        assert np.all(w_elec.elm.tag1 == reference['tag1'])
+
 
     def test_line_line_intersection(self):
         line1 = np.array([[1., 1.], [-1., -1.]])
@@ -14,6 +14,7 @@ from .. import fem
 from .. import analytical_solutions
 from .. import coil_numpy as coil_lib
 from .. import petsc_solver
+from .. import scipy_solver
 from ...mesh_tools import mesh_io
 
 fem._initialize_petsc()
@@ -257,6 +258,62 @@ class TestSolve:
         x = petsc_solver.petsc_solve(options, A, b)
         assert np.allclose(A.dot(x), b)
 
+    @pytest.mark.parametrize('preconditioner', ['jacobi', 'ilu', 'none'])
+    def test_solve_scipy(self, preconditioner):
+        np.random.seed(0)
+        n = 50
+        A = sparse.random(n, n, density=.1, random_state=0)
+        A = (A + A.T + n * sparse.eye(n)).tocsr()
+        b = np.random.random((n, 3))
+        solver = scipy_solver.Solver(A, preconditioner=preconditioner)
+        x = solver.solve(b)
+        assert x.shape == b.shape
+        assert np.allclose(A.dot(x), b)
+        assert len(solver.iterations) == 3
+
+    def test_solve_scipy_amg(self):
+        pytest.importorskip('pyamg')
+        n = 200
+        A = sparse.diags([-np.ones(n - 1), 2.1 * np.ones(n), -np.ones(n - 1)],
+                         [-1, 0, 1]).tocsr()
+        b = np.random.random((n, 2))
+        solver = scipy_solver.Solver(A, preconditioner='amg')
+        x = solver.solve(b)
+        assert solver.preconditioner == 'amg'
+        assert np.allclose(A.dot(x), b)
+        solver2 = scipy_solver.Solver(1.1 * A, preconditioner=solver)
+        assert solver2.M is solver.M
+        x = solver2.solve(b)
+        assert np.allclose(1.1 * A.dot(x), b)
+
+    def test_solve_scipy_warm_start(self):
+        np.random.seed(0)
+        n = 200
+        A = sparse.diags([-np.ones(n - 1), 2.1 * np.ones(n), -np.ones(n - 1)],
+                         [-1, 0, 1]).tocsr()
+        b = np.random.random(n)
+        solver = scipy_solver.Solver(A, preconditioner='none')
+        solver.solve(b)
+        x = solver.solve(b + 1e-3 * np.random.random(n))
+        assert solver.iterations[1] < solver.iterations[0]
+        assert np.allclose(A.dot(x).squeeze(), b, atol=1e-2)
+
+    def test_solve_scipy_reuse_preconditioner(self):
+        n = 5
+        A = sparse.diags(2 * np.ones(n)).tocsr()
+        solver = scipy_solver.Solver(A, preconditioner='jacobi')
+        solver2 = scipy_solver.Solver(2 * A, preconditioner=solver)
+        assert solver2.M is solver.M
+        x = solver2.solve(np.ones(n))
+        assert np.allclose(x, .25)
+
+    def test_parse_options_scipy(self):
+        kwargs = scipy_solver.parse_options(
+            'scipy -pc_type ilu -ksp_rtol 1e-8 -ksp_max_it 100')
+        assert kwargs == {'preconditioner': 'ilu', 'rtol': 1e-8, 'maxiter': 100}
+        with pytest.raises(ValueError):
+            scipy_solver.parse_options('scipy -ksp_type gmres')
+
 
 class TestAssemble:
     def test_gradient_operator(self, cube_msh):
@@ -309,6 +366,62 @@ class TestFEMSystem:
         assert np.allclose(s.A.dot(np.pi*np.ones(s.A.shape[0])), 0)
         assert np.allclose(s.A.T.toarray(), s.A.toarray())
 
+    def test_stiffness_pattern(self, sphere3_msh):
+        msh = sphere3_msh
+        pattern = fem.StiffnessPattern(msh)
+        np.random.seed(0)
+        cond = np.random.uniform(0.1, 2, msh.elm.nr)
+        s = fem.FEMSystem(msh, cond)
+        s_pattern = fem.FEMSystem(msh, cond, stiffness_pattern=pattern)
+        assert np.allclose(s_pattern.A.toarray(), s.A.toarray())
+        cond = np.random.rand(msh.elm.nr, 3, 3)
+        cond = cond @ cond.transpose(0, 2, 1)
+        s = fem.FEMSystem(msh, cond)
+        A = pattern.assemble(mesh_io.ElementData(cond.reshape(-1, 9)))
+        assert np.allclose(A.toarray(), s.A.toarray())
+        assert np.all((A != A.T).toarray() == 0)
+
+    def test_incremental_stiffness(self, sphere3_msh):
+        from ..electrode_placement import put_electrode_on_mesh
+        from ..sim_struct import ELECTRODE
+
+        def cond(m):
+            return 1 + .1 * (m.elm.tag1 % 7)
+
+        def full_assembly(m, c):
+            return fem.FEMSystem(m, c).A
+
+        stiffness = fem.IncrementalStiffness(sphere3_msh)
+        np.random.seed(0)
+        # Different montages, each in a new copy of the head mesh
+        for centres in [[[0., 0., 95.]], [[0., 95., 0.], [0., 80., 50.]]]:
+            m = copy.deepcopy(sphere3_msh)
+            for i, c in enumerate(centres):
+                el = ELECTRODE()
+                el.centre = c
+                el.shape = 'rect'
+                el.dimensions = [10, 10]
+                el.thickness = [2]
+                m, _ = put_electrode_on_mesh(el, m, 101 + i)
+            m.fix_th_node_ordering()
+            A = stiffness.assemble(m, cond(m))
+            A_full = full_assembly(m, cond(m))
+            assert abs(A - A_full).max() < 1e-10 * abs(A_full).max()
+            s = fem.FEMSystem(m, cond(m), incremental_stiffness=stiffness)
+            assert abs(s.A - A_full).max() < 1e-10 * abs(A_full).max()
+
+        # Change in the head conductivities
+        c = cond(m)
+        c[m.elm.tag1 == 5] = 3.
+        A = stiffness.assemble(m, c)
+        A_full = full_assembly(m, c)
+        assert abs(A - A_full).max() < 1e-10 * abs(A_full).max()
+
+        # Mesh which does not extend the head mesh
+        m = sphere3_msh.crop_mesh([3, 4, 1003, 1004])
+        A = stiffness.assemble(m, cond(m))
+        assert abs(A - full_assembly(m, cond(m))).max() == 0
+
     def test_set_up_tms(self, tms_sphere):
         m, cond, dAdt, E_analytical = tms_sphere
         S = fem.TMSFEM(m, cond)
@@ -395,6 +508,31 @@ class TestFEMSystem:
         assert rdm(E, E_analytical) < .2
         assert np.abs(mag(E, E_analytical)) < np.log(1.1)
 
+    def test_solve_scipy(self, tms_sphere):
+        m, cond, dAdt, E_analytical = tms_sphere
+        S = fem.TMSFEM(m, cond, solver_options='scipy -pc_type jacobi')
+        b = S.assemble_rhs(dAdt)
+        x = S.solve(b)
+        S_ref = fem.TMSFEM(m, cond)
+        x_ref = S_ref.solve(b)
+        assert isinstance(S._solver, scipy_solver.Solver)
+        assert np.allclose(x - np.mean(x), x_ref - np.mean(x_ref),
+                           atol=1e-6 * np.abs(x_ref).max())
+
+    def test_solve_scipy_previous_solver(self, tms_sphere):
+        m, cond, dAdt, E_analytical = tms_sphere
+        S = fem.TMSFEM(m, cond, solver_options='scipy -pc_type jacobi')
+        b = S.assemble_rhs(dAdt)
+        S.solve(b)
+        S2 = fem.TMSFEM(m, 1.1 * cond.value, solver_options='scipy -pc_type jacobi',
+                        previous_solver=S)
+        x = S2.solve(b)
+        assert S2.solver.M is S.solver.M
+        assert S2.solver.iterations[0] < S.solver.iterations[0]
+        x_ref = fem.TMSFEM(m, 1.1 * cond.value).solve(b)
+        assert np.allclose(x - np.mean(x), x_ref - np.mean(x_ref),
+                           atol=1e-6 * np.abs(x_ref).max())
+
     def test_solve_dirichlet_petsc(self, cube_msh):
         m = cube_msh
         cond = np.ones(m.elm.nr)
@@ -545,6 +683,32 @@ class TestTDCS:
         assert rdm(sol, x.value) < .1
         assert np.abs(mag(x.value, sol)) < np.log(1.1)
 
+    @pytest.mark.parametrize('n_workers', [1, 2])
+    def test_tdcs_incremental_stiffness(self, n_workers, sphere3_msh):
+        if sys.platform in ['win32', 'darwin'] and n_workers > 1:
+            ''' Same as above, does not work on windows or MacOS'''
+            return
+        from ..electrode_placement import put_electrodes_on_mesh
+        from ..sim_struct import ELECTRODE
+        electrodes = []
+        for c in [[0., 0., 95.], [0., 95., 0.], [95., 0., 0.]]:
+            el = ELECTRODE()
+            el.centre = c
+            el.shape = 'rect'
+            el.dimensions = [10, 10]
+            el.thickness = [2]
+            electrodes.append(el)
+        m, el_tags = put_electrodes_on_mesh(
+            electrodes, copy.deepcopy(sphere3_msh), [101, 102, 103])
+        m.fix_th_node_ordering()
+        cond = mesh_io.ElementData(1 + .1 * (m.elm.tag1 % 7))
+        currents = [.5, -1.5, 1.]
+        stiffness = fem.IncrementalStiffness(sphere3_msh)
+        x = fem.tdcs(m, cond, currents, el_tags, n_workers=n_workers,
+                     incremental_stiffness=stiffness)
+        x_full = fem.tdcs(m, cond, currents, el_tags)
+        assert np.allclose(x.value, x_full.value, atol=1e-8 * np.abs(x_full.value).max())
+
 
 
 class TestTDCSNeumann:
@@ -582,6 +746,26 @@ class TestTDCSNeumann:
         assert rdm(sol, x.value) < .1
         assert np.abs(mag(x.value, sol)) < np.log(1.1)
 
+    def test_tdcs_system(self, cube_msh):
+        m = cube_msh
+        cond = np.ones(m.elm.nr)
+        cond[m.elm.tag1 > 5] = 1e3
+        cond = mesh_io.ElementData(cond)
+        S = fem.TDCSFEMNeumann(m, cond, None)
+        el_tags = [1100, 1101, 1101]
+        sol = (m.nodes.node_coord[:, 1] - 50) / 20
+        x = fem.tdcs(m, cond, [.5, -1.5, 1.], el_tags, system=S)
+        x.value -= np.average(x.value - sol)
+        assert rdm(sol, x.value) < .1
+        assert np.abs(mag(x.value, sol)) < np.log(1.1)
+        # Several montages with the same system
+        montages = fem.tdcs(m, cond, [[1., -1., 0.], [-.5, 1.5, -1.]], el_tags, system=S)
+        assert len(montages) == 2
+        for x, s in zip(montages, [2 * sol, -sol]):
+            x.value -= np.average(x.value - s)
+            assert rdm(s, x.value) < .1
+            assert np.abs(mag(x.value, s)) < np.log(1.1)
+
 
 class TestTMS:
     def test_tms_dadt(self, tms_sphere):
@@ -597,6 +781,19 @@ class TestTMS:
         assert rdm(E, E_analytical) < .2
         assert np.abs(mag(E, E_analytical)) < np.log(1.1)
 
+    def test_tms_dadt_solver_cache(self, tms_sphere):
+        m, cond, dAdt, E_analytical = tms_sphere
+        solver_cache = {}
+        v = fem.tms_dadt(m, cond, dAdt, 'scipy -pc_type jacobi',
+                         solver_cache=solver_cache)
+        solver = solver_cache['tms']
+        v2 = fem.tms_dadt(m, cond, dAdt, 'scipy -pc_type jacobi',
+                          solver_cache=solver_cache)
+        assert solver_cache['tms'] is not solver
+        assert solver_cache['tms'].M is solver.M
+        assert solver_cache['tms'].iterations[0] < solver.iterations[0]
+        assert np.allclose(v.value, v2.value, atol=1e-6 * np.abs(v.value).max())
+
     @patch.object(fem, '_get_da_dt_from_coil')
     def test_tms_coil(self, mock_set_up, tms_sphere):
         m, cond, dAdt, E_analytical = tms_sphere
@@ -710,6 +907,43 @@ class TestLeadfield:
 
         os.remove(fn_hdf5)
 
+    @pytest.mark.parametrize('n_workers', [1, 2])
+    def test_leadfield_system(self, n_workers, cube_msh):
+        if sys.platform in ['win32', 'darwin'] and n_workers > 1:
+            ''' Same as above, does not work on windows or MacOS'''
+            return
+
+        m = cube_msh
+        cond = np.ones(m.elm.nr)
+        cond[m.elm.tag1 > 5] = 1e3
+        cond = mesh_io.ElementData(cond, mesh=m)
+        S = fem.TDCSFEMNeumann(m, cond, None, input_type='nodes')
+        # Patches of different sizes
+        el = [cube_msh_all_nodes_at_tag(m, 1100),
+              cube_msh_center_tri_nodes_at_tag(m, 1101)]
+        n_roi = np.sum(m.elm.tag1 == 5)
+        # The same system is used for different electrode positions
+        for sign, electrodes in zip([1, -1], [el, el[::-1]]):
+            fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+            fem.tdcs_leadfield(
+                m, cond, electrodes + [electrodes[-1]], fn_hdf5, 'leadfield',
+                roi=[5], n_workers=n_workers, system=S
+            )
+            with h5py.File(fn_hdf5, 'r') as f:
+                assert f['leadfield'].shape == (2, n_roi, 3)
+                for E in f['leadfield']:
+                    assert rdm(E, np.tile([0., sign * 100, 0.], (n_roi, 1))) < .2
+                    assert mag(E, np.tile([0., sign * 100, 0.], (n_roi, 1))) < np.log(1.1)
+            os.remove(fn_hdf5)
+
+    def test_leadfield_system_mesh(self, cube_msh):
+        m = cube_msh
+        cond = mesh_io.ElementData(np.ones(m.elm.nr), mesh=m)
+        S = fem.TDCSFEMNeumann(m, cond, 1100)
+        with pytest.raises(ValueError):
+            fem.tdcs_leadfield(m, cond, [1100, 1101], 'lf.hdf5', 'leadfield',
+                               system=S)
+
 
 class TestTMSMany:
     @pytest.mark.parametrize('post_pro', [False, True])
@@ -838,3 +1072,47 @@ class TestDipole:
             n_v -= np.average(n_v)
             assert rdm(a_v, n_v) < 0.2
             assert mag(a_v, n_v) < 0.15
+
+    def test_st_venant_loads(self, sphere3_msh):
+        positions = np.array([[50, 0, 0], [0, 30, 20], [10, -40, 5]], dtype=float)
+        moments = np.array([[0, 1, 0], [1, 0, 0], [0.3, 0.2, 1]], dtype=float)
+        node_indices = fem.st_venant_node_indices(sphere3_msh, positions)
+        closest = sphere3_msh.nodes.find_closest_node(positions, return_index=True)[1]
+        for ni, c in zip(node_indices, closest):
+            assert c - 1 in ni
+            assert len(ni) > 4
+
+        b = fem.compute_st_venant_loads(
+            positions, moments, node_indices, sphere3_msh.nodes.node_coord)
+        assert b.shape == (sphere3_msh.nodes.nr, 3)
+        b = b.toarray()
+        # monopole moment is zero and dipole moment is the given moment
+        assert np.allclose(b.sum(axis=0), 0, atol=1e-5)
+        for q, p, m in zip(b.T, positions, moments):
+            assert np.allclose(
+                np.sum(q[:, None] * (sphere3_msh.nodes.node_coord - p), axis=0),
+                m, atol=1e-4)
+
+    def test_transfer_matrix(self, sphere3_msh):
+        positions = np.array([[50, 0, 0], [0, 30, 20], [10, -40, 5]], dtype=float)
+        moments = np.array([[0, 1, 0], [1, 0, 0], [0.3, 0.2, 1]], dtype=float)
+        cond = 2 * np.ones(sphere3_msh.elm.nr)
+        cond[sphere3_msh.elm.tag1 == 4] = 0.1
+
+        surface_nodes = np.unique(sphere3_msh.elm[sphere3_msh.elm.tag1 == 1005, :3])
+        electrodes = surface_nodes[::40][:6]
+        source_elements = sphere3_msh.elm.elm_number[
+            (sphere3_msh.elm.tag1 == 3) * (sphere3_msh.elm.elm_type == 4)]
+
+        T = fem.DipoleTransferMatrix(
+            sphere3_msh, cond, list(electrodes), source_elements)
+        lf = T.leadfield(positions, moments)
+
+        v = fem.electric_dipole(
+            sphere3_msh, cond, positions, moments, "partial integration")
+        v = v[:, electrodes[1:] - 1] - v[:, [electrodes[0] - 1]]
+        assert np.allclose(lf, v.T, atol=1e-6 * np.abs(v).max())
+
+        assert T.element_leadfield().shape == (5, len(source_elements), 3)
+        with pytest.raises(ValueError):
+            T.leadfield([0, 0, 88], [1, 0, 0])
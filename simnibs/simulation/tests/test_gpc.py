@@ -2,6 +2,7 @@ import numpy as np
 import h5py
 import os
 import tempfile
+from collections import OrderedDict
 from mock import Mock, patch
 
 import pytest
@@ -347,6 +348,37 @@ class TestSampler:
             assert np.allclose(f['mesh_roi/data_matrices/rand_samples'][:],[[1], [2]])
 
 
+    @pytest.mark.parametrize('cpus', [1, 2])
+    @patch.object(simnibs_gpc, 'fem')
+    def test_tdcs_run_simulations(self, mock_fem, cpus, sampler_args):
+        mesh, poslist, fn_hdf5, roi = sampler_args
+        v = mesh.nodes.node_coord[:, 0]
+        v_roi = mesh.crop_mesh(roi).nodes.node_coord[:, 0]
+
+        def tdcs(mesh, cond, *args, **kwargs):
+            # potential proportional to the random conductivity
+            return mesh_io.NodeData(cond.value[mesh.elm.tag1 == 3][0] * v, mesh=mesh)
+        mock_fem.tdcs.side_effect = tdcs
+
+        S = simnibs_gpc.TDCSgPCSampler(
+            mesh, poslist, fn_hdf5, [1101, 1102], [-1, 1], roi)
+        S.qoi_function = OrderedDict([('pot', lambda v, rand: v.value)])
+
+        random_vars = np.array([[0.3], [0.35], [0.4]])
+        qoi = S.run_simulations(random_vars, cpus=cpus)
+        assert np.allclose(qoi, random_vars * v_roi)
+
+        # Simulate an interruption while recording a sample
+        S.record_data_matrix([0.38], 'random_var_samples', '/')
+        S.record_data_matrix(v, 'v_samples', 'mesh/data_matrices')
+        recorded_vars, recorded_qoi = S.recorded_samples()
+        assert np.allclose(recorded_vars, random_vars)
+        assert np.allclose(recorded_qoi, qoi)
+        with h5py.File(fn_hdf5, 'r') as f:
+            assert f['random_var_samples'].shape == (3, 1)
+            assert np.allclose(f['mesh/data_matrices/v_samples'][()], random_vars * v)
+        os.remove(fn_hdf5)
+
     def test_tms_set_up(self, sampler_args):
         mesh, poslist, fn_hdf5, roi = sampler_args
         matsimnibs = np.eye(4)
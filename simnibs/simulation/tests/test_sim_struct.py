@@ -380,6 +380,48 @@ class TestTDCSLEADFIELD:
         assert p.electrode[0].shape == 'rect'
 
 
+class TestTDCSLIST:
+    def test_neumann_electrodes_mat(self, tmp_path):
+        p = sim_struct.TDCSLIST()
+        p.neumann_electrodes = True
+        scipy.io.savemat(str(tmp_path / 'tmp.mat'), p.sim_struct2mat())
+        mat = scipy.io.loadmat(
+            str(tmp_path / 'tmp.mat'), struct_as_record=True, squeeze_me=False)
+        p2 = sim_struct.TDCSLIST()
+        p2.read_mat_struct(mat)
+        assert p2.neumann_electrodes
+
+    def test_run_simulation_neumann_electrodes(self, sphere3_msh, tmp_path, monkeypatch):
+        systems = []
+        tdcs = sim_struct.fem.tdcs
+
+        def tdcs_spy(*args, system=None, **kwargs):
+            systems.append(system)
+            return tdcs(*args, system=system, **kwargs)
+
+        monkeypatch.setattr(sim_struct.fem, 'tdcs', tdcs_spy)
+        p = sim_struct.TDCSLIST()
+        p.mesh = sphere3_msh
+        p.currents = [1e-3, -1e-3]
+        for i, c in enumerate([[0., 0., 95.], [0., 95., 0.]]):
+            el = p.add_electrode()
+            el.channelnr = i + 1
+            el.centre = c
+            el.shape = 'rect'
+            el.dimensions = [10, 10]
+            el.thickness = [2]
+        p.neumann_electrodes = True
+        fn, _ = p.run_simulation(str(tmp_path / 'neumann'), view=False)
+        assert isinstance(systems[0], sim_struct.fem.TDCSFEMNeumann)
+        assert systems[0].ground_electrode is None
+        m = mesh_io.read_msh(fn[0])
+        assert np.all(np.isfinite(m.field['E'].value))
+
+        p.neumann_electrodes = False
+        p.run_simulation(str(tmp_path / 'dirichlet'), view=False)
+        assert systems[1] is None
+
+
 class TestGetSurroundPos:
     def test_get_surround_pos(self,sphere3_fn):
         P = sim_struct.get_surround_pos([0., 0., 95.], sphere3_fn,
@@ -10,7 +10,7 @@ import numpy as np
 import pytest
 from scipy.spatial import KDTree
 
-from simnibs.mesh_tools.mesh_io import Elements, Msh, Nodes
+from simnibs.mesh_tools.mesh_io import Elements, Msh, Nodes, SignedDistanceGrid
 from simnibs.simulation.tms_coil.tms_coil import TmsCoil
 from simnibs.simulation.tms_coil.tms_coil_deformation import TmsCoilRotation
 from simnibs.simulation.tms_coil.tms_coil_element import (
@@ -970,6 +970,139 @@ class TestPositionOptimization:
         assert self_intersection_after < 0.00001
         np.testing.assert_allclose(coil_affine, affine_after)
 
+    def test_batched_deformation_scores(
+        self, small_self_intersecting_2_element_coil: TmsCoil, sphere3_msh: Msh
+    ):
+        coil = deepcopy(small_self_intersecting_2_element_coil)
+        skin_surface = sphere3_msh.crop_mesh(tags=[1005])
+        coil_affine = np.array(
+            [[1, 0, 0, 3], [0, 0.8, -0.6, 2], [0, 0.6, 0.8, 100], [0, 0, 0, 1]]
+        )
+        distance_grid, _ = skin_surface.get_min_distance_on_grid()
+        element_distances = {
+            element: element.casing.get_distance_grid() for element in coil.elements
+        }
+        deformation_ranges = coil.get_deformation_ranges()
+        rng = np.random.default_rng(0)
+        deformation_settings = np.array(
+            [rng.uniform(*deform.range, 5) for deform in deformation_ranges]
+        ).T
+
+        scores = coil._get_batched_deformation_scores(
+            distance_grid,
+            element_distances,
+            coil_affine,
+            deformation_ranges,
+            deformation_settings,
+        )
+
+        for i, deformation_setting in enumerate(deformation_settings):
+            for deform, setting in zip(deformation_ranges, deformation_setting):
+                deform.current = setting
+            np.testing.assert_allclose(
+                [score[i] for score in scores],
+                coil._get_fast_deformation_scores(
+                    distance_grid, element_distances, coil_affine
+                ),
+            )
+
+    def test_multistart_optimization(
+        self, small_functional_3_element_coil: TmsCoil, sphere3_msh: Msh
+    ):
+        coil = deepcopy(small_functional_3_element_coil)
+        skin_surface = sphere3_msh.crop_mesh(tags=[1005])
+        coil_affine = np.array(
+            [[1, 0, 0, -4], [0, 1, 0, 3], [0, 0, 1, 110], [0, 0, 0, 1]]
+        )
+
+        before, after, affine_after = coil.optimize_deformations(
+            skin_surface,
+            coil_affine,
+            np.array([[-5, 5], [-5, 5], [-20, 20]]),
+            method="multistart",
+            n_samples=200,
+            n_starts=2,
+        )
+
+        assert after < before * 0.05
+        intersection, _, _ = coil._get_exact_deformation_scores(
+            skin_surface.get_AABBTree(), affine_after
+        )
+        assert intersection < 0.1
+
+    def test_unknown_method(
+        self, small_functional_3_element_coil: TmsCoil, sphere3_msh: Msh
+    ):
+        skin_surface = sphere3_msh.crop_mesh(tags=[1005])
+        with pytest.raises(ValueError):
+            small_functional_3_element_coil.optimize_deformations(
+                skin_surface, np.eye(4), method="unknown"
+            )
+
+    @pytest.mark.parametrize("cpus", [1, 2])
+    def test_optimization_for_targets(
+        self, small_functional_3_element_coil: TmsCoil, sphere3_msh: Msh, cpus
+    ):
+        coil = deepcopy(small_functional_3_element_coil)
+        skin_surface = sphere3_msh.crop_mesh(tags=[1005])
+        coil_affines = [
+            np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 100], [0, 0, 0, 1]]),
+            np.array([[1, 0, 0, 0], [0, 0, -1, -100], [0, 1, 0, 0], [0, 0, 0, 1]]),
+        ]
+        initial_settings = [deform.current for deform in coil.get_deformation_ranges()]
+
+        results = coil.optimize_deformations_for_targets(
+            skin_surface, coil_affines, cpus=cpus
+        )
+
+        assert len(results) == 2
+        assert [
+            deform.current for deform in coil.get_deformation_ranges()
+        ] == initial_settings
+        for coil_affine, (before, after, affine_after, settings) in zip(
+            coil_affines, results
+        ):
+            assert after <= before
+            np.testing.assert_allclose(affine_after, coil_affine)
+            for deform, setting in zip(coil.get_deformation_ranges(), settings):
+                deform.current = setting
+            intersection, _, _ = coil._get_exact_deformation_scores(
+                skin_surface.get_AABBTree(), coil_affine
+            )
+            assert intersection < 0.1
+
+    def test_optimization_distance_grid_file(
+        self,
+        small_functional_3_element_coil: TmsCoil,
+        sphere3_msh: Msh,
+        tmp_path,
+        monkeypatch,
+    ):
+        coil = deepcopy(small_functional_3_element_coil)
+        skin_surface = sphere3_msh.crop_mesh(tags=[1005])
+        coil_affine = np.array(
+            [[1, 0, 0, -4], [0, 1, 0, 3], [0, 0, 1, 110], [0, 0, 0, 1]]
+        )
+        fn = str(tmp_path / "skin_distance_grid.hdf5")
+        initial_settings = [deform.current for deform in coil.get_deformation_ranges()]
+
+        before, after, _ = coil.optimize_deformations(
+            skin_surface, coil_affine, fn_distance_grid=fn
+        )
+        assert os.path.isfile(fn)
+
+        def from_surface(*args, **kwargs):
+            raise AssertionError("The distance grid should be read from the file")
+
+        monkeypatch.setattr(SignedDistanceGrid, "from_surface", from_surface)
+        for deform, setting in zip(coil.get_deformation_ranges(), initial_settings):
+            deform.current = setting
+        before_cached, after_cached, _ = coil.optimize_deformations(
+            skin_surface, coil_affine, fn_distance_grid=fn
+        )
+        assert before_cached == pytest.approx(before)
+        assert after_cached == pytest.approx(after)
+
 class TestGetDeformations:  
     def test_get_deformations(self, small_functional_3_element_coil: TmsCoil):
         assert len(small_functional_3_element_coil.get_deformations()) == 2
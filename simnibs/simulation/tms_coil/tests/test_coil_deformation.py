@@ -219,6 +219,14 @@ class TestCoilTranslation:
         )
         np.testing.assert_allclose(translation.as_matrix(), expected_matrix)
 
+    def test_as_matrices(self):
+        translation = TmsCoilTranslation(TmsCoilDeformationRange(0.0, (-1.0, 1.0)), 2)
+        values = np.array([-0.5, 0.0, 0.75])
+        matrices = translation.as_matrices(values)
+        for value, matrix in zip(values, matrices):
+            translation.deformation_range.current = value
+            np.testing.assert_allclose(matrix, translation.as_matrix())
+
 
 class TestCoilRotation:
     def test_basic(self):
@@ -311,3 +319,17 @@ class TestCoilRotation:
         np.testing.assert_allclose(
             rotation.get_rotation(), expected_rotation, rtol=1e-5, atol=1e-5
         )
+
+    def test_as_matrices(self):
+        rotation = TmsCoilRotation(
+            TmsCoilDeformationRange(0, (-199.0, 199.0)),
+            np.array([1.0, 2.0, 3.0]),
+            np.array([4.0, -1.0, 2.0]),
+        )
+        values = np.array([-90.0, 0.0, 12.5, 180.0])
+        matrices = rotation.as_matrices(values)
+        for value, matrix in zip(values, matrices):
+            rotation.deformation_range.current = value
+            np.testing.assert_allclose(
+                matrix, rotation.as_matrix(), rtol=1e-9, atol=1e-9
+            )
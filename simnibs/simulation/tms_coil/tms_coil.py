@@ -1,5 +1,6 @@
 import itertools
 import json
+import multiprocessing
 import os
 import re
 import shutil
@@ -11,11 +12,19 @@ import nibabel as nib
 import numpy as np
 import numpy.typing as npt
 import scipy.optimize as opt
+from scipy.stats import qmc
 
 from simnibs import __version__
 from simnibs.mesh_tools import mesh_io
 from simnibs.mesh_tools.gmsh_view import Visualization, _gray_red_lightblue_blue_cm
-from simnibs.mesh_tools.mesh_io import Elements, Msh, NodeData, Nodes
+from simnibs.mesh_tools.mesh_io import (
+    Elements,
+    Msh,
+    NodeData,
+    Nodes,
+    SignedDistanceGrid,
+    get_signed_distance_grid,
+)
 from simnibs.simulation.tms_coil.tcd_element import TcdElement
 from simnibs.simulation.tms_coil.tms_coil_constants import TmsCoilElementTag
 from simnibs.simulation.tms_coil.tms_coil_deformation import (
@@ -1931,12 +1940,137 @@ class TmsCoil(TcdElement):
             self_intersection_penalty,
         )
 
+    def _get_batched_deformation_scores(
+        self,
+        distance_function,
+        element_distance_functions: dict,
+        affine: npt.NDArray[np.float_],
+        deformation_ranges: list[TmsCoilDeformationRange],
+        deformation_settings: npt.NDArray[np.float_],
+    ) -> tuple[npt.NDArray[np.float_], npt.NDArray[np.float_], npt.NDArray[np.float_]]:
+        """Evaluates the scores of _get_fast_deformation_scores for several deformation settings at once,
+        without changing the current deformation values
+
+        Parameters
+        ----------
+        distance_function : Callable
+            The signed distance function of the surface to evaluate the cost for, evaluated for arrays of points (... x 3)
+        element_distance_functions: dict[TmsCoilElements, Callable]
+            The signed distance functions of the coil element casings
+        affine : npt.NDArray[np.float_]
+            The affine transformation that is applied to the coil
+        deformation_ranges : list[TmsCoilDeformationRange]
+            The deformation ranges that are set by the columns of deformation_settings
+        deformation_settings : npt.NDArray[np.float_] (N x len(deformation_ranges))
+            The deformation settings to evaluate, one per row
+
+        Returns
+        -------
+        npt.NDArray[np.float_] (N)
+            The intersection penalty for each deformation setting
+        npt.NDArray[np.float_] (N)
+            The distance penalty for each deformation setting
+        npt.NDArray[np.float_] (N)
+            The self intersection penalty for each deformation setting
+        """
+        deformation_settings = np.atleast_2d(deformation_settings)
+        n_settings = deformation_settings.shape[0]
+
+        def transform(points, matrices):
+            return (
+                np.einsum("bij,nj->bni", matrices[:, :3, :3], points)
+                + matrices[:, None, :3, 3]
+            )
+
+        casing_points = []
+        min_distance_points = []
+        intersect_points = []
+        if self.casing is not None:
+            coil_casing_coordinates = [
+                self.casing.get_points(affine),
+                self.casing.get_min_distance_points(affine),
+                self.casing.get_intersect_points(affine),
+            ]
+            for points, coordinates in zip(
+                (casing_points, min_distance_points, intersect_points),
+                coil_casing_coordinates,
+            ):
+                if len(coordinates) > 0:
+                    points.append(
+                        np.broadcast_to(coordinates, (n_settings,) + coordinates.shape)
+                    )
+
+        element_matrices = {}
+        for coil_element in self.elements:
+            if coil_element.casing is None:
+                continue
+            element_matrices[coil_element] = coil_element.get_combined_transformations(
+                deformation_ranges, deformation_settings, affine
+            )
+            for points, coordinates in zip(
+                (casing_points, min_distance_points, intersect_points),
+                (
+                    coil_element.casing.mesh.nodes.node_coord,
+                    coil_element.casing.min_distance_points,
+                    coil_element.casing.intersect_points,
+                ),
+            ):
+                if len(coordinates) > 0:
+                    points.append(
+                        transform(coordinates, element_matrices[coil_element])
+                    )
+
+        casing_points = np.concatenate(casing_points, axis=1)
+        min_distance_points = (
+            np.concatenate(min_distance_points, axis=1)
+            if len(min_distance_points) > 0
+            else casing_points
+        )
+        intersect_points = (
+            np.concatenate(intersect_points, axis=1)
+            if len(intersect_points) > 0
+            else casing_points
+        )
+
+        self_intersection_penalty = np.zeros(n_settings)
+        for intersection_group in self.self_intersection_test:
+            for intersection_pair in itertools.combinations(intersection_group, 2):
+                # casing points of the second element in the space of the first casing
+                relative_matrices = (
+                    np.linalg.inv(element_matrices[intersection_pair[0]])
+                    @ element_matrices[intersection_pair[1]]
+                )
+                self_intersection_penalty += np.abs(
+                    np.min(
+                        element_distance_functions[intersection_pair[0]](
+                            transform(
+                                intersection_pair[1].casing.mesh.nodes.node_coord,
+                                relative_matrices,
+                            )
+                        ),
+                        axis=1,
+                    )
+                )
+
+        return (
+            np.abs(np.min(distance_function(intersect_points), axis=1)),
+            np.mean(np.abs(distance_function(min_distance_points)), axis=1),
+            self_intersection_penalty,
+        )
+
     def optimize_deformations(
         self,
         optimization_surface: Msh,
         affine: npt.NDArray[np.float_],
         coil_translation_ranges: Optional[npt.NDArray[np.float_]] = None,
         coil_rotation_ranges: Optional[npt.NDArray[np.float_]] = None,
+        distance_grid: Optional[SignedDistanceGrid] = None,
+        fn_distance_grid: Optional[str] = None,
+        method: str = "direct",
+        n_samples: int = 1000,
+        n_starts: int = 5,
+        batch_size: int = 100,
+        seed: Optional[int] = 0,
     ) -> tuple[float, float, npt.NDArray[np.float_]]:
         """Optimizes the deformations of the coil elements to minimize the distance between the optimization_surface
         and the min distance points (if not present, the coil casing points) while preventing intersections of the
@@ -1956,6 +2090,26 @@ class TmsCoil(TcdElement):
             If the global coil rotation is supposed to be optimized as well, these ranges in the format
             [[min(x), max(x)],[min(y), max(y)], [min(z), max(z)]] are used
             and the updated affine coil transformation is returned, by default None
+        distance_grid : Optional[SignedDistanceGrid], optional
+            The signed distance grid of the optimization_surface. Can be reused for
+            all placements on the same surface (see get_signed_distance_grid),
+            by default it is calculated from the optimization_surface
+        fn_distance_grid : Optional[str], optional
+            HDF5 file the signed distance grid of the optimization_surface is read from or,
+            if it does not contain the grid of this surface, stored in
+            (e.g. SubjectFiles.skin_distance_grid), by default the grid is not stored
+        method : str, optional
+            The global optimization method, "direct" for the DIRECT algorithm or "multistart"
+            to evaluate n_samples latin hypercube samples of the deformations in batches and
+            refine the n_starts best ones with a local optimization, by default "direct"
+        n_samples : int, optional
+            Number of samples for the "multistart" method, by default 1000
+        n_starts : int, optional
+            Number of local optimizations for the "multistart" method, by default 5
+        batch_size : int, optional
+            Number of deformation settings that are evaluated at once by the "multistart" method, by default 100
+        seed : Optional[int], optional
+            Seed of the samples of the "multistart" method, by default 0
 
         Returns
         -------
@@ -1972,7 +2126,13 @@ class TmsCoil(TcdElement):
             If the coil has no coil casing and no min distance points and no intersection points
         ValueError
             If an initial intersection between the intersect points (if not present, the coil casing points) and the optimization_surface is detected
+        ValueError
+            If the method is unknown
         """
+        if method not in ("direct", "multistart"):
+            raise ValueError(
+                f"Expected 'method' to be 'direct' or 'multistart' but was '{method}'"
+            )
 
         coil_deformation_ranges = self.get_deformation_ranges()
 
@@ -1995,10 +2155,9 @@ class TmsCoil(TcdElement):
             set(np.array(self.self_intersection_test).flat)
         ):
             if intersection_element.casing is not None:
-                (
-                    element_distances[intersection_element],
-                    _,
-                ) = intersection_element.casing.mesh.get_min_distance_on_grid()
+                element_distances[
+                    intersection_element
+                ] = intersection_element.casing.get_distance_grid()
 
         global_deformations = []
         if coil_rotation_ranges is not None:
@@ -2083,55 +2242,83 @@ class TmsCoil(TcdElement):
             for coil_element in self.elements:
                 coil_element.deformations.append(global_deformation)
 
-        (
-            target_distance_function,
-            cost_surface_tree,
-        ) = optimization_surface.get_min_distance_on_grid()
+        if distance_grid is None:
+            distance_grid = get_signed_distance_grid(
+                optimization_surface, fn_distance_grid
+            )
+        target_distance_function = distance_grid
 
         initial_deformation_settings = np.array(
             [coil_deformation.current for coil_deformation in coil_deformation_ranges]
         )
 
         def cost_f_x0_w(x):
-            for coil_deformation, deformation_setting in zip(
-                coil_deformation_ranges, x
-            ):
-                coil_deformation.current = deformation_setting
             (
                 intersection_penalty,
                 distance_penalty,
                 self_intersection_penalty,
-            ) = self._get_fast_deformation_scores(
-                target_distance_function, element_distances, affine
-            )
-
-            f = (
-                100 * intersection_penalty
-                + distance_penalty
-                + self_intersection_penalty
+            ) = self._get_batched_deformation_scores(
+                target_distance_function,
+                element_distances,
+                affine,
+                coil_deformation_ranges,
+                x,
             )
 
             # f = w * np.abs(np.min(fdist(intersect_points), 0)).sum() + np.mean(np.sqrt(cost_surface_tree.min_sqdist(min_distance_points)))
             # f = w * 100 * (len(cost_surface_tree.points_inside(intersect_points)) / len(intersect_points)) + np.mean(np.sqrt(cost_surface_tree.min_sqdist(min_distance_points)))
             # f = w * 100 * (len(cost_surface_tree.points_inside(intersect_points)) / len(intersect_points)) + np.mean(np.abs(fdist(min_distance_points)))
 
-            return f
+            return (
+                100 * intersection_penalty
+                + distance_penalty
+                + self_intersection_penalty
+            )
 
-        initial_cost = cost_f_x0_w(initial_deformation_settings)
+        initial_cost = cost_f_x0_w(initial_deformation_settings)[0]
+        bounds = np.array([deform.range for deform in coil_deformation_ranges])
 
-        direct = opt.direct(
-            cost_f_x0_w,
-            bounds=[deform.range for deform in coil_deformation_ranges],
-            locally_biased=False,
-        )
-        best_deformation_settings = direct.x
+        if method == "direct":
+            direct = opt.direct(
+                lambda x: cost_f_x0_w(x)[0],
+                bounds=[deform.range for deform in coil_deformation_ranges],
+                locally_biased=False,
+            )
+            best_deformation_settings = direct.x
+        else:
+            samples = qmc.scale(
+                qmc.LatinHypercube(len(bounds), seed=seed).random(n_samples),
+                bounds[:, 0],
+                bounds[:, 1],
+            )
+            samples = np.vstack([initial_deformation_settings, samples])
+            sample_costs = np.concatenate(
+                [
+                    cost_f_x0_w(samples[i : i + batch_size])
+                    for i in range(0, len(samples), batch_size)
+                ]
+            )
+            best_deformation_settings = samples[np.argmin(sample_costs)]
+            best_cost = np.min(sample_costs)
+            for x0 in samples[np.argsort(sample_costs)[:n_starts]]:
+                local = opt.minimize(
+                    lambda x: cost_f_x0_w(np.clip(x, bounds[:, 0], bounds[:, 1]))[0],
+                    x0,
+                    method="Powell",
+                    bounds=bounds,
+                )
+                if local.fun < best_cost:
+                    best_cost = local.fun
+                    best_deformation_settings = np.clip(
+                        local.x, bounds[:, 0], bounds[:, 1]
+                    )
 
         for coil_deformation, deformation_setting in zip(
             coil_deformation_ranges, best_deformation_settings
         ):
             coil_deformation.current = deformation_setting
 
-        optimized_cost = cost_f_x0_w(best_deformation_settings)
+        optimized_cost = cost_f_x0_w(best_deformation_settings)[0]
 
         result_affine = np.eye(4)
         if len(global_deformations) > 0:
@@ -2142,3 +2329,104 @@ class TmsCoil(TcdElement):
         result_affine = affine.astype(float) @ result_affine
 
         return initial_cost, optimized_cost, result_affine
+
+    def optimize_deformations_for_targets(
+        self,
+        optimization_surface: Msh,
+        affines: list[npt.NDArray[np.float_]],
+        coil_translation_ranges: Optional[npt.NDArray[np.float_]] = None,
+        coil_rotation_ranges: Optional[npt.NDArray[np.float_]] = None,
+        distance_grid: Optional[SignedDistanceGrid] = None,
+        fn_distance_grid: Optional[str] = None,
+        cpus: int = 1,
+        **kwargs,
+    ) -> list[
+        tuple[float, float, npt.NDArray[np.float_], npt.NDArray[np.float_]]
+    ]:
+        """Optimizes the deformations of the coil elements (see optimize_deformations) independently
+        for several coil placements. The distance grid of the optimization_surface is calculated only once.
+        Every optimization starts from the current deformation settings, which are not changed
+
+        Parameters
+        ----------
+        optimization_surface : Msh
+            The surface the deformations have to be optimized for
+        affines : list[npt.NDArray[np.float_]]
+            The affine transformations of the coil placements
+        coil_translation_ranges : Optional[npt.NDArray[np.float_]], optional
+            Ranges of the global coil translation (see optimize_deformations), by default None
+        coil_rotation_ranges : Optional[npt.NDArray[np.float_]], optional
+            Ranges of the global coil rotation (see optimize_deformations), by default None
+        distance_grid : Optional[SignedDistanceGrid], optional
+            The signed distance grid of the optimization_surface,
+            by default it is calculated from the optimization_surface
+        fn_distance_grid : Optional[str], optional
+            HDF5 file the signed distance grid is cached in (see optimize_deformations),
+            by default the grid is not stored
+        cpus : int, optional
+            Number of processes the coil placements are distributed over, and of threads
+            used to calculate the distance grid, by default 1
+        **kwargs
+            Further arguments of optimize_deformations (e.g. method)
+
+        Returns
+        -------
+        list[tuple[float, float, npt.NDArray[np.float_], npt.NDArray[np.float_]]]
+            For each coil placement the initial cost, the cost after optimization,
+            the affine matrix (see optimize_deformations) and the optimized deformation settings
+            in the order of get_deformation_ranges
+        """
+        if distance_grid is None:
+            distance_grid = get_signed_distance_grid(
+                optimization_surface, fn_distance_grid, cpus=cpus
+            )
+        kwargs = dict(
+            kwargs,
+            coil_translation_ranges=coil_translation_ranges,
+            coil_rotation_ranges=coil_rotation_ranges,
+            distance_grid=distance_grid,
+        )
+        initial_deformation_settings = np.array(
+            [deformation.current for deformation in self.get_deformation_ranges()]
+        )
+        data = (self, initial_deformation_settings, kwargs)
+        if cpus == 1:
+            _set_deformation_data(data)
+            results = [_optimize_deformations_target(affine) for affine in affines]
+        else:
+            with multiprocessing.Pool(
+                processes=cpus, initializer=_set_deformation_data, initargs=(data,)
+            ) as pool:
+                results = pool.map(_optimize_deformations_target, affines)
+        _set_deformation_data(None)
+
+        for deformation, deformation_setting in zip(
+            self.get_deformation_ranges(), initial_deformation_settings
+        ):
+            deformation.current = deformation_setting
+
+        return results
+
+
+def _set_deformation_data(data):
+    global _deformation_data
+    _deformation_data = data
+
+
+def _optimize_deformations_target(affine):
+    # optimizes the deformations for one coil placement, starting from the initial settings
+    coil, initial_deformation_settings, kwargs = _deformation_data
+    coil_deformation_ranges = coil.get_deformation_ranges()
+    for deformation, deformation_setting in zip(
+        coil_deformation_ranges, initial_deformation_settings
+    ):
+        deformation.current = deformation_setting
+    initial_cost, optimized_cost, result_affine = coil.optimize_deformations(
+        None, affine, **kwargs
+    )
+    return (
+        initial_cost,
+        optimized_cost,
+        result_affine,
+        np.array([deformation.current for deformation in coil_deformation_ranges]),
+    )
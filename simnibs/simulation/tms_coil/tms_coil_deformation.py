@@ -119,6 +119,22 @@ class TmsCoilDeformation(ABC, TcdElement):
         """
         pass
 
+    @abstractmethod
+    def as_matrices(self, values: npt.ArrayLike) -> npt.NDArray[np.float_]:
+        """Affine matrix representations of the deformation for several deformation values
+
+        Parameters
+        ----------
+        values : npt.ArrayLike (N)
+            The deformation values (e.g angles of a rotation deformation)
+
+        Returns
+        -------
+        npt.NDArray[np.float_] (N x 4 x 4)
+            The affine matrices representing the deformation for each value
+        """
+        pass
+
     def to_tcd(
         self,
         deformation_ranges: list[TmsCoilDeformationRange],
@@ -202,6 +218,12 @@ class TmsCoilTranslation(TmsCoilDeformation):
         affine_matrix[:3, 3] = self.get_translation()
         return affine_matrix
 
+    def as_matrices(self, values: npt.ArrayLike) -> npt.NDArray[np.float_]:
+        values = np.asarray(values, dtype=float)
+        affine_matrices = np.tile(np.eye(4), (len(values), 1, 1))
+        affine_matrices[:, self.axis, 3] = values
+        return affine_matrices
+
     def to_tcd(
         self,
         deformation_ranges: list[TmsCoilDeformationRange],
@@ -283,6 +305,18 @@ class TmsCoilRotation(TmsCoilDeformation):
         Q = T @ R @ iT
         return Q
 
+    def as_matrices(self, values: npt.ArrayLike) -> npt.NDArray[np.float_]:
+        values = np.asarray(values, dtype=float)
+        v = (self.point_2 - self.point_1) / np.linalg.norm(self.point_2 - self.point_1)
+        affine_matrices = np.tile(np.eye(4), (len(values), 1, 1))
+        if len(values) == 0:
+            return affine_matrices
+        R = Rotation.from_rotvec(v[None] * values[:, None], degrees=True).as_matrix()
+        affine_matrices[:, :3, :3] = R
+        # T @ R @ iT, with T the translation to point_1
+        affine_matrices[:, :3, 3] = self.point_1 - R @ self.point_1
+        return affine_matrices
+
     def apply(self, points: npt.NDArray[np.float_]):
         rotation_matrix = self.get_rotation()
         points = points @ rotation_matrix[:3, :3].T + rotation_matrix[None, :3, 3]
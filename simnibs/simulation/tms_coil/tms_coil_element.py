@@ -13,7 +13,7 @@ from simnibs.simulation.tms_coil.tcd_element import TcdElement
 from simnibs.simulation.tms_coil.tms_coil_constants import TmsCoilElementTag
 from simnibs.simulation.tms_coil.tms_coil_model import TmsCoilModel
 
-from .tms_coil_deformation import TmsCoilDeformation
+from .tms_coil_deformation import TmsCoilDeformation, TmsCoilDeformationRange
 from .tms_stimulator import TmsStimulator
 
 
@@ -134,6 +134,47 @@ class TmsCoilElements(ABC, TcdElement):
 
         return affine_matrix_result
 
+    def get_combined_transformations(
+        self,
+        deformation_ranges: list[TmsCoilDeformationRange],
+        deformation_settings: npt.NDArray[np.float_],
+        affine_matrix: Optional[npt.NDArray[np.float_]] = None,
+    ) -> npt.NDArray[np.float_]:
+        """Returns the combined transformation (see get_combined_transformation) for several
+        settings of the deformations at once, without changing the current deformation values
+
+        Parameters
+        ----------
+        deformation_ranges : list[TmsCoilDeformationRange]
+            The deformation ranges that are set by the columns of deformation_settings.
+            Deformations with other ranges use their current value
+        deformation_settings : npt.NDArray[np.float_] (N x len(deformation_ranges))
+            The deformation settings, one per row
+        affine_matrix : Optional[npt.NDArray[np.float_]], optional
+            The affine transformation that is applied to the coil element, by default None
+
+        Returns
+        -------
+        npt.NDArray[np.float_] (N x 4 x 4)
+            The affine matrices that combine the deformations and the input affine matrix into one
+        """
+        deformation_settings = np.atleast_2d(deformation_settings)
+        n_settings = deformation_settings.shape[0]
+        affine_matrix_result = np.tile(np.eye(4), (n_settings, 1, 1))
+        for deformation in self.deformations:
+            if deformation.deformation_range in deformation_ranges:
+                values = deformation_settings[
+                    :, deformation_ranges.index(deformation.deformation_range)
+                ]
+            else:
+                values = np.full(n_settings, deformation.deformation_range.current)
+            affine_matrix_result = deformation.as_matrices(values) @ affine_matrix_result
+
+        if affine_matrix is not None:
+            affine_matrix_result = affine_matrix @ affine_matrix_result
+
+        return affine_matrix_result
+
     def get_casing_coordinates(
         self,
         affine_matrix: Optional[npt.NDArray[np.float_]] = None,
@@ -12,7 +12,13 @@ from simnibs.segmentation.marching_cube import marching_cubes_lewiner
 from simnibs.simulation.tms_coil.tcd_element import TcdElement
 from simnibs.simulation.tms_coil.tms_coil_constants import TmsCoilElementTag
 
-from ...mesh_tools.mesh_io import Elements, Msh, Nodes
+from ...mesh_tools.mesh_io import (
+    Elements,
+    Msh,
+    Nodes,
+    SignedDistanceGrid,
+    get_signed_distance_grid,
+)
 
 
 class TmsCoilModel(TcdElement):
@@ -77,6 +83,8 @@ class TmsCoilModel(TcdElement):
                 f"Expected 'intersect_points' to have the shape (N, 3) but shape was {self.intersect_points.shape}"
             )
 
+        self._distance_grid = None
+
     def get_mesh(
         self,
         affine_matrix: npt.NDArray[np.float_],
@@ -220,6 +228,22 @@ class TmsCoilModel(TcdElement):
             self.intersect_points @ affine_matrix[:3, :3].T + affine_matrix[None, :3, 3]
         )
 
+    def get_distance_grid(self) -> SignedDistanceGrid:
+        """Returns the signed distance grid of the coil model (inside is negative)
+
+        The grid is calculated on first use and reused while the mesh is unchanged
+
+        Returns
+        -------
+        SignedDistanceGrid
+            The signed distance grid of the coil model
+        """
+        mesh_hash = self.mesh._geometry_hash()
+        if self._distance_grid is None or self._distance_grid[0] != mesh_hash:
+            distance_grid = get_signed_distance_grid(self.mesh)
+            self._distance_grid = (mesh_hash, distance_grid)
+        return self._distance_grid[1]
+
     def merge(self, other_coil_model: "TmsCoilModel") -> "TmsCoilModel":
         """Merges two coil models into one and returning the combination as a new coil model
 
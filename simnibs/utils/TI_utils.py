@@ -5,6 +5,9 @@ Created on Thu Jun 23 17:41:21 2022
 @author: axthi
 """
 
+from itertools import combinations
+import multiprocessing
+
 import h5py
 import numpy as np
 
@@ -101,37 +104,38 @@ def get_maxTI(E1_org,E2_org):
     ----------
     E1 : np.ndarray
            field of electrode pair 1 (N x 3) where N is the number of 
-           positions at which the field was calculated
+           positions at which the field was calculated. Stacks of fields
+           (K x N x 3) are also accepted
     E2 : np.ndarray
         field of electrode pair 2 (N x 3) 
 
     Returns
     -------
     TImax : np.ndarray (N,)
-        maximal modulation amplitude
+        maximal modulation amplitude, (K x N) for stacked fields
 
     """
     assert E1_org.shape == E2_org.shape
-    assert E1_org.shape[1] == 3
+    assert E1_org.shape[-1] == 3
     E1 = E1_org.copy()
     E2 = E2_org.copy()
     
     # ensure E1>E2
-    idx = np.linalg.norm(E2, axis=1) > np.linalg.norm(E1, axis=1)
+    idx = np.linalg.norm(E2, axis=-1) > np.linalg.norm(E1, axis=-1)
     E1[idx] = E2[idx]
     E2[idx] = E1_org[idx]
 
     # ensure alpha < pi/2
-    idx = np.sum(E1*E2, axis=1) < 0
+    idx = np.sum(E1*E2, axis=-1) < 0
     E2[idx] = -E2[idx]
     
     # get maximal amplitude of envelope
-    normE1 = np.linalg.norm(E1, axis=1)
-    normE2 = np.linalg.norm(E2, axis=1)
-    cosalpha = np.sum(E1*E2, axis=1)/(normE1*normE2)
+    normE1 = np.linalg.norm(E1, axis=-1)
+    normE2 = np.linalg.norm(E2, axis=-1)
+    cosalpha = np.sum(E1*E2, axis=-1)/(normE1*normE2)
     
-    TImax = 2*np.linalg.norm(np.cross(E2,E1-E2), axis=1) \
-            /np.linalg.norm(E1-E2, axis=1)
+    TImax = 2*np.linalg.norm(np.cross(E2,E1-E2), axis=-1) \
+            /np.linalg.norm(E1-E2, axis=-1)
     idx = normE2<=normE1*cosalpha
     TImax[idx] = 2*normE2[idx]
     return TImax
@@ -174,3 +178,428 @@ def get_dirTI(E1,E2,dirvec_org):
     TIamp = np.abs( np.abs(np.sum((E1+E2)*dirvec,axis=1)) 
                   - np.abs(np.sum((E1-E2)*dirvec,axis=1)) )
     return TIamp
+
+
+class TIBuffers:
+    """
+    work buffers for get_maxTI_kernel, get_dirTI_kernel and mean_maxTI, 
+    so that repeated evaluations do not allocate memory
+
+    Parameters
+    ----------
+    shape : tuple
+        shape of the fields (N x 3) or (K x N x 3). The buffers can also be 
+        used for fields with fewer positions N
+    dtype : np.dtype, optional
+        data type of the fields, np.float64 or np.float32. The default is 
+        np.float64.
+    """
+    def __init__(self, shape, dtype=np.float64):
+        assert shape[-1] == 3
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._vec = np.empty(self.shape, dtype=self.dtype)
+        self._scalars = np.empty((6,) + self.shape[:-1], dtype=self.dtype)
+        self._mask = np.empty(self.shape[:-1], dtype=bool)
+
+    def get(self, shape, dtype):
+        """
+        returns views of the buffers for fields of the given shape: 
+        a (... x 3) array, five (...) arrays and a (...) boolean mask
+        """
+        shape = tuple(shape)
+        if (np.dtype(dtype) != self.dtype or len(shape) != len(self.shape)
+                or shape[:-2] != self.shape[:-2] or shape[-2] > self.shape[-2]):
+            raise ValueError(
+                f'Buffers of shape {self.shape} ({self.dtype}) can not be '
+                f'used for fields of shape {shape} ({np.dtype(dtype)})')
+        n = shape[-2]
+        return (self._vec[..., :n, :], self._scalars[:5, ..., :n],
+                self._mask[..., :n])
+
+
+def get_maxTI_kernel(E1, E2, out=None, buffers=None):
+    """
+    calculates the maximal modulation amplitude of the TI envelope, as
+    get_maxTI, without allocating temporary arrays
+
+    Uses |E1 x E2|, |E1 - E2| and |E2| (after ensuring |E1| >= |E2| and
+    alpha < pi/2) computed from dot products, so that the input fields are
+    not copied or modified
+
+    Parameters
+    ----------
+    E1 : np.ndarray
+        field of electrode pair 1 (N x 3) or stack of fields (K x N x 3). 
+        Can be float64 or float32
+    E2 : np.ndarray
+        field of electrode pair 2, same shape as E1
+    out : np.ndarray, optional
+        array (N,) or (K x N) where the result is written. The default is
+        to allocate it
+    buffers : TIBuffers, optional
+        work buffers. The default is to allocate them
+
+    Returns
+    -------
+    TImax : np.ndarray (N,) or (K x N)
+        maximal modulation amplitude
+
+    """
+    assert E1.shape == E2.shape
+    assert E1.shape[-1] == 3
+    dtype = np.result_type(E1, E2)
+    if buffers is None:
+        buffers = TIBuffers(E1.shape, dtype)
+    W, (a, b, d, den, e), mask = buffers.get(E1.shape, dtype)
+    if out is None:
+        out = np.empty(E1.shape[:-1], dtype=dtype)
+
+    np.einsum('...i,...i->...', E1, E1, out=a)
+    np.einsum('...i,...i->...', E2, E2, out=b)
+    np.einsum('...i,...i->...', E1, E2, out=d)
+    # W = E1 - E2, with E2 flipped such that alpha < pi/2
+    np.copysign(1, d, out=e)
+    np.multiply(E2, e[..., None], out=W)
+    np.subtract(E1, W, out=W)
+    np.abs(d, out=d)
+    np.einsum('...i,...i->...', W, W, out=den)
+    np.einsum('...i,...i->...', E2, W, out=e)
+
+    # |E2 x (E1 - E2)| / |E1 - E2|
+    np.multiply(b, den, out=out)
+    np.square(e, out=e)
+    out -= e
+    np.maximum(out, 0, out=out)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(out, den, out=out)
+    np.sqrt(out, out=out)
+
+    # |E2| when |E2| <= |E1| cos(alpha)
+    np.minimum(a, b, out=a)
+    np.less_equal(a, d, out=mask)
+    np.sqrt(a, out=a)
+    np.copyto(out, a, where=mask)
+    out *= 2
+    return out
+
+
+def get_dirTI_kernel(E1, E2, dirvec, out=None, buffers=None):
+    """
+    calculates the TI envelope amplitude along the direction specified by 
+    n, as get_dirTI, without allocating temporary arrays
+        
+    Uses TIamp = | |(E1+E2)*n| - |(E1-E2)*n| | = 2 min(|E1*n|, |E2*n|)
+
+    Parameters
+    ----------
+    E1 : np.ndarray
+        field of electrode pair 1 (N x 3) or stack of fields (K x N x 3). 
+        Can be float64 or float32
+    E2 : np.ndarray
+        field of electrode pair 2, same shape as E1
+    dirvec : np.ndarray
+        unit vector (3,) applied to all positions or one unit vector per 
+        position (N x 3). Unlike get_dirTI, it is not normalized
+    out : np.ndarray, optional
+        array (N,) or (K x N) where the result is written. The default is
+        to allocate it
+    buffers : TIBuffers, optional
+        work buffers. The default is to allocate them
+
+    Returns
+    -------
+    TIamp : np.ndarray (N,) or (K x N)
+        modulation amplitude along the direction specified by n
+    """
+    assert E1.shape == E2.shape
+    assert E1.shape[-1] == 3
+    dtype = np.result_type(E1, E2)
+    if buffers is None:
+        buffers = TIBuffers(E1.shape, dtype)
+    _, (a, b, _, _, _), _ = buffers.get(E1.shape, dtype)
+    if out is None:
+        out = np.empty(E1.shape[:-1], dtype=dtype)
+    dirvec = np.asarray(dirvec, dtype=dtype)
+
+    np.einsum('...i,...i->...', E1, dirvec, out=a)
+    np.einsum('...i,...i->...', E2, dirvec, out=b)
+    np.abs(a, out=a)
+    np.abs(b, out=b)
+    np.minimum(a, b, out=out)
+    out *= 2
+    return out
+
+
+def mean_maxTI(E1, E2, weights, out=None, buffers=None, block_size=4096):
+    """
+    weighted mean of the maximal modulation amplitude of the TI envelope 
+    over the positions, computed in blocks of positions so that the 
+    amplitudes at all positions are never stored
+
+    Parameters
+    ----------
+    E1 : np.ndarray
+        field of electrode pair 1 (N x 3) or stack of fields (K x N x 3). 
+        Can be float64 or float32
+    E2 : np.ndarray
+        field of electrode pair 2, same shape as E1
+    weights : np.ndarray
+        weights of each position (N,), e.g. node areas or element volumes 
+        in the ROI
+    out : np.ndarray, optional
+        array () or (K,) where the result is written. The default is to 
+        allocate it
+    buffers : TIBuffers, optional
+        work buffers for fields with block_size positions. The default is to
+        allocate them
+    block_size : int, optional
+        number of positions evaluated at once. The default is 4096.
+
+    Returns
+    -------
+    mean : np.ndarray () or (K,)
+        weighted mean of the maximal modulation amplitude
+    """
+    assert E1.shape == E2.shape
+    n = E1.shape[-2]
+    dtype = np.result_type(E1, E2)
+    block_size = min(block_size, n)
+    block_shape = E1.shape[:-2] + (block_size, 3)
+    if buffers is None:
+        buffers = TIBuffers(block_shape, dtype)
+    if out is None:
+        out = np.zeros(E1.shape[:-2], dtype=dtype)
+    else:
+        out[...] = 0
+    # the last scalar buffer is not used by get_maxTI_kernel
+    TI = buffers._scalars[5]
+    weights = np.asarray(weights, dtype=dtype)
+    w_total = weights.sum()
+    for start in range(0, n, block_size):
+        s = slice(start, min(start + block_size, n))
+        m = s.stop - s.start
+        get_maxTI_kernel(
+            E1[..., s, :], E2[..., s, :], out=TI[..., :m], buffers=buffers
+        )
+        out += TI[..., :m] @ weights[s]
+    out /= w_total
+    return out
+
+
+def search_montages(leadfield, idx_lf, roi, non_roi=None, electrodes=None,
+                    total_current=0.002, current_ratios=(0.5,),
+                    objective='roi', n_best=10, n_candidates=1000,
+                    weights=None, chunk_size=None, cpus=1):
+    """
+    exhaustive search of TI montages (two electrode pairs and the ratio of
+    their currents) maximizing the mean maximal TI amplitude in a ROI
+    
+    All combinations of two electrode pairs without shared electrodes are 
+    evaluated for each current ratio in batches, using only the leadfield in
+    the ROI. Only the best candidates of each batch are kept, so that memory
+    does not grow with the number of combinations. The mean TI amplitude 
+    outside of the ROI is then only calculated for the kept candidates.
+
+    Parameters
+    ----------
+    leadfield : np.ndarray
+        Leadfield matrix (N_elec -1 x M x 3), see load_leadfield
+    idx_lf : dict
+        Mapping from electrode name to index in the leadfield matrix. The 
+        reference electrode has None as index
+    roi : np.ndarray
+        Boolean mask (M,) or indices of the positions in the ROI
+    non_roi : np.ndarray, optional
+        Boolean mask (M,) or indices of the positions outside the ROI used 
+        to assess the focality. The default is all positions not in the ROI.
+    electrodes : list, optional
+        Names of the electrodes to be used. The default is all electrodes
+        in idx_lf.
+    total_current : float, optional
+        Sum of the currents of both electrode pairs (in A). The default is
+        0.002.
+    current_ratios : list, optional
+        Fractions of the total current going through the first pair. The 
+        default is (0.5,), i.e. the same current in both pairs.
+    objective : 'roi' or 'focality', optional
+        Rank the montages by the mean TI amplitude in the ROI ('roi') or by the
+        ratio between the mean TI amplitude in and outside the ROI 
+        ('focality'). The default is 'roi'.
+    n_best : int, optional
+        Number of montages to return. The default is 10.
+    n_candidates : int, optional
+        For objective='focality', number of montages with highest mean TI 
+        amplitude in the ROI which are ranked by focality. Montages with 
+        lower ROI amplitudes are pruned. The default is 1000.
+    weights : np.ndarray, optional
+        Weights of the positions (M,), e.g. node areas or element volumes.
+        The default is to weight all positions equally.
+    chunk_size : int, optional
+        Number of montages evaluated at once. The default is to evaluate 
+        about 2**20 field values at once.
+    cpus : int, optional
+        Number of processes evaluating the montages. The default is 1.
+
+    Returns
+    -------
+    montages : list
+        The best montages as tuples (TIpair1, TIpair2), where each pair is 
+        given as in get_field ([elec_1, elec_2, current_intensity]), sorted
+        by the objective
+    roi_mean : np.ndarray
+        Mean TI amplitude in the ROI for each montage
+    non_roi_mean : np.ndarray
+        Mean TI amplitude outside the ROI for each montage
+
+    """
+    if objective not in ('roi', 'focality'):
+        raise ValueError(f'Invalid objective: {objective}')
+    if electrodes is None:
+        electrodes = list(idx_lf.keys())
+    n_points = leadfield.shape[1]
+    roi = _as_indices(roi, n_points)
+    if non_roi is None:
+        non_roi = np.setdiff1d(np.arange(n_points), roi)
+    else:
+        non_roi = _as_indices(non_roi, n_points)
+    if weights is None:
+        weights = np.ones(n_points)
+    n_keep = n_best if objective == 'roi' else max(n_best, n_candidates)
+
+    # leadfield rows of the electrodes, -1 for the reference
+    rows = np.array(
+        [-1 if idx_lf[e] is None else idx_lf[e] for e in electrodes], dtype=int
+    )
+    # pairs of pairs of electrodes without shared electrodes
+    pairs = np.array(list(combinations(range(len(electrodes)), 2)), dtype=int)
+    pair1, pair2 = np.triu_indices(len(pairs), 1)
+    disjoint = ~np.any(
+        pairs[pair1][:, :, None] == pairs[pair2][:, None, :], axis=(1, 2)
+    )
+    pair1 = pair1[disjoint]
+    pair2 = pair2[disjoint]
+    ratios = np.atleast_1d(np.asarray(current_ratios, dtype=float))
+    n_montages = len(pair1) * len(ratios)
+    if n_montages == 0:
+        raise ValueError('Need at least 4 electrodes')
+
+    # ROI stage: fields of each electrode pair in the ROI, for a unit current
+    lf_roi = _electrode_fields(leadfield, rows, roi)
+    pair_fields = lf_roi[pairs[:, 0]] - lf_roi[pairs[:, 1]]
+    del lf_roi
+    if chunk_size is None:
+        chunk_size = max(1, 2**20 // max(len(roi), 1))
+    chunks = [
+        (start, min(start + chunk_size, n_montages))
+        for start in range(0, n_montages, chunk_size)
+    ]
+    data = (pair_fields, pair1, pair2, ratios, weights[roi] / np.sum(weights[roi]), n_keep)
+    if cpus == 1:
+        _set_search_data(data)
+        results = [_search_chunk(c) for c in chunks]
+    else:
+        with multiprocessing.Pool(
+            processes=cpus, initializer=_set_search_data, initargs=(data,)
+        ) as pool:
+            results = pool.map(_search_chunk, chunks)
+    _set_search_data(None)
+    roi_mean = np.concatenate([r[0] for r in results])
+    montage = np.concatenate([r[1] for r in results])
+    roi_mean, montage = _top_k(roi_mean, montage, n_keep)
+
+    # non-ROI stage, only for the kept montages
+    pair_idx, ratio_idx = np.divmod(montage, len(ratios))
+    el1 = pairs[pair1[pair_idx]]
+    el2 = pairs[pair2[pair_idx]]
+    r1 = ratios[ratio_idx]
+    w_non_roi = weights[non_roi] / np.sum(weights[non_roi])
+    non_roi_mean = np.empty(len(montage))
+    n_chunk = max(1, 2**20 // max(len(non_roi), 1))
+    for start in range(0, len(montage), n_chunk):
+        s = slice(start, start + n_chunk)
+        E1 = (_electrode_fields(leadfield, rows[el1[s, 0]], non_roi)
+              - _electrode_fields(leadfield, rows[el1[s, 1]], non_roi))
+        E2 = (_electrode_fields(leadfield, rows[el2[s, 0]], non_roi)
+              - _electrode_fields(leadfield, rows[el2[s, 1]], non_roi))
+        E1 *= r1[s, None, None]
+        E2 *= 1 - r1[s, None, None]
+        non_roi_mean[s] = mean_maxTI(E1, E2, w_non_roi)
+
+    # The TI amplitude is proportional to the total current
+    roi_mean *= total_current
+    non_roi_mean *= total_current
+    if objective == 'roi':
+        order = np.argsort(-roi_mean)
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            order = np.argsort(-(roi_mean / non_roi_mean))
+    order = order[:n_best]
+
+    montages = [
+        ([electrodes[e1[0]], electrodes[e1[1]], float(r * total_current)],
+         [electrodes[e2[0]], electrodes[e2[1]], float((1 - r) * total_current)])
+        for e1, e2, r in zip(el1[order], el2[order], r1[order])
+    ]
+    return montages, roi_mean[order], non_roi_mean[order]
+
+
+def _as_indices(points, n_points):
+    points = np.asarray(points)
+    if points.dtype == bool:
+        assert len(points) == n_points
+        return np.where(points)[0]
+    return points.astype(int)
+
+
+def _electrode_fields(leadfield, rows, points):
+    # leadfield rows at the given points, zeros for the reference (row -1)
+    fields = np.zeros((len(rows), len(points), 3), dtype=leadfield.dtype)
+    valid = rows >= 0
+    fields[valid] = leadfield[np.ix_(rows[valid], points)]
+    return fields
+
+
+def _top_k(values, index, k):
+    # the k largest values and their indices
+    if len(values) > k:
+        sel = np.argpartition(-values, k - 1)[:k]
+        return values[sel], index[sel]
+    return values, index
+
+
+def _set_search_data(data):
+    global _search_data, _search_buffers
+    _search_data = data
+    _search_buffers = None
+
+
+def _search_chunk(chunk):
+    # mean TI amplitude in the ROI of the montages in the chunk, keeps only 
+    # the best montages. The buffers are reused for all chunks of the same size
+    global _search_buffers
+    pair_fields, pair1, pair2, ratios, w, n_keep = _search_data
+    montage = np.arange(*chunk)
+    pair_idx, ratio_idx = np.divmod(montage, len(ratios))
+    shape = (len(montage),) + pair_fields.shape[1:]
+    if _search_buffers is None or _search_buffers[0].shape != shape:
+        _search_buffers = (
+            np.empty(shape, dtype=pair_fields.dtype),
+            np.empty(shape, dtype=pair_fields.dtype),
+            np.empty(shape[:-1], dtype=pair_fields.dtype),
+            TIBuffers(shape, pair_fields.dtype),
+        )
+    E1, E2, TI, buffers = _search_buffers
+    r = ratios[ratio_idx, None, None].astype(pair_fields.dtype)
+    np.take(pair_fields, pair1[pair_idx], axis=0, out=E1)
+    E1 *= r
+    np.take(pair_fields, pair2[pair_idx], axis=0, out=E2)
+    np.subtract(1, r, out=r)
+    E2 *= r
+    get_maxTI_kernel(E1, E2, out=TI, buffers=buffers)
+    roi_mean = TI @ w.astype(TI.dtype)
+    return _top_k(roi_mean, montage, n_keep)
+
+
+_search_data = None
+_search_buffers = None
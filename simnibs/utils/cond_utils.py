@@ -110,9 +110,99 @@ def _fix_eigv(eig_val, max_value, max_ratio, c):
     return eig_val
 
 
+class TensorField(object):
+    """ Anisotropy tensors interpolated to the elements of a mesh
+
+    Interpolates the anisotropy volume and computes the sorted eigenvalues and
+    eigenvectors of the tensors in each tissue only once. cond2elmdata can then
+    form the conductivities for different conductivity values, anisotropy types
+    and excentricity scalings by rescaling the eigenvalues
+
+    Parameters
+    ----------
+    mesh: simnibs.mesh_io.Msh
+        Mesh with geometry information
+    anisotropy_volume: np.ndarray
+        4-dimensional array with anisotropy information
+    affine: np.ndarray
+        4x4 matrix defining an affine transformation from the grid to the mesh space.
+    correct_FSL: bool
+        Wether to correct the tensors, if the data was preprocessed with FSL.
+
+    Attributes
+    ----------
+    tensors: np.ndarray
+        Tensors in each element (N_elm x 3 x 3)
+    elm_vols: np.ndarray
+        Volume of each element
+    """
+    def __init__(self, mesh, anisotropy_volume, affine, correct_FSL=True):
+        assert len(anisotropy_volume.shape) == 4
+        assert anisotropy_volume.shape[-1] == 6
+        if affine is None:
+            raise ValueError('Please define a 4x4 affine from the grid to the mesh space')
+
+        self.mesh = mesh
+        cond = mesh_io.ElementData.from_data_grid(
+                    mesh, anisotropy_volume, affine, 'conductivities',
+                    order=1, cval=0.0, prefilter=True)
+        tensors = cond.value[:, [0, 1, 2, 1, 3, 4, 2, 4, 5]].reshape(-1, 3, 3)
+        if correct_FSL:
+            M = affine[:3, :3] / np.linalg.norm(affine[:3, :3], axis=0)[:, None]
+            R = np.eye(3)
+            if np.linalg.det(M) > 0:
+                R[0, 0] = -1
+            M = M.dot(R)
+            tensors = tensors.dot(M.T)
+            tensors = M.dot(tensors.transpose(2, 1, 0)).transpose(2, 0, 1)
+        self.tensors = tensors
+        self.elm_vols = mesh.elements_volumes_and_areas().value
+        self._eigv = {}
+
+    def sorted_eigv(self, tag, fix_zeros=None):
+        """ Sorted eigenvalues and eigenvectors of the tensors in a tissue
+
+        Parameters
+        ----------
+        tag: int
+            Volume tag of the tissue
+        fix_zeros: float (optional)
+            Replace zero tensors with isotropic tensors of this value before
+            the decomposition, as done by _fix_zeros. Default: do not replace
+
+        Returns
+        -------
+        eigval: np.ndarray
+            Eigenvalues in decreasing order (N x 3). A copy that can be modified
+        eigvec: np.ndarray
+            Corresponding eigenvectors, in the columns (N x 3 x 3)
+        """
+        if tag not in self._eigv:
+            elms = (self.mesh.elm.tag1 == tag) * (self.mesh.elm.elm_type == 4)
+            tensors = self.tensors[elms]
+            zeros = np.all(np.isclose(tensors.reshape(-1, 9), 0), axis=1)
+            self._eigv[tag] = _get_sorted_eigenv(tensors) + (zeros,)
+        eigval, eigvec, zeros = self._eigv[tag]
+        eigval = eigval.copy()
+        if fix_zeros is not None:
+            frac = np.sum(zeros)/len(eigval)
+            if frac > .1:
+                log = logger.critical
+            else:
+                log = logger.info
+            log('Found {0} ({1:.1%}) Zero tensors in the volume. '
+                ' Fixing it.'.format(np.sum(zeros), frac))
+            if np.any(zeros):
+                eigval[zeros] = fix_zeros
+                eigvec = eigvec.copy()
+                eigvec[zeros] = _get_sorted_eigenv(np.eye(3)[None])[1]
+        return eigval, eigvec
+
+
 def cond2elmdata(mesh, cond_list, anisotropy_volume=None, affine=None,
                  aniso_tissues=[ElementTags.WM, ElementTags.GM], correct_FSL=True, normalize=False,
-                 excentricity_scaling=None, max_ratio=10, max_cond=2, correct_intensity=True):
+                 excentricity_scaling=None, max_ratio=10, max_cond=2, correct_intensity=True,
+                 tensor_field=None):
     """ Define conductivity ElementData from a conductivity list or anisotropy
     information
     Parameters
@@ -147,6 +237,9 @@ def cond2elmdata(mesh, cond_list, anisotropy_volume=None, affine=None,
         Wether or not to fit the tensor sizes according to the scalar values (See
         Rullmann et. al. 2009). This procedure scales the entire tensor field with a
         single scalar. Does not run if normalize==True
+    tensor_field: TensorField (optional)
+        Tensors already interpolated to the mesh. If set, anisotropy_volume,
+        affine and correct_FSL are not used. Default: interpolate anisotropy_volume
     Returns
     -------
     cond: simnibs.mesh_io.ElementData
@@ -167,7 +260,7 @@ def cond2elmdata(mesh, cond_list, anisotropy_volume=None, affine=None,
         return c
 
     # Isotropic
-    if anisotropy_volume is None:
+    if anisotropy_volume is None and tensor_field is None:
         cond = mesh_io.ElementData(np.zeros(mesh.elm.nr, dtype=float),
                                 'conductivity', mesh=mesh)
         for t in vol_tags:
@@ -179,29 +272,14 @@ def cond2elmdata(mesh, cond_list, anisotropy_volume=None, affine=None,
             cond.value[(mesh.elm.tag1 == t) * (mesh.elm.elm_type == 4)] = c
     # Anisotropic
     else:
-        # Interpolate conductivity values
-        assert len(anisotropy_volume.shape) == 4
-        assert anisotropy_volume.shape[-1] == 6
-        assert anisotropy_volume.shape[-1] == 6
-        if affine is None:
-            raise ValueError('Please define a 4x4 affine from the grid to the mesh space')
+        if tensor_field is None:
+            tensor_field = TensorField(mesh, anisotropy_volume, affine, correct_FSL)
+        if tensor_field.tensors.shape[0] != mesh.elm.nr:
+            raise ValueError('The tensor field was not defined in this mesh')
+        cond = mesh_io.ElementData(tensor_field.tensors.reshape(-1, 9).copy(),
+                                   'conductivities', mesh=mesh)
+        elm_vols = tensor_field.elm_vols
 
-        cond = mesh_io.ElementData.from_data_grid(
-                    mesh, anisotropy_volume, affine, 'conductivities',
-                    order=1, cval=0.0, prefilter=True)
-        cond.value = cond.value[:, [0, 1, 2, 1, 3, 4, 2, 4, 5]]
-        tensors = cond.value.reshape(-1, 3, 3)
-        if correct_FSL:
-            M = affine[:3, :3] / np.linalg.norm(affine[:3, :3], axis=0)[:, None]
-            R = np.eye(3)
-            if np.linalg.det(M) > 0:
-                R[0, 0] = -1
-            M = M.dot(R)
-            tensors = tensors.dot(M.T)
-            tensors = M.dot(tensors.transpose(2, 1, 0)).transpose(2, 0, 1)
-        cond.value = tensors.reshape(-1, 9)
-        elm_vols = mesh.elements_volumes_and_areas().value
-        
         # VN type conductivities
         if normalize:
             for i, t in enumerate(vol_tags):
@@ -214,10 +292,7 @@ def cond2elmdata(mesh, cond_list, anisotropy_volume=None, affine=None,
                 # If tissue is to be normalized
                 else:
                     c = test_numerical(cond_list[t-1], t-1)
-                    tensors = cond.value[(mesh.elm.tag1 == t) * (mesh.elm.elm_type == 4)]
-                    tensors = tensors.reshape(-1, 3, 3)
-                    tensors = _fix_zeros(tensors, c)
-                    eigval, eigvec = _get_sorted_eigenv(tensors)
+                    eigval, eigvec = tensor_field.sorted_eigv(t, fix_zeros=c)
                     # Normalize
                     eigval /= (np.abs(eigval).prod(axis=1) ** (1./3.))[:, None]
                     # Fix
@@ -246,9 +321,7 @@ def cond2elmdata(mesh, cond_list, anisotropy_volume=None, affine=None,
 
                 else:
                     c = test_numerical(cond_list[t-1], t-1)
-                    tensors = cond.value[(mesh.elm.tag1 == t) * (mesh.elm.elm_type == 4)]
-                    tensors = tensors.reshape(-1, 3, 3)
-                    eigval, eigvec = _get_sorted_eigenv(tensors)
+                    eigval, eigvec = tensor_field.sorted_eigv(t)
                     if correct_intensity:
                         # First fix, does not apply upper bound
                         eigval = _fix_eigv(eigval, 1e10, max_ratio, -1e-6)
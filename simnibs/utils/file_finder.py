@@ -366,6 +366,14 @@ class SubjectFiles:
     hemi_mask: str
         Mask indicating left/right. Needed for surfaces.
 
+    middle_gm_operators: str
+        Cached operators for interpolating fields to the middle GM surfaces and to
+        fsaverage (.hdf5)
+
+    skin_distance_grid: str
+        Cached signed distance grid of the skin surface, used for coil placement
+        optimization (.hdf5)
+
     charm_log: str
         The charm run log (.html)
 
@@ -496,6 +504,12 @@ class SubjectFiles:
             self.surface_folder, "subcortical_mask.nii.gz"
         )
         self.hemi_mask = os.path.join(self.surface_folder, "hemi_mask.nii.gz")
+        self.middle_gm_operators = os.path.join(
+            self.surface_folder, "middle_gm_operators.hdf5"
+        )
+        self.skin_distance_grid = os.path.join(
+            self.surface_folder, "skin_distance_grid.hdf5"
+        )
 
         self.hemispheres = HEMISPHERES
 
@@ -6,6 +6,7 @@ Created on Fri Jul  1 16:08:27 2022
 """
 
 import os
+from itertools import combinations
 import numpy as np
 import pytest
 import h5py 
@@ -84,3 +85,101 @@ def test_get_dirTI():
     assert np.all(np.isclose(TIamp[0:2],2.))
     assert np.all(np.isclose(TIamp[2:4],0.))
 
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_get_maxTI_stacked():
+    rng = np.random.default_rng(0)
+    ef1 = rng.normal(size=(5, 20, 3))
+    ef2 = rng.normal(size=(5, 20, 3))
+    TImax = TI.get_maxTI(ef1, ef2)
+    assert TImax.shape == (5, 20)
+    for t, e1, e2 in zip(TImax, ef1, ef2):
+        assert np.allclose(t, TI.get_maxTI(e1, e2))
+
+
+def test_get_maxTI_kernel():
+    ef1 = np.array([[1,0,0],[1,0,0],[1,0,0],[1,0,0],[0,0,0]], dtype=float)
+    ef2 = np.array([[1,0,0],[-2,0,0],[0,-1000,0],[0,0,3000],[0,0,0]], dtype=float)
+    TImax = TI.get_maxTI_kernel(ef1, ef2)
+    assert np.allclose(TImax, [2., 2., 2., 2., 0.])
+
+    rng = np.random.default_rng(0)
+    ef1 = rng.normal(size=(5, 20, 3))
+    ef2 = rng.normal(size=(5, 20, 3))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        TImax = TI.get_maxTI(ef1, ef2)
+    buffers = TI.TIBuffers((5, 30, 3))
+    out = np.empty((5, 20))
+    assert TI.get_maxTI_kernel(ef1, ef2, out=out, buffers=buffers) is out
+    assert np.allclose(out, TImax)
+
+    TImax32 = TI.get_maxTI_kernel(ef1.astype(np.float32), ef2.astype(np.float32))
+    assert TImax32.dtype == np.float32
+    assert np.allclose(TImax32, TImax, rtol=1e-4)
+    with pytest.raises(ValueError):
+        TI.get_maxTI_kernel(ef1.astype(np.float32), ef2.astype(np.float32),
+                            buffers=buffers)
+
+
+def test_get_dirTI_kernel():
+    rng = np.random.default_rng(0)
+    ef1 = rng.normal(size=(20, 3))
+    ef2 = rng.normal(size=(20, 3))
+    n = rng.normal(size=(20, 3))
+    n /= np.linalg.norm(n, axis=1)[:, None]
+    assert np.allclose(TI.get_dirTI_kernel(ef1, ef2, n), TI.get_dirTI(ef1, ef2, n))
+    assert np.allclose(
+        TI.get_dirTI_kernel(np.stack([ef1, ef2]), np.stack([ef2, ef1]), [0, 0, 1]),
+        TI.get_dirTI(ef1, ef2, [0, 0, 1])
+    )
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_mean_maxTI():
+    rng = np.random.default_rng(0)
+    ef1 = rng.normal(size=(5, 100, 3))
+    ef2 = rng.normal(size=(5, 100, 3))
+    w = rng.uniform(size=100)
+    TImax = TI.get_maxTI(ef1, ef2)
+    mean = TI.mean_maxTI(ef1, ef2, w, block_size=30)
+    assert mean.shape == (5,)
+    assert np.allclose(mean, TImax @ w / w.sum())
+    assert np.allclose(TI.mean_maxTI(ef1[0], ef2[0], w), mean[0])
+
+
+@pytest.mark.parametrize('objective', ['roi', 'focality'])
+@pytest.mark.parametrize('cpus', [1, 2])
+def test_search_montages(objective, cpus):
+    rng = np.random.default_rng(1)
+    names = ['a', 'b', 'c', 'd', 'e', 'f', 'g']
+    leadfield = rng.normal(size=(6, 100, 3))
+    idx_lf = dict(zip(names[:-1], range(6)))
+    idx_lf['g'] = None
+    roi = np.zeros(100, dtype=bool)
+    roi[:20] = True
+
+    montages, roi_mean, non_roi_mean = TI.search_montages(
+        leadfield, idx_lf, roi, current_ratios=[0.3, 0.5], objective=objective,
+        n_best=3, n_candidates=20, chunk_size=17, cpus=cpus)
+
+    # brute force
+    results = []
+    for p1, p2 in combinations(combinations(names, 2), 2):
+        if len(set(p1 + p2)) < 4:
+            continue
+        for r in [0.3, 0.5]:
+            ef1 = TI.get_field([p1[0], p1[1], r * 0.002], leadfield, idx_lf)
+            ef2 = TI.get_field([p2[0], p2[1], (1 - r) * 0.002], leadfield, idx_lf)
+            TImax = TI.get_maxTI(ef1, ef2)
+            results.append(
+                (TImax[roi].mean(), TImax[~roi].mean(),
+                 ([p1[0], p1[1], r * 0.002], [p2[0], p2[1], (1 - r) * 0.002])))
+    results.sort(key=lambda x: -x[0])
+    if objective == 'focality':
+        results = sorted(results[:20], key=lambda x: -x[0] / x[1])
+
+    assert np.allclose(roi_mean, [r[0] for r in results[:3]])
+    assert np.allclose(non_roi_mean, [r[1] for r in results[:3]])
+    for m, r in zip(montages, results[:3]):
+        assert m[0][:2] == r[2][0][:2] and m[1][:2] == r[2][1][:2]
+        assert np.isclose(m[0][2], r[2][0][2]) and np.isclose(m[1][2], r[2][1][2])
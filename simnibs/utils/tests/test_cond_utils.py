@@ -142,6 +142,36 @@ class TestCond2Elmdata:
         assert np.allclose(tensor, 2 * np.eye(3))
 
 
+    def test_tensor_field(self, sphere3_msh):
+        cond_list = [None, None, 2, 7, 9]
+        rng = np.random.default_rng(0)
+        v = rng.uniform(-.1, .1, size=(64, 64, 64, 6))
+        v[..., [0, 3, 5]] += 1
+        v[:20] = 0
+        affine = np.array([[-4, 0, 0, 128],
+                           [0, 4, 0, -128],
+                           [0, 0, 4, -127],
+                           [0, 0, 0, 1]])
+        # Conductivities of every 25th element, computed before TensorField
+        reference = np.load(os.path.join(
+            SIMNIBSDIR, '_internal_resources', 'testing_files',
+            'sphere3_cond_reference.npz'))
+        tensor_field = simnibs.utils.cond_utils.TensorField(sphere3_msh, v, affine)
+        tensors = tensor_field.tensors.copy()
+        for name, kwargs in [('normalize', dict(normalize=True)),
+                             ('intensity', dict(correct_intensity=True)),
+                             ('no_intensity', dict(correct_intensity=False)),
+                             ('excentricity', dict(normalize=True, excentricity_scaling=.2)),
+                             ('isotropic', dict(excentricity_scaling=0.))]:
+            elmcond = simnibs.utils.cond_utils.cond2elmdata(
+                sphere3_msh, cond_list, v, affine, aniso_tissues=[3, 4], **kwargs)
+            elmcond_tf = simnibs.utils.cond_utils.cond2elmdata(
+                sphere3_msh, cond_list, aniso_tissues=[3, 4],
+                tensor_field=tensor_field, **kwargs)
+            assert np.allclose(elmcond.value[::25], reference[name], rtol=1e-10, atol=1e-12)
+            assert np.allclose(elmcond_tf.value[::25], reference[name], rtol=1e-10, atol=1e-12)
+        assert np.all(tensor_field.tensors == tensors)
+
 
 class TestExcentricity:
     def test_excentricity_no_change(self, tensor):
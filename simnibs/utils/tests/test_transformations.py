@@ -1,5 +1,7 @@
+import copy
 import os
 
+import h5py
 import numpy as np
 import pytest
 from scipy.spatial import cKDTree
@@ -209,6 +211,21 @@ class TestNonlTransformVolume:
                                                            target_dimensions=dimensions)
         assert np.allclose(image[0][1::2, :, :], transformed[1:-1, 1:-1, 1:-1])
 
+    @pytest.mark.parametrize('slab_size', [1, 4])
+    @pytest.mark.parametrize('cpus', [1, 2])
+    def test_nonl_slabs(self, image, nonl_transfomation_id, slab_size, cpus):
+        t_affine = nonl_transfomation_id[1].copy()
+        t_affine[0, 0] = 2
+        dimensions = [7, 13, 13]
+        transformed = transformations.volumetric_nonlinear(image,
+                                                           nonl_transfomation_id,
+                                                           target_space_affine=t_affine,
+                                                           target_dimensions=dimensions,
+                                                           slab_size=slab_size,
+                                                           cpus=cpus)
+        assert transformed.shape == (7, 13, 13, 3)
+        assert np.allclose(image[0][1::2, :, :, :], transformed[1:-1, 1:-1, 1:-1, :])
+
     def test_nonl_reflex(self, image, nonl_transfomation_reflex):
         transformed = transformations.volumetric_nonlinear(
             image, nonl_transfomation_reflex)
@@ -667,6 +684,84 @@ def test_surfacemorph(sphere3_msh):
     np.testing.assert_allclose(np.sum(values[from_tris] * weights, 1), field_est, atol=1e-4)
 
 
+def test_middle_gm_operators(sphere3_msh, monkeypatch, tmp_path):
+    m = sphere3_msh
+    # relabel the spheres as WM, GM and CSF
+    tag1 = m.elm.tag1.copy()
+    for t_from, t_to in zip([3, 4, 5], [1, 2, 3]):
+        m.elm.tag1[tag1 == t_from] = t_to
+    m.add_element_field(m.elements_baricenters().value, "E")
+    m.add_node_field(m.nodes.node_coord, "v")
+    surf = m.crop_mesh(1004)
+    surf.nodes.node_coord *= 87.5 / 90
+    monkeypatch.setattr(
+        mesh_io, "load_subject_surfaces", lambda *args: {"lh": surf}
+    )
+
+    class Files:
+        hemispheres = ["lh"]
+        middle_gm_operators = str(tmp_path / "middle_gm_operators.hdf5")
+
+    operators = transformations.get_middle_gm_operators(m, Files, fsaverage=False)
+    assert os.path.isfile(Files.middle_gm_operators)
+
+    m_cropped = m.crop_mesh(tags=[1, 2, 3])
+    th_indices = m_cropped.elm.elm_number[m_cropped.elm.tag1 == 2]
+    for name in ["E", "v"]:
+        interp = m_cropped.field[name].interpolate_to_surface(surf, th_indices=th_indices)
+        assert np.allclose(operators.interpolate(m.field[name], "lh"), interp.value)
+
+    operators_read = transformations.get_middle_gm_operators(m, Files, fsaverage=False)
+    assert np.allclose(
+        operators_read.elm2surf["lh"].toarray(), operators.elm2surf["lh"].toarray()
+    )
+    with pytest.raises(ValueError):
+        operators_read.to_fsaverage(np.ones(surf.nodes.nr), "lh")
+
+    # Meshes with other elements outside WM, GM and CSF (e.g. electrodes) reuse the
+    # operators, even though the element indices change
+    m2 = m.crop_mesh(tags=[1, 2, 3, 1004, 1005])
+    assert m2.elm.nr != m.elm.nr
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the operators should have been read from the file")
+
+    with monkeypatch.context() as mp:
+        mp.setattr(transformations.MiddleGMOperators, "from_mesh", fail)
+        operators2 = transformations.get_middle_gm_operators(m2, Files, fsaverage=False)
+    for name in ["E", "v"]:
+        assert np.allclose(
+            operators2.interpolate(m2.field[name], "lh"),
+            operators.interpolate(m.field[name], "lh"),
+        )
+
+    # precomputed operators are used without reading the file
+    with monkeypatch.context() as mp:
+        mp.setattr(transformations.MiddleGMOperators, "read", fail)
+        mp.setattr(transformations.MiddleGMOperators, "from_mesh", fail)
+        operators3 = transformations.get_middle_gm_operators(
+            m2, Files, fsaverage=False, precomputed=[operators])
+    assert operators3.elm2surf is operators.elm2surf
+    assert np.all(operators3.keep_elm == operators2.keep_elm)
+
+    # operators of other meshes are added to the file
+    m3 = copy.deepcopy(m)
+    m3.nodes.node_coord[m3.elm.node_number_list[m3.elm.tag1 == 3, 0] - 1] *= 1.001
+    transformations.get_middle_gm_operators(m3, Files, fsaverage=False)
+    with h5py.File(Files.middle_gm_operators, "r") as f:
+        assert len(f.keys()) == 2
+
+    # incomplete operators (e.g. from an interrupted write) are recomputed
+    with h5py.File(Files.middle_gm_operators, "a") as f:
+        del f[f"{operators.mesh_hash}/elm2surf/lh/indptr"]
+    operators4 = transformations.get_middle_gm_operators(m, Files, fsaverage=False)
+    assert np.allclose(
+        operators4.elm2surf["lh"].toarray(), operators.elm2surf["lh"].toarray()
+    )
+    with h5py.File(Files.middle_gm_operators, "r") as f:
+        assert "indptr" in f[f"{operators.mesh_hash}/elm2surf/lh"]
+
+
 def test_get_triangle_neighbors():
     """Triangulate an array of points and test neighbors like
     """
@@ -24,8 +24,12 @@ from pathlib import Path
 import warnings
 import os
 from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 import gc
 import copy
+import hashlib
+import shutil
+import tempfile
 import nibabel as nib
 import numpy as np
 import scipy.ndimage
@@ -52,7 +56,7 @@ __all__ = [
 def volumetric_nonlinear(image, deformation, target_space_affine=None,
                          target_dimensions=None, intorder=1, cpus=1,
                          inverse_deformation=None,
-                         keep_vector_length=True):
+                         keep_vector_length=True, slab_size=None):
     ''' Applies a volumetric non-linear transformation
 
     Parameters
@@ -71,6 +75,8 @@ def volumetric_nonlinear(image, deformation, target_space_affine=None,
     intorder: int (Optiona)
         Order of interpolation. See the documentation for the
         scipy.ndimage.map_coordinates function. Default=1
+    cpus: int (Optional)
+        Number of threads used to interpolate the slabs. Default: 1
     inverse_deformation: tuple
         tuple (ndarray, affine) with inverse field. The inverse deformation field is in the
         original space and specifies in each voxel the equivalent coordinates (x, y, z)
@@ -79,6 +85,10 @@ def volumetric_nonlinear(image, deformation, target_space_affine=None,
     keep_vector_length: bool
         Whether to keep the length of the vectors unchanged. Only comes into effect if the
         image is 3 dimensional and inverse_deformation is set.
+    slab_size: int (Optional)
+        Number of slices along the third axis of the target volume processed
+        at a time. The coordinates are only generated for one slab at a time,
+        which bounds the memory usage. Default: slabs of about 2e6 voxels
     Returns
     ------
     outdata: ndarray
@@ -93,38 +103,7 @@ def volumetric_nonlinear(image, deformation, target_space_affine=None,
     # If the resolution is to be changed
     if target_dimensions is None:
         target_dimensions = df_data.shape[:3]
-    if target_space_affine is not None:
-        # Create grid in target space
-        xyzvox = np.array(np.meshgrid(
-            np.arange(target_dimensions[0], dtype=float),
-            np.arange(target_dimensions[1], dtype=float),
-            np.arange(target_dimensions[2], dtype=float),
-            indexing='ij'))
-
-        # Bring points from the grid in target space to x, y,z in target space
-        # Applyies the inverse transformation of the warp to brin the points from x, y, z
-        # to volxels to later interpolation
-        iM = np.linalg.inv(df_affine).dot(target_space_affine)
-        t = iM[:3, :3].dot(xyzvox.reshape(3, -1)) + iM[:3, 3, None]
-        # Figure out the x, y, z coordinates in the original space
-        f = partial(scipy.ndimage.map_coordinates,
-                    coordinates=t,
-                    output=np.float32, order=1,
-                    mode='constant', cval=np.nan)
-        voxvals = np.array([f(df_data[..., i]) for i in range(3)])
-        # Figure out the voxel coordinates in original space
-        iM = np.linalg.inv(im_affine)
-        coords = iM[:3, :3].dot(voxvals) + iM[:3, 3, None]
-        del t
-        del xyzvox
-        del voxvals
-        gc.collect()
-
-    # If we are using the warp apace
-    else:
-        iM = np.linalg.inv(im_affine)
-        coords = iM[:3, :3].dot(df_data.reshape(-1, 3).T) + iM[:3, 3, None]
-        target_space_affine = df_affine
+    target_dimensions = tuple(int(d) for d in target_dimensions)
 
     # If it's a vector and the inverse is defined
     # Rotate the vectors while still in the original space
@@ -165,13 +144,74 @@ def volumetric_nonlinear(image, deformation, target_space_affine=None,
                      np.linalg.norm(im_data_rotated, axis=3))[:, :, :, None]
             im_data = im_data_rotated
 
-    # Interpolate to the target space
-    outdata = _interpolate(im_data, coords, intorder, target_dimensions, cpus)
+    squeeze = len(im_data.shape) == 3
+    indim = 1 if squeeze else im_data.shape[3]
+    outdata = np.zeros(target_dimensions + (indim,), dtype=im_data.dtype)
+    if slab_size is None:
+        slab_size = max(1, int(2e6) // (target_dimensions[0] * target_dimensions[1]))
+    slabs = [
+        (z, min(z + slab_size, target_dimensions[2]))
+        for z in range(0, target_dimensions[2], slab_size)
+    ]
+
+    # Interpolate to the target space, one slab at a time
+    def _warp_slab(slab):
+        coords = _nonlinear_coords(
+            df_data, df_affine, im_affine, target_space_affine,
+            target_dimensions, slab
+        )
+        slab_dim = target_dimensions[:2] + (slab[1] - slab[0],)
+        outdata[:, :, slab[0]:slab[1]] = _interpolate(
+            im_data, coords, intorder, slab_dim).reshape(slab_dim + (indim,))
+
+    if cpus > 1 and len(slabs) > 1:
+        with ThreadPoolExecutor(max_workers=cpus) as executor:
+            list(executor.map(_warp_slab, slabs))
+    else:
+        for slab in slabs:
+            _warp_slab(slab)
+
     del im_data
     gc.collect()
+    if squeeze:
+        outdata = outdata.squeeze()
     return outdata
 
 
+def _nonlinear_coords(df_data, df_affine, im_affine, target_space_affine,
+                      target_dimensions, slab):
+    ''' Voxel coordinates in the original image for the slab (z0, z1) of the
+    target volume '''
+    if target_space_affine is not None:
+        # Create grid in target space
+        xyzvox = np.array(np.meshgrid(
+            np.arange(target_dimensions[0], dtype=float),
+            np.arange(target_dimensions[1], dtype=float),
+            np.arange(slab[0], slab[1], dtype=float),
+            indexing='ij'))
+
+        # Bring points from the grid in target space to x, y,z in target space
+        # Applyies the inverse transformation of the warp to brin the points from x, y, z
+        # to volxels to later interpolation
+        iM = np.linalg.inv(df_affine).dot(target_space_affine)
+        t = iM[:3, :3].dot(xyzvox.reshape(3, -1)) + iM[:3, 3, None]
+        del xyzvox
+        # Figure out the x, y, z coordinates in the original space
+        f = partial(scipy.ndimage.map_coordinates,
+                    coordinates=t,
+                    output=np.float32, order=1,
+                    mode='constant', cval=np.nan)
+        voxvals = np.array([f(df_data[..., i]) for i in range(3)])
+        del t
+    # If we are using the warp apace
+    else:
+        voxvals = df_data[:, :, slab[0]:slab[1]].reshape(-1, 3).T
+
+    # Figure out the voxel coordinates in original space
+    iM = np.linalg.inv(im_affine)
+    return iM[:3, :3].dot(voxvals) + iM[:3, 3, None]
+
+
 def volumetric_affine(image, affine, target_space_affine,
                       target_dimensions, intorder=1, cpus=1,
                       keep_vector_length=True):
@@ -229,7 +269,7 @@ def volumetric_affine(image, affine, target_space_affine,
     return outdata
 
 
-def _interpolate(im_data, coords, intorder, outdim, cpus=1):
+def _interpolate(im_data, coords, intorder, outdim):
     if len(im_data.shape) > 3:
         indim = im_data.shape[3]
         squeeze = False
@@ -249,7 +289,7 @@ def _interpolate(im_data, coords, intorder, outdim, cpus=1):
 
 
 def nifti_transform(image, warp, ref, out=None, mask=None, order=1, inverse_warp=None,
-                    binary=False):
+                    binary=False, cpus=1):
     ''' Transforms a nifti file to the reference space usign the defined warp
 
     Parameters
@@ -275,6 +315,10 @@ def nifti_transform(image, warp, ref, out=None, mask=None, order=1, inverse_warp
         Name of nifti file with inverse the transformation. Used to rotate vectors to the
         target space in the case of non-liner transformations. If the transformation is
         linear, the inverse matrix is used.
+    binary: bool (optional)
+        Whether to binarize the transformed image (threshold 0.5). Default: False
+    cpus: int (optional)
+        Number of threads used for non-linear transformations. Default: 1
     Returns
     ------
     img: nibabel.Nifti1Pair
@@ -331,6 +375,7 @@ def nifti_transform(image, warp, ref, out=None, mask=None, order=1, inverse_warp
             target_space_affine=reference_nifti.affine,
             target_dimensions=reference_nifti.header['dim'][1:4],
             intorder=order,
+            cpus=cpus,
             inverse_deformation=inverse_warp)
 
     if binary:
@@ -417,15 +462,16 @@ def warp_volume(image_fn, m2m_folder, out_name,
                 method='linear',
                 continuous=False,
                 binary=False,
-                keep_tissues=None):
+                keep_tissues=None,
+                cpus=1):
     ''' Warps a nifti image or a mesh using a linear or non-linar transform, writes out
     the output as a nifti file
 
     Parameters
     --------
-    image_fn: str
-        path to mesh or volume. If it is a mesh, all the ElementData fields will be
-        warped
+    image_fn: str or simnibs.msh.Msh
+        path to mesh or volume, or a preloaded mesh. If it is a mesh, all the
+        ElementData fields will be warped
     m2m_folder: str
         Path to the m2m_{subject_id} folder, generated during the segmantation
     out_name: str
@@ -456,8 +502,10 @@ def warp_volume(image_fn, m2m_folder, out_name,
     keep_tissues: list of tissue tags (Optional)
         Only the fields for the listed tissues are interpolated, rest is set to
         zero. Only applied to mesh inputs. Default: None (all tissues are kept)
+    cpus: int (optional)
+        Number of threads used for non-linear transformations. Default: 1
     '''
-    from ..mesh_tools.mesh_io import read_msh
+    from ..mesh_tools.mesh_io import read_msh, Msh
     names = get_names_from_folder_structure(m2m_folder)
 
     if transformation_direction not in ['subject2mni', 'mni2subject']:
@@ -516,8 +564,12 @@ def warp_volume(image_fn, m2m_folder, out_name,
             end = '.nii.gz'
         out_name = name + '_MNI' + end
 
-    if os.path.splitext(image_fn)[1] == '.msh':
-        m = read_msh(image_fn)
+    if isinstance(image_fn, Msh) or os.path.splitext(image_fn)[1] == '.msh':
+        if isinstance(image_fn, Msh):
+            m = image_fn
+            image_fn = m.fn
+        else:
+            m = read_msh(image_fn)
         if keep_tissues is not None:
             m = m.crop_mesh(tags=keep_tissues)
 
@@ -544,7 +596,8 @@ def warp_volume(image_fn, m2m_folder, out_name,
                                 continuous=continuous,
                                 inverse_warp=inverse_warp,
                                 reference_original=names['reference_conf'],
-                                binary=binary)
+                                binary=binary,
+                                cpus=cpus)
 
     else:
         logger.info('Warping nifti file: {0}'.format(image_fn))
@@ -553,12 +606,12 @@ def warp_volume(image_fn, m2m_folder, out_name,
         logger.debug('Mask: {0}'.format(mask))
         nifti_transform(image_fn, warp, reference, out=out_name,
                         mask=mask, order=order, inverse_warp=inverse_warp,
-                        binary=binary)
+                        binary=binary, cpus=cpus)
 
 
 def interpolate_to_volume(fn_mesh, reference, fn_out, create_masks=False,
                           method='linear', continuous=False, create_label=False,
-                          keep_tissues=None):
+                          keep_tissues=None, cpus=1):
     ''' Interpolates the fields in a mesh and writem them to nifti files
 
     Parameters:
@@ -584,8 +637,16 @@ def interpolate_to_volume(fn_mesh, reference, fn_out, create_masks=False,
     keep_tissues: list of tissue tags (Optional)
         Only the fields for the listed tissues are interpolated, rest is set to
         zero. Default: None (all tissues are kept)
+    cpus: int (optional)
+        Number of threads used to grid the fields. Default: 1
+
+    Notes
+    -------
+    All fields (or masks) are gridded together in a single pass over the
+    tetrahedra, see mesh_io.interpolate_fields_to_grid
     '''
-    from ..mesh_tools.mesh_io import read_msh, ElementData
+    from ..mesh_tools.mesh_io import (
+        read_msh, ElementData, interpolate_fields_to_grid, _grid_to_nifti)
     if os.path.isdir(reference):
         names = get_names_from_folder_structure(reference)
         reference = names['reference_conf']
@@ -619,14 +680,15 @@ def interpolate_to_volume(fn_mesh, reference, fn_out, create_masks=False,
     if create_masks:
         mesh = mesh.crop_mesh(elm_type=4)
         vol_tags = np.unique(mesh.elm.tag1)
+        names = []
+        fields = []
         for v in vol_tags:
-            name = fn + '_mask_{0}'.format(v) + ext
+            names.append(fn + '_mask_{0}'.format(v) + ext)
             field = np.zeros(mesh.elm.nr, dtype=np.uint8)
             field[mesh.elm.tag1 == v] = 1
-            ed = ElementData(field)
-            ed.mesh = mesh
-            ed.to_nifti(n_voxels, affine, fn=name, qform=image.header.get_qform(),
-                        method='assign')
+            fields.append(ElementData(field, mesh=mesh))
+        method = 'assign'
+        qform = image.header.get_qform()
     elif create_label:
         mesh = mesh.crop_mesh(elm_type=4)
         field = np.zeros(mesh.elm.nr, dtype=np.int32)
@@ -635,18 +697,28 @@ def interpolate_to_volume(fn_mesh, reference, fn_out, create_masks=False,
         ed.mesh = mesh
         ed.to_nifti(n_voxels, affine, fn=fn_out, qform=image.header.get_qform(),
                     method='assign')
+        return
     else:
         if len(mesh.elmdata) + len(mesh.nodedata) == 0:
             warnings.warn('No fields found in mesh!')
-        for ed in mesh.elmdata + mesh.nodedata:
+        fields = mesh.elmdata + mesh.nodedata
+        names = []
+        for ed in fields:
             name = append_name(fn_out, ed.field_name)
             logger.info('Field: {0}'.format(ed.field_name))
             logger.info('To file: {0}'.format(name))
-            logger.debug('Method: {0}'.format(method))
-            logger.debug('Continuous: {0}'.format(continuous))
-            ed.to_nifti(n_voxels, affine, fn=name, method=method,
-                        continuous=continuous)
-            gc.collect()
+            names.append(name)
+        logger.debug('Method: {0}'.format(method))
+        logger.debug('Continuous: {0}'.format(continuous))
+        qform = None
+
+    images = interpolate_fields_to_grid(
+        fields, n_voxels, affine, method=method,
+        continuous=continuous, cpus=cpus)
+    del fields
+    for name in names:
+        nib.save(_grid_to_nifti(images.pop(0), affine, qform=qform), name)
+    gc.collect()
 
 
 def coordinates_nonlinear(coordinates, deformation, intorder=1, vectors=None,
@@ -1594,6 +1666,267 @@ def make_cross_subject_morph(
     return {h: SurfaceMorph(surfs[0][h], surfs[1][h], **surface_morph_kwargs) for h in surfaces}
 
 
+def _middle_gm_head_tissues(mesh):
+    """Elements and nodes of the WM, GM and CSF in a head mesh
+
+    Returns
+    --------
+    keep_elm: np.ndarray
+        Zero-based indices of the WM, GM and CSF elements
+    keep_nodes: np.ndarray
+        Zero-based indices of their nodes
+    tissues_hash: str
+        Hash of the geometry of these elements and nodes. It does not depend on
+        the other tissues in the mesh (e.g. tDCS electrodes)
+    """
+    tags = [ElementTags.WM, ElementTags.GM, ElementTags.CSF]
+    keep_elm = np.where(np.isin(mesh.elm.tag1, tags))[0]
+    node_number_list = mesh.elm.node_number_list[keep_elm]
+    keep_nodes = np.unique(node_number_list)
+    keep_nodes = keep_nodes[keep_nodes > 0] - 1
+    # node numbers local to the WM, GM and CSF
+    local_nodes = np.where(
+        node_number_list > 0,
+        np.searchsorted(keep_nodes, node_number_list - 1),
+        -1,
+    )
+    h = hashlib.sha1(np.ascontiguousarray(mesh.nodes.node_coord[keep_nodes]))
+    h.update(np.ascontiguousarray(local_nodes, dtype=np.int64))
+    h.update(np.ascontiguousarray(mesh.elm.tag1[keep_elm], dtype=np.int64))
+    return keep_elm, keep_nodes, h.hexdigest()
+
+
+class MiddleGMOperators:
+    """Sparse operators which interpolate the fields of a head mesh to the middle
+    gray matter surfaces and, optionally, morph them to fsaverage
+
+    The operators depend only on the WM, GM and CSF of the head model, so they can
+    be computed once per subject (see get_middle_gm_operators) and applied to any
+    number of simulation results as sparse matrix-vector products, also when the
+    meshes have different electrodes.
+
+    Parameters
+    -----------
+    elm2surf: dict
+        For each hemisphere, sparse matrix (n_surface_nodes x n_tissue_elements)
+        interpolating element data of the WM, GM and CSF elements to the nodes of the
+        middle GM surface
+    node2surf: dict
+        For each hemisphere, sparse matrix (n_surface_nodes x n_tissue_nodes)
+        interpolating node data of the WM, GM and CSF nodes to the nodes of the middle
+        GM surface
+    surf2fsavg: dict (optional)
+        For each hemisphere, sparse matrix morphing values in the middle GM surface to
+        fsaverage. Default: no fsaverage transformation
+    mesh_hash: str (optional)
+        Hash of the WM, GM and CSF geometry the operators were computed for
+    keep_elm: np.ndarray (optional)
+        Zero-based indices of the WM, GM and CSF elements in the head mesh the
+        operators are applied to. Default: the data is given only in these elements
+    keep_nodes: np.ndarray (optional)
+        Zero-based indices of the WM, GM and CSF nodes in the head mesh the operators
+        are applied to. Default: the data is given only in these nodes
+    """
+
+    def __init__(self, elm2surf, node2surf, surf2fsavg=None, mesh_hash=None,
+                 keep_elm=None, keep_nodes=None):
+        self.elm2surf = elm2surf
+        self.node2surf = node2surf
+        self.surf2fsavg = surf2fsavg
+        self.mesh_hash = mesh_hash
+        self.keep_elm = keep_elm
+        self.keep_nodes = keep_nodes
+
+    @classmethod
+    def from_mesh(cls, mesh, subject_files, fsaverage=True):
+        """Computes the operators for a head mesh
+
+        The interpolation is performed as in ElementData.interpolate_to_surface
+        in a mesh with only WM, GM and CSF, using only the GM tetrahedra
+
+        Parameters
+        -----------
+        mesh: simnibs.mesh_io.Msh
+            Head mesh
+        subject_files: simnibs.utils.file_finder.SubjectFiles
+            Subject files, used to load the middle GM and registered spheres
+        fsaverage: bool (optional)
+            Whether to also compute the morph to fsaverage. Default: True
+
+        Returns
+        --------
+        operators: MiddleGMOperators
+        """
+        from ..mesh_tools import mesh_io
+
+        # Crop out WM, GM, and CSF. We add WM and CSF to make the mesh convex.
+        # The elements and nodes of the cropped mesh are in the same order as
+        # keep_elm and keep_nodes
+        m = mesh.crop_mesh(tags=[ElementTags.WM, ElementTags.GM, ElementTags.CSF])
+        th_indices = m.elm.elm_number[m.elm.tag1 == ElementTags.GM]
+        keep_elm, keep_nodes, mesh_hash = _middle_gm_head_tissues(mesh)
+
+        middle_surf = mesh_io.load_subject_surfaces(subject_files, "central")
+        elm2surf = {}
+        node2surf = {}
+        for hemi in subject_files.hemispheres:
+            pos = middle_surf[hemi].nodes.node_coord
+            elm2surf[hemi] = m.interpolate_scattered_matrix(
+                pos, th_indices, element_wise=True).tocsr()
+            node2surf[hemi] = m.interpolate_scattered_matrix(pos, th_indices).tocsr()
+
+        surf2fsavg = None
+        if fsaverage:
+            reg_surf = mesh_io.load_subject_surfaces(subject_files, "sphere.reg")
+            ref_surf = mesh_io.load_reference_surfaces("sphere")
+            surf2fsavg = {
+                h: SurfaceMorph(reg_surf[h], ref_surf[h]).morph_mat
+                for h in subject_files.hemispheres
+            }
+
+        return cls(elm2surf, node2surf, surf2fsavg, mesh_hash, keep_elm, keep_nodes)
+
+    def interpolate(self, data, hemi):
+        """Interpolates a field of the head mesh to the middle GM surface
+
+        Parameters
+        -----------
+        data: simnibs.mesh_io.ElementData or simnibs.mesh_io.NodeData
+            Field defined in the head mesh
+        hemi: str
+            Hemisphere
+
+        Returns
+        --------
+        values: np.ndarray
+            Values in the nodes of the middle GM surface
+        """
+        from ..mesh_tools import mesh_io
+
+        if isinstance(data, mesh_io.NodeData):
+            values = data.value
+            if self.keep_nodes is not None:
+                values = values[self.keep_nodes]
+            return np.squeeze(self.node2surf[hemi] @ values)
+        else:
+            values = data.value
+            if self.keep_elm is not None:
+                values = values[self.keep_elm]
+            return np.squeeze(self.elm2surf[hemi] @ values)
+
+    def to_fsaverage(self, values, hemi):
+        """Morphs values in the middle GM surface to fsaverage"""
+        if self.surf2fsavg is None:
+            raise ValueError("The operators do not include the fsaverage morph")
+        return self.surf2fsavg[hemi] @ values
+
+    def write(self, fn):
+        """Adds the operators to a HDF5 file, which can hold operators of several
+        meshes
+
+        The operators are written to a copy of the file which then replaces it, so
+        that readers never see a partially written file
+        """
+        from ..mesh_tools.mesh_io import _write_sparse_hdf5
+
+        fd, fn_tmp = tempfile.mkstemp(
+            suffix=".hdf5", dir=os.path.dirname(os.path.abspath(fn))
+        )
+        os.close(fd)
+        try:
+            if os.path.isfile(fn):
+                shutil.copyfile(fn, fn_tmp)
+            else:
+                os.remove(fn_tmp)
+            for name in ["elm2surf", "node2surf", "surf2fsavg"]:
+                operators = getattr(self, name)
+                if operators is None:
+                    continue
+                for hemi, M in operators.items():
+                    _write_sparse_hdf5(fn_tmp, f"{self.mesh_hash}/{name}/{hemi}", M)
+            os.replace(fn_tmp, fn)
+        finally:
+            if os.path.isfile(fn_tmp):
+                os.remove(fn_tmp)
+
+    @classmethod
+    def read(cls, fn, mesh_hash, hemispheres, fsaverage=True):
+        """Reads the operators of a mesh from a HDF5 file
+
+        Returns None if the file does not have (all) the operators for the mesh
+        """
+        from ..mesh_tools.mesh_io import _read_sparse_hdf5
+
+        names = ["elm2surf", "node2surf"]
+        if fsaverage:
+            names.append("surf2fsavg")
+        operators = dict.fromkeys(["elm2surf", "node2surf", "surf2fsavg"])
+        for name in names:
+            operators[name] = {
+                h: _read_sparse_hdf5(fn, f"{mesh_hash}/{name}/{h}") for h in hemispheres
+            }
+            if any(M is None for M in operators[name].values()):
+                return None
+        return cls(mesh_hash=mesh_hash, **operators)
+
+
+def get_middle_gm_operators(mesh, subject_files, fsaverage=True, precomputed=None):
+    """Returns the middle GM operators of a head mesh
+
+    The operators are taken from "precomputed" or read from the m2m folder if they
+    were already computed for the same WM, GM and CSF geometry, e.g. for another tDCS
+    montage in the same head model. Otherwise, they are computed and added to the
+    file there.
+
+    Parameters
+    -----------
+    mesh: simnibs.mesh_io.Msh
+        Head mesh
+    subject_files: simnibs.utils.file_finder.SubjectFiles
+        Subject files
+    fsaverage: bool (optional)
+        Whether the fsaverage morph is needed. Default: True
+    precomputed: list of MiddleGMOperators (optional)
+        Operators computed before, possibly for other meshes. Default: None
+
+    Returns
+    --------
+    operators: MiddleGMOperators
+    """
+    fn = subject_files.middle_gm_operators
+    keep_elm, keep_nodes, mesh_hash = _middle_gm_head_tissues(mesh)
+    for operators in precomputed or []:
+        if operators.mesh_hash == mesh_hash and (
+            operators.surf2fsavg is not None or not fsaverage
+        ):
+            operators = copy.copy(operators)
+            operators.keep_elm = keep_elm
+            operators.keep_nodes = keep_nodes
+            return operators
+
+    operators = None
+    if os.path.isfile(fn):
+        try:
+            operators = MiddleGMOperators.read(
+                fn, mesh_hash, subject_files.hemispheres, fsaverage
+            )
+        except OSError:
+            logger.warning(f"Could not read middle GM operators from {fn}")
+    if operators is not None:
+        logger.debug(f"Loaded middle GM operators from {fn}")
+        operators.keep_elm = keep_elm
+        operators.keep_nodes = keep_nodes
+        return operators
+
+    logger.info("Computing middle GM interpolation operators")
+    operators = MiddleGMOperators.from_mesh(mesh, subject_files, fsaverage)
+    try:
+        operators.write(fn)
+    except OSError:
+        logger.warning(f"Could not write middle GM operators to {fn}")
+    return operators
+
+
 def middle_gm_interpolation(
     mesh_fn,
     m2m_folder,
@@ -1604,13 +1937,14 @@ def middle_gm_interpolation(
     fields=None,
     open_in_gmsh=False,
     f_geo=None,
+    operators=None,
 ):
     """Interpolates the vector fieds in the middle gray matter surface
 
     Parameters
     -----------
-    mesh_fn: str
-        String with file name to mesh
+    mesh_fn: str or simnibs.msh.Msh
+        String with file name to mesh, or a preloaded mesh
     m2m_folder: str
         Path to the m2m_{subject_id} folder, generated during the segmantation
     out_folder: str
@@ -1629,6 +1963,9 @@ def middle_gm_interpolation(
         If true, opens a Gmsh window with the interpolated fields
     f_geo: str
         String with file name to geo file that accompanies the mesh
+    operators: list of MiddleGMOperators (optional)
+        Precomputed interpolation operators, see get_middle_gm_operators.
+        Default: read them from or compute them in the m2m folder
     """
     from ..mesh_tools import mesh_io
 
@@ -1656,15 +1993,18 @@ def middle_gm_interpolation(
                 raise ValueError("Invalid quantity: {0}".format(q))
         return d
 
-    m = mesh_io.read_msh(mesh_fn)
+    if isinstance(mesh_fn, mesh_io.Msh):
+        m = mesh_fn
+        mesh_fn = m.fn
+    else:
+        m = mesh_io.read_msh(mesh_fn)
     _, sim_name = os.path.split(mesh_fn)
     sim_name = "." + os.path.splitext(sim_name)[0]
 
-    # Crop out WM, GM, and CSF. We add WM and CSF to make the mesh convex.
-    m = m.crop_mesh(tags=[ElementTags.WM, ElementTags.GM, ElementTags.CSF])
-
-    # Set the volume to be GM. The interpolation will use only the tetrahedra in the volume.
-    th_indices = m.elm.elm_number[m.elm.tag1 == ElementTags.GM]
+    # Interpolation (and fsaverage morph) operators, cached in the m2m folder
+    operators = get_middle_gm_operators(
+        m, subject_files, fsaverage=out_fsaverage is not None, precomputed=operators
+    )
 
     if not os.path.isdir(out_folder):
         os.mkdir(out_folder)
@@ -1679,7 +2019,6 @@ def middle_gm_interpolation(
     names_fsavg = []
 
     middle_surf = mesh_io.load_subject_surfaces(subject_files, "central")
-    reg_surf = mesh_io.load_subject_surfaces(subject_files, "sphere.reg")
 
     ref_surf = mesh_io.load_reference_surfaces("sphere")
     avg_surf = mesh_io.load_reference_surfaces("central")
@@ -1690,19 +2029,14 @@ def middle_gm_interpolation(
             os.path.join(out_folder, hemi + ".central")
         )
 
-    if out_fsaverage is not None:
-        # Intersubject interpolators
-        morph = {
-            h: SurfaceMorph(reg_surf[h], ref_surf[h]) for h in subject_files.hemispheres
-        }
-
     h = []
     for name, data in m.field.items():
         for hemi in subject_files.hemispheres:
             if fields is None or name in fields:
                 # Interpolate to middle gm
-                interpolated = data.interpolate_to_surface(
-                    middle_surf[hemi], th_indices=th_indices
+                interpolated = mesh_io.NodeData(
+                    operators.interpolate(data, hemi),
+                    name=data.field_name, mesh=middle_surf[hemi]
                 )
 
                 # For vector quantities, calculate quantities (normal, magn, ...)
@@ -1721,7 +2055,7 @@ def middle_gm_interpolation(
                         h.append(hemi)
                         # Interpolate to fsavg
                         if out_fsaverage is not None:
-                            q_transformed = morph[hemi].transform(q_data.value)
+                            q_transformed = operators.to_fsaverage(q_data.value, hemi)
                             out_avg = os.path.join(
                                 out_fsaverage,
                                 hemi + sim_name + ".fsavg." + name + "." + q_name,
@@ -1753,8 +2087,8 @@ def middle_gm_interpolation(
                         h.append(hemi)
                         middle_surf[hemi].add_node_field(interpolated, name)
                         if out_fsaverage is not None:
-                            f_transformed = morph[hemi].transform(
-                                interpolated.value.squeeze()
+                            f_transformed = operators.to_fsaverage(
+                                interpolated.value.squeeze(), hemi
                             )
                             out_avg = os.path.join(
                                 out_fsaverage, hemi + sim_name + ".fsavg." + name